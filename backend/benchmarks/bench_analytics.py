@@ -0,0 +1,76 @@
+"""
+Analytics benchmark - Latency of the analytics endpoints for one heavy user
+
+Loads --meals meals for one user into the in-memory store, then times each
+analytics handler (weekly summary, macro distribution, food frequency,
+rolling means, trends, the combined dashboard) against the per-meal Python loop the handlers used
+before the vectorized engine (query_meals + accumulate per meal).
+
+Usage:
+    python -m benchmarks.bench_analytics [--meals 10000] [--days 365] [--json]
+"""
+import argparse
+import os
+import sys
+from collections import defaultdict
+from datetime import date, datetime, time as dtime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ['STORAGE_BACKEND'] = 'memory'
+
+from routes import analytics
+from routes.meal import meal_store
+from utils.serialization import construct_meal_entry
+from benchmarks.common import make_meal_dicts, measure, print_report
+
+USER_ID = 'bench-analytics'
+
+
+def loop_baseline(days: int):
+    """Daily totals and food counts by walking materialised meals"""
+    end_date = date.today()
+    start = datetime.combine(end_date - timedelta(days=days), dtime.min)
+    totals = defaultdict(lambda: defaultdict(float))
+    foods = defaultdict(int)
+    for meal in meal_store.query_meals(USER_ID, start=start, end=datetime.combine(end_date, dtime.max)):
+        day = totals[meal.timestamp.date()]
+        for field in ('calories', 'protein', 'carbs', 'fat'):
+            day[field] += getattr(meal.total_nutrition, field)
+        for food in meal.detected_foods:
+            foods[food.food_id] += 1
+    return totals, foods
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--meals', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=365, help='Days the meals are spread over (and analyzed)')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    meal_store.add_meals([construct_meal_entry(d) for d in make_meal_dicts(args.meals, user_id=USER_ID, days=args.days)])
+    analytics.analytics_cache.budget_bytes = 0  # time the computation, not cache hits
+    weeks = max(1, args.days // 7)
+
+    handlers = {
+        'weekly_summary': lambda: analytics.get_weekly_summary(USER_ID, weeks=weeks),
+        'macro_distribution': lambda: analytics.get_macro_distribution(USER_ID, days=args.days),
+        'food_frequency': lambda: analytics.get_food_frequency(USER_ID, days=args.days),
+        'rolling_7_30': lambda: analytics.get_rolling_averages(USER_ID, days=args.days),
+        'trends': lambda: analytics.get_trends(USER_ID, days=args.days),
+        'dashboard': lambda: analytics.get_dashboard(USER_ID)
+    }
+    results = {
+        name: measure(handler, repeat=args.repeat)
+        for name, handler in handlers.items()
+    }
+    results['python_loop_baseline'] = measure(lambda: loop_baseline(args.days), repeat=max(3, args.repeat // 10))
+
+    print_report(f"Analytics endpoints ({args.meals} meals over {args.days} days, one user)", results, args.json,
+                 {'meals': args.meals, 'days': args.days})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Analytics cache benchmark - Dashboard refreshes per second with and without the cache
+
+Loads --users users with --meals meals each into the in-memory store. A
+dashboard refresh calls the handlers the dashboard polls (weekly summary,
+macro distribution, goal progress, food frequency, trends) for one user;
+users are picked with a Zipf-like skew and one meal is logged every
+--write-every refreshes, bumping that user's data version. The same refresh
+sequence runs with the cache disabled and enabled.
+
+Usage:
+    python -m benchmarks.bench_analytics_cache [--users 200] [--meals 2000] [--refreshes 3000] [--json]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ['STORAGE_BACKEND'] = 'memory'
+
+from models.user import UserProfile
+from routes import analytics
+from routes.meal import meal_store
+from routes.user import user_store
+from utils.serialization import construct_meal_entry
+from benchmarks.common import make_meal_dicts, print_report
+
+
+def dashboard_refresh(user_id: str) -> None:
+    analytics.get_weekly_summary(user_id)
+    analytics.get_macro_distribution(user_id)
+    analytics.get_goal_progress(user_id)
+    analytics.get_food_frequency(user_id)
+    analytics.get_trends(user_id)
+
+
+def run(sequence, write_every: int, seed: int):
+    started = time.perf_counter()
+    for i, user_id in enumerate(sequence):
+        if write_every and i % write_every == write_every - 1:
+            meal_store.add_meal(construct_meal_entry(make_meal_dicts(1, user_id=user_id, days=7, seed=seed + i)[0]))
+        dashboard_refresh(user_id)
+    elapsed = time.perf_counter() - started
+    return {
+        'refreshes_per_s': round(len(sequence) / elapsed, 1),
+        'ms_per_refresh': round(elapsed / len(sequence) * 1000, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--meals', type=int, default=2000, help='Meals per user')
+    parser.add_argument('--refreshes', type=int, default=3000)
+    parser.add_argument('--write-every', type=int, default=20, help='Log one meal every N refreshes (0: never)')
+    parser.add_argument('--budget-mb', type=float, default=64)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    user_ids = [f'bench-cache-{i}' for i in range(args.users)]
+    for i, user_id in enumerate(user_ids):
+        user_store.save_user(UserProfile(
+            user_id=user_id, name='Bench', email=f'{user_id}@example.com', age=30, gender='female',
+            height_cm=165, weight_kg=60, health_goal='maintenance'
+        ))
+        meal_store.add_meals([construct_meal_entry(d)
+                              for d in make_meal_dicts(args.meals, user_id=user_id, days=90, seed=i)])
+
+    rng = random.Random(1)
+    weights = [1 / (rank + 1) for rank in range(args.users)]
+    sequence = rng.choices(user_ids, weights=weights, k=args.refreshes)
+
+    analytics.analytics_cache.budget_bytes = 0
+    results = {'no_cache': run(sequence, args.write_every, seed=2)}
+
+    analytics.analytics_cache.budget_bytes = int(args.budget_mb * 1024 * 1024)
+    results['cache'] = run(sequence, args.write_every, seed=3)
+    stats = analytics.analytics_cache.stats()
+    results['cache'].update({key: stats[key] for key in ('hit_rate', 'entries', 'bytes', 'evictions')})
+    results['speedup'] = {'x': round(results['cache']['refreshes_per_s'] / results['no_cache']['refreshes_per_s'], 1)}
+
+    print_report(f"Dashboard refreshes ({args.users} users x {args.meals} meals, write every {args.write_every})",
+                 results, args.json,
+                 {'users': args.users, 'meals_per_user': args.meals, 'refreshes': args.refreshes,
+                  'write_every': args.write_every, 'budget_mb': args.budget_mb})
+
+
+if __name__ == "__main__":
+    main()
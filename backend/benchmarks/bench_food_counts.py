@@ -0,0 +1,99 @@
+"""
+Food frequency benchmark - Sliding-window top-K against rescanning the window
+
+Loads --meals meals over --days days for one user into the in-memory store,
+then times top-20 foods over the last --window days:
+
+    * rescan: gather the window's detected foods (meal_arrays) and count them
+      with np.bincount, as food-frequency did before,
+    * window_build: the first query, which loads the window's day buckets,
+    * window_warm: repeated queries against the maintained window,
+    * window_slide: the window moving forward one day per query,
+    * sketch_warm: warm queries with the count-min sketch tally,
+
+plus the per-write cost of keeping one window current.
+
+Usage:
+    python -m benchmarks.bench_food_counts [--meals 50000] [--days 1095] [--window 30] [--json]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.food_counts import FoodWindowIndex
+from services.memory_store import InMemoryMealStore
+from utils.serialization import construct_meal_entry
+from benchmarks.common import make_meal_dicts, measure, print_report
+
+USER_ID = 'bench-food-counts'
+
+
+def rescan_top(store: InMemoryMealStore, start: date, end: date, k: int = 20):
+    with store.snapshot(USER_ID) as snapshot:
+        arrays = snapshot.meal_arrays(datetime.combine(start, dtime.min), datetime.combine(end, dtime.max), foods=True)
+    counts = np.bincount(arrays.food_codes)
+    grams = np.bincount(arrays.food_codes, weights=arrays.food_portion)
+    ranked = sorted(np.flatnonzero(counts).tolist(), key=lambda code: counts[code], reverse=True)
+    return [(arrays.foods[code], int(counts[code]), float(grams[code])) for code in ranked[:k]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--meals', type=int, default=50000)
+    parser.add_argument('--days', type=int, default=1095)
+    parser.add_argument('--window', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    meals = [construct_meal_entry(d) for d in make_meal_dicts(args.meals, user_id=USER_ID, days=args.days)]
+    store = InMemoryMealStore()
+    store.add_meals(meals)
+    end = date.today()
+    start = end - timedelta(days=args.window)
+
+    results = {'rescan': measure(lambda: rescan_top(store, start, end), repeat=args.repeat)}
+
+    def build():
+        store.food_windows.clear()
+        store.top_foods(USER_ID, start, end)
+    results['window_build'] = measure(build, repeat=max(5, args.repeat // 10))
+    results['window_warm'] = measure(lambda: store.top_foods(USER_ID, start, end), repeat=args.repeat)
+
+    # Slide a window forward across the history, one day per query
+    first = end - timedelta(days=args.days)
+    store.top_foods(USER_ID, first, first + timedelta(days=args.window))
+    started = time.perf_counter()
+    for shift in range(1, args.days - args.window):
+        day = first + timedelta(days=shift)
+        store.top_foods(USER_ID, day, day + timedelta(days=args.window))
+    results['window_slide'] = {
+        'us_per_query': round((time.perf_counter() - started) / max(1, args.days - args.window - 1) * 1e6, 1)
+    }
+
+    sketched = InMemoryMealStore()
+    sketched.food_windows = FoodWindowIndex(sketched._food_arrays, sketch_width=2048)
+    sketched.add_meals(meals)
+    sketched.top_foods(USER_ID, start, end)
+    results['sketch_warm'] = measure(lambda: sketched.top_foods(USER_ID, start, end), repeat=args.repeat)
+
+    extra = [construct_meal_entry(d) for d in make_meal_dicts(5000, user_id=USER_ID, days=args.window, seed=9)]
+    started = time.perf_counter()
+    for meal in extra:
+        store.add_meal(meal)
+    results['add_meal_with_window'] = {
+        'us_per_write': round((time.perf_counter() - started) / len(extra) * 1e6, 1)
+    }
+
+    print_report(f"Food frequency top-20 ({args.meals} meals over {args.days} days, {args.window}-day window)",
+                 results, args.json, {'meals': args.meals, 'days': args.days, 'window': args.window})
+
+
+if __name__ == "__main__":
+    main()
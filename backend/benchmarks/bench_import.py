@@ -0,0 +1,56 @@
+"""
+Bulk import benchmark - Sustained NDJSON meal import rate on one core
+
+Usage:
+    python -m benchmarks.bench_import [--meals 100000] [--batch-size 1000] [--backend memory|sqlite] [--json]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.memory_store import InMemoryMealStore
+from services.sqlite_store import SQLiteDatabase, SQLiteMealStore
+from services.meal_import import import_ndjson
+from utils.serialization import dumps
+from benchmarks.common import make_meal_dicts, print_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--meals', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--backend', choices=['memory', 'sqlite'], default='memory')
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    per_user = max(1, args.meals // args.users)
+    records = []
+    for i in range(args.users):
+        for record in make_meal_dicts(per_user, user_id=f"user-{i}", days=3 * 365, seed=i):
+            del record['meal_id']
+            records.append(record)
+    payload = b'\n'.join(dumps(record) for record in records)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.backend == 'sqlite':
+            database = SQLiteDatabase(os.path.join(tmp, 'bench.db'))
+            store = SQLiteMealStore(database)
+        else:
+            store = InMemoryMealStore()
+
+        report = import_ndjson(store, payload, batch_size=args.batch_size)
+        report.pop('errors')
+
+        if args.backend == 'sqlite':
+            database.close()
+
+    print_report(f"NDJSON import ({len(records)} meals, {args.backend})", {'import': report}, args.json,
+                 {'meals': len(records), 'payload_bytes': len(payload), 'batch_size': args.batch_size})
+
+
+if __name__ == "__main__":
+    main()
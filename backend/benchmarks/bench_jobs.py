@@ -0,0 +1,96 @@
+"""
+Report precompute benchmark - Nightly job throughput and precomputed read latency
+
+Loads --users users with --meals meals each into the in-memory store and
+runs the precompute-reports job (services.scheduler) with --workers
+processes, then times the report endpoints (weekly summary, macro
+distribution, food frequency) for every user with the analytics cache
+disabled:
+
+    * computed: no precomputed report, the handler computes the result,
+    * precomputed: served from the report store at the current version.
+
+Usage:
+    python -m benchmarks.bench_jobs [--users 500] [--meals 1000] [--workers 2] [--json]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ['STORAGE_BACKEND'] = 'memory'
+os.environ['ANALYTICS_CACHE_MB'] = '0'
+os.environ.setdefault('JOBS_DIR', tempfile.mkdtemp(prefix='bench-jobs-'))
+
+from models.user import UserProfile
+from routes import analytics
+from routes.meal import meal_store
+from routes.user import user_store
+from utils.serialization import construct_meal_entry
+from benchmarks.common import make_meal_dicts, print_report
+
+
+def read_reports(user_ids):
+    for user_id in user_ids:
+        for handler in analytics.REPORT_HANDLERS:
+            handler(user_id)
+
+
+def time_reads(user_ids):
+    started = time.perf_counter()
+    read_reports(user_ids)
+    elapsed = time.perf_counter() - started
+    reads = len(user_ids) * len(analytics.REPORT_HANDLERS)
+    return {'reads_per_s': round(reads / elapsed, 1), 'ms_per_read': round(elapsed / reads * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--meals', type=int, default=1000, help='Meals per user')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--chunk-size', type=int, default=50)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    user_ids = [f'bench-jobs-{i}' for i in range(args.users)]
+    for i, user_id in enumerate(user_ids):
+        user_store.save_user(UserProfile(
+            user_id=user_id, name='Bench', email=f'{user_id}@example.com', age=30, gender='female',
+            height_cm=165, weight_kg=60, health_goal='maintenance'
+        ))
+        meal_store.add_meals([construct_meal_entry(d)
+                              for d in make_meal_dicts(args.meals, user_id=user_id, days=90, seed=i)])
+
+    store, analytics.report_store = analytics.report_store, None
+    results = {'computed': time_reads(user_ids)}
+    analytics.report_store = store
+
+    scheduler = analytics.job_scheduler
+    scheduler.max_workers = args.workers
+    scheduler.jobs['precompute-reports'].chunk_size = args.chunk_size
+    started = time.perf_counter()
+    run_id = scheduler.trigger('precompute-reports', trigger='benchmark')
+    while scheduler.status()['jobs']['precompute-reports']['running_run_id'] == run_id:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    run = scheduler.state.runs('precompute-reports', limit=1)[0]
+    results['precompute_job'] = {
+        'status': run['status'], 'users': run['done'], 'seconds': round(elapsed, 2),
+        'users_per_s': round(run['done'] / elapsed, 1)
+    }
+
+    results['precomputed'] = time_reads(user_ids)
+    results['precomputed']['hit_rate'] = store.stats()['hit_rate']
+    results['speedup'] = {'x': round(results['precomputed']['reads_per_s'] / results['computed']['reads_per_s'], 1)}
+
+    print_report(f"Report precompute ({args.users} users x {args.meals} meals, {args.workers} workers)",
+                 results, args.json,
+                 {'users': args.users, 'meals_per_user': args.meals, 'workers': args.workers})
+
+
+if __name__ == "__main__":
+    main()
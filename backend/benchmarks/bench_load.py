@@ -0,0 +1,200 @@
+"""
+Load benchmark - Throughput, latency percentiles and RSS per read endpoint at several data sizes
+
+For each --sizes entry (USERS:MEALS) a fresh process fills the configured
+stores with that Workload (see benchmarks/workload.py) and then drives the
+ASGI app with --concurrency concurrent clients over httpx, --requests
+requests per endpoint. Users are picked in proportion to how many meals they
+logged, so active users are requested more, as in production. Covered:
+
+    * meals: history (first page), daily-summary (a recent day),
+    * analytics: every read endpoint in routes/analytics.py: the per-user
+      weekly-summary, macro-distribution, goal-progress, food-frequency,
+      rolling, trends, series, range-summary and dashboard, plus population,
+      jobs and cache/stats. POST /analytics/jobs/{name}/run triggers a batch
+      job rather than serving a read, and is measured by bench_jobs.
+
+Per endpoint it reports requests/s, p50/p90/p99 latency, errors and the
+process RSS after the run; per size, the population time and RSS before
+the load. Sizes run in separate processes so each starts from an empty
+store and a clean RSS baseline (with a persistent STORAGE_BACKEND, point it
+at an empty database).
+
+Usage:
+    python -m benchmarks.bench_load [--sizes 200:20000,1000:100000,2000:400000] [--concurrency 8]
+                                    [--requests 300] [--endpoints history,dashboard] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+
+from benchmarks.common import print_report
+from benchmarks.workload import Workload
+
+RESULT_PREFIX = 'BENCH_LOAD_RESULT '
+
+
+def _recent_day(rng: random.Random) -> str:
+    return (date.today() - timedelta(days=rng.randrange(7))).isoformat()
+
+
+# name -> GET path for a user id (and an RNG for per-request parameters)
+ENDPOINTS: Dict[str, Callable[[str, random.Random], str]] = {
+    'meals.history': lambda user_id, rng: f"/meals/{user_id}/history?limit=20",
+    'meals.daily_summary': lambda user_id, rng: f"/meals/{user_id}/daily-summary?date_str={_recent_day(rng)}",
+    'analytics.weekly_summary': lambda user_id, rng: f"/analytics/{user_id}/weekly-summary",
+    'analytics.macro_distribution': lambda user_id, rng: f"/analytics/{user_id}/macro-distribution",
+    'analytics.goal_progress': lambda user_id, rng: f"/analytics/{user_id}/goal-progress",
+    'analytics.food_frequency': lambda user_id, rng: f"/analytics/{user_id}/food-frequency",
+    'analytics.rolling': lambda user_id, rng: f"/analytics/{user_id}/rolling",
+    'analytics.trends': lambda user_id, rng: f"/analytics/{user_id}/trends",
+    'analytics.series': lambda user_id, rng: f"/analytics/{user_id}/series",
+    'analytics.range_summary': lambda user_id, rng: f"/analytics/{user_id}/range-summary",
+    'analytics.dashboard': lambda user_id, rng: f"/analytics/{user_id}/dashboard",
+    'analytics.population': lambda user_id, rng: "/analytics/population",
+    'analytics.jobs': lambda user_id, rng: "/analytics/jobs",
+    'analytics.cache_stats': lambda user_id, rng: "/analytics/cache/stats"
+}
+
+
+async def drive(client, paths: List[str], concurrency: int) -> Dict[str, float]:
+    """GET every path with `concurrency` clients; throughput and latency percentiles"""
+    latencies, errors = [], 0
+    queue = iter(paths)
+
+    async def worker():
+        nonlocal errors
+        for path in queue:
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    return {
+        'requests_per_s': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(float(p50), 3),
+        'p90_ms': round(float(p90), 3),
+        'p99_ms': round(float(p99), 3),
+        'max_ms': round(max(latencies), 3),
+        'errors': errors
+    }
+
+
+async def run_size(args, workload: Workload) -> Dict:
+    """Populate the app's stores with `workload` and load every endpoint"""
+    import httpx
+    from main import app
+    from routes.meal import meal_store
+    from routes.user import user_store
+    from services.metrics import process_rss_bytes
+    from benchmarks.workload import populate
+
+    rss_empty = process_rss_bytes()
+    populated = populate(workload, meal_store, user_store)
+    rss_loaded = process_rss_bytes()
+
+    counts = workload.meal_counts()
+    user_ids = [workload.user_id(i) for i in range(workload.users)]
+    weights = counts / counts.sum()
+    names = [name for name in ENDPOINTS if not args.endpoints or any(e in name for e in args.endpoints)]
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        for name in names:
+            rng = random.Random(f"{args.seed}:{name}")
+            picks = np.random.default_rng(rng.randrange(2 ** 32)).choice(len(user_ids), args.requests, p=weights)
+            paths = [ENDPOINTS[name](user_ids[i], rng) for i in picks]
+            await drive(client, paths[:max(1, args.requests // 10)], args.concurrency)  # warm up
+            stats = await drive(client, paths, args.concurrency)
+            results[name] = {**stats, 'rss_mb': round(process_rss_bytes() / 2 ** 20, 1)}
+
+    return {
+        'users': workload.users,
+        'meals': workload.meals,
+        'populate_s': populated['seconds'],
+        'rss_empty_mb': round(rss_empty / 2 ** 20, 1),
+        'rss_loaded_mb': round(rss_loaded / 2 ** 20, 1),
+        'endpoints': results
+    }
+
+
+def run_child(args, users: int, meals: int) -> Dict:
+    """Run one size in a fresh interpreter and return its result"""
+    command = [sys.executable, '-m', 'benchmarks.bench_load', '--child', '--users', str(users),
+               '--meals', str(meals), '--days', str(args.days), '--concurrency', str(args.concurrency),
+               '--requests', str(args.requests), '--seed', str(args.seed)]
+    if args.endpoints:
+        command += ['--endpoints', ','.join(args.endpoints)]
+    output = subprocess.run(command, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            capture_output=True, text=True, check=True).stdout
+    for line in output.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError(f"No result from size {users}:{meals}:\n{output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='200:20000,1000:100000,2000:400000', help='Comma-separated USERS:MEALS')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=300, help='Requests per endpoint')
+    parser.add_argument('--endpoints', type=lambda value: value.split(','), default=None,
+                        help='Only endpoints whose name contains one of these (comma-separated)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--users', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--meals', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        workload = Workload(args.users, args.meals, args.days, seed=args.seed)
+        print(RESULT_PREFIX + json.dumps(asyncio.run(run_size(args, workload))))
+        return
+
+    sizes = {}
+    for size in args.sizes.split(','):
+        users, meals = (int(value) for value in size.split(':'))
+        sizes[f'{users}:{meals}'] = run_child(args, users, meals)
+
+    if args.json:
+        print_report("Load (per endpoint and data size)", sizes, True, {
+            'storage': os.environ['STORAGE_BACKEND'],
+            'concurrency': args.concurrency,
+            'requests_per_endpoint': args.requests
+        })
+        return
+
+    # One table per endpoint: how it scales with the data size
+    results = {}
+    for size, result in sizes.items():
+        results[f'populate@{size}'] = {key: result[key] for key in ('populate_s', 'rss_empty_mb', 'rss_loaded_mb')}
+    for name in next(iter(sizes.values()))['endpoints']:
+        for size, result in sizes.items():
+            results[f'{name}@{size}'] = result['endpoints'][name]
+    print_report(f"Load ({os.environ['STORAGE_BACKEND']}, concurrency {args.concurrency})", results)
+
+
+if __name__ == "__main__":
+    main()
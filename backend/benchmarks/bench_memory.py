@@ -0,0 +1,105 @@
+"""
+Memory benchmark - Bytes per stored meal for the in-memory meal store
+
+Streams N synthetic meals into the columnar InMemoryMealStore and reports
+the traced heap it holds (including daily rollups). The baseline, a plain
+{meal_id: MealEntry} dict as used before the columnar store, is measured on
+a sample and reported per meal since holding millions of Pydantic objects
+does not fit in a typical machine's RAM.
+
+Usage:
+    python -m benchmarks.bench_memory [--meals 1000000] [--users 1000] [--baseline-sample 20000] [--json]
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.memory_store import InMemoryMealStore
+from utils.serialization import construct_meal_entry
+from benchmarks.common import make_meal_dicts, print_report
+
+BATCH_SIZE = 10000
+
+
+def generate_batches(meals: int, users: int):
+    """Yield lists of MealEntry, round-robin over users, BATCH_SIZE at a time"""
+    per_user = max(1, meals // users)
+    per_batch_user = max(1, BATCH_SIZE // per_user)
+    for first in range(0, users, per_batch_user):
+        batch = []
+        for i in range(first, min(users, first + per_batch_user)):
+            batch.extend(construct_meal_entry(d) for d in make_meal_dicts(per_user, user_id=f"user-{i}", seed=i))
+        yield batch
+
+
+def traced_bytes(build):
+    """Heap bytes still held by the object returned from build()"""
+    gc.collect()
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    obj = build()
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current - base, peak - base
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--meals', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--baseline-sample', type=int, default=20000)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    def build_columnar():
+        store = InMemoryMealStore()
+        for batch in generate_batches(args.meals, args.users):
+            store.add_meals(batch)
+        return store
+
+    started = time.perf_counter()
+    store, columnar_bytes, _ = traced_bytes(build_columnar)
+    elapsed = time.perf_counter() - started
+    stored = len(store.meal_owners)
+    del store
+
+    def build_baseline():
+        meals_db = {}
+        for batch in generate_batches(args.baseline_sample, max(1, args.users * args.baseline_sample // args.meals)):
+            meals_db.update((meal.meal_id, meal) for meal in batch)
+        return meals_db
+
+    baseline, baseline_bytes, _ = traced_bytes(build_baseline)
+    baseline_count = len(baseline)
+    del baseline
+
+    columnar_per_meal = columnar_bytes / stored
+    baseline_per_meal = baseline_bytes / baseline_count
+    results = {
+        'columnar_store': {
+            'meals': stored,
+            'total_mb': round(columnar_bytes / 2 ** 20, 1),
+            'bytes_per_meal': round(columnar_per_meal),
+            'build_s': round(elapsed, 1)
+        },
+        'pydantic_dict_baseline': {
+            'meals': baseline_count,
+            'bytes_per_meal': round(baseline_per_meal),
+            'projected_mb': round(baseline_per_meal * stored / 2 ** 20, 1)
+        },
+        'savings': {
+            'ratio': round(baseline_per_meal / columnar_per_meal, 2)
+        }
+    }
+    print_report(f"Meal store memory ({stored} meals, {args.users} users)", results, args.json,
+                 {'meals': stored, 'users': args.users})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Population analytics benchmark - Sketch partitions against scanning every meal
+
+Loads --users users (a third per health goal) with --meals meals each over
+--days days into the in-memory store, then answers "daily calorie
+percentiles, protein adherence and top foods per goal over the last
+--window days" two ways:
+
+    * scan: read every user's meals in the window and compute the exact
+      answer with NumPy (what a report would do without the index),
+    * sketch: population_summary() + report() from the sealed partitions,
+
+and compares the sketch answer with the exact one, the size of the serialized
+summary a shard would send, and the index's share of the write path.
+
+Usage:
+    python -m benchmarks.bench_population [--users 500] [--meals 400] [--days 90] [--window 30] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from datetime import date, datetime, time as dtime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.user import UserProfile
+from services.memory_store import InMemoryMealStore, InMemoryUserStore
+from services.population import PopulationIndex, cohort_of
+from utils.serialization import construct_meal_entry
+from benchmarks.common import make_meal_dicts, measure, print_report
+
+GOALS = ('weight_loss', 'muscle_gain', 'maintenance')
+
+
+def scan_report(store: InMemoryMealStore, users: InMemoryUserStore, user_ids, start: date, end: date):
+    """Exact per-goal answer from every meal in the window"""
+    days, foods = {}, {}
+    for user_id in user_ids:
+        profile = users.get_user(user_id)
+        cohort = cohort_of(profile)
+        for meal in store.query_meals(user_id, start=datetime.combine(start, dtime.min),
+                                      end=datetime.combine(end, dtime.max)):
+            key = (user_id, meal.timestamp.date())
+            totals = days.setdefault(cohort, {}).setdefault(key, [0.0, 0.0, profile.daily_protein_target_g])
+            totals[0] += meal.total_nutrition.calories
+            totals[1] += meal.total_nutrition.protein
+            foods.setdefault(cohort, Counter()).update(food.food_name for food in meal.detected_foods)
+    report = {}
+    for cohort, user_days in days.items():
+        values = np.array(list(user_days.values()))
+        report[cohort] = {
+            'daily_calories': np.percentile(values[:, 0], [10, 25, 50, 75, 90, 99]).tolist(),
+            'adherence_rate': float(np.mean(values[:, 1] / values[:, 2] >= 1)),
+            'top_foods': foods[cohort].most_common(10)
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--meals', type=int, default=400, help='Meals per user')
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--window', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    users = InMemoryUserStore()
+    store = InMemoryMealStore()
+    store.set_profile_source(users.get_user)
+    user_ids = [f'bench-pop-{i}' for i in range(args.users)]
+    meals = []
+    for i, user_id in enumerate(user_ids):
+        users.save_user(UserProfile(
+            user_id=user_id, name='Bench', email=f'{user_id}@example.com', age=30, gender='female',
+            height_cm=165, weight_kg=50 + i % 40, health_goal=GOALS[i % len(GOALS)]
+        ))
+        meals.append([construct_meal_entry(d) for d in make_meal_dicts(args.meals, user_id=user_id,
+                                                                       days=args.days, seed=i)])
+
+    started = time.perf_counter()
+    for user_meals in meals:
+        store.add_meals(user_meals)
+    load_s = time.perf_counter() - started
+    index = PopulationIndex(users.get_user)
+    started = time.perf_counter()
+    for user_meals in meals:
+        index.add_meals(user_meals)
+    index_s = time.perf_counter() - started
+    del index
+
+    end = date.today()
+    start = end - timedelta(days=args.window - 1)
+    started = time.perf_counter()
+    store.population_summary(start, end)  # seals the closed days
+    seal_ms = (time.perf_counter() - started) * 1000
+
+    def sketch_query():
+        return store.population_summary(start, end).report()
+
+    results = {
+        'scan': measure(lambda: scan_report(store, users, user_ids, start, end), repeat=max(2, args.repeat // 5), warmup=1),
+        'sketch': measure(sketch_query, repeat=args.repeat, warmup=1)
+    }
+    results['speedup'] = {'x': round(results['scan']['p50_ms'] / results['sketch']['p50_ms'], 1)}
+    results['load'] = {
+        'first_seal_ms': round(seal_ms, 1),
+        'store_us_per_meal': round(load_s / (args.users * args.meals) * 1e6, 2),
+        'index_us_per_meal': round(index_s / (args.users * args.meals) * 1e6, 2)
+    }
+
+    exact, sketched = scan_report(store, users, user_ids, start, end), sketch_query()
+    for cohort, expected in exact.items():
+        got = sketched['cohorts'][cohort]
+        results[f'accuracy_{cohort}'] = {
+            'p50_exact': round(expected['daily_calories'][2], 1),
+            'p50_sketch': got['daily_calories']['p50'],
+            'adherence_exact': round(expected['adherence_rate'], 4),
+            'adherence_sketch': got['protein_adherence']['adherence_rate'],
+            'top5_counts_match': [times for _, times in expected['top_foods'][:5]] ==
+                                 [food['times_consumed'] for food in got['top_foods'][:5]]
+        }
+    results['summary_size'] = {'json_kb': round(len(json.dumps(store.population_summary(start, end).to_dict())) / 1024, 1),
+                               **store.population.stats()}
+
+    print_report(f"Population report ({args.users} users x {args.meals} meals, {args.window}-day window)",
+                 results, args.json,
+                 {'users': args.users, 'meals_per_user': args.meals, 'days': args.days, 'window': args.window})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Profile metrics benchmark - Cached and vectorized health targets
+
+Builds --profiles random profiles and times:
+
+    * recompute / cached: reading bmi, daily_calorie_target and
+      daily_protein_target_g five times per profile (what an analytics
+      request does), recomputing every time against the cached metrics,
+    * scalar_bulk / vectorized_bulk: targets for every profile with new
+      formula parameters, one compute_profile_metrics() call per profile
+      against one compute_metrics() pass over ProfileArrays,
+
+and checks that the vectorized targets equal the per-profile ones.
+
+Usage:
+    python -m benchmarks.bench_profile_metrics [--profiles 10000] [--json]
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.user import Gender, HealthGoal, UserProfile, compute_profile_metrics
+from services.profile_metrics import METRIC_FIELDS, ProfileArrays, compute_metrics
+from benchmarks.common import measure, print_report
+
+READS_PER_PROFILE = 5
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    profiles = [UserProfile(
+        user_id=f'bench-profile-{i}', name='Bench', email=f'bench{i}@example.com', age=rng.randint(18, 80),
+        gender=rng.choice(list(Gender)), height_cm=round(rng.uniform(150, 200), 1),
+        weight_kg=round(rng.uniform(45, 130), 1), health_goal=rng.choice(list(HealthGoal))
+    ) for i in range(args.profiles)]
+
+    def recompute():
+        for profile in profiles:
+            for _ in range(READS_PER_PROFILE):
+                metrics = compute_profile_metrics(profile.age, profile.gender, profile.height_cm,
+                                                  profile.weight_kg, profile.health_goal)
+                metrics.bmi, metrics.daily_calorie_target, metrics.daily_protein_target_g
+
+    def cached():
+        for profile in profiles:
+            for _ in range(READS_PER_PROFILE):
+                profile.bmi, profile.daily_calorie_target, profile.daily_protein_target_g
+
+    results = {
+        'recompute': measure(recompute, repeat=args.repeat),
+        'cached': measure(cached, repeat=args.repeat),
+        'scalar_bulk': measure(lambda: [compute_profile_metrics(p.age, p.gender, p.height_cm, p.weight_kg,
+                                                                p.health_goal) for p in profiles],
+                               repeat=args.repeat),
+        'vectorized_bulk': measure(lambda: compute_metrics(ProfileArrays.from_profiles(profiles)),
+                                   repeat=args.repeat)
+    }
+    results['speedup'] = {
+        'cached_x': round(results['recompute']['p50_ms'] / results['cached']['p50_ms'], 1),
+        'vectorized_x': round(results['scalar_bulk']['p50_ms'] / results['vectorized_bulk']['p50_ms'], 1)
+    }
+
+    vectorized = compute_metrics(ProfileArrays.from_profiles(profiles))
+    results['accuracy'] = {
+        name: sum(getattr(profile.metrics, name) == vectorized[name][i] for i, profile in enumerate(profiles))
+        / len(profiles)
+        for name in METRIC_FIELDS
+    }
+
+    print_report(f"Profile metrics ({args.profiles} profiles)", results, args.json, {'profiles': args.profiles})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Recognize benchmark - Offline per-stage and end-to-end /food/recognize latency
+
+Runs without network access or an API key: Gemini is replaced by
+FakeGemini (--gemini-latency-ms, --gemini-jitter-ms, --shape) and uploads
+are synthetic plate photos at each of --resolutions. For every resolution
+it times:
+
+    * preprocess_image, detect_plate_size and estimate_multiple_portions
+      on the encoded image,
+    * end-to-end POST /food/recognize through the ASGI app (with a user
+      id, so alerts are personalized), plus the mean time per pipeline
+      stage taken from the recognize_stage_seconds histogram,
+
+and once, independent of the image:
+
+    * calculate_total_nutrition and generate_health_alerts (generic and
+      personalized),
+    * the Gemini response parsing for every response shape, when Pillow
+      is installed (the Gemini path decodes with it).
+
+The image stages are no-ops with the cv2 stand-in (backend/cv2.py) and detection falls back to color
+matching without Pillow; the report records which paths ran, and the commit
+it ran on, so --json output can be compared across commits.
+
+Usage:
+    python -m benchmarks.bench_recognize [--resolutions vga,hd,fhd] [--gemini-latency-ms 0] [--json]
+                                         [--output results.json]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+
+from fastapi.testclient import TestClient
+
+from main import app
+from ml import portion_estimator as estimator_module
+from models.user import UserProfile
+from routes.food import UPLOAD_DIR, get_alert_context, get_ml_modules
+from routes.meal import meal_store
+from routes.user import user_store
+from services.metrics import RECOGNIZE_STAGES, STAGE_TIMERS
+from utils.serialization import construct_meal_entry
+from benchmarks.common import make_meal_dicts, measure, print_report
+from benchmarks.recognize_fixtures import (
+    RESOLUTIONS, RESPONSE_SHAPES, FakeGemini, encode_image, install_fake_gemini, make_detections,
+    make_plate_image
+)
+
+USER_ID = 'bench-recognize-user'
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or 'unknown'
+    except OSError:
+        return 'unknown'
+
+
+def stage_snapshot():
+    return {stage: STAGE_TIMERS[stage].snapshot() for stage in RECOGNIZE_STAGES}
+
+
+def stage_means(before, after):
+    """Mean ms per stage between two histogram snapshots"""
+    means = {}
+    for stage in RECOGNIZE_STAGES:
+        count = sum(after[stage][0]) - sum(before[stage][0])
+        if count:
+            means[f'{stage}_ms'] = round((after[stage][1] - before[stage][1]) / count * 1000, 3)
+    return means
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resolutions', default='vga,hd,fhd',
+                        help=f"Comma-separated names ({', '.join(RESOLUTIONS)}) or WIDTHxHEIGHT")
+    parser.add_argument('--gemini-latency-ms', type=float, default=0.0)
+    parser.add_argument('--gemini-jitter-ms', type=float, default=0.0)
+    parser.add_argument('--shape', choices=RESPONSE_SHAPES, default='json', help='Fake Gemini response shape')
+    parser.add_argument('--foods', type=int, default=3, help='Foods per plate and per Gemini response')
+    parser.add_argument('--repeat', type=int, default=30, help='Iterations per end-to-end scenario')
+    parser.add_argument('--micro-repeat', type=int, default=50)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    resolutions = {}
+    for name in args.resolutions.split(','):
+        width, height = RESOLUTIONS[name] if name in RESOLUTIONS else map(int, name.lower().split('x'))
+        resolutions[f'{width}x{height}'] = (width, height)
+
+    classifier, estimator, mapper = get_ml_modules()
+    fake = FakeGemini(classifier.indian_foods, args.gemini_latency_ms, args.gemini_jitter_ms, args.shape,
+                      items=args.foods)
+    gemini_path = install_fake_gemini(classifier, fake)
+
+    user_store.save_user(UserProfile(
+        user_id=USER_ID, name='Bench', email='bench.recognize@example.com', age=29, gender='female',
+        height_cm=162, weight_kg=58, health_goal='weight_loss'
+    ))
+    today = make_meal_dicts(2, user_id=USER_ID, days=0)
+    for meal in today:
+        meal['timestamp'] = datetime.utcnow()
+    meal_store.add_meals([construct_meal_entry(meal) for meal in today])
+
+    results = {}
+    detected = make_detections(classifier.food_database, count=args.foods)
+    existing_uploads = set(UPLOAD_DIR.iterdir())
+    client = TestClient(app)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, (width, height) in resolutions.items():
+            data, content_type, extension = encode_image(make_plate_image(width, height, args.foods))
+            image_path = str(Path(tmp) / f'plate_{label}{extension}')
+            with open(image_path, 'wb') as f:
+                f.write(data)
+
+            results[f'preprocess_image@{label}'] = measure(
+                lambda: classifier.preprocess_image(image_path), repeat=args.micro_repeat)
+            results[f'detect_plate_size@{label}'] = measure(
+                lambda: estimator.detect_plate_size(image_path), repeat=args.micro_repeat)
+            results[f'estimate_multiple_portions@{label}'] = measure(
+                lambda: estimator.estimate_multiple_portions(detected, image_path), repeat=args.micro_repeat)
+
+            def recognize():
+                response = client.post('/food/recognize', data={'user_id': USER_ID},
+                                       files={'file': (f'plate{extension}', data, content_type)})
+                assert response.status_code == 200, response.text
+
+            before = stage_snapshot()
+            stats = measure(recognize, repeat=args.repeat, warmup=2)
+            results[f'recognize@{label}'] = {**stats, 'upload_kb': round(len(data) / 1024, 1)}
+            results[f'recognize_stages@{label}'] = stage_means(before, stage_snapshot())
+
+    for path in set(UPLOAD_DIR.iterdir()) - existing_uploads:
+        path.unlink()
+
+    for food in detected:
+        food['estimated_grams'] = 150
+        food['nutrition'] = mapper.calculate_nutrition(food['food_id'], food['estimated_grams'])
+    total = mapper.calculate_total_nutrition(detected)
+    user_profile, today_totals = get_alert_context(USER_ID)
+    repeat = args.micro_repeat * 20
+    results['calculate_total_nutrition'] = measure(lambda: mapper.calculate_total_nutrition(detected), repeat=repeat)
+    results['generate_health_alerts'] = measure(lambda: mapper.generate_health_alerts(total), repeat=repeat)
+    results['generate_health_alerts_personalized'] = measure(
+        lambda: mapper.generate_health_alerts(total, user_profile, today_totals), repeat=repeat)
+
+    if gemini_path:
+        data, _, extension = encode_image(make_plate_image(*RESOLUTIONS['vga'], args.foods))
+        with tempfile.NamedTemporaryFile(suffix=extension) as upload:
+            upload.write(data)
+            upload.flush()
+            latency_ms, fake.latency_ms, fake.jitter_ms = fake.latency_ms, 0.0, 0.0
+            for shape in RESPONSE_SHAPES:
+                fake.shape = shape
+                results[f'gemini_parse@{shape}'] = measure(
+                    lambda: classifier.detect_multiple_foods(upload.name), repeat=args.micro_repeat)
+            fake.shape, fake.latency_ms = args.shape, latency_ms
+
+    extra = {
+        'commit': git_commit(),
+        'resolutions': list(resolutions),
+        'gemini_path': gemini_path,
+        'opencv': getattr(estimator_module.cv2, '__version__', 'stand-in') if estimator_module.CV2_AVAILABLE else None,
+        'gemini_latency_ms': args.gemini_latency_ms,
+        'gemini_jitter_ms': args.gemini_jitter_ms,
+        'shape': args.shape,
+        'foods': args.foods,
+        'gemini_calls': fake.calls
+    }
+    if args.output:
+        # The ML modules print import warnings to stdout, so keep the JSON in its own file
+        with open(args.output, 'w', encoding='utf-8') as f, redirect_stdout(f):
+            print_report("Recognize pipeline (offline)", results, True, extra)
+    else:
+        print_report("Recognize pipeline (offline)", results, args.json, extra)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Recognize alerts benchmark - Cost of personalized, day-aware health alerts
+
+Loads one user with --meals meals (the last --today of them logged today)
+into the configured stores and times the alert step of /food/recognize for
+one recognized meal:
+
+    * generic: generate_health_alerts() without a profile (the old path),
+    * personalized: get_alert_context() (profile + today's rollup) and
+      generate_health_alerts() with both,
+    * naive_scan: the same alerts with today's totals summed from a scan of
+      every one of the user's meals, for comparison.
+
+Usage:
+    python -m benchmarks.bench_recognize_alerts [--meals 5000] [--today 3] [--json]
+"""
+import argparse
+import os
+import sys
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+
+from models.user import UserProfile
+from routes.food import get_alert_context, get_ml_modules
+from routes.meal import meal_store
+from routes.user import user_store
+from utils.serialization import NUTRIENT_FIELDS, construct_meal_entry
+from benchmarks.common import load_foods, make_meal_dicts, measure, print_report
+
+USER_ID = 'bench-alerts-user'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--meals', type=int, default=5000)
+    parser.add_argument('--today', type=int, default=3, help='Meals already logged today')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    _, _, mapper = get_ml_modules()
+    user_store.save_user(UserProfile(
+        user_id=USER_ID, name='Bench', email='bench.alerts@example.com', age=34, gender='male',
+        height_cm=176, weight_kg=82, health_goal='muscle_gain'
+    ))
+    meals = make_meal_dicts(args.meals - args.today, user_id=USER_ID, days=365)
+    now = datetime.utcnow()
+    for meal in make_meal_dicts(args.today, user_id=USER_ID, days=0, seed=7):
+        meal['timestamp'] = now
+        meals.append(meal)
+    meal_store.add_meals([construct_meal_entry(meal) for meal in meals])
+
+    food = load_foods()[0]
+    nutrition = mapper.calculate_total_nutrition([{'food_id': food['id'], 'estimated_grams': 350}])
+
+    def generic():
+        return mapper.generate_health_alerts(nutrition, None)
+
+    def personalized():
+        user_profile, today_totals = get_alert_context(USER_ID)
+        return mapper.generate_health_alerts(nutrition, user_profile, today_totals)
+
+    def naive_scan():
+        user_profile, _ = get_alert_context(USER_ID)
+        today = date.today()
+        totals = dict.fromkeys(NUTRIENT_FIELDS, 0.0)
+        for meal in meal_store.query_meals(USER_ID):
+            if meal.timestamp.date() == today:
+                for field in NUTRIENT_FIELDS:
+                    totals[field] += getattr(meal.total_nutrition, field)
+        return mapper.generate_health_alerts(nutrition, user_profile, totals)
+
+    results = {
+        'generic': measure(generic, repeat=args.repeat, warmup=10),
+        'personalized': measure(personalized, repeat=args.repeat, warmup=10),
+        'naive_scan': measure(naive_scan, repeat=max(5, args.repeat // 20), warmup=1)
+    }
+    generic_ms, personalized_ms = results['generic']['p50_ms'], results['personalized']['p50_ms']
+    results['overhead'] = {
+        'personalized_vs_generic_us': round((personalized_ms - generic_ms) * 1000, 1),
+        'scan_vs_personalized_x': round(results['naive_scan']['p50_ms'] / max(personalized_ms, 0.001), 1)
+    }
+    assert personalized() == naive_scan()
+    results['alerts'] = {'count': len(personalized()), 'sample': personalized()[-1]}
+
+    print_report(f"Recognize alerts ({args.meals} meals, {args.today} today)", results, args.json,
+                 {'meals': args.meals, 'today': args.today, 'storage': os.environ['STORAGE_BACKEND']})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Crash recovery check - Kill a journaled writer mid-write and verify recovery
+
+Each round starts a writer process on the same WAL directory that logs
+meals (single and batched), deletes meals and saves users as fast as it
+can, printing every operation once it is acknowledged. The writer is
+SIGKILLed at a random moment (often mid-fsync or mid-snapshot) and the
+directory is recovered in this process, which must contain every
+acknowledged write and agree with the daily rollups.
+
+A final step preloads --preload meals, snapshots, and times a cold recovery.
+
+Usage:
+    python -m benchmarks.bench_recovery [--rounds 5] [--preload 200000] [--json]
+"""
+import argparse
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.user import UserProfile
+from services.persistence import Journal
+from utils.serialization import construct_meal_entry
+from benchmarks.common import make_meal_dicts, print_report
+
+
+def run_writer(directory: str, seed: int):
+    """Child process: mutate the journaled stores forever, reporting acknowledged operations"""
+    journal = Journal(directory, snapshot_interval_s=0.3, snapshot_min_records=200)
+    rng = random.Random(seed)
+    meal_store, user_store = journal.meal_store, journal.user_store
+    out = sys.stdout
+    counter = 0
+    while True:
+        counter += 1
+        user_id = f"user-{rng.randint(0, 9)}"
+        batch = [construct_meal_entry(d) for d in
+                 make_meal_dicts(rng.choice([1, 1, 1, 20]), user_id=user_id, days=30, seed=seed * 100000 + counter)]
+        if len(batch) == 1:
+            meal_store.add_meal(batch[0])
+        else:
+            meal_store.add_meals(batch)
+        out.write(''.join(f"A {meal.meal_id}\n" for meal in batch))
+
+        if rng.random() < 0.2:
+            meals = meal_store.query_meals(user_id, limit=5, newest_first=True)
+            if meals:
+                victim = rng.choice(meals).meal_id
+                meal_store.remove_meal(victim)
+                out.write(f"D {victim}\n")
+        if rng.random() < 0.05:
+            user = UserProfile(user_id=user_id, email=f"{user_id}@example.com", name=f"User {counter}",
+                               age=30, gender='female', height_cm=165, weight_kg=60 + counter % 10,
+                               health_goal='maintenance')
+            user_store.save_user(user)
+            out.write(f"U {user_id} {user.name}\n")
+        out.flush()
+
+
+def verify(directory: str, acknowledged: dict, deleted: set, users: dict):
+    """Recover the directory and check it against the acknowledged operations"""
+    started = time.perf_counter()
+    journal = Journal(directory, snapshot_interval_s=0)
+    recovery_s = time.perf_counter() - started
+    meal_store, user_store = journal.meal_store, journal.user_store
+
+    for meal_id in acknowledged:
+        present = meal_store.get_meal(meal_id) is not None
+        if meal_id in deleted:
+            assert not present, f"deleted meal {meal_id} came back"
+        else:
+            assert present, f"acknowledged meal {meal_id} lost"
+    for user_id, name in users.items():
+        user = user_store.get_user(user_id)
+        assert user is not None and user.name == name, f"user {user_id} not recovered"
+
+    # Rollups rebuilt from columns must match the meals themselves
+    for user_id in list(meal_store.user_columns):
+        days = defaultdict(lambda: [0, 0.0])
+        for meal in meal_store.query_meals(user_id):
+            totals = days[meal.timestamp.date()]
+            totals[0] += 1
+            totals[1] += meal.total_nutrition.calories
+        for day, (count, calories) in days.items():
+            rollup = meal_store.daily_rollup(user_id, day)
+            assert rollup.meals_count == count and abs(rollup.calories - calories) < 1e-6, (user_id, day)
+
+    stats = dict(journal.recovery, recovery_s=round(recovery_s, 3))
+    journal.close()
+    return stats
+
+
+def kill_rounds(directory: str, rounds: int, rng: random.Random):
+    acknowledged, deleted, users = {}, set(), {}
+    results = {}
+    for round_number in range(rounds):
+        writer = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.bench_recovery', '--writer', directory, '--seed', str(round_number + 1)],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        lines = []
+        reader = threading.Thread(target=lambda: lines.extend(writer.stdout), daemon=True)
+        reader.start()
+        time.sleep(rng.uniform(1.0, 3.0))
+        writer.send_signal(signal.SIGKILL)
+        writer.wait()
+        reader.join()
+
+        for line in lines:
+            if not line.endswith('\n'):
+                continue  # the kill interrupted this acknowledgement
+            kind, key, *rest = line.rstrip('\n').split(' ', 2)
+            if kind == 'A':
+                acknowledged[key] = round_number
+            elif kind == 'D':
+                deleted.add(key)
+            elif kind == 'U':
+                users[key] = rest[0]
+
+        stats = verify(directory, acknowledged, deleted, users)
+        results[f"round_{round_number + 1}"] = {
+            'acknowledged_ops': len(lines),
+            'meals': stats['meals'],
+            'replayed_records': stats['replayed_records'],
+            'recovery_s': stats['recovery_s']
+        }
+    return results
+
+
+def torn_tail(directory: str):
+    """Append half a record to the live segment and check recovery truncates it"""
+    journal = Journal(directory, snapshot_interval_s=0)
+    meals_before = len(journal.meal_store.meal_owners)
+    segment = max(name for name in os.listdir(directory) if name.startswith('wal-'))
+    journal.close()
+    with open(os.path.join(directory, segment), 'ab') as f:
+        f.write(b'\xff\x00\x00\x00\x12\x34\x56\x78{"partial')
+
+    journal = Journal(directory, snapshot_interval_s=0)
+    assert len(journal.meal_store.meal_owners) == meals_before
+    journal.close()
+    return {'meals': meals_before, 'recovered': True}
+
+
+def cold_recovery(preload: int):
+    """Time recovering `preload` meals from a snapshot plus a small log tail"""
+    with tempfile.TemporaryDirectory() as directory:
+        journal = Journal(directory, snapshot_interval_s=0)
+        users = max(1, preload // 1000)
+        for i in range(users):
+            journal.meal_store.add_meals(
+                [construct_meal_entry(d) for d in make_meal_dicts(preload // users, user_id=f"user-{i}", seed=i)]
+            )
+        snapshot = journal.snapshot()
+        journal.meal_store.add_meals([construct_meal_entry(d) for d in make_meal_dicts(1000, user_id='tail', seed=0)])
+        journal.close()
+
+        started = time.perf_counter()
+        recovered = Journal(directory, snapshot_interval_s=0)
+        elapsed = time.perf_counter() - started
+        stats = dict(recovered.recovery, recovery_s=round(elapsed, 3), snapshot_mb=round(snapshot['bytes'] / 2 ** 20, 1))
+        recovered.close()
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--preload', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--writer', metavar='DIR', help=argparse.SUPPRESS)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    if args.writer:
+        run_writer(args.writer, args.seed)
+        return
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        results = kill_rounds(directory, args.rounds, rng)
+        results['torn_tail'] = torn_tail(directory)
+    if args.preload:
+        results['cold_recovery'] = cold_recovery(args.preload)
+
+    print_report(f"Crash recovery ({args.rounds} kill rounds)", results, args.json,
+                 {'rounds': args.rounds, 'preload': args.preload})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Rollup benchmark - Range sums and downsampled series over multi-year histories
+
+Loads --meals meals spread over --days days for one user into the in-memory
+store, then times arbitrary date-range sums (day tree) against summing the
+daily rollups in range, the /series shapes (100 points, weekly, monthly)
+and the per-write cost of keeping week/month rollups and the tree current.
+
+Usage:
+    python -m benchmarks.bench_rollups [--meals 20000] [--days 1095] [--json]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.memory_store import InMemoryMealStore
+from services.rollups import DailyRollup
+from utils.serialization import construct_meal_entry
+from benchmarks.common import make_meal_dicts, measure, print_report
+
+USER_ID = 'bench-rollups'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--meals', type=int, default=20000)
+    parser.add_argument('--days', type=int, default=1095)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    meals = [construct_meal_entry(d) for d in make_meal_dicts(args.meals, user_id=USER_ID, days=args.days)]
+    store = InMemoryMealStore()
+    store.add_meals(meals)
+    rollups = store.rollups
+
+    end = date.today()
+    first = end - timedelta(days=args.days)
+    rng = random.Random(3)
+    ranges = []
+    for _ in range(args.queries):
+        a, b = sorted(rng.randrange(args.days + 1) for _ in range(2))
+        ranges.append((first + timedelta(days=a), first + timedelta(days=b)))
+
+    def scan_range(start, stop):
+        total = DailyRollup()
+        day = start
+        while day <= stop:
+            rollup = rollups.get(USER_ID, day)
+            if rollup is not None:
+                total.merge(rollup)
+            day += timedelta(days=1)
+        return total
+
+    results = {}
+    store.rollup_range(USER_ID, first, end)  # build the tree
+    for name, fn in (('tree_range_sum', store.rollup_range), ('daily_scan_range_sum',
+                                                                 lambda user_id, a, b: scan_range(a, b))):
+        started = time.perf_counter()
+        for a, b in ranges:
+            fn(USER_ID, a, b)
+        results[name] = {'us_per_query': round((time.perf_counter() - started) / len(ranges) * 1e6, 1)}
+
+    bucket_days = -(-(args.days + 1) // 100)
+    results['series_100_points'] = measure(lambda: store.rollup_series(USER_ID, first, end, bucket_days))
+    results['series_weekly'] = measure(lambda: store.rollup_series(USER_ID, first, end, 'week'))
+    results['series_monthly'] = measure(lambda: store.rollup_series(USER_ID, first, end, 'month'))
+
+    extra = [construct_meal_entry(d) for d in make_meal_dicts(5000, user_id=USER_ID, days=args.days, seed=9)]
+    started = time.perf_counter()
+    for meal in extra:
+        store.add_meal(meal)
+    results['add_meal_with_aggregates'] = {
+        'us_per_write': round((time.perf_counter() - started) / len(extra) * 1e6, 1)
+    }
+
+    print_report(f"Rollups ({args.meals} meals over {args.days} days, one user)", results, args.json,
+                 {'meals': args.meals, 'days': args.days})
+
+
+if __name__ == "__main__":
+    main()
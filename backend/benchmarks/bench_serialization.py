@@ -0,0 +1,97 @@
+"""
+Serialization benchmark - 1k-meal history response, before and after
+
+Compares FastAPI's generic path (jsonable_encoder + json.dumps) with the
+ORJSONResponse fast path, and per-food validation with the single-pass and
+trusted construction paths used by log_meal and the storage loaders.
+
+Usage:
+    python -m benchmarks.bench_serialization [--meals 1000] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+
+from models.food import NutritionInfo, DetectedFood
+from models.meal import MealEntry
+from utils.serialization import dumps, validate_detected_foods, construct_meal_entry
+from benchmarks.common import make_meal_dicts, measure, measure_allocations, print_report
+
+
+def build_validated(meal_dicts):
+    """Previous log_meal path: one NutritionInfo + DetectedFood construction per food"""
+    meals = []
+    for data in meal_dicts:
+        foods = [
+            DetectedFood(
+                food_id=food['food_id'],
+                food_name=food['food_name'],
+                confidence=food['confidence'],
+                estimated_portion_g=food['estimated_portion_g'],
+                bounding_box=food['bounding_box'],
+                nutrition=NutritionInfo(**food['nutrition'])
+            )
+            for food in data['detected_foods']
+        ]
+        meals.append(MealEntry(**{**data, 'detected_foods': foods,
+                                  'total_nutrition': NutritionInfo(**data['total_nutrition'])}))
+    return meals
+
+
+def build_single_pass(meal_dicts):
+    """Current log_meal path: the food list is validated in one call"""
+    return [
+        MealEntry(**{**data, 'detected_foods': validate_detected_foods(data['detected_foods']),
+                     'total_nutrition': NutritionInfo(**data['total_nutrition'])})
+        for data in meal_dicts
+    ]
+
+
+def build_trusted(meal_dicts):
+    """Trusted internal data: no validation at all"""
+    return [construct_meal_entry(data) for data in meal_dicts]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--meals', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    meal_dicts = make_meal_dicts(args.meals)
+    meals = build_trusted(meal_dicts)
+    content = {"user_id": "bench-user", "total_meals": len(meals), "returned": len(meals), "meals": meals}
+
+    def serialize_default():
+        return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False,
+                          indent=None, separators=(",", ":")).encode("utf-8")
+
+    def serialize_fast():
+        return dumps(content)
+
+    assert json.loads(serialize_default()) == json.loads(serialize_fast())
+
+    results = {
+        'serialize/jsonable_encoder': {**measure(serialize_default, args.repeat),
+                                       **measure_allocations(serialize_default)},
+        'serialize/orjson_response': {**measure(serialize_fast, args.repeat),
+                                      **measure_allocations(serialize_fast)},
+        'construct/per_food_validation': {**measure(lambda: build_validated(meal_dicts), args.repeat),
+                                          **measure_allocations(lambda: build_validated(meal_dicts))},
+        'construct/single_pass_validation': {**measure(lambda: build_single_pass(meal_dicts), args.repeat),
+                                             **measure_allocations(lambda: build_single_pass(meal_dicts))},
+        'construct/trusted': {**measure(lambda: build_trusted(meal_dicts), args.repeat),
+                              **measure_allocations(lambda: build_trusted(meal_dicts))},
+    }
+
+    print_report(f"Serialization of a {args.meals}-meal history", results, args.json, {'meals': args.meals})
+
+
+if __name__ == "__main__":
+    main()
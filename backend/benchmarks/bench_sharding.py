@@ -0,0 +1,137 @@
+"""
+Sharding benchmark - Per-user read/write throughput across shard processes
+
+For each shard count, starts that many shard servers on local sockets and
+--clients client processes that route a mixed workload (30% add_meal, 50%
+history page, 20% daily rollup) over random users through the sharded
+stores for --seconds. Reports aggregate operations per second and latency
+percentiles, then times a rebalance onto one extra shard.
+
+Scaling is bounded by the cores on the box (os.cpu_count() is reported).
+
+Usage:
+    python -m benchmarks.bench_sharding [--shards 1,2,4] [--clients 4] [--seconds 5] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.sharding import ShardClient, ShardRouter, ShardedMealStore, rebalance, shard_authkey
+from utils.serialization import construct_meal_entry
+from benchmarks.common import load_foods, make_meal_dict, make_meal_dicts, print_report
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_client(addresses, users: int, seconds: float, seed: int):
+    """Client process: run the workload and print one JSON line of results"""
+    from datetime import datetime
+    store = ShardedMealStore(ShardRouter([ShardClient(address, shard_authkey()) for address in addresses]))
+    rng = random.Random(seed)
+    foods = load_foods()
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        user_id = f"user-{rng.randrange(users)}"
+        roll = rng.random()
+        start = time.perf_counter()
+        if roll < 0.3:
+            store.add_meal(construct_meal_entry(make_meal_dict(user_id, datetime.utcnow(), foods, rng)))
+        elif roll < 0.8:
+            store.page_meals(user_id, limit=10)
+        else:
+            store.daily_rollup(user_id, datetime.utcnow().date())
+        latencies.append(time.perf_counter() - start)
+    print(json.dumps({'ops': len(latencies), 'latencies': latencies}))
+
+
+def start_shards(directory: str, count: int, first: int = 0):
+    addresses = [os.path.join(directory, f"shard-{i}.sock") for i in range(first, first + count)]
+    processes = [
+        subprocess.Popen([sys.executable, '-m', 'services.shard_server', 'serve', '--address', address],
+                         cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for address in addresses
+    ]
+    for address in addresses:
+        deadline = time.time() + 30
+        while True:
+            try:
+                ShardClient(address, shard_authkey()).call('shard.ping')
+                break
+            except (OSError, EOFError):
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+    return addresses, processes
+
+
+def run_round(shard_count: int, args):
+    with tempfile.TemporaryDirectory() as directory:
+        addresses, processes = start_shards(directory, shard_count)
+        try:
+            store = ShardedMealStore(ShardRouter([ShardClient(address, shard_authkey()) for address in addresses]))
+            for i in range(args.users):
+                user_id = f"user-{i}"
+                store.add_meals([construct_meal_entry(d) for d in make_meal_dicts(args.meals_per_user, user_id=user_id, seed=i)])
+
+            clients = [
+                subprocess.Popen(
+                    [sys.executable, '-m', 'benchmarks.bench_sharding', '--client', ','.join(addresses),
+                     '--users', str(args.users), '--seconds', str(args.seconds), '--seed', str(seed)],
+                    cwd=BACKEND_DIR, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+                )
+                for seed in range(args.clients)
+            ]
+            reports = [json.loads(client.communicate()[0].strip().splitlines()[-1]) for client in clients]
+            latencies = sorted(latency for report in reports for latency in report['latencies'])
+            ops = sum(report['ops'] for report in reports)
+            result = {
+                'ops_per_s': round(ops / args.seconds),
+                'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+                'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 3)
+            }
+
+            extra_addresses, extra_processes = start_shards(directory, 1, first=shard_count)
+            processes += extra_processes
+            moved = rebalance([ShardClient(address, shard_authkey()) for address in addresses + extra_addresses])
+            result['rebalance_users_moved_pct'] = round(100 * moved['users_moved'] / max(1, args.users), 1)
+            result['rebalance_s'] = moved['elapsed_s']
+            return result
+        finally:
+            for process in processes:
+                process.kill()
+                process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shards', default='1,2,4')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--meals-per-user', type=int, default=20)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--client', metavar='ADDRESSES', help=argparse.SUPPRESS)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+    os.environ.setdefault('SHARD_AUTHKEY', secrets.token_hex(16))  # inherited by shard and client processes
+
+    if args.client:
+        run_client(args.client.split(','), args.users, args.seconds, args.seed)
+        return
+
+    results = {f"{count}_shards": run_round(count, args) for count in (int(n) for n in args.shards.split(','))}
+    print_report(f"Sharded stores ({args.clients} client processes, {args.users} users)", results, args.json,
+                 {'cpu_count': os.cpu_count(), 'clients': args.clients, 'users': args.users})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Storage benchmark - Read/write throughput of the memory and SQLite backends
+
+Writes N meals spread across users, then measures point reads, history
+pages and full-day queries against each backend.
+
+Usage:
+    python -m benchmarks.bench_storage [--meals 20000] [--users 50] [--json]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, time as dtime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.memory_store import InMemoryMealStore
+from services.sqlite_store import SQLiteDatabase, SQLiteMealStore
+from utils.serialization import construct_meal_entry
+from benchmarks.common import make_meal_dicts, print_report
+
+
+def run_backend(store, meals, user_ids, reads: int):
+    """Measure write and read throughput (operations per second) for one store"""
+    rng = random.Random(7)
+    results = {}
+
+    start = time.perf_counter()
+    for meal in meals:
+        store.add_meal(meal)
+    elapsed = time.perf_counter() - start
+    results['write_ops_per_s'] = round(len(meals) / elapsed)
+
+    sample_ids = [rng.choice(meals).meal_id for _ in range(reads)]
+    start = time.perf_counter()
+    for meal_id in sample_ids:
+        store.get_meal(meal_id)
+    results['get_meal_ops_per_s'] = round(reads / (time.perf_counter() - start))
+
+    sample_users = [rng.choice(user_ids) for _ in range(reads)]
+    start = time.perf_counter()
+    for user_id in sample_users:
+        store.query_meals(user_id, limit=10, newest_first=True)
+    results['history_page_ops_per_s'] = round(reads / (time.perf_counter() - start))
+
+    sample_days = [rng.choice(meals).timestamp.date() for _ in range(reads)]
+    start = time.perf_counter()
+    for user_id, day in zip(sample_users, sample_days):
+        store.query_meals(user_id, start=datetime.combine(day, dtime.min), end=datetime.combine(day, dtime.max))
+    results['day_query_ops_per_s'] = round(reads / (time.perf_counter() - start))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--meals', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--reads', type=int, default=2000)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    user_ids = [f"user-{i}" for i in range(args.users)]
+    per_user = max(1, args.meals // args.users)
+    meals = []
+    for i, user_id in enumerate(user_ids):
+        meals.extend(construct_meal_entry(d) for d in make_meal_dicts(per_user, user_id=user_id, seed=i))
+
+    results = {'memory': run_backend(InMemoryMealStore(), meals, user_ids, args.reads)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = SQLiteDatabase(os.path.join(tmp, 'bench.db'))
+        results['sqlite'] = run_backend(SQLiteMealStore(database), meals, user_ids, args.reads)
+        database.close()
+
+    print_report(f"Storage throughput ({len(meals)} meals, {args.users} users)", results, args.json,
+                 {'meals': len(meals), 'users': args.users})
+
+
+if __name__ == "__main__":
+    main()
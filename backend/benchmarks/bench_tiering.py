@@ -0,0 +1,78 @@
+"""
+Tiering benchmark - Memory saved, hit rate and page-in latency of the tiered store
+
+Loads --users users into a TieredMealStore with a memory budget of
+--budget-pct of their resident size, then replays a skewed read workload
+(--hot-pct of users receive 90% of requests: history pages and daily
+summaries) and reports the store's stats alongside request latency.
+
+Usage:
+    python -m benchmarks.bench_tiering [--users 2000] [--meals-per-user 200] [--budget-pct 20] [--json]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.tiered_store import TieredMealStore
+from utils.serialization import construct_meal_entry
+from benchmarks.common import make_meal_dicts, print_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--meals-per-user', type=int, default=200)
+    parser.add_argument('--budget-pct', type=float, default=20)
+    parser.add_argument('--hot-pct', type=float, default=10)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = TieredMealStore(directory=directory, memory_budget_bytes=2 ** 62)
+        user_ids = [f"user-{i}" for i in range(args.users)]
+        for i, user_id in enumerate(user_ids):
+            store.add_meals([construct_meal_entry(d) for d in make_meal_dicts(args.meals_per_user, user_id=user_id, seed=i)])
+        full_bytes = store.stats()['resident_mb']
+
+        store.memory_budget_bytes = int(full_bytes * 2 ** 20 * args.budget_pct / 100)
+        store._enforce_budget()
+        store.hits = store.misses = 0
+
+        rng = random.Random(1)
+        hot = user_ids[:max(1, int(args.users * args.hot_pct / 100))]
+        today = datetime.utcnow().date()
+        latencies = []
+        for _ in range(args.requests):
+            user_id = rng.choice(hot) if rng.random() < 0.9 else rng.choice(user_ids)
+            start = time.perf_counter()
+            if rng.random() < 0.7:
+                store.page_meals(user_id, limit=10)
+            else:
+                store.daily_rollup(user_id, today)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+
+        stats = store.stats()
+        store.close()
+
+    results = {
+        'store': stats,
+        'requests': {
+            'p50_ms': round(latencies[len(latencies) // 2], 3),
+            'p99_ms': round(latencies[int(len(latencies) * 0.99)], 3),
+            'all_resident_mb': full_bytes
+        }
+    }
+    print_report(f"Tiered store ({args.users} users x {args.meals_per_user} meals, budget {args.budget_pct}%)",
+                 results, args.json, {'users': args.users, 'meals_per_user': args.meals_per_user})
+
+
+if __name__ == "__main__":
+    main()
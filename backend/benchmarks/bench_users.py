@@ -0,0 +1,82 @@
+"""
+User directory benchmark - Indexed email checks and pagination against scans
+
+Loads --users profiles into the in-memory user store (spread over health
+goals and genders) and times:
+
+    * email_scan / email_index: 100 uniqueness checks as create_user needs
+      them, as the old linear scan over every profile and as email index
+      lookups,
+    * list_all: serialising every user in one response (the old GET /users/),
+    * page_first / page_deep / page_filtered: one 50-user page at the start,
+      from a cursor near the end, and filtered by goal and gender from
+      the middle,
+    * batch_lookup: get_users() for 500 IDs.
+
+Usage:
+    python -m benchmarks.bench_users [--users 100000] [--json]
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.user import Gender, HealthGoal, UserProfile
+from services.memory_store import InMemoryUserStore
+from services.storage import encode_user_cursor
+from utils.serialization import dumps
+from benchmarks.common import measure, print_report
+
+GOALS = list(HealthGoal)
+GENDERS = list(Gender)
+EMAIL_CHECKS = 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    store = InMemoryUserStore()
+    start = datetime(2024, 1, 1)
+    for i in range(args.users):
+        store.create_user(UserProfile.model_construct(
+            user_id=f'bench-user-{i}', name='Bench', email=f'bench.user{i}@example.com', age=30,
+            gender=GENDERS[rng.randrange(3)], height_cm=170, weight_kg=70, health_goal=GOALS[rng.randrange(3)],
+            created_at=start + timedelta(seconds=i * 30)
+        ))
+
+    new_emails = [f'new.user{i}@example.com' for i in range(EMAIL_CHECKS)]  # worst case for the scan: no match
+    users, _ = store.page_users(limit=args.users)
+    deep_cursor = encode_user_cursor(users[-100])
+    middle_cursor = encode_user_cursor(users[len(users) // 2])
+    batch = [f'bench-user-{rng.randrange(args.users)}' for _ in range(500)]
+
+    results = {
+        'email_scan': measure(lambda: [next((u for u in store.users_db.values() if u.email == email), None)
+                                       for email in new_emails], repeat=max(2, args.repeat // 5), warmup=1),
+        'email_index': measure(lambda: [store.get_user_by_email(email) for email in new_emails], repeat=args.repeat),
+        'list_all': measure(lambda: dumps(store.list_users()), repeat=max(2, args.repeat // 5), warmup=1),
+        'page_first': measure(lambda: dumps(store.page_users(limit=50)[0]), repeat=args.repeat),
+        'page_deep': measure(lambda: dumps(store.page_users(limit=50, cursor=deep_cursor)[0]), repeat=args.repeat),
+        'page_filtered': measure(lambda: dumps(store.page_users(limit=50, cursor=middle_cursor,
+                                                                health_goal='muscle_gain', gender='female')[0]),
+                                 repeat=args.repeat),
+        'batch_lookup': measure(lambda: dumps(store.get_users(batch)), repeat=args.repeat)
+    }
+    results['speedup'] = {
+        'email_x': round(results['email_scan']['p50_ms'] / max(results['email_index']['p50_ms'], 0.001), 1),
+        'page_vs_list_x': round(results['list_all']['p50_ms'] / results['page_deep']['p50_ms'], 1)
+    }
+
+    print_report(f"User directory ({args.users} users)", results, args.json, {'users': args.users})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Write-behind benchmark - Logged meals per second, synchronous vs write-behind
+
+Simulates a meal-time peak: --threads concurrent writers (like the
+request threadpool) each log meals one at a time with add_meal. Every
+durable backend is measured with synchronous writes and wrapped in
+WriteBehindMealStore. Throughput includes draining the queue at the end.
+
+Usage:
+    python -m benchmarks.bench_write_behind [--meals 20000] [--threads 16] [--json]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.persistence import Journal
+from services.sqlite_store import SQLiteDatabase, SQLiteMealStore
+from services.write_behind import WriteBehindMealStore
+from utils.serialization import construct_meal_entry
+from benchmarks.common import make_meal_dicts, print_report
+
+
+def run_writers(store, meals, threads: int):
+    """Log meals from `threads` threads; returns throughput and ack latency stats"""
+    chunks = [meals[i::threads] for i in range(threads)]
+    latencies = [[] for _ in range(threads)]
+
+    def writer(index):
+        samples = latencies[index]
+        for meal in chunks[index]:
+            start = time.perf_counter()
+            store.add_meal(meal)
+            samples.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=writer, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    acked = time.perf_counter()
+    if isinstance(store, WriteBehindMealStore):
+        store.close()
+    drained = time.perf_counter()
+
+    samples = sorted(sample for thread_samples in latencies for sample in thread_samples)
+    return {
+        'meals_per_s': round(len(meals) / (drained - started)),
+        'ack_p50_ms': round(samples[len(samples) // 2] * 1000, 3),
+        'ack_p99_ms': round(samples[int(len(samples) * 0.99)] * 1000, 3),
+        'drain_ms': round((drained - acked) * 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--meals', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    per_user = max(1, args.meals // args.users)
+    meals = []
+    for i in range(args.users):
+        meals.extend(construct_meal_entry(d) for d in make_meal_dicts(per_user, user_id=f"user-{i}", days=7, seed=i))
+
+    results = {}
+    for mode in ('sync', 'write_behind'):
+        with tempfile.TemporaryDirectory() as tmp:
+            database = SQLiteDatabase(os.path.join(tmp, 'bench.db'))
+            store = SQLiteMealStore(database)
+            if mode == 'write_behind':
+                store = WriteBehindMealStore(store, batch_size=args.batch_size)
+            results[f"sqlite_{mode}"] = run_writers(store, meals, args.threads)
+            database.close()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = Journal(tmp, snapshot_interval_s=0)
+            store = journal.meal_store
+            if mode == 'write_behind':
+                store = WriteBehindMealStore(store, batch_size=args.batch_size)
+            results[f"memory_wal_{mode}"] = run_writers(store, meals, args.threads)
+            journal.close()
+
+    print_report(f"Meal logging ({len(meals)} meals, {args.threads} writer threads)", results, args.json,
+                 {'meals': len(meals), 'threads': args.threads, 'batch_size': args.batch_size})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Shared helpers for the benchmark scripts
+
+Run benchmarks from the backend directory, e.g.:
+    python -m benchmarks.bench_serialization
+"""
+import json
+import random
+import statistics
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+FOOD_DB_PATH = Path(__file__).parent.parent.parent / "data" / "indian_food_nutrition.json"
+
+MEAL_TYPE_WEIGHTS = {'breakfast': 0.28, 'lunch': 0.30, 'dinner': 0.30, 'snack': 0.12}
+
+
+def load_foods() -> List[Dict]:
+    """Load the real food database used for synthetic meals"""
+    with open(FOOD_DB_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)['foods']
+
+
+def make_meal_dict(user_id: str, timestamp: datetime, foods: List[Dict], rng: random.Random) -> Dict[str, Any]:
+    """Build one meal document in the shape produced by /food/recognize + /meals/"""
+    meal_type = rng.choices(list(MEAL_TYPE_WEIGHTS), weights=list(MEAL_TYPE_WEIGHTS.values()))[0]
+    detected = []
+    total = {'calories': 0.0, 'protein': 0.0, 'carbs': 0.0, 'fat': 0.0, 'fiber': 0.0, 'sugar': 0.0, 'sodium': 0.0}
+
+    for i, food in enumerate(rng.sample(foods, rng.randint(1, 3))):
+        grams = round(rng.uniform(50, 300), 1)
+        factor = grams / 100.0
+        nutrition = {key: round(food['per_100g'].get(key, 0) * factor, 1) for key in total}
+        for key in total:
+            total[key] += nutrition[key]
+        detected.append({
+            'food_id': food['id'],
+            'food_name': food['name'],
+            'confidence': round(rng.uniform(0.6, 0.99), 3),
+            'estimated_portion_g': grams,
+            'bounding_box': {'x': 0.1 + i * 0.05, 'y': 0.1 + i * 0.05, 'width': 0.7, 'height': 0.7},
+            'nutrition': nutrition
+        })
+
+    return {
+        'meal_id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'meal_type': meal_type,
+        'detected_foods': detected,
+        'total_nutrition': {key: round(value, 1) for key, value in total.items()},
+        'image_path': None,
+        'notes': None,
+        'timestamp': timestamp,
+        'alerts': []
+    }
+
+
+def make_meal_dicts(count: int, user_id: str = 'bench-user', days: int = 365, seed: int = 42) -> List[Dict[str, Any]]:
+    """Generate `count` meals spread over the last `days` days, oldest first"""
+    rng = random.Random(seed)
+    foods = load_foods()
+    end = datetime.utcnow()
+    start = end - timedelta(days=days)
+    span = (end - start).total_seconds()
+    timestamps = sorted(start + timedelta(seconds=rng.uniform(0, span)) for _ in range(count))
+    return [make_meal_dict(user_id, ts, foods, rng) for ts in timestamps]
+
+
+def measure(fn: Callable[[], Any], repeat: int = 20, warmup: int = 2) -> Dict[str, float]:
+    """Time `fn` and return latency statistics in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'mean_ms': round(statistics.mean(samples), 3),
+        'p50_ms': round(samples[len(samples) // 2], 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+        'min_ms': round(samples[0], 3)
+    }
+
+
+def measure_allocations(fn: Callable[[], Any]) -> Dict[str, int]:
+    """Run `fn` once under tracemalloc and report allocation counts and peak bytes"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    result = fn()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    diff = after.compare_to(before, 'filename')
+    return {
+        'peak_bytes': peak,
+        'allocated_blocks': sum(max(0, stat.count_diff) for stat in diff)
+    }
+
+
+def print_report(title: str, results: Dict[str, Any], as_json: bool = False, extra: Optional[Dict] = None):
+    """Print benchmark results either as a table or as one JSON document"""
+    if as_json:
+        print(json.dumps({'benchmark': title, **(extra or {}), 'results': results}, indent=2, default=str))
+        return
+
+    print("=" * 60)
+    print(f"📈 {title}")
+    print("=" * 60)
+    for name, stats in results.items():
+        line = ", ".join(f"{key}={value}" for key, value in stats.items())
+        print(f"  {name:<34} {line}")
@@ -0,0 +1,185 @@
+"""Offline fixtures for the recognize benchmarks
+
+    * FakeGemini: stands in for genai.GenerativeModel. It sleeps for a
+      configurable latency (with jitter) and answers in one of several
+      response shapes seen from the real model, so the parsing, fuzzy
+      matching and fallback paths are all reachable without a network or
+      an API key.
+    * make_plate_image / encode_image: synthetic plate photos (table, plate
+      with a rim, textured food blobs) at any resolution, encoded as JPEG
+      with OpenCV or Pillow, or as PNG with only zlib when neither is
+      installed (backend/cv2.py, the stand-in module, does not count).
+"""
+import json
+import random
+import struct
+import time
+import zlib
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+RESOLUTIONS = {
+    'vga': (640, 480),
+    'hd': (1280, 960),
+    'fhd': (1920, 1440),
+    'phone': (4032, 3024)
+}
+
+# 'unknown_foods' exercises fuzzy matching and the default food, 'unparseable'
+# and 'empty' the fallback detections
+RESPONSE_SHAPES = ('json', 'fenced', 'prose', 'unknown_foods', 'unparseable', 'empty')
+
+# Approximate RGB of dishes (same profiles the color matcher scores against)
+FOOD_COLORS = [
+    (217, 217, 204), (179, 153, 102), (166, 140, 89), (191, 166, 77),
+    (153, 115, 64), (191, 179, 140), (153, 128, 77), (204, 191, 128)
+]
+TABLE_COLOR = (120, 85, 55)
+PLATE_COLOR = (238, 238, 232)
+
+
+class FakeGemini:
+    """Local stand-in for genai.GenerativeModel with configurable latency and responses"""
+
+    def __init__(self, food_ids: Sequence[str], latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 shape: str = 'json', items: int = 2, seed: int = 0):
+        if shape not in RESPONSE_SHAPES:
+            raise ValueError(f"Unknown response shape: {shape}")
+        self.food_ids = list(food_ids)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.shape = shape
+        self.items = items
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    def generate_content(self, contents):
+        self.calls += 1
+        delay_ms = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms))
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        return SimpleNamespace(text=self.respond())
+
+    def respond(self) -> str:
+        """Response text in the configured shape"""
+        if self.shape == 'unparseable':
+            return "I can see a plate of food, it looks delicious!"
+        if self.shape == 'empty':
+            return "[]"
+
+        if self.shape == 'unknown_foods':
+            names = ['paneer tikka masala', 'mystery curry', 'rice'][:self.items]
+        else:
+            names = self.rng.sample(self.food_ids, min(self.items, len(self.food_ids)))
+        detections = json.dumps([
+            {'food_id': name, 'confidence': round(self.rng.uniform(0.7, 0.98), 2), 'description': f"{name} on a plate"}
+            for name in names
+        ], indent=2)
+
+        if self.shape == 'fenced':
+            return f"```json\n{detections}\n```"
+        if self.shape == 'prose':
+            return f"Here are the foods I identified in the image:\n{detections}\nLet me know if you need more detail."
+        return detections
+
+
+def install_fake_gemini(classifier, fake: FakeGemini) -> bool:
+    """
+    Route a FoodClassifier's Gemini path to `fake`
+
+    The Gemini path decodes the upload with Pillow before calling the model,
+    so this returns False (and leaves the classifier on color matching) when
+    Pillow is not installed.
+    """
+    from ml import food_classifier as classifier_module
+    if not hasattr(classifier_module, 'Image'):
+        try:
+            from PIL import Image
+        except ImportError:
+            return False
+        classifier_module.Image = Image
+
+    classifier.model = fake
+    classifier.api_key = 'fake-gemini-key'
+    classifier.use_gemini = True
+    return True
+
+
+def make_plate_image(width: int, height: int, foods: int = 3, seed: int = 0) -> np.ndarray:
+    """RGB uint8 image of a plate with `foods` textured food portions on a table"""
+    rng = np.random.default_rng(seed)
+    ys, xs = np.ogrid[0:height, 0:width]
+    cy, cx = height / 2, width / 2
+    radius = 0.42 * min(width, height)
+    plate_distance = (ys - cy) ** 2 + (xs - cx) ** 2
+
+    image = np.empty((height, width, 3), dtype=np.float32)
+    image[:] = TABLE_COLOR
+    image[plate_distance <= radius ** 2] = PLATE_COLOR
+    image[(plate_distance <= radius ** 2) & (plate_distance >= (0.9 * radius) ** 2)] = np.subtract(PLATE_COLOR, 25)
+
+    for i in range(foods):
+        angle = 2 * np.pi * i / max(foods, 1) + rng.uniform(0, 0.5)
+        offset = 0.35 * radius if foods > 1 else 0.0
+        fy, fx = cy + offset * np.sin(angle), cx + offset * np.cos(angle)
+        ry, rx = rng.uniform(0.22, 0.32) * radius, rng.uniform(0.22, 0.32) * radius
+        mask = ((ys - fy) / ry) ** 2 + ((xs - fx) / rx) ** 2 <= 1
+        image[mask] = FOOD_COLORS[int(rng.integers(len(FOOD_COLORS)))]
+
+    # Sensor noise gives the food (and the decoder) some texture to work with
+    image += rng.normal(0, 10, size=(height, width, 1)).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def _encode_png(pixels: np.ndarray) -> bytes:
+    height, width, _ = pixels.shape
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), pixels.reshape(height, width * 3)], axis=1)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw.tobytes(), 6))
+            + chunk(b'IEND', b''))
+
+
+def encode_image(pixels: np.ndarray, quality: int = 90) -> Tuple[bytes, str, str]:
+    """
+    Encode an RGB image like a phone upload
+
+    Returns:
+        (data, content_type, file_extension): JPEG via OpenCV or Pillow,
+        PNG when neither is installed
+    """
+    try:
+        import cv2  # type: ignore
+        if hasattr(cv2, '__version__'):  # not backend/cv2.py, the no-op stand-in
+            ok, buffer = cv2.imencode('.jpg', pixels[:, :, ::-1], [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if ok:
+                return buffer.tobytes(), 'image/jpeg', '.jpg'
+    except ImportError:
+        pass
+
+    try:
+        import io
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=quality)
+        return buffer.getvalue(), 'image/jpeg', '.jpg'
+    except ImportError:
+        return _encode_png(pixels), 'image/png', '.png'
+
+
+def make_detections(food_database: Dict[str, Dict], food_ids: Optional[List[str]] = None,
+                    count: int = 3) -> List[Dict]:
+    """Detections in the shape detect_multiple_foods() returns"""
+    food_ids = food_ids or list(food_database)[:count]
+    return [{
+        'food_id': food_id,
+        'food_name': food_database[food_id]['name'],
+        'confidence': 0.9,
+        'bounding_box': {'x': 0.1 + i * 0.05, 'y': 0.1 + i * 0.05, 'width': 0.7, 'height': 0.7},
+        'food_data': food_database[food_id]
+    } for i, food_id in enumerate(food_ids)]
@@ -0,0 +1,196 @@
+"""
+Workload generator - Fill the configured stores with realistic user histories
+
+Generates --users profiles (gender, age, height, BMI-derived weight and
+health goal drawn from plausible distributions) and --meals meals shared
+out between them with a log-normal activity skew, so a few users log a lot
+and most log a little. Each user joined at a random point within the last
+--days days; their meals fall on days since then at meal-type-specific times
+of day, with meal types drawn from MEAL_TYPE_WEIGHTS and foods drawn from the
+real food database, breakfasts preferring breakfast dishes.
+
+Everything is derived from --seed and the user's index, so a workload is
+reproducible and the load benchmark can recompute user ids and activity
+without reading the stores back. Meals are written in batches through
+add_meals(), keeping memory bounded to what the store itself holds.
+
+Run against a persistent backend (sqlite, or memory with WAL_DIR) to build a
+large dataset once, e.g.:
+    STORAGE_BACKEND=sqlite python -m benchmarks.workload --users 100000 --meals 50000000
+
+Usage:
+    python -m benchmarks.workload [--users 1000] [--meals 100000] [--days 365] [--seed 42] [--json]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.user import UserProfile
+from utils.serialization import construct_meal_entry
+from benchmarks.common import MEAL_TYPE_WEIGHTS, load_foods, make_meal_dict, print_report
+
+GOAL_WEIGHTS = {'weight_loss': 0.45, 'maintenance': 0.35, 'muscle_gain': 0.20}
+GENDER_WEIGHTS = {'female': 0.49, 'male': 0.49, 'other': 0.02}
+
+# Hours of the day (start, end) each meal type is logged in
+MEAL_HOURS = {'breakfast': (7, 10), 'lunch': (12, 15), 'dinner': (19, 22), 'snack': (16, 18)}
+
+# Food categories each meal type draws from (every category is allowed for lunch/dinner)
+MEAL_CATEGORIES = {
+    'breakfast': {'breakfast', 'bread', 'dairy', 'side_dish'},
+    'snack': {'snack', 'dessert', 'dairy'}
+}
+
+BATCH_SIZE = 20000
+
+
+@dataclass
+class Workload:
+    """A reproducible synthetic population"""
+    users: int = 1000
+    meals: int = 100_000
+    days: int = 365
+    activity_sigma: float = 1.0
+    seed: int = 42
+
+    def user_id(self, index: int) -> str:
+        return f"load-user-{index}"
+
+    def meal_counts(self) -> np.ndarray:
+        """Meals per user, summing to `meals`, log-normally skewed"""
+        rng = np.random.default_rng(self.seed)
+        weights = rng.lognormal(0.0, self.activity_sigma, self.users)
+        return rng.multinomial(self.meals, weights / weights.sum())
+
+    def make_user(self, index: int) -> UserProfile:
+        rng = random.Random(f"{self.seed}:user:{index}")
+        gender = rng.choices(list(GENDER_WEIGHTS), weights=list(GENDER_WEIGHTS.values()))[0]
+        height_cm = rng.gauss(176 if gender == 'male' else 163, 7)
+        bmi = min(max(rng.gauss(24.5, 4), 16), 42)
+        return UserProfile(
+            user_id=self.user_id(index),
+            name=f"Load User {index}",
+            email=f"load.user.{index}@example.com",
+            age=int(min(max(rng.gauss(36, 12), 18), 85)),
+            gender=gender,
+            height_cm=round(height_cm, 1),
+            weight_kg=round(bmi * (height_cm / 100) ** 2, 1),
+            health_goal=rng.choices(list(GOAL_WEIGHTS), weights=list(GOAL_WEIGHTS.values()))[0]
+        )
+
+    def make_meals(self, index: int, count: int, foods_by_type: Dict[str, List[Dict]],
+                   now: datetime) -> List[Dict]:
+        """`count` meal documents for one user, oldest first"""
+        rng = random.Random(f"{self.seed}:meals:{index}")
+        user_id = self.user_id(index)
+        history_days = rng.randint(1, max(1, self.days))
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        meals = []
+        for _ in range(count):
+            meal_type = rng.choices(list(MEAL_TYPE_WEIGHTS), weights=list(MEAL_TYPE_WEIGHTS.values()))[0]
+            first_hour, last_hour = MEAL_HOURS[meal_type]
+            timestamp = (midnight - timedelta(days=rng.randrange(history_days))
+                         + timedelta(hours=rng.uniform(first_hour, last_hour)))
+            if timestamp > now:
+                timestamp -= timedelta(days=1)
+            meal = make_meal_dict(user_id, timestamp, foods_by_type[meal_type], rng)
+            meal['meal_type'] = meal_type
+            meals.append(meal)
+        meals.sort(key=lambda meal: meal['timestamp'])
+        return meals
+
+
+def foods_by_meal_type(foods: List[Dict]) -> Dict[str, List[Dict]]:
+    by_type = {}
+    for meal_type in MEAL_TYPE_WEIGHTS:
+        categories = MEAL_CATEGORIES.get(meal_type)
+        matching = [food for food in foods if categories is None or food.get('category') in categories]
+        # make_meal_dict samples up to 3 foods per meal
+        by_type[meal_type] = matching if len(matching) >= 3 else foods
+    return by_type
+
+
+def populate(workload: Workload, meal_store, user_store, batch_size: int = BATCH_SIZE,
+             on_progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, float]:
+    """
+    Write the workload's users and meals into the given stores
+
+    Args:
+        workload: The population to generate
+        meal_store: Store receiving meals through add_meals()
+        user_store: Store receiving profiles through save_user()
+        batch_size: Meals per add_meals() call
+        on_progress: Called with (users_done, meals_done) after every batch
+
+    Returns:
+        Counts and generation/write throughput
+    """
+    foods = foods_by_meal_type(load_foods())
+    counts = workload.meal_counts()
+    now = datetime.utcnow()
+    started = time.perf_counter()
+
+    batch, written = [], 0
+    for index in range(workload.users):
+        user_store.save_user(workload.make_user(index))
+        batch.extend(construct_meal_entry(meal)
+                     for meal in workload.make_meals(index, int(counts[index]), foods, now))
+        if len(batch) >= batch_size or index == workload.users - 1:
+            meal_store.add_meals(batch)
+            written += len(batch)
+            batch = []
+            if on_progress is not None:
+                on_progress(index + 1, written)
+
+    seconds = time.perf_counter() - started
+    return {
+        'users': workload.users,
+        'meals': written,
+        'max_meals_per_user': int(counts.max()) if workload.users else 0,
+        'seconds': round(seconds, 2),
+        'meals_per_s': round(written / seconds) if seconds else 0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--meals', type=int, default=100_000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--activity-sigma', type=float, default=1.0, help='Log-normal spread of meals per user')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', action='store_true', help='Emit results as JSON')
+    args = parser.parse_args()
+
+    from services.storage import close_stores, create_meal_store, create_user_store
+    workload = Workload(args.users, args.meals, args.days, args.activity_sigma, args.seed)
+    meal_store, user_store = create_meal_store(), create_user_store()
+
+    def progress(users_done: int, meals_done: int):
+        if not args.json:
+            print(f"\r  {users_done}/{args.users} users, {meals_done}/{args.meals} meals", end='', flush=True)
+
+    stats = populate(workload, meal_store, user_store, on_progress=progress)
+    if not args.json:
+        print()
+    close_stores()
+
+    print_report(f"Workload ({args.users} users, {args.meals} meals)", {'populate': stats}, args.json, {
+        'storage': os.getenv('STORAGE_BACKEND', 'memory'),
+        'days': args.days,
+        'seed': args.seed
+    })
+
+
+if __name__ == "__main__":
+    main()
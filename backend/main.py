@@ -3,6 +3,7 @@
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import os
 from pathlib import Path
 
@@ -19,7 +20,28 @@ try:
 except ImportError:
     print("⚠️ python-dotenv not installed. Install with: pip install python-dotenv")
 
-app = FastAPI(title="Nutrition AI")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background jobs (JOBS_DIR): resume interrupted runs, then follow schedules
+    from routes.analytics import job_scheduler
+    if job_scheduler is not None:
+        from services.storage import on_shutdown
+        job_scheduler.start()
+        on_shutdown(job_scheduler.stop)
+    yield
+    # Flush write-behind queues and the write-ahead log before exiting
+    from services.storage import close_stores
+    close_stores()
+
+app = FastAPI(title="Nutrition AI", lifespan=lifespan)
+
+# Writes refused while the write-behind queue is full: the client should retry
+from fastapi.responses import JSONResponse
+from services.storage import StoreBusyError
+
+@app.exception_handler(StoreBusyError)
+async def store_busy(request, exc):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
 
 # CORS config for local dev
 app.add_middleware(
@@ -35,6 +57,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency histograms and in-flight gauge (METRICS_ENABLED=0 to disable)
+from services.metrics import CONTENT_TYPE, MetricsMiddleware, metrics_enabled, registry
+if metrics_enabled():
+    app.add_middleware(MetricsMiddleware)
+
 # Routers to be included here
 from routes import food, user, meal, analytics
 app.include_router(food.router, tags=["food"])
@@ -42,7 +69,23 @@ app.include_router(user.router, tags=["user"])
 app.include_router(meal.router, tags=["meal"])
 app.include_router(analytics.router, tags=["analytics"])
 
+# On-demand CPU/memory profiling, not installed at all unless PROFILING_ENABLED=1
+from services.profiling import ProfilingMiddleware, profiling_enabled
+if profiling_enabled():
+    from routes import admin
+    if admin.cpu_profiler.token:
+        app.include_router(admin.router, tags=["admin"])
+    else:
+        print("⚠️ PROFILE_TOKEN not set: /admin/profiling is not mounted and X-Profile headers are ignored")
+    app.add_middleware(ProfilingMiddleware, profiler=admin.cpu_profiler)
+
 @app.get("/")
 def read_root():
     return {"msg": "Nutrition AI backend is running!"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus text exposition of every registered metric"""
+    from fastapi.responses import PlainTextResponse
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
+
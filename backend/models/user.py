@@ -1,6 +1,6 @@
 """User Model - Stores user profile and health information"""
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Dict, List, NamedTuple, Optional
 from datetime import datetime
 from enum import Enum
 
@@ -16,6 +16,55 @@ class Gender(str, Enum):
     FEMALE = "female"
     OTHER = "other"
 
+# Inputs of the derived targets (see compute_profile_metrics)
+ACTIVITY_FACTOR = 1.55  # moderate activity
+GENDER_BMR_OFFSETS = {Gender.MALE: 5, Gender.FEMALE: -161, Gender.OTHER: -80}  # other: average
+GOAL_CALORIE_OFFSETS = {HealthGoal.WEIGHT_LOSS: -500, HealthGoal.MUSCLE_GAIN: 300, HealthGoal.MAINTENANCE: 0}
+GOAL_PROTEIN_G_PER_KG = {HealthGoal.WEIGHT_LOSS: 1.6, HealthGoal.MUSCLE_GAIN: 2.0, HealthGoal.MAINTENANCE: 1.6}
+CARBS_CALORIE_SHARE = 0.475
+FAT_CALORIE_SHARE = 0.275
+
+# Fields the derived metrics depend on; assigning any of them drops the cached metrics
+METRIC_INPUTS = frozenset({'age', 'gender', 'height_cm', 'weight_kg', 'health_goal'})
+
+
+class ProfileMetrics(NamedTuple):
+    """Health metrics derived from a profile's body measurements and goal"""
+    bmi: float
+    bmr: float
+    tdee: float
+    daily_calorie_target: int
+    daily_protein_target_g: int
+    daily_carbs_target_g: int
+    daily_fat_target_g: int
+
+
+def compute_profile_metrics(age: int, gender: Gender, height_cm: float, weight_kg: float,
+                            health_goal: HealthGoal) -> ProfileMetrics:
+    """
+    BMI, BMR/TDEE and daily targets for one profile
+
+    BMR follows the Mifflin-St Jeor equation
+        BMR = (10 × weight in kg) + (6.25 × height in cm) - (5 × age in years) + s
+    where s = +5 for males and -161 for females; TDEE applies the activity
+    factor and the calorie target the health goal's surplus or deficit.
+    services.profile_metrics computes the same for many profiles at once.
+    """
+    height_m = height_cm / 100
+    bmr = (10 * weight_kg) + (6.25 * height_cm) - (5 * age) + GENDER_BMR_OFFSETS.get(gender, -80)
+    tdee = bmr * ACTIVITY_FACTOR
+    calories = int(tdee + GOAL_CALORIE_OFFSETS.get(health_goal, 0))
+    return ProfileMetrics(
+        bmi=round(weight_kg / (height_m ** 2), 2),
+        bmr=bmr,
+        tdee=tdee,
+        daily_calorie_target=calories,
+        daily_protein_target_g=int(weight_kg * GOAL_PROTEIN_G_PER_KG.get(health_goal, 1.6)),
+        daily_carbs_target_g=int(calories * CARBS_CALORIE_SHARE / 4),
+        daily_fat_target_g=int(calories * FAT_CALORIE_SHARE / 9)
+    )
+
+
 class UserProfile(BaseModel):
     """User profile with health information"""
     user_id: str = Field(..., description="Unique user identifier")
@@ -28,48 +77,51 @@ class UserProfile(BaseModel):
     health_goal: HealthGoal
     created_at: datetime = Field(default_factory=datetime.utcnow)
     
+    # Derived metrics, computed on first access and kept until an input changes
+    _metrics: Optional[ProfileMetrics] = PrivateAttr(default=None)
+    
+    def __setattr__(self, name, value):
+        if name in METRIC_INPUTS and getattr(self, name, None) != value:
+            self.__pydantic_private__['_metrics'] = None
+        super().__setattr__(name, value)
+    
+    @property
+    def metrics(self) -> ProfileMetrics:
+        """Cached derived metrics (BMI, BMR/TDEE and daily targets)"""
+        # Read the private dict directly: attribute access to private fields
+        # goes through BaseModel.__getattr__, which costs as much as recomputing
+        private = self.__pydantic_private__
+        metrics = private['_metrics']
+        if metrics is None:
+            metrics = private['_metrics'] = compute_profile_metrics(
+                self.age, self.gender, self.height_cm, self.weight_kg, self.health_goal
+            )
+        return metrics
+    
     @property
     def bmi(self) -> float:
-        """Calculate BMI (Body Mass Index)"""
-        height_m = self.height_cm / 100
-        return round(self.weight_kg / (height_m ** 2), 2)
+        """BMI (Body Mass Index)"""
+        return self.metrics.bmi
     
     @property
     def daily_calorie_target(self) -> int:
-        """
-        Calculate daily calorie target based on Mifflin-St Jeor equation
-        BMR = (10 × weight in kg) + (6.25 × height in cm) - (5 × age in years) + s
-        where s = +5 for males and -161 for females
-        """
-        # Calculate BMR (Basal Metabolic Rate)
-        bmr = (10 * self.weight_kg) + (6.25 * self.height_cm) - (5 * self.age)
-        
-        if self.gender == Gender.MALE:
-            bmr += 5
-        elif self.gender == Gender.FEMALE:
-            bmr -= 161
-        else:
-            bmr -= 80  # Average for other
-        
-        # Activity factor (assuming moderate activity)
-        tdee = bmr * 1.55
-        
-        # Adjust based on health goal
-        if self.health_goal == HealthGoal.WEIGHT_LOSS:
-            target = tdee - 500  # 500 cal deficit for weight loss
-        elif self.health_goal == HealthGoal.MUSCLE_GAIN:
-            target = tdee + 300  # 300 cal surplus for muscle gain
-        else:
-            target = tdee  # Maintenance
-        
-        return int(target)
+        """Daily calorie target: Mifflin-St Jeor BMR x activity factor, adjusted for the health goal"""
+        return self.metrics.daily_calorie_target
     
     @property
     def daily_protein_target_g(self) -> int:
-        """Calculate daily protein target in grams"""
-        if self.health_goal == HealthGoal.MUSCLE_GAIN:
-            return int(self.weight_kg * 2.0)
-        return int(self.weight_kg * 1.6)
+        """Daily protein target in grams"""
+        return self.metrics.daily_protein_target_g
+    
+    @property
+    def daily_carbs_target_g(self) -> int:
+        """Daily carbohydrate target in grams (47.5% of calories)"""
+        return self.metrics.daily_carbs_target_g
+    
+    @property
+    def daily_fat_target_g(self) -> int:
+        """Daily fat target in grams (27.5% of calories)"""
+        return self.metrics.daily_fat_target_g
 
 class UserCreate(BaseModel):
     """Model for creating a new user"""
@@ -82,3 +134,14 @@ class UserCreate(BaseModel):
     health_goal: HealthGoal
 
 
+
+class UserLookup(BaseModel):
+    """Model for fetching several users by ID"""
+    user_ids: List[str]
+
+class BulkTargetsRequest(BaseModel):
+    """Model for recomputing health targets of many users, optionally with new formula parameters"""
+    user_ids: List[str]
+    activity_factor: Optional[float] = Field(None, gt=0)
+    goal_calorie_offsets: Dict[HealthGoal, float] = Field(default_factory=dict)
+    goal_protein_g_per_kg: Dict[HealthGoal, float] = Field(default_factory=dict)
@@ -0,0 +1,142 @@
+"""Admin Routes - Retrieve CPU profiles of live requests and memory snapshots
+
+Only mounted when PROFILING_ENABLED=1 and PROFILE_TOKEN is set (see
+services/profiling.py); every endpoint requires the token in the
+X-Admin-Token header. require_token also guards admin operations mounted
+elsewhere (POST /analytics/jobs/{name}/run, POST /meals/rollups/rebuild).
+"""
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+import hmac
+
+from services.profiling import DEFAULT_TRACE_FRAMES, MemoryProfiler, create_cpu_profiler
+
+
+async def require_token(x_admin_token: Optional[str] = Header(None)):
+    """Reject requests without the configured PROFILE_TOKEN (all of them when none is configured)"""
+    if cpu_profiler.token is None or x_admin_token is None or not hmac.compare_digest(
+            x_admin_token.encode('utf-8'), cpu_profiler.token.encode('utf-8')):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin/profiling", tags=["Admin"], dependencies=[Depends(require_token)])
+
+# Profilers (installed as middleware by main.py)
+cpu_profiler = create_cpu_profiler()
+memory_profiler = MemoryProfiler()
+
+
+@router.get("/")
+async def get_profiling_status():
+    """
+    Profiler settings and state
+
+    Returns:
+        CPU profiler settings/counters and tracemalloc status
+    """
+    return {
+        "cpu": cpu_profiler.stats(),
+        "memory": memory_profiler.status()
+    }
+
+
+@router.get("/profiles")
+async def list_profiles():
+    """
+    List kept CPU profiles, newest first
+
+    Returns:
+        Profile summaries (path, trigger, duration, samples)
+    """
+    profiles = cpu_profiler.list()
+    return {
+        "total_profiles": len(profiles),
+        "profiles": profiles
+    }
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = "json", top: int = 20):
+    """
+    Get one CPU profile
+
+    Args:
+        profile_id: X-Profile-Id of the profiled response
+        format: "json" (summary and top functions) or "folded" (flamegraph input)
+        top: Number of functions in the JSON summary
+
+    Returns:
+        The profile summary with its hottest functions, or folded stacks as text
+    """
+    profile = cpu_profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        return PlainTextResponse(profile.folded())
+    if format != "json":
+        raise HTTPException(status_code=400, detail=f"Invalid format: {format}")
+
+    return {
+        **profile.summary(),
+        "top_functions": profile.top_functions(top)
+    }
+
+
+@router.delete("/profiles")
+async def clear_profiles():
+    """
+    Drop every kept CPU profile
+
+    Returns:
+        Number of profiles removed
+    """
+    return {"removed": cpu_profiler.clear()}
+
+
+@router.post("/memory/start")
+async def start_memory_tracing(frames: int = DEFAULT_TRACE_FRAMES):
+    """
+    Start tracing allocations with tracemalloc
+
+    Args:
+        frames: Stack frames kept per allocation
+
+    Returns:
+        Tracing status
+    """
+    if frames < 1:
+        raise HTTPException(status_code=400, detail="frames must be at least 1")
+    return memory_profiler.start(frames)
+
+
+@router.post("/memory/snapshot")
+async def take_memory_snapshot(limit: int = 25, group_by: str = "lineno"):
+    """
+    Snapshot traced allocations and diff against the previous snapshot
+
+    Args:
+        limit: Allocation sites to return
+        group_by: "lineno", "filename" or "traceback"
+
+    Returns:
+        Top allocation sites and, from the second snapshot on, the sites
+        that grew since the previous one
+    """
+    try:
+        return memory_profiler.snapshot(limit, group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.post("/memory/stop")
+async def stop_memory_tracing():
+    """
+    Stop tracing allocations and drop the previous snapshot
+
+    Returns:
+        Tracing status
+    """
+    return memory_profiler.stop()
@@ -1,18 +1,137 @@
 """Analytics Routes - Provide nutrition analytics and insights"""
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from typing import Optional, List
-from datetime import datetime, date, timedelta
-from collections import defaultdict
+from datetime import datetime, date, time, timedelta
+import functools
+import inspect
+import os
+
+from models.user import HealthGoal, UserProfile
+from services.analytics_cache import MISS, create_analytics_cache, create_report_store
+from services.analytics_engine import ADHERENCE_RANGE, DailySeries, round_series
+from services.metrics import registry
+from services.population import UNKNOWN_COHORT
+from services.rollups import RESOLUTIONS, DailyRollup, PeriodRollup, next_period, period_start
+from services.scheduler import DEFAULT_CHUNK_SIZE, Job, create_job_scheduler, jobs_dir
+from utils.serialization import NUTRIENT_FIELDS
 
 router = APIRouter(prefix="/analytics", tags=["Analytics"])
 
 # Import from other routes to access data
-from routes.meal import meals_db, user_meals_index
-from routes.user import users_db
+from routes.admin import require_token
+from routes.meal import meal_store
+from routes.user import user_store
+
+# Population sketches are partitioned by each user's health goal
+meal_store.set_profile_source(user_store.get_user)
+
+DASHBOARD_WIDGETS = ('daily_summary', 'goal_progress', 'macro_distribution', 'weekly_summary', 'food_frequency')
+
+# Results cached per user until their meals (or profile, or the date) change
+analytics_cache = create_analytics_cache()
+
+# Reports precomputed by the background job (None unless JOBS_DIR is set)
+job_scheduler = create_job_scheduler()
+report_store = create_report_store(jobs_dir())
+
+
+def _cache_metrics():
+    """Analytics cache and report store counters, read from their stats when /metrics is scraped"""
+    stats = analytics_cache.stats()
+    endpoints = stats['endpoints'].items()
+    families = [
+        ('analytics_cache_hits_total', 'counter', 'Analytics results served from the cache',
+         [({'endpoint': endpoint}, counts['hits']) for endpoint, counts in endpoints]),
+        ('analytics_cache_misses_total', 'counter', 'Analytics results computed on a cache miss',
+         [({'endpoint': endpoint}, counts['misses']) for endpoint, counts in endpoints]),
+        ('analytics_cache_bytes', 'gauge', 'Estimated size of cached analytics results', [({}, stats['bytes'])]),
+        ('analytics_cache_evictions_total', 'counter', 'Analytics cache evictions', [({}, stats['evictions'])])
+    ]
+    if report_store is not None:
+        reports = report_store.stats()
+        families.append(('report_store_hits_total', 'counter', 'Reads served by precomputed reports',
+                         [({}, reports['hits'])]))
+        families.append(('report_store_misses_total', 'counter', 'Reads with no current precomputed report',
+                         [({}, reports['misses'])]))
+    return families
+
+
+registry.collector(_cache_metrics)
+
+
+def _day_range(start_date: date, end_date: date):
+    """Inclusive datetime bounds covering whole days"""
+    return datetime.combine(start_date, time.min), datetime.combine(end_date, time.max)
+
+
+def _daily_series(user_id: str, start_date: date, end_date: date) -> DailySeries:
+    """Per-day totals for a user over [start_date, end_date], from one snapshot"""
+    with meal_store.snapshot(user_id) as snapshot:
+        arrays = snapshot.meal_arrays(*_day_range(start_date, end_date))
+    return DailySeries.from_arrays(arrays, start_date, end_date)
+
+
+def _profile_key(user_id: str):
+    """The user's profile fields, or None without a profile"""
+    user = user_store.get_user(user_id)
+    return None if user is None else tuple(user.__dict__.values())
+
+
+def _version(user_id: str, uses_profile: bool):
+    """What a cached result depends on besides its parameters"""
+    version = (meal_store.data_version(user_id), date.today())
+    if uses_profile:
+        version += (_profile_key(user_id),)
+    return version
+
+
+def _cached(endpoint: str, uses_profile: bool = False):
+    """
+    Serve a handler from analytics_cache while its inputs are unchanged
+
+    Results are keyed by the query parameters and versioned by the user's
+    meal data version and today's date (windows end today), plus the
+    profile for handlers that read it. Errors are never cached. On a miss,
+    a report precomputed at the same version (see precompute_reports) is
+    served before computing.
+    """
+    def decorate(handler):
+        signature = inspect.signature(handler)
+
+        def cache_key(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+            return params.pop('user_id'), tuple(params.items())
+
+        @functools.wraps(handler)
+        def cached_handler(*args, **kwargs):
+            if not analytics_cache.enabled and report_store is None:
+                return handler(*args, **kwargs)
+            user_id, key = cache_key(*args, **kwargs)
+            # Read the version before computing: the result is at least this fresh
+            version = _version(user_id, uses_profile)
+
+            result = analytics_cache.get(user_id, endpoint, key, version) if analytics_cache.enabled else MISS
+            if result is MISS:
+                if report_store is not None:
+                    result = report_store.get(user_id, endpoint, key, version)
+                if result is MISS:
+                    result = handler(*args, **kwargs)
+                if analytics_cache.enabled:
+                    analytics_cache.put(user_id, endpoint, key, version, result)
+            return result
+
+        cached_handler.endpoint = endpoint
+        cached_handler.uses_profile = uses_profile
+        cached_handler.cache_key = cache_key
+        return cached_handler
+    return decorate
 
 
 @router.get("/{user_id}/weekly-summary")
-async def get_weekly_summary(user_id: str, weeks: int = 1):
+@_cached("weekly-summary")
+def get_weekly_summary(user_id: str, weeks: int = 1):
     """
     Get weekly nutrition summary
     
@@ -23,7 +142,7 @@ async def get_weekly_summary(user_id: str, weeks: int = 1):
     Returns:
         Weekly nutrition breakdown
     """
-    if user_id not in user_meals_index:
+    if not meal_store.has_meals(user_id):
         return {
             "user_id": user_id,
             "message": "No meal data found",
@@ -33,67 +152,12 @@ async def get_weekly_summary(user_id: str, weeks: int = 1):
     # Get date range
     end_date = date.today()
     start_date = end_date - timedelta(days=weeks * 7)
-    
-    # Get meals in date range
-    meal_ids = user_meals_index[user_id]
-    daily_totals = defaultdict(lambda: {
-        'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0, 'meals': 0
-    })
-    
-    for meal_id in meal_ids:
-        if meal_id in meals_db:
-            meal = meals_db[meal_id]
-            meal_date = meal.timestamp.date()
-            
-            if start_date <= meal_date <= end_date:
-                nutrition = meal.total_nutrition
-                daily_totals[meal_date]['calories'] += nutrition.calories
-                daily_totals[meal_date]['protein'] += nutrition.protein
-                daily_totals[meal_date]['carbs'] += nutrition.carbs
-                daily_totals[meal_date]['fat'] += nutrition.fat
-                daily_totals[meal_date]['meals'] += 1
-    
-    # Format for response
-    weekly_data = []
-    current_date = start_date
-    while current_date <= end_date:
-        data = daily_totals.get(current_date, {
-            'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0, 'meals': 0
-        })
-        weekly_data.append({
-            'date': current_date.isoformat(),
-            'day_name': current_date.strftime('%A'),
-            **data
-        })
-        current_date += timedelta(days=1)
-    
-    # Calculate averages
-    total_days = len([d for d in weekly_data if d['meals'] > 0])
-    if total_days > 0:
-        avg_calories = sum(d['calories'] for d in weekly_data) / total_days
-        avg_protein = sum(d['protein'] for d in weekly_data) / total_days
-        avg_carbs = sum(d['carbs'] for d in weekly_data) / total_days
-        avg_fat = sum(d['fat'] for d in weekly_data) / total_days
-    else:
-        avg_calories = avg_protein = avg_carbs = avg_fat = 0
-    
-    return {
-        "user_id": user_id,
-        "period": f"{start_date.isoformat()} to {end_date.isoformat()}",
-        "total_days": len(weekly_data),
-        "days_with_data": total_days,
-        "averages": {
-            "calories": round(avg_calories, 1),
-            "protein": round(avg_protein, 1),
-            "carbs": round(avg_carbs, 1),
-            "fat": round(avg_fat, 1)
-        },
-        "daily_breakdown": weekly_data
-    }
+    return _weekly_summary(user_id, _daily_series(user_id, start_date, end_date))
 
 
 @router.get("/{user_id}/macro-distribution")
-async def get_macro_distribution(user_id: str, days: int = 7):
+@_cached("macro-distribution", uses_profile=True)
+def get_macro_distribution(user_id: str, days: int = 7):
     """
     Get macronutrient distribution analysis
     
@@ -104,32 +168,540 @@ async def get_macro_distribution(user_id: str, days: int = 7):
     Returns:
         Macro distribution percentages and trends
     """
-    if user_id not in user_meals_index:
+    if not meal_store.has_meals(user_id):
         raise HTTPException(status_code=404, detail="No data found for user")
     
     # Get meals from last N days
     end_date = date.today()
     start_date = end_date - timedelta(days=days)
+    series = _daily_series(user_id, start_date, end_date)
+    return _macro_distribution(user_id, days, series, user_store.get_user(user_id) is not None)
+
+
+@router.get("/{user_id}/goal-progress")
+@_cached("goal-progress", uses_profile=True)
+def get_goal_progress(user_id: str):
+    """
+    Track progress towards health goals
+    
+    Args:
+        user_id: User identifier
+        
+    Returns:
+        Progress metrics and insights
+    """
+    user = user_store.get_user(user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    today = date.today()
+    return _goal_progress(user, meal_store.daily_rollup(user_id, today), today)
+
+
+@router.get("/{user_id}/food-frequency")
+@_cached("food-frequency")
+def get_food_frequency(user_id: str, days: int = 30):
+    """
+    Analyze most frequently consumed foods
+    
+    Args:
+        user_id: User identifier
+        days: Number of days to analyze
+        
+    Returns:
+        Food frequency analysis
+    """
+    if not meal_store.has_meals(user_id):
+        return {
+            "message": "No meal data found",
+            "food_frequency": []
+        }
+    
+    # Top 20 over the last N days from the user's sliding food window
+    end_date = date.today()
+    start_date = end_date - timedelta(days=days)
+    return _food_frequency(user_id, days, *meal_store.top_foods(user_id, start_date, end_date, k=20))
+
+
+@router.get("/{user_id}/rolling")
+@_cached("rolling")
+def get_rolling_averages(
+    user_id: str,
+    days: int = 30,
+    windows: str = "7,30",
+    nutrients: str = "calories,protein,carbs,fat"
+):
+    """
+    Daily totals with trailing rolling means
+    
+    Args:
+        user_id: User identifier
+        days: Number of days to return (ending today)
+        windows: Comma-separated rolling window lengths in days
+        nutrients: Comma-separated nutrient fields
+        
+    Returns:
+        One entry per day with totals and <nutrient>_avg_<window>d means
+        (averaged over days with data; null when a window has none)
+    """
+    if days < 1:
+        raise HTTPException(status_code=400, detail="days must be at least 1")
+    window_list = _parse_ints(windows, "windows")
+    fields = _parse_fields(nutrients)
+    
+    # Load enough history for the longest window to be full on the first day
+    end_date = date.today()
+    start_date = end_date - timedelta(days=days - 1)
+    series = _daily_series(user_id, start_date - timedelta(days=max(window_list) - 1), end_date)
+    
+    columns = {'meals': series.meals[-days:].tolist()}
+    for field in fields:
+        columns[field] = round_series(series.totals[field][-days:])
+        for window in window_list:
+            columns[f"{field}_avg_{window}d"] = round_series(series.rolling_mean(field, window)[-days:])
+    
+    dates = series.tail(days).dates()
+    return {
+        "user_id": user_id,
+        "period": f"{start_date.isoformat()} to {end_date.isoformat()}",
+        "windows": window_list,
+        "daily": [
+            {'date': day.isoformat(), **{name: values[i] for name, values in columns.items()}}
+            for i, day in enumerate(dates)
+        ]
+    }
+
+
+@router.get("/{user_id}/trends")
+@_cached("trends", uses_profile=True)
+def get_trends(user_id: str, days: int = 30, nutrients: Optional[str] = None):
+    """
+    Linear trends and calorie-target adherence streaks
+    
+    Args:
+        user_id: User identifier
+        days: Number of days to analyze (ending today)
+        nutrients: Comma-separated nutrient fields (default: all)
+        
+    Returns:
+        Least-squares slope (per day and per week) and r^2 of daily totals
+        over days with data, plus adherence streaks when the user has a profile
+    """
+    if days < 1:
+        raise HTTPException(status_code=400, detail="days must be at least 1")
+    fields = _parse_fields(nutrients) if nutrients else list(NUTRIENT_FIELDS)
+    
+    end_date = date.today()
+    start_date = end_date - timedelta(days=days - 1)
+    series = _daily_series(user_id, start_date, end_date)
+    
+    trends = {}
+    for field, fit in series.trends(fields).items():
+        slope = fit['slope_per_day']
+        trends[field] = {
+            "slope_per_day": round(slope, 2) if slope is not None else None,
+            "slope_per_week": round(slope * 7, 2) if slope is not None else None,
+            "r2": round(fit['r2'], 3) if fit['r2'] is not None else None
+        }
+    
+    adherence = None
+    user = user_store.get_user(user_id)
+    if user is not None and user.daily_calorie_target > 0:
+        streaks = series.streaks(user.daily_calorie_target)
+        logged_days = series.days_with_data()
+        adherence = {
+            "calorie_target": user.daily_calorie_target,
+            "target_range_percent": [round(bound * 100) for bound in ADHERENCE_RANGE],
+            **streaks,
+            "adherence_percent": round(streaks['adherent_days'] / logged_days * 100, 1) if logged_days else 0.0
+        }
+    
+    return {
+        "user_id": user_id,
+        "period": f"{start_date.isoformat()} to {end_date.isoformat()}",
+        "days_with_data": series.days_with_data(),
+        "averages": {field: round(value, 1) for field, value in series.averages(fields).items()},
+        "trends": trends,
+        "adherence": adherence
+    }
+
+
+@router.get("/{user_id}/series")
+@_cached("series")
+def get_series(
+    user_id: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    resolution: str = "day",
+    points: Optional[int] = None,
+    nutrients: str = "calories,protein,carbs,fat"
+):
+    """
+    Downsampled nutrition series for long-horizon charts
+    
+    Args:
+        user_id: User identifier
+        start: First date YYYY-MM-DD (default: 364 days before end)
+        end: Last date YYYY-MM-DD (default: today)
+        resolution: day, week or month (ignored when points is given)
+        points: Point budget; the range is split into equal N-day buckets
+        nutrients: Comma-separated nutrient fields
+        
+    Returns:
+        One point per period (including empty ones) with totals and the
+        average per day with data, served from pre-aggregated rollups
+    """
+    fields = _parse_fields(nutrients)
+    end_date, start_date = _parse_range(start, end, default_days=365)
+    
+    if points is not None:
+        if points < 1:
+            raise HTTPException(status_code=400, detail="points must be at least 1")
+        bucket_days = -(-((end_date - start_date).days + 1) // points)
+        period = 'day' if bucket_days == 1 else bucket_days
+    elif resolution in RESOLUTIONS:
+        period = resolution
+    else:
+        raise HTTPException(status_code=400, detail=f"Invalid resolution: {resolution}")
+    
+    rollups = dict(meal_store.rollup_series(user_id, start_date, end_date, period))
+    
+    series = []
+    current = period_start(start_date, period, origin=start_date)
+    while current <= end_date:
+        following = next_period(current, period)
+        rollup = rollups.get(current) or PeriodRollup()
+        point = {
+            'start': max(current, start_date).isoformat(),
+            'end': min(following - timedelta(days=1), end_date).isoformat(),
+            'meals': rollup.meals_count,
+            'days_logged': rollup.days_logged
+        }
+        for field in fields:
+            total = getattr(rollup, field)
+            point[field] = round(total, 1)
+            point[f"{field}_daily_avg"] = round(total / rollup.days_logged, 1) if rollup.days_logged else None
+        series.append(point)
+        current = following
+    
+    return {
+        "user_id": user_id,
+        "period": f"{start_date.isoformat()} to {end_date.isoformat()}",
+        "resolution": period if isinstance(period, str) else f"{period}d",
+        "points": series
+    }
+
+
+@router.get("/{user_id}/range-summary")
+@_cached("range-summary")
+def get_range_summary(user_id: str, start: Optional[str] = None, end: Optional[str] = None):
+    """
+    Nutrition totals and daily averages over any date range
+    
+    Args:
+        user_id: User identifier
+        start: First date YYYY-MM-DD (default: 29 days before end)
+        end: Last date YYYY-MM-DD (default: today)
+        
+    Returns:
+        Totals, meal and logged-day counts, and averages per day with data
+    """
+    end_date, start_date = _parse_range(start, end, default_days=30)
+    rollup = meal_store.rollup_range(user_id, start_date, end_date)
+    totals = rollup.to_dict()
+    
+    return {
+        "user_id": user_id,
+        "period": f"{start_date.isoformat()} to {end_date.isoformat()}",
+        "total_days": (end_date - start_date).days + 1,
+        "days_logged": totals.pop('days_logged'),
+        "meals": totals.pop('meals_count'),
+        "totals": totals,
+        "daily_averages": {
+            field: round(getattr(rollup, field) / rollup.days_logged, 1) if rollup.days_logged else 0.0
+            for field in NUTRIENT_FIELDS
+        }
+    }
+
+
+@router.get("/{user_id}/dashboard")
+@_cached("dashboard", uses_profile=True)
+def get_dashboard(
+    user_id: str,
+    fields: Optional[str] = None,
+    weeks: int = 1,
+    macro_days: int = 7,
+    food_days: int = 30
+):
+    """
+    All dashboard widgets in one request
+    
+    Args:
+        user_id: User identifier
+        fields: Comma-separated widgets to include (default: all of
+            daily_summary, goal_progress, macro_distribution, weekly_summary,
+            food_frequency)
+        weeks: Weeks for weekly_summary
+        macro_days: Days for macro_distribution
+        food_days: Days for food_frequency
+        
+    Returns:
+        The requested widgets, each shaped like its own endpoint's response;
+        goal_progress is None without a profile and the meal widgets carry
+        their "No meal data" responses without meals
+    """
+    widgets = _parse_widgets(fields)
+    if min(weeks, macro_days, food_days) < 0:
+        raise HTTPException(status_code=400, detail="weeks and days must not be negative")
+    
+    today = date.today()
+    has_meals = meal_store.has_meals(user_id)
+    dashboard = {"user_id": user_id, "date": today.isoformat()}
+    
+    # Today's totals (one rollup read) serve both the daily summary and goal progress
+    rollup = None
+    if 'daily_summary' in widgets or 'goal_progress' in widgets:
+        rollup = meal_store.daily_rollup(user_id, today)
+    user = user_store.get_user(user_id) if widgets & {'goal_progress', 'macro_distribution'} else None
+    
+    # One snapshot scan over the widest window; each widget takes its tail
+    series = None
+    spans = [days for widget, days in (('weekly_summary', weeks * 7), ('macro_distribution', macro_days))
+             if widget in widgets]
+    if has_meals and spans:
+        series = _daily_series(user_id, today - timedelta(days=max(spans)), today)
+    
+    if 'daily_summary' in widgets:
+        dashboard['daily_summary'] = (rollup or DailyRollup()).to_summary(user_id, today)
+    if 'goal_progress' in widgets:
+        dashboard['goal_progress'] = _goal_progress(user, rollup, today) if user is not None else None
+    if 'macro_distribution' in widgets:
+        dashboard['macro_distribution'] = (
+            _macro_distribution(user_id, macro_days, series.tail(macro_days + 1), user is not None)
+            if series is not None else {"message": "No data found for user"}
+        )
+    if 'weekly_summary' in widgets:
+        dashboard['weekly_summary'] = (
+            _weekly_summary(user_id, series.tail(weeks * 7 + 1)) if series is not None
+            else {"user_id": user_id, "message": "No meal data found", "weekly_data": []}
+        )
+    if 'food_frequency' in widgets:
+        dashboard['food_frequency'] = (
+            _food_frequency(user_id, food_days,
+                            *meal_store.top_foods(user_id, today - timedelta(days=food_days), today, k=20))
+            if has_meals else {"message": "No meal data found", "food_frequency": []}
+        )
+    
+    return dashboard
+
+
+@router.get("/population")
+def get_population(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    goals: Optional[str] = None,
+    top_foods: int = 10,
+    raw: bool = False
+):
+    """
+    Population distributions across all users, from mergeable sketches
+    
+    Args:
+        start: First date YYYY-MM-DD (default: 29 days before end)
+        end: Last date YYYY-MM-DD (default: today)
+        goals: Comma-separated health goals to include (default: all,
+            'unknown' for users without a profile)
+        top_foods: Number of most common foods per cohort
+        raw: Return the serialized per (day, goal) sketches instead, for
+            merging with other deployments' summaries
+        
+    Returns:
+        Overall and per-goal daily calorie percentiles, protein adherence,
+        estimated unique users and most common foods (approximate; see
+        services.population)
+    """
+    end_date, start_date = _parse_range(start, end, default_days=30)
+    cohorts = None
+    if goals:
+        cohorts = {goal.strip() for goal in goals.split(',') if goal.strip()}
+        unknown = cohorts - {goal.value for goal in HealthGoal} - {UNKNOWN_COHORT}
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown health goals: {', '.join(sorted(unknown))}")
+    if top_foods < 0:
+        raise HTTPException(status_code=400, detail="top_foods must not be negative")
+    
+    summary = meal_store.population_summary(start_date, end_date)
+    if raw:
+        return summary.to_dict()
+    return {
+        "period": f"{start_date.isoformat()} to {end_date.isoformat()}",
+        **summary.report(cohorts, top_foods)
+    }
+
+
+@router.get("/jobs")
+def get_jobs():
+    """
+    Background job status
     
-    meal_ids = user_meals_index[user_id]
-    total_protein = 0
-    total_carbs = 0
-    total_fat = 0
-    total_calories = 0
-    
-    for meal_id in meal_ids:
-        if meal_id in meals_db:
-            meal = meals_db[meal_id]
-            meal_date = meal.timestamp.date()
-            
-            if start_date <= meal_date <= end_date:
-                nutrition = meal.total_nutrition
-                total_protein += nutrition.protein
-                total_carbs += nutrition.carbs
-                total_fat += nutrition.fat
-                total_calories += nutrition.calories
-    
-    if total_calories == 0:
+    Returns:
+        Each job's schedule, last and next fire and recent runs with
+        progress, plus precomputed report counts and hit rate
+    """
+    if job_scheduler is None:
+        return {"enabled": False, "message": "Set JOBS_DIR to enable background jobs"}
+    return {"enabled": True, **job_scheduler.status(), "reports": report_store.stats()}
+
+
+@router.post("/jobs/{name}/run", dependencies=[Depends(require_token)])
+def run_job(name: str):
+    """
+    Start a job now (or return its current run); requires the admin token
+    (PROFILE_TOKEN) in X-Admin-Token, so it is refused when none is set
+    
+    Args:
+        name: Job name
+        
+    Returns:
+        The run id; progress is reported by GET /analytics/jobs
+    """
+    if job_scheduler is None:
+        raise HTTPException(status_code=503, detail="Background jobs are disabled (set JOBS_DIR)")
+    if name not in job_scheduler.jobs:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {name}")
+    return {"job": name, "run_id": job_scheduler.trigger(name)}
+
+
+@router.get("/cache/stats")
+def get_cache_stats():
+    """
+    Analytics cache metrics
+    
+    Returns:
+        Entries, memory use against the budget, evictions, and hit rates
+        overall and per endpoint (stale = miss after the user's data changed)
+    """
+    return analytics_cache.stats()
+
+
+# Precomputed reports: the endpoints a dashboard opens with, at default parameters
+REPORT_HANDLERS = (get_weekly_summary, get_macro_distribution, get_food_frequency)
+
+DEFAULT_REPORTS_SCHEDULE = "0 3 * * *"  # nightly, off-peak
+
+
+def precompute_reports(user_ids: List[str]) -> List[tuple]:
+    """Compute REPORT_HANDLERS for a chunk of users (runs in a job worker process)"""
+    reports = []
+    for user_id in user_ids:
+        for handler in REPORT_HANDLERS:
+            _, key = handler.cache_key(user_id)
+            version = _version(user_id, handler.uses_profile)
+            try:
+                result = handler.__wrapped__(user_id)
+            except HTTPException:
+                continue
+            reports.append((user_id, handler.endpoint, key, version, result))
+    return reports
+
+
+def _report_user_ids() -> List[str]:
+    return sorted(user.user_id for user in user_store.list_users())
+
+
+if job_scheduler is not None:
+    job_scheduler.register(Job(
+        'precompute-reports',
+        os.getenv('REPORTS_SCHEDULE', DEFAULT_REPORTS_SCHEDULE),
+        items=_report_user_ids,
+        work=precompute_reports,
+        collect=report_store.put_many,
+        chunk_size=int(os.getenv('JOB_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+    ))
+
+
+def _parse_widgets(fields: Optional[str]) -> set:
+    """Dashboard field mask (all widgets when omitted)"""
+    if not fields:
+        return set(DASHBOARD_WIDGETS)
+    widgets = {field.strip() for field in fields.split(',') if field.strip()}
+    unknown = widgets - set(DASHBOARD_WIDGETS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown dashboard fields: {', '.join(sorted(unknown))}")
+    return widgets
+
+
+def _parse_range(start: Optional[str], end: Optional[str], default_days: int):
+    """(end, start) dates from optional YYYY-MM-DD parameters"""
+    try:
+        end_date = date.fromisoformat(end) if end else date.today()
+        start_date = date.fromisoformat(start) if start else end_date - timedelta(days=default_days - 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return end_date, start_date
+
+
+def _parse_ints(value: str, name: str) -> List[int]:
+    """Positive integers from a comma-separated query parameter"""
+    try:
+        numbers = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: {value}")
+    if not numbers or min(numbers) < 1:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: {value}")
+    return numbers
+
+
+def _parse_fields(value: str) -> List[str]:
+    """Nutrient fields from a comma-separated query parameter"""
+    fields = [part.strip() for part in value.split(',') if part.strip()]
+    unknown = [field for field in fields if field not in NUTRIENT_FIELDS]
+    if not fields or unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown nutrients: {', '.join(unknown) or value}")
+    return fields
+
+
+def _weekly_summary(user_id: str, series: DailySeries) -> dict:
+    """weekly-summary body from a daily series"""
+    start_date, end_date = series.first_day, series.first_day + timedelta(days=len(series) - 1)
+    
+    # Format for response
+    calories, protein, carbs, fat = (series.totals[field].tolist() for field in ('calories', 'protein', 'carbs', 'fat'))
+    weekly_data = [
+        {
+            'date': current_date.isoformat(),
+            'day_name': current_date.strftime('%A'),
+            'calories': calories[i],
+            'protein': protein[i],
+            'carbs': carbs[i],
+            'fat': fat[i],
+            'meals': meals
+        }
+        for i, (current_date, meals) in enumerate(zip(series.dates(), series.meals.tolist()))
+    ]
+    
+    # Calculate averages (over days with data)
+    total_days = series.days_with_data()
+    averages = series.averages(('calories', 'protein', 'carbs', 'fat'))
+    
+    return {
+        "user_id": user_id,
+        "period": f"{start_date.isoformat()} to {end_date.isoformat()}",
+        "total_days": len(weekly_data),
+        "days_with_data": total_days,
+        "averages": {field: round(value, 1) for field, value in averages.items()},
+        "daily_breakdown": weekly_data
+    }
+
+
+def _macro_distribution(user_id: str, days: int, series: DailySeries, has_profile: bool) -> dict:
+    """macro-distribution body from a daily series"""
+    totals = series.sums(('protein', 'carbs', 'fat', 'calories'))
+    total_protein, total_carbs, total_fat = totals['protein'], totals['carbs'], totals['fat']
+    
+    if totals['calories'] == 0:
         return {
             "message": "No meal data in the specified period",
             "protein_percent": 0,
@@ -137,24 +709,13 @@ async def get_macro_distribution(user_id: str, days: int = 7):
             "fat_percent": 0
         }
     
-    # Calculate macro percentages (calories from each macro)
-    protein_calories = total_protein * 4  # 4 cal/g
-    carbs_calories = total_carbs * 4  # 4 cal/g
-    fat_calories = total_fat * 9  # 9 cal/g
-    
-    total_macro_calories = protein_calories + carbs_calories + fat_calories
-    
-    if total_macro_calories > 0:
-        protein_percent = (protein_calories / total_macro_calories) * 100
-        carbs_percent = (carbs_calories / total_macro_calories) * 100
-        fat_percent = (fat_calories / total_macro_calories) * 100
-    else:
-        protein_percent = carbs_percent = fat_percent = 0
+    # Calculate macro percentages (calories from each macro: 4/4/9 cal per g)
+    percentages = series.macro_percentages()
+    protein_percent, carbs_percent, fat_percent = percentages['protein'], percentages['carbs'], percentages['fat']
     
     # Get user targets if available
     targets = {}
-    if user_id in users_db:
-        user = users_db[user_id]
+    if has_profile:
         targets = {
             "target_protein_percent": 25,  # Typical: 20-30%
             "target_carbs_percent": 50,  # Typical: 45-55%
@@ -179,36 +740,10 @@ async def get_macro_distribution(user_id: str, days: int = 7):
     }
 
 
-@router.get("/{user_id}/goal-progress")
-async def get_goal_progress(user_id: str):
-    """
-    Track progress towards health goals
-    
-    Args:
-        user_id: User identifier
-        
-    Returns:
-        Progress metrics and insights
-    """
-    if user_id not in users_db:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    user = users_db[user_id]
-    
-    # Get today's summary
-    today = date.today()
-    daily_calories = 0
-    daily_protein = 0
-    
-    if user_id in user_meals_index:
-        meal_ids = user_meals_index[user_id]
-        for meal_id in meal_ids:
-            if meal_id in meals_db:
-                meal = meals_db[meal_id]
-                if meal.timestamp.date() == today:
-                    nutrition = meal.total_nutrition
-                    daily_calories += nutrition.calories
-                    daily_protein += nutrition.protein
+def _goal_progress(user: UserProfile, rollup: Optional[DailyRollup], today: date) -> dict:
+    """goal-progress body from the profile and today's rollup"""
+    daily_calories = rollup.calories if rollup is not None else 0
+    daily_protein = rollup.protein if rollup is not None else 0
     
     # Calculate progress
     calorie_target = user.daily_calorie_target
@@ -233,7 +768,7 @@ async def get_goal_progress(user_id: str):
         protein_status = "Excellent"
     
     return {
-        "user_id": user_id,
+        "user_id": user.user_id,
         "health_goal": user.health_goal,
         "date": today.isoformat(),
         "calorie_progress": {
@@ -254,61 +789,24 @@ async def get_goal_progress(user_id: str):
     }
 
 
-@router.get("/{user_id}/food-frequency")
-async def get_food_frequency(user_id: str, days: int = 30):
-    """
-    Analyze most frequently consumed foods
-    
-    Args:
-        user_id: User identifier
-        days: Number of days to analyze
-        
-    Returns:
-        Food frequency analysis
-    """
-    if user_id not in user_meals_index:
-        return {
-            "message": "No meal data found",
-            "food_frequency": []
-        }
-    
-    # Get meals from last N days
-    end_date = date.today()
-    start_date = end_date - timedelta(days=days)
-    
-    food_counts = defaultdict(lambda: {'count': 0, 'total_grams': 0.0, 'name': ''})
-    
-    meal_ids = user_meals_index[user_id]
-    for meal_id in meal_ids:
-        if meal_id in meals_db:
-            meal = meals_db[meal_id]
-            meal_date = meal.timestamp.date()
-            
-            if start_date <= meal_date <= end_date:
-                for food in meal.detected_foods:
-                    food_counts[food.food_id]['count'] = int(food_counts[food.food_id]['count']) + 1
-                    food_counts[food.food_id]['total_grams'] = float(food_counts[food.food_id]['total_grams']) + float(food.estimated_portion_g)
-                    food_counts[food.food_id]['name'] = food.food_name
-    
-    # Sort by frequency
+def _food_frequency(user_id: str, days: int, top_foods: List, unique_foods: int) -> dict:
+    """food-frequency body from MealStore.top_foods"""
     frequency_list = [
         {
-            'food_id': food_id,
-            'food_name': data['name'],
-            'times_consumed': int(data['count']),
-            'total_grams': round(float(data['total_grams']), 1),
-            'avg_portion_g': round(float(data['total_grams']) / float(data['count']), 1)
+            "food_id": food_id,
+            "food_name": food_name,
+            "times_consumed": count,
+            "total_grams": round(total_grams, 1),
+            "avg_portion_g": round(total_grams / count, 1)
         }
-        for food_id, data in food_counts.items()
+        for food_id, food_name, count, total_grams in top_foods
     ]
     
-    frequency_list.sort(key=lambda x: x['times_consumed'], reverse=True)
-    
     return {
         "user_id": user_id,
         "period_days": days,
-        "unique_foods": len(frequency_list),
-        "food_frequency": frequency_list[:20]  # Top 20
+        "unique_foods": unique_foods,
+        "food_frequency": frequency_list
     }
 
 
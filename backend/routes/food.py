@@ -1,12 +1,14 @@
 """Food Recognition Routes - Handle food image upload and recognition"""
 from fastapi import APIRouter, File, UploadFile, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
-from typing import Optional
+from typing import Dict, Optional, Tuple
 import shutil
+import threading
 import os
 from pathlib import Path
 import uuid
-from datetime import datetime
+from datetime import date, datetime
 
 # Import ML modules
 import sys
@@ -16,6 +18,14 @@ from ml.food_classifier import FoodClassifier
 from ml.portion_estimator import PortionEstimator
 from ml.nutrition_mapper import NutritionMapper
 
+from models.user import HealthGoal
+from services.metrics import RECOGNIZE_IN_FLIGHT, STAGE_TIMERS, record_event, stage_timer
+from utils.serialization import NUTRIENT_FIELDS
+
+# Profiles and meals for personalized alerts
+from routes.meal import meal_store
+from routes.user import user_store
+
 router = APIRouter(prefix="/food", tags=["Food Recognition"])
 
 # Create upload directory
@@ -27,17 +37,53 @@ food_classifier: Optional[FoodClassifier] = None
 portion_estimator: Optional[PortionEstimator] = None
 nutrition_mapper: Optional[NutritionMapper] = None
 
+_ml_lock = threading.Lock()
+
 def get_ml_modules():
     """Lazy initialization of ML modules to ensure environment variables are loaded"""
     global food_classifier, portion_estimator, nutrition_mapper
-    if food_classifier is None:
-        food_classifier = FoodClassifier()
-        portion_estimator = PortionEstimator()
-        nutrition_mapper = NutritionMapper()
-        print(f"🤖 ML Modules initialized - Gemini: {'Enabled' if food_classifier.use_gemini else 'Disabled'}")
+    # Recognize requests run in the threadpool, so the first ones may race here
+    with _ml_lock:
+        if food_classifier is None:
+            classifier = FoodClassifier()
+            portion_estimator = PortionEstimator()
+            nutrition_mapper = NutritionMapper()
+            classifier.stage_timer = stage_timer
+            classifier.on_event = record_event
+            food_classifier = classifier
+            print(f"🤖 ML Modules initialized - Gemini: {'Enabled' if food_classifier.use_gemini else 'Disabled'}")
     return food_classifier, portion_estimator, nutrition_mapper
 
 
+def get_alert_context(user_id: Optional[str]) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """
+    Profile targets and today's nutrition so far, for personalized alerts
+    
+    Both are point lookups: the profile (its derived targets are cached on
+    it) and today's daily rollup, which every meal write keeps current, so
+    no meals are scanned on the recognize path.
+    
+    Returns:
+        (user_profile, today_totals), or (None, None) for unknown users
+    """
+    if not user_id:
+        return None, None
+    user = user_store.get_user(user_id)
+    if user is None:
+        return None, None
+    
+    metrics = user.metrics
+    user_profile = {
+        'health_goal': HealthGoal(user.health_goal).value,
+        'daily_calorie_target': metrics.daily_calorie_target,
+        'daily_protein_target_g': metrics.daily_protein_target_g,
+        'daily_fat_target_g': metrics.daily_fat_target_g
+    }
+    rollup = meal_store.daily_rollup(user_id, date.today())
+    today_totals = {field: getattr(rollup, field) for field in NUTRIENT_FIELDS} if rollup is not None else {}
+    return user_profile, today_totals
+
+
 @router.post("/recognize")
 async def recognize_food(
     file: UploadFile = File(..., description="Food image file"),
@@ -52,6 +98,13 @@ async def recognize_food(
         - health_alerts: Personalized health warnings
         - explanation: How nutrition was calculated
     """
+    with RECOGNIZE_IN_FLIGHT.track():
+        # Decoding, the Gemini call and the store reads all block
+        return await run_in_threadpool(_recognize, file, user_id)
+
+
+def _recognize(file: UploadFile, user_id: Optional[str]):
+    """The recognize pipeline; every stage is timed into recognize_stage_seconds"""
     try:
         # Get ML modules (lazy initialization)
         classifier, estimator, mapper = get_ml_modules()
@@ -68,17 +121,20 @@ async def recognize_food(
         unique_filename = f"{uuid.uuid4()}{file_extension}"
         image_path = UPLOAD_DIR / unique_filename
         
-        with open(image_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        with STAGE_TIMERS['upload_write'].time():
+            with open(image_path, "wb") as buffer:
+                shutil.copyfileobj(file.file, buffer)
         
-        # Step 1: Classify food
-        detected_foods = classifier.detect_multiple_foods(str(image_path))
+        # Step 1: Classify food (decode and Gemini call are timed inside)
+        with STAGE_TIMERS['detect'].time():
+            detected_foods = classifier.detect_multiple_foods(str(image_path))
         
         if not detected_foods:
             raise HTTPException(status_code=400, detail="No food detected in image")
         
         # Step 2: Estimate portions
-        portions = estimator.estimate_multiple_portions(detected_foods, str(image_path))
+        with STAGE_TIMERS['portions'].time():
+            portions = estimator.estimate_multiple_portions(detected_foods, str(image_path))
         
         # Step 3: Add portion estimates to detected foods
         for food in detected_foods:
@@ -90,26 +146,30 @@ async def recognize_food(
                 food['estimated_grams'] = 100  # Default
                 food['portion_explanation'] = "Standard serving size assumed"
         
-        # Step 4: Calculate nutrition for each food
-        for food in detected_foods:
-            nutrition = mapper.calculate_nutrition(
-                food['food_id'],
-                food['estimated_grams']
-            )
-            food['nutrition'] = nutrition
-        
-        # Step 5: Calculate total nutrition
-        total_nutrition = mapper.calculate_total_nutrition(detected_foods)
+        with STAGE_TIMERS['nutrition'].time():
+            # Step 4: Calculate nutrition for each food
+            for food in detected_foods:
+                nutrition = mapper.calculate_nutrition(
+                    food['food_id'],
+                    food['estimated_grams']
+                )
+                food['nutrition'] = nutrition
+            
+            # Step 5: Calculate total nutrition
+            total_nutrition = mapper.calculate_total_nutrition(detected_foods)
         
         # Step 6: Generate health alerts (personalized if user_id provided)
-        user_profile = None  # TODO: Fetch from database if user_id provided
-        health_alerts = mapper.generate_health_alerts(total_nutrition, user_profile)
+        with STAGE_TIMERS['alerts'].time():
+            user_profile, today_totals = get_alert_context(user_id)
+            health_alerts = mapper.generate_health_alerts(total_nutrition, user_profile, today_totals)
         
         # Step 7: Generate explanation
-        explanation = mapper.generate_explanation(detected_foods, portions)
+        with STAGE_TIMERS['explanation'].time():
+            explanation = mapper.generate_explanation(detected_foods, portions)
         
         # Step 8: Assess image quality
-        image_quality = classifier.assess_image_quality(str(image_path))
+        with STAGE_TIMERS['quality'].time():
+            image_quality = classifier.assess_image_quality(str(image_path))
         
         # Clean up uploaded file (optional - keep for history)
         # image_path.unlink()
@@ -1,22 +1,26 @@
 """Meal Logging Routes - Handle meal history and tracking"""
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional, List
 import uuid
-from datetime import datetime, date, timedelta
-from collections import defaultdict
+from datetime import datetime, date
 
-from models.meal import MealEntry, MealType, DailyNutritionSummary
-from models.food import NutritionInfo, DetectedFood
+from models.meal import MealEntry, MealType
+from models.food import NutritionInfo
+from services.storage import create_meal_store, encode_cursor
+from services.rollups import DailyRollup
+from services.meal_import import MealImporter, DEFAULT_BATCH_SIZE, MAX_BATCH_SIZE
+from utils.serialization import ORJSONResponse, validate_detected_foods
+from routes.admin import require_token
 
 router = APIRouter(prefix="/meals", tags=["Meals"])
 
-# In-memory storage (replace with database in production)
-meals_db = {}  # {meal_id: MealEntry}
-user_meals_index = defaultdict(list)  # {user_id: [meal_ids]}
+# Meal storage (backend selected by STORAGE_BACKEND, see services/storage.py)
+meal_store = create_meal_store()
 
 
-@router.post("/")
-async def log_meal(
+@router.post("/", response_class=ORJSONResponse)
+def log_meal(
     user_id: str,
     meal_type: MealType,
     detected_foods: List[dict],
@@ -40,19 +44,8 @@ async def log_meal(
     """
     meal_id = str(uuid.uuid4())
     
-    # Convert detected_foods to DetectedFood models
-    foods_list = []
-    for food in detected_foods:
-        nutrition = NutritionInfo(**food.get('nutrition', {}))
-        detected_food = DetectedFood(
-            food_id=food['food_id'],
-            food_name=food['food_name'],
-            confidence=food['confidence'],
-            estimated_portion_g=food.get('estimated_grams', 100),
-            bounding_box=food.get('bounding_box'),
-            nutrition=nutrition
-        )
-        foods_list.append(detected_food)
+    # Convert detected_foods to DetectedFood models (one validation pass for the whole list)
+    foods_list = validate_detected_foods(detected_foods)
     
     # Create meal entry
     meal_entry = MealEntry(
@@ -67,78 +60,98 @@ async def log_meal(
     )
     
     # Store meal
-    meals_db[meal_id] = meal_entry
-    user_meals_index[user_id].append(meal_id)
+    meal_store.add_meal(meal_entry)
     
-    return {
+    return ORJSONResponse({
         "message": "Meal logged successfully",
         "meal": meal_entry
-    }
+    })
+
+
+@router.post("/import", response_class=ORJSONResponse)
+async def import_meals(request: Request, batch_size: int = Query(DEFAULT_BATCH_SIZE, ge=1, le=MAX_BATCH_SIZE)):
+    """
+    Bulk import meals from a streamed NDJSON body (one meal record per line)
+    
+    Args:
+        request: Request whose body is NDJSON meal records
+        batch_size: Number of records validated and written together (1 to MAX_BATCH_SIZE)
+        
+    Returns:
+        Import report with counts, throughput and per-line errors
+    """
+    importer = MealImporter(meal_store, batch_size=batch_size)
+    # Validation and store writes (which may wait on write-behind backpressure) run off the event loop
+    async for chunk in request.stream():
+        await run_in_threadpool(importer.feed, chunk)
+    
+    return ORJSONResponse(await run_in_threadpool(importer.finish))
 
 
-@router.get("/{user_id}/history")
-async def get_meal_history(
+@router.get("/{user_id}/history", response_class=ORJSONResponse)
+def get_meal_history(
     user_id: str,
     limit: int = 10,
     offset: int = 0,
     meal_type: Optional[MealType] = None,
     date_from: Optional[str] = None,
-    date_to: Optional[str] = None
+    date_to: Optional[str] = None,
+    cursor: Optional[str] = None
 ):
     """
-    Get meal history for a user
+    Get meal history for a user (newest first)
     
     Args:
         user_id: User identifier
         limit: Maximum number of meals to return
-        offset: Number of meals to skip
+        offset: Number of meals to skip (ignored when cursor is given)
         meal_type: Filter by meal type
         date_from: Filter from date (YYYY-MM-DD)
         date_to: Filter to date (YYYY-MM-DD)
+        cursor: next_cursor from the previous page (keyset pagination)
         
     Returns:
-        List of meal entries
+        List of meal entries and the cursor for the next page
     """
-    if user_id not in user_meals_index:
-        return {
+    if not meal_store.has_meals(user_id):
+        return ORJSONResponse({
             "user_id": user_id,
             "total_meals": 0,
             "meals": []
-        }
-    
-    # Get all meals for user
-    meal_ids = user_meals_index[user_id]
-    meals = [meals_db[meal_id] for meal_id in meal_ids if meal_id in meals_db]
-    
-    # Apply filters
-    if meal_type:
-        meals = [m for m in meals if m.meal_type == meal_type]
-    
-    if date_from:
-        date_from_obj = datetime.fromisoformat(date_from)
-        meals = [m for m in meals if m.timestamp >= date_from_obj]
-    
-    if date_to:
-        date_to_obj = datetime.fromisoformat(date_to)
-        meals = [m for m in meals if m.timestamp <= date_to_obj]
-    
-    # Sort by timestamp (newest first)
-    meals.sort(key=lambda m: m.timestamp, reverse=True)
-    
-    # Apply pagination
-    total_meals = len(meals)
-    meals = meals[offset:offset + limit]
-    
-    return {
+        })
+    
+    date_from_obj = datetime.fromisoformat(date_from) if date_from else None
+    date_to_obj = datetime.fromisoformat(date_to) if date_to else None
+    
+    # Filter, sort (newest first) and paginate in the store; the count and the
+    # page come from the same snapshot so they agree under concurrent writes
+    with meal_store.snapshot(user_id) as snapshot:
+        total_meals = snapshot.count_meals(meal_type, date_from_obj, date_to_obj)
+        if cursor:
+            try:
+                meals, next_cursor = snapshot.page_meals(
+                    meal_type, date_from_obj, date_to_obj, limit=limit, cursor=cursor
+                )
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+        else:
+            meals = snapshot.query_meals(
+                meal_type, date_from_obj, date_to_obj,
+                limit=limit, offset=offset, newest_first=True
+            )
+            next_cursor = encode_cursor(meals[-1]) if meals and offset + len(meals) < total_meals else None
+    
+    return ORJSONResponse({
         "user_id": user_id,
         "total_meals": total_meals,
         "returned": len(meals),
-        "meals": meals
-    }
+        "meals": meals,
+        "next_cursor": next_cursor
+    })
 
 
 @router.get("/{user_id}/daily-summary")
-async def get_daily_summary(
+def get_daily_summary(
     user_id: str,
     date_str: Optional[str] = None
 ):
@@ -157,83 +170,52 @@ async def get_daily_summary(
     else:
         target_date = date.today()
     
-    if user_id not in user_meals_index:
-        return DailyNutritionSummary(
-            user_id=user_id,
-            date=target_date.isoformat(),
-            total_calories=0,
-            total_protein=0,
-            total_carbs=0,
-            total_fat=0,
-            total_fiber=0,
-            meals_count=0,
-            breakfast_calories=0,
-            lunch_calories=0,
-            dinner_calories=0,
-            snack_calories=0
-        )
-    
-    # Get meals for the day
-    meal_ids = user_meals_index[user_id]
-    daily_meals = []
+    # Totals are maintained incrementally on every meal write
+    rollup = meal_store.daily_rollup(user_id, target_date) or DailyRollup()
     
-    for meal_id in meal_ids:
-        if meal_id in meals_db:
-            meal = meals_db[meal_id]
-            meal_date = meal.timestamp.date()
-            if meal_date == target_date:
-                daily_meals.append(meal)
-    
-    # Calculate totals
-    total_calories = 0
-    total_protein = 0
-    total_carbs = 0
-    total_fat = 0
-    total_fiber = 0
-    
-    breakfast_calories = 0
-    lunch_calories = 0
-    dinner_calories = 0
-    snack_calories = 0
+    return rollup.to_summary(user_id, target_date)
+
+
+@router.post("/rollups/rebuild", dependencies=[Depends(require_token)])
+def rebuild_rollups(user_id: Optional[str] = None):
+    """
+    Recompute daily rollups from raw meals; an admin operation (a full
+    rebuild scans every meal), so it requires the admin token (PROFILE_TOKEN)
+    in X-Admin-Token and is refused when none is set
     
-    for meal in daily_meals:
-        nutrition = meal.total_nutrition
-        total_calories += nutrition.calories
-        total_protein += nutrition.protein
-        total_carbs += nutrition.carbs
-        total_fat += nutrition.fat
-        total_fiber += nutrition.fiber
+    Args:
+        user_id: Only rebuild this user's rollups (default: all users)
         
-        # Categorize by meal type
-        if meal.meal_type == MealType.BREAKFAST:
-            breakfast_calories += nutrition.calories
-        elif meal.meal_type == MealType.LUNCH:
-            lunch_calories += nutrition.calories
-        elif meal.meal_type == MealType.DINNER:
-            dinner_calories += nutrition.calories
-        elif meal.meal_type == MealType.SNACK:
-            snack_calories += nutrition.calories
-    
-    summary = DailyNutritionSummary(
-        user_id=user_id,
-        date=target_date.isoformat(),
-        total_calories=round(total_calories, 1),
-        total_protein=round(total_protein, 1),
-        total_carbs=round(total_carbs, 1),
-        total_fat=round(total_fat, 1),
-        total_fiber=round(total_fiber, 1),
-        meals_count=len(daily_meals),
-        breakfast_calories=round(breakfast_calories, 1),
-        lunch_calories=round(lunch_calories, 1),
-        dinner_calories=round(dinner_calories, 1),
-        snack_calories=round(snack_calories, 1)
-    )
+    Returns:
+        Number of meals aggregated
+    """
+    meals_aggregated = meal_store.rebuild_rollups(user_id)
     
-    return summary
+    return {
+        "message": "Rollups rebuilt successfully",
+        "user_id": user_id,
+        "meals_aggregated": meals_aggregated
+    }
 
 
-@router.get("/{meal_id}")
-async def get_meal(meal_id: str):
+@router.get("/storage/stats")
+def get_storage_stats():
+    """
+    Storage statistics (tiering hit rate and memory saved, write-behind queue)
+
+    Returns:
+        Backend name and the store's own stats, if it reports any
+    """
+    stats = meal_store.stats() if hasattr(meal_store, 'stats') else {}
+
+    return {
+        "backend": type(meal_store).__name__,
+        "stats": stats
+    }
+
+
+@router.get("/{meal_id}", response_class=ORJSONResponse)
+def get_meal(meal_id: str):
     """
     Get a specific meal by ID
     
@@ -243,14 +225,15 @@ async def get_meal(meal_id: str):
     Returns:
         Meal entry details
     """
-    if meal_id not in meals_db:
+    meal = meal_store.get_meal(meal_id)
+    if meal is None:
         raise HTTPException(status_code=404, detail="Meal not found")
     
-    return meals_db[meal_id]
+    return ORJSONResponse(meal)
 
 
 @router.delete("/{meal_id}")
-async def delete_meal(meal_id: str):
+def delete_meal(meal_id: str):
     """
     Delete a meal entry
     
@@ -260,19 +243,11 @@ async def delete_meal(meal_id: str):
     Returns:
         Success message
     """
-    if meal_id not in meals_db:
+    # Remove from storage (and the user's index)
+    meal = meal_store.remove_meal(meal_id)
+    if meal is None:
         raise HTTPException(status_code=404, detail="Meal not found")
     
-    meal = meals_db[meal_id]
-    user_id = meal.user_id
-    
-    # Remove from database
-    del meals_db[meal_id]
-    
-    # Remove from index
-    if user_id in user_meals_index:
-        user_meals_index[user_id].remove(meal_id)
-    
     return {
         "message": "Meal deleted successfully",
         "meal_id": meal_id
@@ -4,16 +4,23 @@ from typing import Optional, List
 import uuid
 from datetime import datetime
 
-from models.user import UserProfile, UserCreate, Gender, HealthGoal
+from models.user import UserProfile, UserCreate, UserLookup, BulkTargetsRequest, Gender, HealthGoal
+from services.profile_metrics import METRIC_FIELDS, MetricParameters, ProfileArrays, compute_metrics
+from services.storage import create_user_store
+from utils.serialization import ORJSONResponse
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
-# In-memory storage (replace with database in production)
-users_db = {}
+# User storage (backend selected by STORAGE_BACKEND, see services/storage.py)
+user_store = create_user_store()
+
+MAX_PAGE_SIZE = 500
+MAX_LOOKUP_IDS = 1000
+MAX_BULK_TARGET_IDS = 20000
 
 
 @router.post("/", response_model=UserProfile)
-async def create_user(user_data: UserCreate):
+def create_user(user_data: UserCreate):
     """
     Create a new user profile
     
@@ -25,11 +32,6 @@ async def create_user(user_data: UserCreate):
     """
     user_id = str(uuid.uuid4())
     
-    # Check if email already exists
-    for existing_user in users_db.values():
-        if existing_user.email == user_data.email:
-            raise HTTPException(status_code=400, detail="Email already registered")
-    
     user_profile = UserProfile(
         user_id=user_id,
         name=user_data.name,
@@ -42,13 +44,72 @@ async def create_user(user_data: UserCreate):
         created_at=datetime.utcnow()
     )
     
-    users_db[user_id] = user_profile
+    # Email check and insert are one atomic step in the store (case-insensitive)
+    if not user_store.create_user(user_profile):
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     return user_profile
 
 
+@router.post("/batch", response_class=ORJSONResponse)
+def get_users_batch(lookup: UserLookup):
+    """
+    Get several user profiles in one request
+    
+    Args:
+        lookup: user_ids to fetch (at most MAX_LOOKUP_IDS)
+        
+    Returns:
+        The users found, in request order, and the IDs that do not exist
+    """
+    if len(lookup.user_ids) > MAX_LOOKUP_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_LOOKUP_IDS} user_ids per request")
+    
+    users = user_store.get_users(lookup.user_ids)
+    found = {user.user_id for user in users}
+    return ORJSONResponse({
+        "users": users,
+        "missing": [user_id for user_id in lookup.user_ids if user_id not in found]
+    })
+
+
+@router.post("/targets", response_class=ORJSONResponse)
+def compute_bulk_targets(request: BulkTargetsRequest):
+    """
+    Compute BMI, BMR/TDEE and macro targets for many users in one vectorized pass
+    
+    Args:
+        request: user_ids (at most MAX_BULK_TARGET_IDS) and optional overrides
+                 of the activity factor, per-goal calorie offsets and per-goal
+                 protein grams per kg (to preview a formula change)
+        
+    Returns:
+        The parameters used, user_ids found (in request order) with one
+        column per metric, and the IDs that do not exist
+    """
+    if len(request.user_ids) > MAX_BULK_TARGET_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_TARGET_IDS} user_ids per request")
+    
+    params = MetricParameters()
+    if request.activity_factor is not None:
+        params.activity_factor = request.activity_factor
+    params.goal_calorie_offsets.update({goal.value: offset for goal, offset in request.goal_calorie_offsets.items()})
+    params.goal_protein_g_per_kg.update({goal.value: per_kg for goal, per_kg in request.goal_protein_g_per_kg.items()})
+    
+    profiles = ProfileArrays.from_profiles(user_store.get_users(request.user_ids))
+    metrics = compute_metrics(profiles, params)
+    found = set(profiles.user_ids)
+    return ORJSONResponse({
+        "count": len(profiles),
+        "parameters": params.to_dict(),
+        "user_ids": profiles.user_ids,
+        "metrics": {name: metrics[name].tolist() for name in METRIC_FIELDS},
+        "missing": [user_id for user_id in request.user_ids if user_id not in found]
+    })
+
+
 @router.get("/{user_id}", response_model=UserProfile)
-async def get_user(user_id: str):
+def get_user(user_id: str):
     """
     Get user profile by ID
     
@@ -58,14 +119,15 @@ async def get_user(user_id: str):
     Returns:
         User profile with health metrics
     """
-    if user_id not in users_db:
+    user = user_store.get_user(user_id)
+    if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return users_db[user_id]
+    return user
 
 
 @router.put("/{user_id}", response_model=UserProfile)
-async def update_user(user_id: str, update_data: dict):
+def update_user(user_id: str, update_data: dict):
     """
     Update user profile
     
@@ -76,11 +138,10 @@ async def update_user(user_id: str, update_data: dict):
     Returns:
         Updated user profile
     """
-    if user_id not in users_db:
+    user = user_store.get_user(user_id)
+    if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user = users_db[user_id]
-    
     # Update allowed fields
     if 'name' in update_data:
         user.name = update_data['name']
@@ -93,11 +154,13 @@ async def update_user(user_id: str, update_data: dict):
     if 'health_goal' in update_data:
         user.health_goal = HealthGoal(update_data['health_goal'])
     
+    user_store.save_user(user)
+    
     return user
 
 
 @router.delete("/{user_id}")
-async def delete_user(user_id: str):
+def delete_user(user_id: str):
     """
     Delete user profile
     
@@ -107,16 +170,14 @@ async def delete_user(user_id: str):
     Returns:
         Success message
     """
-    if user_id not in users_db:
+    if not user_store.delete_user(user_id):
         raise HTTPException(status_code=404, detail="User not found")
     
-    del users_db[user_id]
-    
     return {"message": "User deleted successfully", "user_id": user_id}
 
 
 @router.get("/{user_id}/health-metrics")
-async def get_health_metrics(user_id: str):
+def get_health_metrics(user_id: str):
     """
     Get calculated health metrics for user
     
@@ -126,11 +187,10 @@ async def get_health_metrics(user_id: str):
     Returns:
         BMI, calorie targets, macro targets, and health status
     """
-    if user_id not in users_db:
+    user = user_store.get_user(user_id)
+    if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user = users_db[user_id]
-    
     # Calculate BMI category
     bmi = user.bmi
     if bmi < 18.5:
@@ -151,8 +211,8 @@ async def get_health_metrics(user_id: str):
         "daily_targets": {
             "calories": user.daily_calorie_target,
             "protein_g": user.daily_protein_target_g,
-            "carbs_g": user.daily_carbs_target_g if hasattr(user, 'daily_carbs_target_g') else int(user.daily_calorie_target * 0.475 / 4),
-            "fat_g": user.daily_fat_target_g if hasattr(user, 'daily_fat_target_g') else int(user.daily_calorie_target * 0.275 / 9)
+            "carbs_g": user.daily_carbs_target_g,
+            "fat_g": user.daily_fat_target_g
         },
         "health_goal": user.health_goal,
         "recommendations": _get_recommendations(user)
@@ -186,16 +246,40 @@ def _get_recommendations(user: UserProfile) -> List[str]:
     return recommendations
 
 
-@router.get("/")
-async def list_users():
+@router.get("/", response_class=ORJSONResponse)
+def list_users(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    health_goal: Optional[HealthGoal] = None,
+    gender: Optional[Gender] = None
+):
     """
-    List all users (for demo purposes)
+    List users, oldest first, one page at a time
     
+    Args:
+        limit: Maximum number of users to return (1-MAX_PAGE_SIZE)
+        cursor: next_cursor from the previous page (keyset pagination)
+        health_goal: Only users with this health goal
+        gender: Only users with this gender
+        
     Returns:
-        List of all user profiles
+        One page of user profiles, the number of matching users and the
+        cursor for the next page
     """
-    return {
-        "total_users": len(users_db),
-        "users": list(users_db.values())
-    }
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    
+    goal = health_goal.value if health_goal else None
+    sex = gender.value if gender else None
+    try:
+        users, next_cursor = user_store.page_users(limit=limit, cursor=cursor, health_goal=goal, gender=sex)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    return ORJSONResponse({
+        "total_users": user_store.count_users(health_goal=goal, gender=sex),
+        "returned": len(users),
+        "users": users,
+        "next_cursor": next_cursor
+    })
 
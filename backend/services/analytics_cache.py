@@ -0,0 +1,226 @@
+"""Analytics Cache - Per-user analytics results keyed by the user's data version
+
+Analytics only change when the user logs or deletes a meal (or edits their
+profile, or the day rolls over), yet the dashboard polls every endpoint on
+each view. Results are cached under (user_id, endpoint, params) together
+with the version they were computed at; MealStore.data_version() is bumped
+by every meal mutation, so a lookup with a newer version is a miss and a
+stale result is never served. One entry is kept per key, so superseded
+versions do not pile up.
+
+Entries are evicted least recently used first to stay within a memory
+budget. A result's size is estimated from its JSON encoding times
+OBJECT_OVERHEAD (Python dicts/floats are several times larger than JSON).
+
+ReportStore is a persistent second tier for results precomputed by the job
+scheduler (services.scheduler): one row per (user_id, endpoint, params),
+checked against the same version, so a report is only served while the
+data it was computed from is unchanged.
+
+Environment:
+    ANALYTICS_CACHE_MB - memory budget (default: 64; 0 disables the cache)
+"""
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+import hashlib
+import os
+import sqlite3
+import threading
+
+from utils.serialization import dumps, loads
+
+DEFAULT_BUDGET_MB = 64
+
+# Estimated in-memory bytes per byte of JSON
+OBJECT_OVERHEAD = 4
+
+# Returned by get() when there is no current entry
+MISS = object()
+
+
+class _Entry:
+    __slots__ = ('version', 'value', 'nbytes')
+
+    def __init__(self, version: Hashable, value: Any, nbytes: int):
+        self.version = version
+        self.value = value
+        self.nbytes = nbytes
+
+
+class _EndpointStats:
+    __slots__ = ('hits', 'misses', 'stale')
+
+    def __init__(self):
+        self.hits = self.misses = self.stale = 0
+
+
+class AnalyticsCache:
+    """LRU result cache with version-checked lookups and hit-rate metrics"""
+
+    def __init__(self, budget_bytes: int = DEFAULT_BUDGET_MB * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self._entries: "OrderedDict[Tuple[str, str, Hashable], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _EndpointStats] = {}
+        self.nbytes = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_bytes > 0
+
+    def _endpoint_stats(self, endpoint: str) -> _EndpointStats:
+        stats = self._stats.get(endpoint)
+        if stats is None:
+            stats = self._stats[endpoint] = _EndpointStats()
+        return stats
+
+    def get(self, user_id: str, endpoint: str, params: Hashable, version: Hashable) -> Any:
+        """The cached result computed at `version`, or MISS"""
+        key = (user_id, endpoint, params)
+        with self._lock:
+            stats = self._endpoint_stats(endpoint)
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                stats.hits += 1
+                return entry.value
+            stats.misses += 1
+            if entry is not None:
+                stats.stale += 1
+            return MISS
+
+    def put(self, user_id: str, endpoint: str, params: Hashable, version: Hashable, value: Any) -> None:
+        """Store a result computed at `version` (replacing any older one for the key)"""
+        nbytes = len(dumps(value)) * OBJECT_OVERHEAD
+        if nbytes > self.budget_bytes:
+            return
+        key = (user_id, endpoint, params)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._entries[key] = _Entry(version, value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.budget_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: str) -> int:
+        """Drop a user's entries (e.g. on account deletion); returns entries dropped"""
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == user_id]
+            for key in keys:
+                self.nbytes -= self._entries.pop(key).nbytes
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Entries, memory use, evictions and hit rates overall and per endpoint"""
+        with self._lock:
+            endpoints = {
+                endpoint: {
+                    'hits': stats.hits,
+                    'misses': stats.misses,
+                    'stale': stats.stale,
+                    'hit_rate': _rate(stats.hits, stats.misses)
+                }
+                for endpoint, stats in self._stats.items()
+            }
+            hits = sum(stats.hits for stats in self._stats.values())
+            misses = sum(stats.misses for stats in self._stats.values())
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self.nbytes,
+                'budget_bytes': self.budget_bytes,
+                'evictions': self.evictions,
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': _rate(hits, misses),
+                'endpoints': endpoints
+            }
+
+
+_REPORTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    user_id     TEXT NOT NULL,
+    endpoint    TEXT NOT NULL,
+    params      TEXT NOT NULL,
+    version     TEXT NOT NULL,
+    computed_at TEXT NOT NULL,
+    payload     BLOB NOT NULL,
+    PRIMARY KEY (user_id, endpoint, params)
+) WITHOUT ROWID;
+"""
+
+
+def _digest(value: Hashable) -> str:
+    return hashlib.blake2b(repr(value).encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ReportStore:
+    """Precomputed analytics results in a local SQLite file, version-checked on read"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_REPORTS_SCHEMA)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str, endpoint: str, params: Hashable, version: Hashable) -> Any:
+        """The stored result if it was computed at `version`, else MISS"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version, payload FROM reports WHERE user_id = ? AND endpoint = ? AND params = ?",
+                (user_id, endpoint, repr(params))
+            ).fetchone()
+            if row is None or row[0] != _digest(version):
+                self.misses += 1
+                return MISS
+            self.hits += 1
+        return loads(row[1])
+
+    def put_many(self, reports: Iterable[Tuple[str, str, Hashable, Hashable, Any]]) -> int:
+        """Store (user_id, endpoint, params, version, result) rows; returns rows written"""
+        computed_at = datetime.now().isoformat(timespec='seconds')
+        rows = [
+            (user_id, endpoint, repr(params), _digest(version), computed_at, dumps(result))
+            for user_id, endpoint, params, version, result in reports
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+            return {'reports': count, 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': _rate(self.hits, self.misses)}
+
+
+def _rate(hits: int, misses: int) -> Optional[float]:
+    return round(hits / (hits + misses), 4) if hits + misses else None
+
+
+def create_analytics_cache() -> AnalyticsCache:
+    """Cache sized from ANALYTICS_CACHE_MB"""
+    return AnalyticsCache(int(float(os.getenv("ANALYTICS_CACHE_MB", DEFAULT_BUDGET_MB)) * 1024 * 1024))
+
+
+def create_report_store(directory: Optional[str]) -> Optional[ReportStore]:
+    """Report store under the jobs directory, or None when jobs are disabled"""
+    if directory is None:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    return ReportStore(os.path.join(directory, 'reports.db'))
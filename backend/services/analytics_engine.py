@@ -0,0 +1,219 @@
+"""Analytics Engine - Vectorized per-user nutrient time series
+
+A user's meals are loaded from a MealSnapshot as NumPy arrays (MealArrays)
+and reduced to per-day totals with one np.bincount per nutrient
+(DailySeries). Every metric is then array arithmetic over those daily
+series instead of a Python loop over meals:
+
+    * window totals, averages over days with data and macro percentages
+    * trailing N-day rolling means (cumulative sums)
+    * adherence streaks against a daily calorie target (run lengths)
+    * least-squares trend slopes for every nutrient at once
+"""
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from models.meal import MealEntry, MealType
+from services.storage import to_micros
+from utils.serialization import NUTRIENT_FIELDS
+
+MEAL_TYPES = list(MealType)
+
+MICROS_PER_DAY = 86400 * 1000000
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Calories per gram of each macronutrient
+MACRO_KCAL_PER_G = {'protein': 4, 'carbs': 4, 'fat': 9}
+
+# A day is adherent when calories are within this fraction of the target
+# (the "On target" band used by goal progress)
+ADHERENCE_RANGE = (0.8, 1.1)
+
+
+def day_number(day: date) -> int:
+    """Days since 1970-01-01"""
+    return day.toordinal() - _EPOCH_ORDINAL
+
+
+class MealArrays:
+    """A user's meals in time order as parallel NumPy arrays"""
+
+    __slots__ = ('timestamps', 'meal_types', 'nutrients', 'food_codes', 'food_portion', 'food_meals', 'foods')
+
+    def __init__(self, timestamps: np.ndarray, meal_types: np.ndarray, nutrients: Dict[str, np.ndarray],
+                 food_codes: Optional[np.ndarray] = None, food_portion: Optional[np.ndarray] = None,
+                 food_meals: Optional[np.ndarray] = None, foods: Optional[Sequence[Tuple[str, str]]] = None):
+        self.timestamps = timestamps  # int64 microseconds since epoch (UTC)
+        self.meal_types = meal_types  # int8 index into MealType
+        self.nutrients = nutrients  # {field: float64 per meal}
+        self.food_codes = food_codes  # detected foods of every meal, flattened (when requested)
+        self.food_portion = food_portion
+        self.food_meals = food_meals  # index of the meal each food belongs to
+        self.foods = foods  # code -> (food_id, food_name)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @classmethod
+    def from_meals(cls, meals: List[MealEntry], foods: bool = False) -> "MealArrays":
+        """Build arrays from materialised meals (backends without columnar storage)"""
+        type_codes = {meal_type: code for code, meal_type in enumerate(MEAL_TYPES)}
+        nutrients = {
+            field: np.fromiter((getattr(meal.total_nutrition, field) for meal in meals), np.float64, len(meals))
+            for field in NUTRIENT_FIELDS
+        }
+        arrays = cls(
+            np.fromiter((to_micros(meal.timestamp) for meal in meals), np.int64, len(meals)),
+            np.fromiter((type_codes[MealType(meal.meal_type)] for meal in meals), np.int8, len(meals)),
+            nutrients
+        )
+        if foods:
+            codes: Dict[Tuple[str, str], int] = {}
+            food_codes, food_portion, food_meals = [], [], []
+            for index, meal in enumerate(meals):
+                for food in meal.detected_foods:
+                    food_codes.append(codes.setdefault((food.food_id, food.food_name), len(codes)))
+                    food_portion.append(food.estimated_portion_g)
+                    food_meals.append(index)
+            arrays.food_codes = np.asarray(food_codes, dtype=np.int32)
+            arrays.food_portion = np.asarray(food_portion, dtype=np.float64)
+            arrays.food_meals = np.asarray(food_meals, dtype=np.int64)
+            arrays.foods = list(codes)
+        return arrays
+
+    def days(self) -> np.ndarray:
+        """Day number (UTC) of every meal"""
+        return self.timestamps // MICROS_PER_DAY
+
+
+class DailySeries:
+    """Per-day totals for one user over an inclusive date range"""
+
+    def __init__(self, first_day: date, totals: Dict[str, np.ndarray], meals: np.ndarray):
+        self.first_day = first_day
+        self.totals = totals  # {field: float64 per day}
+        self.meals = meals  # int64 meals logged per day
+
+    @classmethod
+    def from_arrays(cls, arrays: MealArrays, first_day: date, last_day: date) -> "DailySeries":
+        """Bucket meals by day with one bincount per nutrient (meals outside the range are ignored)"""
+        length = max(0, (last_day - first_day).days + 1)
+        index = arrays.days() - day_number(first_day)
+        if len(index) and (index[0] < 0 or index[-1] >= length):
+            in_range = (index >= 0) & (index < length)
+            index = index[in_range]
+            values = {field: column[in_range] for field, column in arrays.nutrients.items()}
+        else:
+            values = arrays.nutrients
+        totals = {field: np.bincount(index, weights=column, minlength=length) for field, column in values.items()}
+        return cls(first_day, totals, np.bincount(index, minlength=length))
+
+    def __len__(self) -> int:
+        return len(self.meals)
+
+    def dates(self) -> List[date]:
+        return [self.first_day + timedelta(days=i) for i in range(len(self))]
+
+    def tail(self, days: int) -> "DailySeries":
+        """The last `days` days"""
+        start = max(0, len(self) - days)
+        return DailySeries(
+            self.first_day + timedelta(days=start),
+            {field: column[start:] for field, column in self.totals.items()},
+            self.meals[start:]
+        )
+
+    @property
+    def logged(self) -> np.ndarray:
+        """Days with at least one meal"""
+        return self.meals > 0
+
+    def days_with_data(self) -> int:
+        return int(np.count_nonzero(self.meals))
+
+    def sums(self, fields: Iterable[str] = NUTRIENT_FIELDS) -> Dict[str, float]:
+        return {field: float(self.totals[field].sum()) for field in fields}
+
+    def averages(self, fields: Iterable[str] = NUTRIENT_FIELDS) -> Dict[str, float]:
+        """Mean daily totals over days with data (0 when there are none)"""
+        logged_days = self.days_with_data()
+        return {
+            field: float(self.totals[field].sum()) / logged_days if logged_days else 0.0
+            for field in fields
+        }
+
+    def macro_percentages(self) -> Dict[str, float]:
+        """Share of macro calories from protein, carbs and fat"""
+        calories = {field: float(self.totals[field].sum()) * kcal for field, kcal in MACRO_KCAL_PER_G.items()}
+        total = sum(calories.values())
+        return {field: value / total * 100 if total > 0 else 0.0 for field, value in calories.items()}
+
+    def rolling_mean(self, field: str, window: int) -> np.ndarray:
+        """
+        Trailing mean over the last `window` days, counting only days with data
+
+        Days whose window has no logged meals are NaN.
+        """
+        sums = _trailing_sum(self.totals[field], window)
+        counts = _trailing_sum(self.logged.astype(np.float64), window)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / counts, np.nan)
+
+    def streaks(self, calorie_target: float, low: float = ADHERENCE_RANGE[0],
+                high: float = ADHERENCE_RANGE[1]) -> Dict[str, int]:
+        """
+        Runs of consecutive days within [low, high] x calorie_target
+
+        The current streak ends on the last day, or on the day before when
+        the last day (usually today) is not adherent yet.
+        """
+        calories = self.totals['calories']
+        adherent = self.logged & (calories >= low * calorie_target) & (calories <= high * calorie_target)
+        edges = np.diff(np.concatenate(([0], adherent.view(np.int8), [0])))
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        lengths = ends - starts
+
+        current = 0
+        if len(ends) and ends[-1] >= len(adherent) - 1:
+            current = int(lengths[-1])
+        return {
+            'current_streak': current,
+            'longest_streak': int(lengths.max()) if len(lengths) else 0,
+            'adherent_days': int(adherent.sum())
+        }
+
+    def trends(self, fields: Sequence[str] = NUTRIENT_FIELDS) -> Dict[str, Dict[str, Optional[float]]]:
+        """Least-squares slope (per day) and r^2 of each field over days with data"""
+        logged = self.logged
+        x = np.flatnonzero(logged).astype(np.float64)
+        if len(x) < 2:
+            return {field: {'slope_per_day': None, 'r2': None} for field in fields}
+
+        y = np.stack([self.totals[field][logged] for field in fields])
+        dx = x - x.mean()
+        dy = y - y.mean(axis=1, keepdims=True)
+        sxx = float(dx @ dx)
+        sxy = dy @ dx
+        syy = np.einsum('ij,ij->i', dy, dy)
+        slopes = sxy / sxx
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r2 = np.where(syy > 0, sxy * sxy / (sxx * syy), 0.0)
+        return {
+            field: {'slope_per_day': float(slope), 'r2': float(fit)}
+            for field, slope, fit in zip(fields, slopes, r2)
+        }
+
+
+def _trailing_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Sum of values[i - window + 1 : i + 1] for every i"""
+    cumulative = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    ends = np.arange(1, len(cumulative))
+    return cumulative[ends] - cumulative[np.maximum(ends - window, 0)]
+
+
+def round_series(values: np.ndarray, digits: int = 1) -> List[Optional[float]]:
+    """JSON-ready rounded list with NaN as None"""
+    rounded = np.round(values, digits)
+    return [None if value != value else value for value in rounded.tolist()]
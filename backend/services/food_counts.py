@@ -0,0 +1,312 @@
+"""Food Counts - Sliding-window food frequency per user
+
+food-frequency asks for the most eaten foods over the last N days. Instead
+of rescanning those meals on every request, each (user, window length) pair
+that has been queried keeps a FoodWindow:
+
+    * day buckets ({food_id: [name, count, grams]}) for every day from the
+      window start on, updated by meal writes as they happen, and
+    * a tally of the buckets inside [start, end].
+
+When the window moves (a new day starts) the buckets that fell out are
+subtracted and the ones that came in, already filled by writes, are added;
+meals are only read once, when the window is first built. Top K is a heap
+selection over the tally (heapq.nlargest), O(n log K) in the foods of the
+window however long the history is.
+
+With a very large food vocabulary the tally can be a count-min sketch
+(FOOD_SKETCH_WIDTH) plus a bounded candidate set instead of an exact dict:
+fixed memory per window and approximate counts (never under).
+
+Windows are capped to the most recently queried (user, length) pairs. The
+store publishes each write and applies it to the windows under the index
+lock, and windows are built under the same lock, so a write is counted
+exactly once: either it is in the snapshot a window is built from, or it
+is applied to the window afterwards.
+"""
+from collections import OrderedDict
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+import heapq
+import os
+import threading
+
+import numpy as np
+
+from models.meal import MealEntry
+from services.analytics_engine import MICROS_PER_DAY, MealArrays, day_number
+from services.sketches import DEFAULT_CMS_DEPTH, CountMinSketch
+from services.storage import after_fork, to_micros
+
+DEFAULT_MAX_WINDOWS = 4096
+DEFAULT_SKETCH_CANDIDATES = 256
+
+# (food_id, food_name, times consumed, total grams)
+FoodCount = Tuple[str, str, int, float]
+
+
+def _meal_foods(meal: MealEntry) -> Tuple[int, List[Tuple[str, str, float]]]:
+    """A meal's day number and (food_id, food_name, grams) of its detected foods"""
+    return (
+        to_micros(meal.timestamp) // MICROS_PER_DAY,
+        [(food.food_id, food.food_name, food.estimated_portion_g) for food in meal.detected_foods]
+    )
+
+
+def _rank(item: FoodCount):
+    return item[2], item[0]
+
+
+class FoodTally:
+    """Exact times consumed and grams per food_id"""
+
+    __slots__ = ('foods',)
+
+    def __init__(self):
+        self.foods: Dict[str, List] = {}  # food_id -> [name, count, grams]
+
+    def add(self, food_id: str, food_name: str, count: int, grams: float) -> None:
+        entry = self.foods.get(food_id)
+        if entry is None:
+            if count > 0:
+                self.foods[food_id] = [food_name, count, grams]
+            return
+        entry[1] += count
+        entry[2] += grams
+        if entry[1] <= 0:
+            del self.foods[food_id]
+
+    def top(self, k: Optional[int]) -> List[FoodCount]:
+        items = [(food_id, name, count, grams) for food_id, (name, count, grams) in self.foods.items()]
+        if k is None:
+            return sorted(items, key=_rank, reverse=True)
+        return heapq.nlargest(k, items, key=_rank)
+
+    def unique(self) -> int:
+        return len(self.foods)
+
+
+class SketchTally:
+    """
+    Approximate tally: count-min sketch plus the highest-count candidates
+
+    Counts and grams live in the sketch; only `capacity` food ids are kept,
+    a newcomer replacing the lowest-estimate candidate when it beats it.
+    unique() is the number of candidates, a lower bound once full.
+    """
+
+    __slots__ = ('sketch', 'capacity', 'candidates')
+
+    def __init__(self, width: int, depth: int = DEFAULT_CMS_DEPTH, capacity: int = DEFAULT_SKETCH_CANDIDATES):
+        self.sketch = CountMinSketch(width, depth)
+        self.capacity = capacity
+        self.candidates: Dict[str, str] = {}  # food_id -> food_name
+
+    def add(self, food_id: str, food_name: str, count: int, grams: float) -> None:
+        estimate = self.sketch.add(food_id, count, grams)
+        if food_id in self.candidates:
+            if estimate <= 0:
+                del self.candidates[food_id]
+        elif estimate > 0:
+            if len(self.candidates) >= self.capacity:
+                weakest = min(self.candidates, key=self.sketch.estimate)
+                if self.sketch.estimate(weakest) >= estimate:
+                    return
+                del self.candidates[weakest]
+            self.candidates[food_id] = food_name
+
+    def top(self, k: Optional[int]) -> List[FoodCount]:
+        items = []
+        for food_id, name in self.candidates.items():
+            count, grams = self.sketch.estimate_with_weight(food_id)
+            items.append((food_id, name, count, grams))
+        if k is None:
+            return sorted(items, key=_rank, reverse=True)
+        return heapq.nlargest(k, items, key=_rank)
+
+    def unique(self) -> int:
+        return len(self.candidates)
+
+
+class FoodWindow:
+    """Day buckets from `start` on and the tally of those in [start, end] (day numbers)"""
+
+    __slots__ = ('start', 'end', 'buckets', 'tally')
+
+    def __init__(self, start: int, end: int, tally):
+        self.start = start
+        self.end = end
+        self.buckets: Dict[int, Dict[str, List]] = {}  # day -> {food_id: [name, count, grams]}
+        self.tally = tally
+
+    def apply(self, day: int, foods: List[Tuple[str, str, float]], sign: int) -> None:
+        """Add (sign=-1: remove) one meal's foods"""
+        if day < self.start:
+            return
+        bucket = self.buckets.setdefault(day, {})
+        for food_id, food_name, grams in foods:
+            entry = bucket.get(food_id)
+            if entry is None:
+                entry = bucket[food_id] = [food_name, 0, 0.0]
+            entry[1] += sign
+            entry[2] += sign * grams
+            if entry[1] <= 0:
+                del bucket[food_id]
+        if not bucket:
+            del self.buckets[day]
+        if day <= self.end:
+            for food_id, food_name, grams in foods:
+                self.tally.add(food_id, food_name, sign, sign * grams)
+
+    def _merge_bucket(self, bucket: Dict[str, List], sign: int) -> None:
+        for food_id, (name, count, grams) in bucket.items():
+            self.tally.add(food_id, name, sign * count, sign * grams)
+
+    def slide(self, start: int, end: int) -> None:
+        """Move to [start, end] (start >= self.start) by dropping and adding whole buckets"""
+        for day in list(self.buckets):
+            inside_before = self.start <= day <= self.end
+            inside_now = start <= day <= end
+            if inside_before != inside_now:
+                self._merge_bucket(self.buckets[day], 1 if inside_now else -1)
+            if day < start:
+                del self.buckets[day]
+        self.start, self.end = start, end
+
+    @classmethod
+    def build(cls, arrays: MealArrays, start: int, end: int, tally) -> "FoodWindow":
+        """Window over meals loaded from `start` on (arrays with foods and food_meals)"""
+        window = cls(start, end, tally)
+        if arrays.food_codes is None or not len(arrays.food_codes):
+            return window
+        days = arrays.days()[arrays.food_meals]
+        keep = days >= start
+        days, codes, grams = days[keep], arrays.food_codes[keep], arrays.food_portion[keep]
+        width = int(codes.max()) + 1 if len(codes) else 1
+        keys, inverse, counts = np.unique((days - start) * width + codes, return_inverse=True, return_counts=True)
+        totals = np.bincount(inverse, weights=grams, minlength=len(keys))
+
+        # Codes are (food_id, food_name) pairs; the first name seen wins for a food_id
+        for key, count, total in zip(keys.tolist(), counts.tolist(), totals.tolist()):
+            day, code = divmod(key, width)
+            food_id, food_name = arrays.foods[code]
+            bucket = window.buckets.setdefault(start + day, {})
+            entry = bucket.get(food_id)
+            if entry is None:
+                bucket[food_id] = [food_name, count, total]
+            else:
+                entry[1] += count
+                entry[2] += total
+        for day, bucket in window.buckets.items():
+            if day <= end:
+                window._merge_bucket(bucket, 1)
+        return window
+
+
+class FoodWindowIndex:
+    """
+    Sliding food-frequency windows for the most recently queried (user, length) pairs
+
+    loader(user_id, start) returns the user's meals from `start` on with
+    foods (MealArrays); it is only called to build a window.
+    """
+
+    def __init__(self, loader: Callable[[str, date], MealArrays], max_windows: int = DEFAULT_MAX_WINDOWS,
+                 sketch_width: int = 0, sketch_depth: int = DEFAULT_CMS_DEPTH,
+                 sketch_candidates: int = DEFAULT_SKETCH_CANDIDATES):
+        self.loader = loader
+        self.max_windows = max_windows
+        self.sketch_width = sketch_width
+        self.sketch_depth = sketch_depth
+        self.sketch_candidates = sketch_candidates
+        self.lock = threading.RLock()
+        after_fork(self._reset_lock)
+        self._windows: "OrderedDict[Tuple[str, int], FoodWindow]" = OrderedDict()
+        self._lengths: Dict[str, Set[int]] = {}  # user_id -> window lengths held
+
+    def _reset_lock(self) -> None:
+        self.lock = threading.RLock()
+
+    def _new_tally(self):
+        if self.sketch_width:
+            return SketchTally(self.sketch_width, self.sketch_depth, self.sketch_candidates)
+        return FoodTally()
+
+    def _apply(self, meal: MealEntry, sign: int) -> None:
+        lengths = self._lengths.get(meal.user_id)
+        if not lengths:
+            return
+        day, foods = _meal_foods(meal)
+        if not foods:
+            return
+        for length in lengths:
+            self._windows[(meal.user_id, length)].apply(day, foods, sign)
+
+    def add_meal(self, meal: MealEntry) -> None:
+        with self.lock:
+            self._apply(meal, 1)
+
+    def add_meals(self, meals: Iterable[MealEntry]) -> None:
+        with self.lock:
+            for meal in meals:
+                self._apply(meal, 1)
+
+    def remove_meal(self, meal: MealEntry) -> None:
+        with self.lock:
+            self._apply(meal, -1)
+
+    def drop_user(self, user_id: str) -> None:
+        """Forget a user's windows (their meals were replaced wholesale)"""
+        with self.lock:
+            for length in self._lengths.pop(user_id, ()):
+                del self._windows[(user_id, length)]
+
+    def clear(self) -> None:
+        with self.lock:
+            self._windows.clear()
+            self._lengths.clear()
+
+    def top(self, user_id: str, start: date, end: date, k: Optional[int] = 20) -> Tuple[List[FoodCount], int]:
+        """
+        Most consumed foods over [start, end]
+
+        Returns:
+            (top k as (food_id, food_name, times consumed, total grams), most
+            frequent first, ties by food_id; number of distinct foods). k=None
+            returns every food.
+        """
+        first, last = day_number(start), day_number(end)
+        length = last - first + 1
+        if length <= 0:
+            return [], 0
+        key = (user_id, length)
+        with self.lock:
+            window = self._windows.get(key)
+            if window is None or first < window.start:
+                arrays = self.loader(user_id, start)
+                window = self._windows[key] = FoodWindow.build(arrays, first, last, self._new_tally())
+                self._lengths.setdefault(user_id, set()).add(length)
+                while len(self._windows) > self.max_windows:
+                    (evicted_user, evicted_length), _ = self._windows.popitem(last=False)
+                    lengths = self._lengths[evicted_user]
+                    lengths.discard(evicted_length)
+                    if not lengths:
+                        del self._lengths[evicted_user]
+            elif (first, last) != (window.start, window.end):
+                window.slide(first, last)
+            self._windows.move_to_end(key)
+            return window.tally.top(k), window.tally.unique()
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+
+def create_food_window_index(loader: Callable[[str, date], MealArrays]) -> FoodWindowIndex:
+    """Index configured from the environment (FOOD_WINDOWS_MAX, FOOD_SKETCH_WIDTH/DEPTH/CANDIDATES)"""
+    return FoodWindowIndex(
+        loader,
+        max_windows=int(os.getenv("FOOD_WINDOWS_MAX", DEFAULT_MAX_WINDOWS)),
+        sketch_width=int(os.getenv("FOOD_SKETCH_WIDTH", 0)),
+        sketch_depth=int(os.getenv("FOOD_SKETCH_DEPTH", DEFAULT_CMS_DEPTH)),
+        sketch_candidates=int(os.getenv("FOOD_SKETCH_CANDIDATES", DEFAULT_SKETCH_CANDIDATES))
+    )
@@ -0,0 +1,177 @@
+"""Bulk Meal Import - Streaming NDJSON import with batched validation
+
+Each line of the request body is one meal record in the shape returned by
+the history endpoint (meal_id is optional and generated when missing):
+
+    {"user_id": "...", "meal_type": "lunch", "timestamp": "2024-05-01T13:05:00",
+     "detected_foods": [...], "total_nutrition": {...}, "notes": null}
+
+Lines are parsed as they arrive and validated a batch at a time with a single
+pydantic-core call. Valid meals are written with MealStore.add_meals (one
+transaction and one index/rollup update per batch); invalid lines are
+reported by line number without aborting the import.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from contextlib import contextmanager
+import gc
+import time
+import uuid
+
+from pydantic import TypeAdapter, ValidationError
+
+from models.meal import MealEntry
+from services.storage import MealStore
+from utils.serialization import loads
+
+_meal_batch_adapter = TypeAdapter(List[MealEntry])
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_BATCH_SIZE = 10000  # a batch is parsed, validated and held in memory at once
+MAX_REPORTED_ERRORS = 100
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Pause cyclic garbage collection while a batch is built
+
+    Parsing and validating a batch allocates tens of thousands of objects
+    that all survive, which otherwise triggers repeated collections and makes
+    the import several times slower. Nothing in a batch forms reference cycles.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+class MealImporter:
+    """Incremental NDJSON meal importer"""
+
+    def __init__(self, store: MealStore, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_reported_errors: int = MAX_REPORTED_ERRORS):
+        self.store = store
+        self.batch_size = max(1, batch_size)
+        self.max_reported_errors = max_reported_errors
+
+        self.imported = 0
+        self.failed = 0
+        self.batches = 0
+        self.errors: List[Dict[str, Any]] = []
+
+        self._buffer = b''
+        self._line_number = 0
+        self._pending: List[Tuple[int, Dict[str, Any]]] = []  # (line number, record)
+        self._started = time.perf_counter()
+
+    def feed(self, chunk: bytes) -> None:
+        """Consume a chunk of the NDJSON stream"""
+        if not chunk:
+            return
+        data = self._buffer + chunk
+        lines = data.split(b'\n')
+        self._buffer = lines.pop()
+        with _gc_paused():
+            for line in lines:
+                self._add_line(line)
+
+    def finish(self) -> Dict[str, Any]:
+        """Flush the trailing line and last batch; returns the import report"""
+        with _gc_paused():
+            if self._buffer:
+                self._add_line(self._buffer)
+                self._buffer = b''
+            self._flush()
+
+        elapsed = time.perf_counter() - self._started
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "batches": self.batches,
+            "elapsed_s": round(elapsed, 3),
+            "meals_per_second": round(self.imported / elapsed) if elapsed > 0 else 0,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors)
+        }
+
+    def _add_line(self, line: bytes) -> None:
+        self._line_number += 1
+        if not line.strip():
+            return
+
+        try:
+            record = loads(line)
+        except ValueError as e:
+            self._error(self._line_number, f"Invalid JSON: {e}")
+            return
+        if not isinstance(record, dict):
+            self._error(self._line_number, "Record must be a JSON object")
+            return
+
+        if not record.get('meal_id'):
+            record['meal_id'] = str(uuid.uuid4())
+        self._pending.append((self._line_number, record))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def _error(self, line_number: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_reported_errors:
+            self.errors.append({"line": line_number, "error": message})
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        self.batches += 1
+
+        meals = self._validate(pending)
+        if not meals:
+            return
+
+        # Duplicate meal IDs (within the batch or already stored) are rejected per line
+        seen = set()
+        existing = self.store.existing_meal_ids([meal.meal_id for _, meal in meals])
+        unique = []
+        for line_number, meal in meals:
+            if meal.meal_id in existing or meal.meal_id in seen:
+                self._error(line_number, f"Duplicate meal_id: {meal.meal_id}")
+                continue
+            seen.add(meal.meal_id)
+            unique.append(meal)
+
+        self.store.add_meals(unique)
+        self.imported += len(unique)
+
+    def _validate(self, pending: List[Tuple[int, Dict[str, Any]]]) -> List[Tuple[int, MealEntry]]:
+        """Validate a batch in one call; on errors, report them and re-validate the rest"""
+        records = [record for _, record in pending]
+        try:
+            meals = _meal_batch_adapter.validate_python(records)
+            return list(zip((line for line, _ in pending), meals))
+        except ValidationError as e:
+            failed: Dict[int, List[str]] = {}
+            for error in e.errors(include_url=False):
+                index, *field = error['loc']
+                location = '.'.join(str(part) for part in field) or 'record'
+                failed.setdefault(index, []).append(f"{location}: {error['msg']}")
+
+        for index, messages in failed.items():
+            self._error(pending[index][0], "; ".join(messages))
+
+        remaining = [item for index, item in enumerate(pending) if index not in failed]
+        if not remaining:
+            return []
+        meals = _meal_batch_adapter.validate_python([record for _, record in remaining])
+        return list(zip((line for line, _ in remaining), meals))
+
+
+def import_ndjson(store: MealStore, data: bytes, batch_size: int = DEFAULT_BATCH_SIZE,
+                  max_reported_errors: Optional[int] = None) -> Dict[str, Any]:
+    """Import a complete NDJSON document (used by scripts and benchmarks)"""
+    importer = MealImporter(store, batch_size, max_reported_errors or MAX_REPORTED_ERRORS)
+    importer.feed(data)
+    return importer.finish()
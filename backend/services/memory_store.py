@@ -0,0 +1,819 @@
+"""In-Memory Storage Backend - Compact columnar meal store and user store
+
+Meals are not kept as Pydantic objects. Each user's meals live in a
+struct-of-arrays (UserMealColumns): timestamps, meal types and the 7 nutrient
+totals are typed ``array`` columns, detected foods are rows of a second set
+of per-user columns, and food IDs/names are interned in a FoodVocabulary.
+A MealEntry is only materialised when a meal leaves the store.
+
+Rows are append-only. Time order is kept in separate row-number arrays
+(overall and per meal type) that are bisected for date ranges and cursors.
+Deletes mark the row dead in O(1); dead rows are skipped on reads and the
+columns are compacted once a quarter of them are dead.
+
+Reads go through versioned, copy-on-write views. After every mutation the
+writer publishes an immutable ColumnsVersion (the order arrays and their
+lengths, plus the kill version); a reader takes the current one in O(1) and
+sees exactly that version however long it scans:
+
+    * appended rows lie past the published order lengths,
+    * an out-of-order insert copies the order array it would shift once
+      per published version instead of mutating it in place,
+    * a delete records the version that killed the row, so older views
+      still see it, and compaction builds new columns.
+
+Writers never wait for readers. Superseded order arrays and pre-compaction
+columns are reclaimed by reference counting once no snapshot holds them.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, time, timedelta
+from math import isnan, nan
+from time import time_ns
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import heapq
+import itertools
+import threading
+
+from models.meal import MealEntry, MealType
+from models.user import Gender, HealthGoal, UserProfile
+import numpy as np
+
+from services.analytics_engine import MealArrays
+from services.food_counts import FoodCount, create_food_window_index
+from services.population import PopulationSummary, UserDay, create_population_index
+from services.rollups import DailyRollup, PeriodRollup, RollupIndex
+from services.storage import (
+    MealStore, MealSnapshot, UserStore, CursorKey, MAX_ID, to_micros, encode_cursor, decode_cursor,
+    after_fork, encode_user_cursor, normalize_email, user_key
+)
+from utils.serialization import NUTRIENT_FIELDS, construct_meal_entry
+
+MEAL_TYPES = list(MealType)
+MEAL_TYPE_CODES = {meal_type: code for code, meal_type in enumerate(MEAL_TYPES)}
+
+BBOX_FIELDS = ('x', 'y', 'width', 'height')
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Mutations recorded in the write-ahead log (see services.persistence)
+OP_ADD_MEALS = 'add_meals'
+OP_REMOVE_MEAL = 'remove_meal'
+OP_SAVE_USER = 'save_user'
+OP_DELETE_USER = 'delete_user'
+
+MICROS_PER_DAY = 86400 * 1000000
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# meal_ids list entry + str object + rows dict entry, per meal
+MEAL_ID_OVERHEAD_BYTES = 250
+
+# Compact once this many rows are dead and they are over a quarter of the user's rows
+COMPACT_MIN_DEAD = 64
+
+
+def from_micros(micros: int) -> datetime:
+    """Inverse of to_micros (naive UTC)"""
+    return _EPOCH + timedelta(microseconds=micros)
+
+
+class FoodVocabulary:
+    """Interned (food_id, food_name) pairs shared by every user's columns"""
+
+    __slots__ = ('_codes', 'entries')
+
+    def __init__(self):
+        self._codes: Dict[Tuple[str, str], int] = {}
+        self.entries: List[Tuple[str, str]] = []
+
+    def code(self, food_id: str, food_name: str) -> int:
+        key = (food_id, food_name)
+        code = self._codes.get(key)
+        if code is None:
+            code = self._codes[key] = len(self.entries)
+            self.entries.append((food_id, food_name))
+        return code
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class MealExtras:
+    """Rarely-set meal fields, only allocated for meals that have any"""
+
+    __slots__ = ('image_path', 'notes', 'alerts', 'bounding_boxes')
+
+    def __init__(self, image_path=None, notes=None, alerts=None, bounding_boxes=None):
+        self.image_path = image_path
+        self.notes = notes
+        self.alerts = alerts
+        self.bounding_boxes = bounding_boxes  # {food row: bbox} for non-standard boxes
+
+
+class UserMealColumns:
+    """Struct-of-arrays storage for one user's meals"""
+
+    __slots__ = (
+        'timestamps', 'meal_types', 'nutrients', 'alive', 'food_start', 'food_count',
+        'meal_ids', 'extras', 'rows', 'order', 'type_order', 'dead',
+        'food_codes', 'food_confidence', 'food_portion', 'food_nutrients', 'food_bbox',
+        'version', 'killed_at', 'published'
+    )
+
+    def __init__(self):
+        # Meal rows
+        self.timestamps = array('q')  # microseconds since epoch
+        self.meal_types = array('b')  # MEAL_TYPE_CODES
+        self.nutrients = {field: array('d') for field in NUTRIENT_FIELDS}
+        self.alive = bytearray()
+        self.food_start = array('I')
+        self.food_count = array('H')
+        self.meal_ids: List[str] = []
+        self.extras: List[Optional[MealExtras]] = []
+        self.rows: Dict[str, int] = {}  # meal_id -> row
+        self.dead = 0
+
+        # Row numbers in (timestamp, meal_id) order, overall and per meal type
+        self.order = array('i')
+        self.type_order = [array('i') for _ in MEAL_TYPES]
+
+        # Detected food rows
+        self.food_codes = array('i')
+        self.food_confidence = array('d')
+        self.food_portion = array('d')
+        self.food_nutrients = {field: array('d') for field in NUTRIENT_FIELDS}
+        self.food_bbox = {field: array('d') for field in BBOX_FIELDS}  # NaN when absent
+
+        # Copy-on-write versioning (see publish)
+        self.version = 0
+        self.killed_at: Dict[int, int] = {}  # dead row -> version that killed it
+        self.published = ColumnsVersion(self, 0, (self.order, *self.type_order), (0,) * (len(MEAL_TYPES) + 1), 0)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def nbytes(self) -> int:
+        """Approximate heap footprint (column buffers plus per-meal ID bookkeeping)"""
+        total = sum(len(column) * (column.itemsize if isinstance(column, array) else 1) for column in self.arrays())
+        return total + len(self.meal_ids) * MEAL_ID_OVERHEAD_BYTES
+
+    def arrays(self) -> List:
+        """Every typed column, in a fixed order (the snapshot layout)"""
+        columns = [
+            self.timestamps, self.meal_types, self.alive, self.food_start, self.food_count,
+            self.order, self.food_codes, self.food_confidence, self.food_portion
+        ]
+        columns.extend(self.type_order)
+        for group in (self.nutrients, self.food_nutrients, self.food_bbox):
+            columns.extend(group.values())
+        return columns
+
+    @classmethod
+    def from_arrays(cls, buffers: List[bytes], meal_ids: List[str],
+                    extras: List[Optional[MealExtras]], dead: int) -> "UserMealColumns":
+        """Rebuild columns from raw column bytes in arrays() order"""
+        columns = cls()
+        for column, buffer in zip(columns.arrays(), buffers):
+            if isinstance(column, bytearray):
+                column.extend(buffer)
+            else:
+                column.frombytes(buffer)
+        columns.meal_ids = meal_ids
+        columns.extras = extras
+        columns.dead = dead
+        alive = columns.alive
+        columns.rows = {meal_id: row for row, meal_id in enumerate(meal_ids) if alive[row]}
+        columns.publish()
+        return columns
+
+    def daily_rollups(self) -> Dict[date, DailyRollup]:
+        """Daily rollups computed straight from the columns"""
+        rollups: Dict[date, DailyRollup] = {}
+        timestamps, meal_types, alive = self.timestamps, self.meal_types, self.alive
+        calories, protein, carbs, fat, fiber, sugar, sodium = (self.nutrients[field] for field in NUTRIENT_FIELDS)
+        type_fields = [f"{meal_type.value}_calories" for meal_type in MEAL_TYPES]
+
+        current_day, rollup = None, None
+        for row in self.order:
+            if not alive[row]:
+                continue
+            day = timestamps[row] // MICROS_PER_DAY
+            if day != current_day:
+                current_day = day
+                rollup = rollups[date.fromordinal(_EPOCH_ORDINAL + day)] = DailyRollup()
+            rollup.calories += calories[row]
+            rollup.protein += protein[row]
+            rollup.carbs += carbs[row]
+            rollup.fat += fat[row]
+            rollup.fiber += fiber[row]
+            rollup.sugar += sugar[row]
+            rollup.sodium += sodium[row]
+            type_field = type_fields[meal_types[row]]
+            setattr(rollup, type_field, getattr(rollup, type_field) + calories[row])
+            rollup.meals_count += 1
+        return rollups
+
+    def population_days(self, vocabulary: FoodVocabulary) -> Dict[date, UserDay]:
+        """Per-day totals and foods for the population index (services.population)"""
+        days: Dict[date, UserDay] = {}
+        timestamps, alive, food_start, food_count = self.timestamps, self.alive, self.food_start, self.food_count
+        calories, protein = self.nutrients['calories'], self.nutrients['protein']
+        entries, food_codes, food_portion = vocabulary.entries, self.food_codes, self.food_portion
+        for row in range(len(timestamps)):
+            if not alive[row]:
+                continue
+            day = date.fromordinal(_EPOCH_ORDINAL + timestamps[row] // MICROS_PER_DAY)
+            totals = days.get(day)
+            if totals is None:
+                totals = days[day] = UserDay()
+            totals.calories += calories[row]
+            totals.protein += protein[row]
+            totals.meals += 1
+            for food_row in range(food_start[row], food_start[row] + food_count[row]):
+                counter = totals.foods.setdefault(entries[food_codes[food_row]][1], [0, 0.0])
+                counter[0] += 1
+                counter[1] += food_portion[food_row]
+        return days
+
+    def _sort_key(self, row: int) -> CursorKey:
+        return self.timestamps[row], self.meal_ids[row]
+
+    def append(self, meal: MealEntry, vocabulary: FoodVocabulary) -> int:
+        """Add a meal and return its row"""
+        row = len(self.meal_ids)
+        micros = to_micros(meal.timestamp)
+        type_code = MEAL_TYPE_CODES[MealType(meal.meal_type)]
+
+        self.timestamps.append(micros)
+        self.meal_types.append(type_code)
+        nutrition = meal.total_nutrition
+        for field, column in self.nutrients.items():
+            column.append(getattr(nutrition, field))
+        self.alive.append(1)
+        self.meal_ids.append(meal.meal_id)
+        self.rows[meal.meal_id] = row
+
+        bounding_boxes = None
+        self.food_start.append(len(self.food_codes))
+        self.food_count.append(len(meal.detected_foods))
+        for food in meal.detected_foods:
+            food_row = len(self.food_codes)
+            self.food_codes.append(vocabulary.code(food.food_id, food.food_name))
+            self.food_confidence.append(food.confidence)
+            self.food_portion.append(food.estimated_portion_g)
+            for field, column in self.food_nutrients.items():
+                column.append(getattr(food.nutrition, field))
+
+            bbox = food.bounding_box
+            if bbox is not None and set(bbox) == set(BBOX_FIELDS):
+                for field, column in self.food_bbox.items():
+                    column.append(bbox[field])
+            else:
+                for column in self.food_bbox.values():
+                    column.append(nan)
+                if bbox is not None:
+                    bounding_boxes = bounding_boxes or {}
+                    bounding_boxes[food_row] = dict(bbox)
+
+        if meal.image_path or meal.notes or meal.alerts or bounding_boxes:
+            self.extras.append(MealExtras(meal.image_path, meal.notes, list(meal.alerts or []), bounding_boxes))
+        else:
+            self.extras.append(None)
+
+        key = (micros, meal.meal_id)
+        self.order = self._insert(self.order, 0, row, key)
+        self.type_order[type_code] = self._insert(self.type_order[type_code], 1 + type_code, row, key)
+        return row
+
+    def _insert(self, order: array, index: int, row: int, key: CursorKey) -> array:
+        """Insert row into an order array, copying it first if a published view would see the shift"""
+        if not order or self._sort_key(order[-1]) <= key:
+            order.append(row)  # past every published length
+            return order
+        if order is self.published.orders[index]:
+            order = array('i', order)
+        order.insert(bisect_left(order, key, key=self._sort_key), row)
+        return order
+
+    def kill(self, row: int) -> None:
+        """Mark a row deleted (views published before the next version still see it)"""
+        self.killed_at[row] = self.version + 1
+        self.alive[row] = 0
+        self.dead += 1
+        del self.rows[self.meal_ids[row]]
+
+    def needs_compaction(self) -> bool:
+        return self.dead >= COMPACT_MIN_DEAD and self.dead * 4 > len(self.meal_ids)
+
+    def compacted(self, vocabulary: FoodVocabulary) -> "UserMealColumns":
+        """Copy of these columns without dead rows"""
+        fresh = UserMealColumns()
+        fresh.version = self.version
+        for row in self.order:
+            if self.alive[row]:
+                fresh.append(self.materialize(row, vocabulary), vocabulary)
+        return fresh
+
+    def publish(self) -> "ColumnsVersion":
+        """Make the current state visible to readers as the next version"""
+        self.version += 1
+        orders = (self.order, *self.type_order)
+        self.published = ColumnsVersion(self, self.version, orders, tuple(map(len, orders)), self.dead)
+        return self.published
+
+    def materialize(self, row: int, vocabulary: FoodVocabulary) -> MealEntry:
+        """Build the MealEntry for a row"""
+        extras = self.extras[row]
+        foods = []
+        start = self.food_start[row]
+        for food_row in range(start, start + self.food_count[row]):
+            food_id, food_name = vocabulary.entries[self.food_codes[food_row]]
+            x = self.food_bbox['x'][food_row]
+            if not isnan(x):
+                bbox = {field: column[food_row] for field, column in self.food_bbox.items()}
+            elif extras is not None and extras.bounding_boxes:
+                bbox = extras.bounding_boxes.get(food_row)
+            else:
+                bbox = None
+            foods.append({
+                'food_id': food_id,
+                'food_name': food_name,
+                'confidence': self.food_confidence[food_row],
+                'estimated_portion_g': self.food_portion[food_row],
+                'bounding_box': bbox,
+                'nutrition': {field: column[food_row] for field, column in self.food_nutrients.items()}
+            })
+
+        return construct_meal_entry({
+            'meal_id': self.meal_ids[row],
+            'user_id': None,
+            'meal_type': MEAL_TYPES[self.meal_types[row]],
+            'detected_foods': foods,
+            'total_nutrition': {field: column[row] for field, column in self.nutrients.items()},
+            'image_path': extras.image_path if extras else None,
+            'notes': extras.notes if extras else None,
+            'timestamp': from_micros(self.timestamps[row]),
+            'alerts': extras.alerts if extras else []
+        })
+
+
+class ColumnsVersion:
+    """Immutable published state of one user's columns"""
+
+    __slots__ = ('columns', 'version', 'orders', 'lengths', 'dead')
+
+    def __init__(self, columns: UserMealColumns, version: int, orders: Tuple[array, ...],
+                 lengths: Tuple[int, ...], dead: int):
+        self.columns = columns
+        self.version = version
+        self.orders = orders  # overall order, then one per meal type
+        self.lengths = lengths
+        self.dead = dead
+
+
+class ColumnSnapshot(MealSnapshot):
+    """A user's meals as of one published ColumnsVersion"""
+
+    def __init__(self, user_id: str, state: Optional[ColumnsVersion], vocabulary: FoodVocabulary):
+        self.store = None
+        self.user_id = user_id
+        self.state = state
+        self.vocabulary = vocabulary
+
+    @property
+    def version(self) -> int:
+        return self.state.version if self.state is not None else 0
+
+    def close(self) -> None:
+        self.state = None
+
+    def _span(self, meal_type, start, end) -> Tuple[array, int, int]:
+        """Order array and [lo, hi) positions covering the filters"""
+        state = self.state
+        index = 0 if meal_type is None else 1 + MEAL_TYPE_CODES[MealType(meal_type)]
+        order, length = state.orders[index], state.lengths[index]
+        sort_key = state.columns._sort_key
+        lo = bisect_left(order, (to_micros(start), ''), 0, length, key=sort_key) if start else 0
+        hi = bisect_right(order, (to_micros(end), MAX_ID), 0, length, key=sort_key) if end else length
+        return order, lo, hi
+
+    def _iter_rows(self, order: array, lo: int, hi: int, reverse: bool) -> Iterator[int]:
+        """Rows among order[lo:hi] alive at this version, oldest first (newest first when reverse)"""
+        alive, killed_at, version = self.state.columns.alive, self.state.columns.killed_at, self.state.version
+        positions = range(hi - 1, lo - 1, -1) if reverse else range(lo, hi)
+        for position in positions:
+            row = order[position]
+            if alive[row] or killed_at.get(row, 0) > version:
+                yield row
+
+    def _rows(self, meal_type, start, end, newest_first, after=None) -> Iterator[int]:
+        """Matching rows, optionally past a cursor key"""
+        if self.state is None:
+            return iter(())
+        order, lo, hi = self._span(meal_type, start, end)
+        sort_key = self.state.columns._sort_key
+        if after is not None:
+            if newest_first:
+                hi = min(hi, bisect_left(order, after, lo, hi, key=sort_key))
+            else:
+                lo = max(lo, bisect_right(order, after, lo, hi, key=sort_key))
+        return self._iter_rows(order, lo, hi, reverse=newest_first)
+
+    def _materialize(self, row: int) -> MealEntry:
+        meal = self.state.columns.materialize(row, self.vocabulary)
+        meal.__dict__['user_id'] = self.user_id
+        return meal
+
+    def query_meals(self, meal_type=None, start=None, end=None,
+                    limit=None, offset=0, newest_first=False) -> List[MealEntry]:
+        meals = []
+        for i, row in enumerate(self._rows(meal_type, start, end, newest_first)):
+            if limit is not None and i >= offset + limit:
+                break
+            if i >= offset:
+                meals.append(self._materialize(row))
+        return meals
+
+    def page_meals(self, meal_type=None, start=None, end=None,
+                   limit=10, cursor=None, newest_first=True) -> Tuple[List[MealEntry], Optional[str]]:
+        after = decode_cursor(cursor) if cursor else None
+        meals = []
+        has_more = False
+        for row in self._rows(meal_type, start, end, newest_first, after):
+            if len(meals) == limit:
+                has_more = True
+                break
+            meals.append(self._materialize(row))
+        next_cursor = encode_cursor(meals[-1]) if has_more and meals else None
+        return meals, next_cursor
+
+    def meal_arrays(self, start=None, end=None, foods=False) -> MealArrays:
+        """Gather the visible rows' columns with NumPy fancy indexing (no MealEntry objects)"""
+        if self.state is None:
+            return MealArrays.from_meals([], foods=foods)
+        state = self.state
+        columns = state.columns
+        order, lo, hi = self._span(None, start, end)
+        # Slices copy under the GIL, so concurrent appends never see an exported buffer
+        rows = np.frombuffer(order[lo:hi], dtype=np.int32)
+        if state.dead or columns.killed_at:
+            visible = np.frombuffer(bytes(columns.alive), dtype=np.uint8)[rows].astype(bool)
+            revived = [row for row, version in list(columns.killed_at.items()) if version > state.version]
+            if revived:
+                visible |= np.isin(rows, revived)
+            rows = rows[visible]
+        end_row = int(rows.max()) + 1 if len(rows) else 0
+
+        arrays = MealArrays(
+            _gather(columns.timestamps, end_row, rows),
+            _gather(columns.meal_types, end_row, rows),
+            {field: _gather(column, end_row, rows) for field, column in columns.nutrients.items()}
+        )
+        if foods:
+            counts = _gather(columns.food_count, end_row, rows).astype(np.int64)
+            starts = _gather(columns.food_start, end_row, rows).astype(np.int64)
+            total = int(counts.sum())
+            # Food rows of every meal: start + 0..count-1, flattened
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            food_rows = np.repeat(starts, counts) + offsets
+            end_food = int(food_rows.max()) + 1 if total else 0
+            arrays.food_codes = _gather(columns.food_codes, end_food, food_rows)
+            arrays.food_portion = _gather(columns.food_portion, end_food, food_rows)
+            arrays.food_meals = np.repeat(np.arange(len(rows)), counts)
+            arrays.foods = self.vocabulary.entries
+        return arrays
+
+    def count_meals(self, meal_type=None, start=None, end=None) -> int:
+        if self.state is None:
+            return 0
+        order, lo, hi = self._span(meal_type, start, end)
+        if hi <= lo:
+            return 0
+        if not self.state.dead:
+            return hi - lo
+        return sum(1 for _ in self._iter_rows(order, lo, hi, reverse=False))
+
+
+def _gather(column: array, end: int, rows: np.ndarray) -> np.ndarray:
+    """column[rows] as a NumPy array (copies column[:end] first)"""
+    return np.frombuffer(column[:end], dtype=column.typecode)[rows]
+
+
+def _journaled(lock, journal, op: str, data, apply, *args):
+    """
+    Apply a mutation under the store's write lock and, when a journal is
+    attached, log it durably
+
+    Handlers run in the threadpool, so writes to one store are serialized by
+    its lock whether or not it is journaled. The mutation is applied and
+    logged under the journal lock too, so the log order matches the
+    in-memory order; the caller then waits for the (group) fsync outside
+    both locks.
+    """
+    with lock:
+        if journal is None:
+            return apply(*args)
+        with journal.lock:
+            result = apply(*args)
+            lsn = journal.record(op, data)
+    journal.commit(lsn)
+    return result
+
+
+class InMemoryMealStore(MealStore):
+    """Process-local columnar meal storage, optionally journaled (services.persistence)"""
+
+    def __init__(self, journal=None):
+        self.journal = journal
+        # Serializes writes (taken before the food window lock); reads use published versions
+        self.write_lock = threading.RLock()
+        after_fork(self._reset_write_lock)
+        self.vocabulary = FoodVocabulary()
+        self.user_columns: Dict[str, UserMealColumns] = {}  # {user_id: UserMealColumns}
+        self.meal_owners: Dict[str, str] = {}  # {meal_id: user_id}
+        self.rollups = RollupIndex()
+        # Writes publish and update the food windows under its lock (see services.food_counts)
+        self.food_windows = create_food_window_index(self._food_arrays)
+        self.data_versions: Dict[str, int] = {}  # {user_id: version of the last mutation}
+        # Versions come from a clock seeded with the wall time, so results stored
+        # against a version (services.analytics_cache.ReportStore) never match data
+        # rebuilt by a later process
+        self._version_clock = itertools.count(time_ns())
+        self.population = create_population_index()
+
+    def _reset_write_lock(self) -> None:
+        self.write_lock = threading.RLock()
+
+    def _columns(self, user_id: str) -> Optional[UserMealColumns]:
+        """A user's columns (the tiered store overrides this to page users in)"""
+        return self.user_columns.get(user_id)
+
+    def iter_user_columns(self) -> Iterator[Tuple[str, UserMealColumns]]:
+        """(user_id, columns) for every user with meals"""
+        return iter(list(self.user_columns.items()))
+
+    def meal_user_ids(self) -> List[str]:
+        """Every user with meals"""
+        return list(self.user_columns)
+
+    def _append(self, meal: MealEntry) -> None:
+        columns = self._columns(meal.user_id)
+        if columns is None:
+            columns = self.user_columns[meal.user_id] = UserMealColumns()
+        columns.append(meal, self.vocabulary)
+        self.meal_owners[meal.meal_id] = meal.user_id
+
+    def _bump(self, user_id: str) -> None:
+        self.data_versions[user_id] = next(self._version_clock)
+
+    def _materialize(self, user_id: str, columns: UserMealColumns, row: int) -> MealEntry:
+        meal = columns.materialize(row, self.vocabulary)
+        meal.__dict__['user_id'] = user_id
+        return meal
+
+    def add_meal(self, meal: MealEntry) -> None:
+        _journaled(self.write_lock, self.journal, OP_ADD_MEALS, [meal], self.apply_add_meal, meal)
+
+    def add_meals(self, meals: List[MealEntry]) -> None:
+        _journaled(self.write_lock, self.journal, OP_ADD_MEALS, meals, self.apply_add_meals, meals)
+
+    def apply_add_meal(self, meal: MealEntry) -> None:
+        self._append(meal)
+        with self.food_windows.lock:
+            self.user_columns[meal.user_id].publish()
+            self.food_windows.add_meal(meal)
+        self.rollups.add_meal(meal)
+        self.population.add_meal(meal)
+        self._bump(meal.user_id)
+
+    def apply_add_meals(self, meals: List[MealEntry]) -> None:
+        touched = {}
+        for meal in sorted(meals, key=lambda m: (m.user_id, to_micros(m.timestamp), m.meal_id)):
+            self._append(meal)
+            touched[meal.user_id] = self.user_columns[meal.user_id]
+        with self.food_windows.lock:
+            for columns in touched.values():
+                columns.publish()  # one version per batch
+            self.food_windows.add_meals(meals)
+        self.rollups.add_meals(meals)
+        self.population.add_meals(meals)
+        for user_id in touched:
+            self._bump(user_id)
+
+    def restore_columns(self, user_id: str, columns: UserMealColumns) -> None:
+        """Install a user's columns loaded from a snapshot"""
+        with self.write_lock:
+            with self.food_windows.lock:
+                self.user_columns[user_id] = columns
+                self.food_windows.drop_user(user_id)
+            for meal_id in columns.rows:
+                self.meal_owners[meal_id] = user_id
+            self.rollups.set_user(user_id, columns.daily_rollups())
+            self.population.add_user_days(user_id, columns.population_days(self.vocabulary))
+            self._bump(user_id)
+
+    def existing_meal_ids(self, meal_ids: List[str]) -> Set[str]:
+        return {meal_id for meal_id in meal_ids if meal_id in self.meal_owners}
+
+    def get_meal(self, meal_id: str) -> Optional[MealEntry]:
+        user_id = self.meal_owners.get(meal_id)
+        if user_id is None:
+            return None
+        columns = self._columns(user_id)
+        row = columns.rows.get(meal_id) if columns is not None else None
+        if row is None:
+            return None  # removed since the owner lookup
+        return self._materialize(user_id, columns, row)
+
+    def remove_meal(self, meal_id: str) -> Optional[MealEntry]:
+        return _journaled(self.write_lock, self.journal, OP_REMOVE_MEAL, meal_id, self.apply_remove_meal, meal_id)
+
+    def apply_remove_meal(self, meal_id: str) -> Optional[MealEntry]:
+        user_id = self.meal_owners.pop(meal_id, None)
+        if user_id is None:
+            return None
+        columns = self._columns(user_id)
+        row = columns.rows[meal_id]
+        meal = self._materialize(user_id, columns, row)
+        with self.food_windows.lock:
+            columns.kill(row)
+            if not columns.rows:
+                del self.user_columns[user_id]
+            elif columns.needs_compaction():
+                self.user_columns[user_id] = columns.compacted(self.vocabulary)
+            self.user_columns.get(user_id, columns).publish()
+            self.food_windows.remove_meal(meal)
+        self.rollups.remove_meal(meal)
+        self.population.remove_meal(meal)
+        self._bump(user_id)
+        return meal
+
+    def has_meals(self, user_id: str) -> bool:
+        return user_id in self.user_columns
+
+    def snapshot(self, user_id: str) -> ColumnSnapshot:
+        """The user's latest published version (O(1); never blocks writers)"""
+        columns = self._columns(user_id)
+        return ColumnSnapshot(user_id, columns.published if columns is not None else None, self.vocabulary)
+
+    def query_meals(self, user_id, meal_type=None, start=None, end=None,
+                    limit=None, offset=0, newest_first=False) -> List[MealEntry]:
+        return self.snapshot(user_id).query_meals(meal_type, start, end, limit, offset, newest_first)
+
+    def page_meals(self, user_id, meal_type=None, start=None, end=None,
+                   limit=10, cursor=None, newest_first=True) -> Tuple[List[MealEntry], Optional[str]]:
+        return self.snapshot(user_id).page_meals(meal_type, start, end, limit, cursor, newest_first)
+
+    def count_meals(self, user_id, meal_type=None, start=None, end=None) -> int:
+        return self.snapshot(user_id).count_meals(meal_type, start, end)
+
+    def daily_rollup(self, user_id: str, day: date) -> Optional[DailyRollup]:
+        return self.rollups.get(user_id, day)
+
+    def rollup_range(self, user_id: str, start: date, end: date) -> PeriodRollup:
+        return self.rollups.range_total(user_id, start, end)
+
+    def rollup_series(self, user_id, start, end, resolution='day') -> List[Tuple[date, PeriodRollup]]:
+        return self.rollups.series(user_id, start, end, resolution)
+
+    def _food_arrays(self, user_id: str, start: date) -> MealArrays:
+        """A user's meals from `start` on with foods, to build a food window"""
+        with self.snapshot(user_id) as snapshot:
+            return snapshot.meal_arrays(start=datetime.combine(start, time.min), foods=True)
+
+    def top_foods(self, user_id, start, end, k=20) -> Tuple[List[FoodCount], int]:
+        return self.food_windows.top(user_id, start, end, k)
+
+    def rebuild_rollups(self, user_id: Optional[str] = None) -> int:
+        with self.write_lock:
+            user_ids = list(self.user_columns) if user_id is None else [user_id]
+            if user_id is None:
+                self.rollups.clear()
+            count = 0
+            for owner in user_ids:
+                columns = self.user_columns.get(owner)
+                days = columns.daily_rollups() if columns is not None else {}
+                self.rollups.set_user(owner, days)
+                self._bump(owner)
+                count += sum(rollup.meals_count for rollup in days.values())
+            return count
+
+    def data_version(self, user_id: str) -> int:
+        return self.data_versions.get(user_id, 0)
+
+    def set_profile_source(self, profile_of) -> None:
+        self.population.profile_of = profile_of
+
+    def population_summary(self, start: date, end: date) -> PopulationSummary:
+        return self.population.summary(start, end)
+
+
+class InMemoryUserStore(UserStore):
+    """
+    Process-local user storage, optionally journaled (services.persistence)
+
+    Secondary indexes are maintained on every save/delete:
+
+        * emails: normalized email -> user_id, for O(1) lookups and the
+          uniqueness check in create_user,
+        * directory: per (health goal, gender) partition, the sorted
+          (created_at micros, user_id) keys; a page merges the partitions
+          matching the filters from the cursor onwards, so it costs
+          O(partitions * log n + limit) however many users precede it.
+    """
+
+    def __init__(self, journal=None):
+        self.journal = journal
+        self.users_db: Dict[str, UserProfile] = {}
+        self.emails: Dict[str, str] = {}
+        self.directory: Dict[Tuple[str, str], List[CursorKey]] = {}
+        # user_id -> (email key, partition, directory key) as indexed; profiles
+        # are updated in place by the routes, so the old values are kept here
+        self._indexed: Dict[str, Tuple[str, Tuple[str, str], CursorKey]] = {}
+        self._lock = threading.RLock()
+        after_fork(self._reset_lock)
+
+    def _reset_lock(self) -> None:
+        self._lock = threading.RLock()
+
+    def create_user(self, user: UserProfile) -> bool:
+        with self._lock:
+            owner = self.emails.get(normalize_email(user.email))
+            if owner is not None and owner != user.user_id:
+                return False
+            self.save_user(user)
+            return True
+
+    def save_user(self, user: UserProfile) -> None:
+        _journaled(self._lock, self.journal, OP_SAVE_USER, user, self.apply_save_user, user)
+
+    def apply_save_user(self, user: UserProfile) -> None:
+        with self._lock:
+            self._unindex(user.user_id)
+            self.users_db[user.user_id] = user
+            email = normalize_email(user.email)
+            self.emails.setdefault(email, user.user_id)
+            partition = (HealthGoal(user.health_goal).value, Gender(user.gender).value)
+            key = user_key(user)
+            keys = self.directory.setdefault(partition, [])
+            if not keys or keys[-1] < key:
+                keys.append(key)  # new users arrive in created_at order
+            else:
+                keys.insert(bisect_left(keys, key), key)
+            self._indexed[user.user_id] = (email, partition, key)
+
+    def _unindex(self, user_id: str) -> None:
+        indexed = self._indexed.pop(user_id, None)
+        if indexed is None:
+            return
+        email, partition, key = indexed
+        if self.emails.get(email) == user_id:
+            del self.emails[email]
+        keys = self.directory[partition]
+        del keys[bisect_left(keys, key)]
+        if not keys:
+            del self.directory[partition]
+
+    def get_user(self, user_id: str) -> Optional[UserProfile]:
+        return self.users_db.get(user_id)
+
+    def get_users(self, user_ids: List[str]) -> List[UserProfile]:
+        users_db = self.users_db
+        return [users_db[user_id] for user_id in user_ids if user_id in users_db]
+
+    def get_user_by_email(self, email: str) -> Optional[UserProfile]:
+        user_id = self.emails.get(normalize_email(email))
+        return self.users_db.get(user_id) if user_id is not None else None
+
+    def delete_user(self, user_id: str) -> bool:
+        return _journaled(self._lock, self.journal, OP_DELETE_USER, user_id, self.apply_delete_user, user_id)
+
+    def apply_delete_user(self, user_id: str) -> bool:
+        with self._lock:
+            self._unindex(user_id)
+            return self.users_db.pop(user_id, None) is not None
+
+    def list_users(self) -> List[UserProfile]:
+        return list(self.users_db.values())
+
+    def _partitions(self, health_goal: Optional[str], gender: Optional[str]) -> List[List[CursorKey]]:
+        return [keys for (goal, sex), keys in self.directory.items()
+                if (health_goal is None or goal == health_goal) and (gender is None or sex == gender)]
+
+    def page_users(self, limit=50, cursor=None, health_goal=None, gender=None) -> Tuple[List[UserProfile], Optional[str]]:
+        after = decode_cursor(cursor) if cursor else None
+        with self._lock:
+            runs = []
+            for keys in self._partitions(health_goal, gender):
+                start = bisect_right(keys, after) if after is not None else 0
+                runs.append(map(keys.__getitem__, range(start, len(keys))))
+            page = list(itertools.islice(heapq.merge(*runs), limit + 1))
+            users = [self.users_db[user_id] for _, user_id in page[:limit]]
+        next_cursor = encode_user_cursor(users[-1]) if len(page) > limit else None
+        return users, next_cursor
+
+    def count_users(self, health_goal=None, gender=None) -> int:
+        if health_goal is None and gender is None:
+            return len(self.users_db)
+        with self._lock:
+            return sum(len(keys) for keys in self._partitions(health_goal, gender))
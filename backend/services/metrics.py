@@ -0,0 +1,369 @@
+"""Metrics - In-process counters, gauges and histograms in Prometheus text format
+
+A small dependency-free registry: recording is a dict lookup (children are
+usually bound once at import) plus an integer/float update under an
+uncontended lock, so instrumentation stays on in production. Everything
+expensive - cumulative buckets, text formatting, stats pulled from caches
+and stores through collectors - happens only when /metrics is scraped.
+
+Built-in metrics:
+    http_request_duration_seconds{method,route,status}  every request (MetricsMiddleware)
+    http_requests_in_flight                              requests being served
+    recognize_stage_seconds{stage}                       /food/recognize stages
+    recognize_in_flight, gemini_requests_in_flight       recognitions / Gemini calls under way
+    recognize_events_total{event}                        fallbacks and upstream errors
+    process_resident_memory_bytes                        sampled at scrape time
+
+Set METRICS_ENABLED=0 to leave the middleware out entirely.
+"""
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import os
+import threading
+
+# Request and stage latencies: 1 ms .. 30 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# A collector returns (name, type, help, [(labels, value), ...]) families at scrape time
+Sample = Tuple[Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    """A metric family: one child per combination of label values"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values: str):
+        """The child for these label values (bind it once on hot paths)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self, lines: List[str]) -> None:
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for values, child in list(self._children.items()):
+            self._render_child(lines, values, child)
+
+    def _render_child(self, lines: List[str], values: Tuple[str, ...], child) -> None:
+        lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}")
+
+
+class _Value:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def track(self) -> '_InFlight':
+        """Context manager counting the block while it runs (gauges)"""
+        return _InFlight(self)
+
+
+class _InFlight:
+    __slots__ = ('gauge',)
+
+    def __init__(self, gauge: _Value):
+        self.gauge = gauge
+
+    def __enter__(self):
+        self.gauge.inc()
+        return self
+
+    def __exit__(self, *exc):
+        self.gauge.dec()
+        return False
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = 'counter'
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1) -> None:
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down"""
+
+    kind = 'gauge'
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1) -> None:
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self._default.dec(amount)
+
+    def set(self, value: float) -> None:
+        self._default.set(value)
+
+    def track(self) -> _InFlight:
+        return self._default.track()
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # per bucket, not cumulative; last is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self, gauge: Optional[_Value] = None) -> '_Timer':
+        """Context manager observing the block's duration in seconds"""
+        return _Timer(self, gauge)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class _Timer:
+    __slots__ = ('histogram', 'gauge', 'started')
+
+    def __init__(self, histogram: _HistogramChild, gauge: Optional[_Value] = None):
+        self.histogram = histogram
+        self.gauge = gauge  # also counted as in flight while timing, if given
+
+    def __enter__(self):
+        if self.gauge is not None:
+            self.gauge.inc()
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(perf_counter() - self.started)
+        if self.gauge is not None:
+            self.gauge.dec()
+        return False
+
+
+class Histogram(_Metric):
+    """Distribution of observations in fixed buckets (upper bounds, seconds for latencies)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def time(self) -> _Timer:
+        return self._default.time()
+
+    def _render_child(self, lines: List[str], values: Tuple[str, ...], child: _HistogramChild) -> None:
+        counts, total = child.snapshot()
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+
+
+class MetricsRegistry:
+    """Named metrics and scrape-time collectors, rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} already registered differently")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(self, collect: Callable[[], Iterable[Family]]) -> None:
+        """Register a callback producing metric families when /metrics is scraped"""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            metric.render(lines)
+        for collect in self._collectors:
+            for name, kind, documentation, samples in collect():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} "
+                                 f"{_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'http_request_duration_seconds', 'Request latency by route template', ('method', 'route', 'status')
+)
+HTTP_IN_FLIGHT = registry.gauge('http_requests_in_flight', 'Requests currently being served')
+
+RECOGNIZE_STAGES = ('upload_write', 'decode', 'gemini', 'detect', 'portions', 'nutrition', 'alerts',
+                    'explanation', 'quality')
+RECOGNIZE_STAGE_SECONDS = registry.histogram(
+    'recognize_stage_seconds', 'Time spent in each /food/recognize stage', ('stage',)
+)
+RECOGNIZE_IN_FLIGHT = registry.gauge('recognize_in_flight', 'Food recognitions under way')
+GEMINI_IN_FLIGHT = registry.gauge('gemini_requests_in_flight', 'Gemini Vision calls under way')
+RECOGNIZE_EVENTS = registry.counter(
+    'recognize_events_total', 'Recognition fallbacks and upstream errors', ('event',)
+)
+
+# Hot-path children, bound once
+STAGE_TIMERS = {stage: RECOGNIZE_STAGE_SECONDS.labels(stage) for stage in RECOGNIZE_STAGES}
+_GEMINI_CALLS = GEMINI_IN_FLIGHT.labels()
+
+
+def stage_timer(stage: str) -> _Timer:
+    """Time one recognize stage (FoodClassifier.stage_timer hook); Gemini calls also count as in flight"""
+    return STAGE_TIMERS[stage].time(_GEMINI_CALLS if stage == 'gemini' else None)
+
+
+def record_event(event: str) -> None:
+    """Count a recognize fallback or upstream error (FoodClassifier.on_event hook)"""
+    RECOGNIZE_EVENTS.labels(event).inc()
+
+
+def process_rss_bytes() -> int:
+    """Resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # peak, where /proc is missing
+
+
+def _process_metrics() -> Iterable[Family]:
+    return [('process_resident_memory_bytes', 'gauge', 'Resident memory size in bytes', [({}, process_rss_bytes())])]
+
+
+registry.collector(_process_metrics)
+
+
+def metrics_enabled() -> bool:
+    """METRICS_ENABLED (default on)"""
+    return os.getenv('METRICS_ENABLED', '1').strip().lower() not in ('0', 'false', 'no')
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency and in-flight requests
+
+    Latency is labelled with the matched route's path template (e.g.
+    /users/{user_id}), so the label set stays bounded; requests that match no
+    route are labelled "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get('route')
+            template = getattr(route, 'path', None) or 'unmatched'
+            HTTP_REQUEST_SECONDS.labels(scope['method'], template, str(status[0])).observe(perf_counter() - started)
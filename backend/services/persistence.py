@@ -0,0 +1,482 @@
+"""Persistence - Write-ahead log and snapshots for the in-memory stores
+
+With WAL_DIR set, the memory backend keeps its latency but survives restarts:
+
+    * Every mutation (meal add/import, meal delete, user save, user delete) is
+      appended to a write-ahead log before the request is acknowledged.
+      Concurrent writers share fsyncs: whichever writer syncs first flushes
+      every record appended so far (group commit).
+    * A background thread periodically writes a binary snapshot. The meal
+      columns are dumped as raw array bytes, so snapshots are compact and load
+      with a memcpy per column. Log segments covered by a snapshot are deleted.
+    * On startup the latest snapshot is loaded and the log tail replayed. A
+      record torn by a crash fails its checksum and the log is truncated there.
+
+Files in WAL_DIR:
+    wal-<first lsn>.log        log segment, one frame per record
+    snapshot-<lsn>.bin         state after record <lsn>
+
+Frames are <length:uint32><crc32:uint32><payload>. Log payloads are JSON
+[op, data]; snapshots are a sequence of frames (see write_snapshot).
+"""
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import os
+import struct
+import threading
+import time
+import zlib
+
+from services.memory_store import (
+    InMemoryMealStore, InMemoryUserStore, UserMealColumns, MealExtras,
+    OP_ADD_MEALS, OP_REMOVE_MEAL, OP_SAVE_USER, OP_DELETE_USER
+)
+from services.storage import on_shutdown
+from utils.serialization import dumps, loads, construct_meal_entry, construct_user_profile
+
+SNAPSHOT_MAGIC = b'NUTRISNAP1\n'
+SNAPSHOT_VERSION = 1
+
+DEFAULT_SNAPSHOT_INTERVAL_S = 300
+DEFAULT_SNAPSHOT_MIN_RECORDS = 10000
+
+_FRAME_HEADER = struct.Struct('<II')
+
+
+def encode_frame(payload: bytes) -> bytes:
+    """Length- and checksum-prefixed record"""
+    return _FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_frames(data: bytes) -> Tuple[List[bytes], int]:
+    """
+    Split a buffer into frame payloads
+
+    Returns:
+        (payloads, offset just past the last intact frame)
+    """
+    payloads = []
+    offset = 0
+    view = memoryview(data)
+    while offset + _FRAME_HEADER.size <= len(data):
+        length, checksum = _FRAME_HEADER.unpack_from(data, offset)
+        start = offset + _FRAME_HEADER.size
+        payload = view[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            break
+        payloads.append(payload.tobytes())
+        offset = start + length
+    return payloads, offset
+
+
+def _fsync_directory(directory: str) -> None:
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _numbered_files(directory: str, prefix: str, suffix: str) -> List[Tuple[int, str]]:
+    """[(number, path)] for files named <prefix><number><suffix>, ascending"""
+    found = []
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(suffix):
+            try:
+                found.append((int(name[len(prefix):-len(suffix)]), os.path.join(directory, name)))
+            except ValueError:
+                continue
+    return sorted(found)
+
+
+class WriteAheadLog:
+    """Segmented append-only log with group-commit fsync"""
+
+    def __init__(self, directory: str, next_lsn: int, fsync: bool = True):
+        self.directory = directory
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._buffer = bytearray()
+        self._lsn = next_lsn - 1  # last appended record
+        self._durable_lsn = self._lsn
+        self._syncing = False
+        self._failed: Optional[OSError] = None
+        self._fd = self._open_segment(next_lsn)
+
+    def _open_segment(self, first_lsn: int) -> int:
+        path = os.path.join(self.directory, f"wal-{first_lsn:020d}.log")
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        _fsync_directory(self.directory)
+        return fd
+
+    @property
+    def lsn(self) -> int:
+        """Sequence number of the last appended record"""
+        return self._lsn
+
+    def append(self, payload: bytes) -> int:
+        """Buffer a record; returns its sequence number (not yet durable)"""
+        with self._lock:
+            self._buffer += encode_frame(payload)
+            self._lsn += 1
+            return self._lsn
+
+    def commit(self, lsn: int) -> None:
+        """
+        Block until record `lsn` (and every record before it) is on disk
+
+        A failed write puts the bytes it did not write back at the front of
+        the buffer, so the next commit retries them. A failed fsync leaves
+        the state of the written bytes unknown: the log then refuses every
+        further commit rather than acknowledge records that may be gone.
+        """
+        with self._lock:
+            while self._durable_lsn < lsn:
+                if self._failed is not None:
+                    raise OSError(f"Write-ahead log unavailable after a failed fsync: {self._failed}")
+                if self._syncing:
+                    self._synced.wait()
+                    continue
+                # Become the syncing writer for everything buffered so far
+                self._syncing = True
+                data, self._buffer = self._buffer, bytearray()
+                target, fd = self._lsn, self._fd
+                view = memoryview(data)
+                synced = False
+                self._lock.release()
+                try:
+                    while view:
+                        view = view[os.write(fd, view):]
+                    if self.fsync:
+                        try:
+                            os.fsync(fd)
+                        except OSError as e:
+                            self._failed = e
+                            raise
+                    synced = True
+                finally:
+                    self._lock.acquire()
+                    self._syncing = False
+                    if view:
+                        self._buffer[:0] = view
+                    if synced:
+                        self._durable_lsn = target
+                    self._synced.notify_all()
+
+    def rotate(self) -> int:
+        """Flush and start a new segment; returns the last LSN of the old one"""
+        last = self._lsn
+        self.commit(last)
+        with self._lock:
+            while self._syncing:
+                self._synced.wait()
+            os.close(self._fd)
+            self._fd = self._open_segment(self._lsn + 1)
+        return last
+
+    def close(self) -> None:
+        self.commit(self._lsn)
+        with self._lock:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def capture_columns(columns: UserMealColumns) -> Tuple:
+    """Point-in-time copy of a user's columns (cheap: raw array bytes and list copies)"""
+    return (
+        [column.tobytes() if hasattr(column, 'tobytes') else bytes(column) for column in columns.arrays()],
+        list(columns.meal_ids),
+        list(columns.extras),
+        columns.dead
+    )
+
+
+def _encode_extras(extras: Optional[MealExtras]) -> Optional[List]:
+    if extras is None:
+        return None
+    return [extras.image_path, extras.notes, extras.alerts, extras.bounding_boxes]
+
+
+def _decode_extras(values: Optional[List]) -> Optional[MealExtras]:
+    if values is None:
+        return None
+    image_path, notes, alerts, bounding_boxes = values
+    if bounding_boxes:
+        bounding_boxes = {int(row): bbox for row, bbox in bounding_boxes.items()}
+    return MealExtras(image_path, notes, alerts, bounding_boxes)
+
+
+def encode_columns(captured: Tuple) -> Iterator[bytes]:
+    """Frames for captured columns: a JSON frame {meal_ids, extras, dead}, then one raw frame per column"""
+    buffers, meal_ids, extras, dead = captured
+    yield encode_frame(dumps({
+        'meal_ids': meal_ids,
+        'extras': [_encode_extras(item) for item in extras],
+        'dead': dead
+    }))
+    for buffer in buffers:
+        yield encode_frame(buffer)
+
+
+def decode_columns(frames: List[bytes]) -> UserMealColumns:
+    """Inverse of encode_columns (frame payloads)"""
+    meta = loads(frames[0])
+    return UserMealColumns.from_arrays(
+        frames[1:],
+        meta['meal_ids'],
+        [_decode_extras(item) for item in meta['extras']],
+        meta['dead']
+    )
+
+
+COLUMN_FRAMES = 1 + len(UserMealColumns().arrays())
+
+
+def write_snapshot(path: str, lsn: int, vocabulary: List, users: List[Dict], columns: Dict[str, Tuple]) -> None:
+    """
+    Write a snapshot atomically (temp file, fsync, rename)
+
+    Layout: magic, header frame {version, lsn, vocabulary, users, meal_users},
+    then per user in meal_users order a JSON frame {meal_ids, extras, dead}
+    followed by one raw frame per column in UserMealColumns.arrays() order.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(encode_frame(dumps({
+            'version': SNAPSHOT_VERSION,
+            'lsn': lsn,
+            'vocabulary': vocabulary,
+            'users': users,
+            'meal_users': list(columns)
+        })))
+        for captured in columns.values():
+            for frame in encode_columns(captured):
+                f.write(frame)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_directory(os.path.dirname(path))
+
+
+def read_snapshot(path: str, meal_store: InMemoryMealStore, user_store: InMemoryUserStore) -> int:
+    """Load a snapshot into empty stores; returns its LSN (raises ValueError if damaged)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(SNAPSHOT_MAGIC):
+        raise ValueError(f"Not a snapshot: {path}")
+    frames, end = read_frames(data[len(SNAPSHOT_MAGIC):])
+    if end != len(data) - len(SNAPSHOT_MAGIC) or not frames:
+        raise ValueError(f"Truncated snapshot: {path}")
+
+    header = loads(frames[0])
+    if header['version'] != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {header['version']}: {path}")
+
+    for food_id, food_name in header['vocabulary']:
+        meal_store.vocabulary.code(food_id, food_name)
+    for user in header['users']:
+        user_store.apply_save_user(construct_user_profile(user))
+
+    position = 1
+    for user_id in header['meal_users']:
+        meal_store.restore_columns(user_id, decode_columns(frames[position:position + COLUMN_FRAMES]))
+        position += COLUMN_FRAMES
+    return header['lsn']
+
+
+def read_log(path: str) -> Tuple[Iterator[Any], int, int]:
+    """(decoded records, intact byte length, file byte length) of a log segment"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    payloads, end = read_frames(data)
+    return (loads(payload) for payload in payloads), end, len(data)
+
+
+class Journal:
+    """Durable in-memory meal and user stores backed by a WAL and snapshots"""
+
+    def __init__(self, directory: str,
+                 snapshot_interval_s: float = DEFAULT_SNAPSHOT_INTERVAL_S,
+                 snapshot_min_records: int = DEFAULT_SNAPSHOT_MIN_RECORDS,
+                 fsync: bool = True,
+                 meal_store_factory: Optional[Callable[["Journal"], InMemoryMealStore]] = None):
+        self.directory = directory
+        self._meal_store_factory = meal_store_factory or (lambda journal: InMemoryMealStore(journal=journal))
+        self.snapshot_interval_s = snapshot_interval_s
+        self.snapshot_min_records = snapshot_min_records
+        os.makedirs(directory, exist_ok=True)
+
+        # Held while a mutation is applied and logged, so the log order
+        # matches the in-memory order and snapshots see a consistent LSN
+        self.lock = threading.RLock()
+        self.meal_store = self._meal_store_factory(self)
+        self.user_store = InMemoryUserStore(journal=self)
+
+        self.recovery = self._recover()
+        self.snapshot_lsn = self.recovery['snapshot_lsn']
+        self.wal = WriteAheadLog(directory, self.recovery['lsn'] + 1, fsync=fsync)
+
+        self._snapshot_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if snapshot_interval_s > 0:
+            self._thread = threading.Thread(target=self._snapshot_loop, name='journal-snapshots', daemon=True)
+            self._thread.start()
+
+    # Logging
+
+    def record(self, op: str, data: Any) -> int:
+        """Append a mutation; call with self.lock held, right after applying it"""
+        return self.wal.append(dumps([op, data]))
+
+    def commit(self, lsn: int) -> None:
+        """Wait until a recorded mutation is durable"""
+        self.wal.commit(lsn)
+
+    # Recovery
+
+    def _recover(self) -> Dict[str, Any]:
+        """Load the newest readable snapshot and replay the log after it"""
+        started = time.perf_counter()
+        snapshot_lsn = 0
+        for _, path in reversed(_numbered_files(self.directory, 'snapshot-', '.bin')):
+            try:
+                snapshot_lsn = read_snapshot(path, self.meal_store, self.user_store)
+                break
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Skipping unreadable snapshot {path}: {e}")
+                self.meal_store = self._meal_store_factory(self)
+                self.user_store = InMemoryUserStore(journal=self)
+        loaded = time.perf_counter()
+
+        lsn = snapshot_lsn
+        replayed = 0
+        segments = _numbered_files(self.directory, 'wal-', '.log')
+        for i, (first_lsn, path) in enumerate(segments):
+            records, end, size = read_log(path)
+            record_lsn = first_lsn - 1
+            for record_lsn, (op, data) in enumerate(records, start=first_lsn):
+                if record_lsn > snapshot_lsn:
+                    self._apply(op, data)
+                    replayed += 1
+            lsn = max(lsn, record_lsn)
+            if end < size:
+                # Torn tail from a crash mid-write; drop it and anything after it
+                print(f"⚠️ Truncating {size - end} bytes of incomplete log records in {path}")
+                with open(path, 'r+b') as f:
+                    f.truncate(end)
+                for _, later in segments[i + 1:]:
+                    os.remove(later)
+                break
+
+        finished = time.perf_counter()
+        return {
+            'snapshot_lsn': snapshot_lsn,
+            'lsn': lsn,
+            'replayed_records': replayed,
+            'snapshot_load_s': round(loaded - started, 3),
+            'replay_s': round(finished - loaded, 3),
+            'meals': len(self.meal_store.meal_owners),
+            'users': self.user_store.count_users()
+        }
+
+    def _apply(self, op: str, data: Any) -> None:
+        """Re-apply a logged mutation (without logging it again)"""
+        if op == OP_ADD_MEALS:
+            self.meal_store.apply_add_meals([construct_meal_entry(meal) for meal in data])
+        elif op == OP_REMOVE_MEAL:
+            self.meal_store.apply_remove_meal(data)
+        elif op == OP_SAVE_USER:
+            self.user_store.apply_save_user(construct_user_profile(data))
+        elif op == OP_DELETE_USER:
+            self.user_store.apply_delete_user(data)
+        else:
+            raise ValueError(f"Unknown log operation: {op}")
+
+    # Snapshots
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Write a snapshot of the current state and drop the log it covers"""
+        with self._snapshot_lock:
+            started = time.perf_counter()
+            # Store locks before the journal lock, the order writes take them in
+            with self.meal_store.write_lock, self.user_store._lock, self.lock:
+                lsn = self.wal.rotate()
+                vocabulary = list(self.meal_store.vocabulary.entries)
+                users = [user.model_dump(mode='json') for user in self.user_store.list_users()]
+                columns = {user_id: capture_columns(user_columns)
+                           for user_id, user_columns in self.meal_store.iter_user_columns()}
+            captured = time.perf_counter()
+
+            path = os.path.join(self.directory, f"snapshot-{lsn:020d}.bin")
+            write_snapshot(path, lsn, vocabulary, users, columns)
+            self.snapshot_lsn = lsn
+
+            # Older snapshots and every segment that ends at or before lsn are now redundant
+            for old_lsn, old_path in _numbered_files(self.directory, 'snapshot-', '.bin'):
+                if old_lsn < lsn:
+                    os.remove(old_path)
+            for first_lsn, old_path in _numbered_files(self.directory, 'wal-', '.log'):
+                if first_lsn <= lsn:
+                    os.remove(old_path)
+
+            return {
+                'lsn': lsn,
+                'bytes': os.path.getsize(path),
+                'capture_ms': round((captured - started) * 1000, 1),
+                'write_s': round(time.perf_counter() - captured, 3)
+            }
+
+    def _snapshot_loop(self) -> None:
+        while not self._stop.wait(self.snapshot_interval_s):
+            if self.wal.lsn - self.snapshot_lsn < self.snapshot_min_records:
+                continue
+            try:
+                self.snapshot()
+            except OSError as e:
+                print(f"⚠️ Snapshot failed: {e}")
+
+    def close(self) -> None:
+        """Stop the snapshot thread and flush the log"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.wal.close()
+
+
+def _tiered_factory() -> Optional[Callable[[Journal], InMemoryMealStore]]:
+    """Tiered meal store factory when TIER_MEMORY_BUDGET_MB is set"""
+    if not os.getenv('TIER_MEMORY_BUDGET_MB'):
+        return None
+    from services.tiered_store import create_tiered_meal_store
+    return create_tiered_meal_store
+
+
+_journals: Dict[str, Journal] = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(directory: Optional[str] = None) -> Journal:
+    """Shared journal for WAL_DIR (or the given directory), recovering it on first use"""
+    directory = os.path.abspath(directory or os.environ['WAL_DIR'])
+    with _journals_lock:
+        journal = _journals.get(directory)
+        if journal is None:
+            journal = _journals[directory] = Journal(
+                directory,
+                snapshot_interval_s=float(os.getenv('SNAPSHOT_INTERVAL_S', DEFAULT_SNAPSHOT_INTERVAL_S)),
+                snapshot_min_records=int(os.getenv('SNAPSHOT_MIN_RECORDS', DEFAULT_SNAPSHOT_MIN_RECORDS)),
+                meal_store_factory=_tiered_factory()
+            )
+            on_shutdown(journal.close)
+            recovery = journal.recovery
+            print(f"✅ Recovered {recovery['meals']} meals and {recovery['users']} users from {directory} "
+                  f"(snapshot {recovery['snapshot_load_s']}s, replayed {recovery['replayed_records']} "
+                  f"records in {recovery['replay_s']}s)")
+        return journal
@@ -0,0 +1,367 @@
+"""Population Analytics - Mergeable sketches of every user's days, by day and health goal
+
+Questions like "median daily calories of weight-loss users last month" or
+"most common foods this week" would otherwise scan every user's meals. A
+PopulationIndex answers them from small sketches (services.sketches) kept per
+partition, a (day, cohort) pair where the cohort is the user's HealthGoal
+('unknown' without a profile):
+
+    * calories - KLLSketch of user-day calorie totals
+    * protein_pct - KLLSketch of user-day protein as % of the user's target,
+      plus the number of user-days at or above PROTEIN_ADHERENCE_PCT
+    * users - HyperLogLog of user_ids (unions into distinct users over a range)
+    * foods - SpaceSaving heavy hitters of detected foods (times, grams)
+    * user_days / meals - exact counts
+
+Writes are applied to exact per-user-day totals for the day they fall on.
+Days stay exact (open) while they may still change, i.e. the last OPEN_DAYS
+days; older days are sealed into their sketches on the next query, or once
+the exact totals grow past MAX_PENDING_USER_DAYS, and their totals dropped.
+The cohort is resolved when a day is sealed. Writes that land on an already
+sealed day (imports, corrections) are sealed again on top: meal counts stay
+exact, a late meal adds a separate user-day sample (and its foods), and late
+deletions only correct the meal count - sketches cannot forget.
+
+A PopulationSummary is a set of partitions; summaries from several shards or
+processes merge partition by partition and round-trip through to_dict().
+"""
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import os
+import threading
+
+from models.meal import MealEntry
+from models.user import UserProfile
+from services.storage import after_fork
+from services.sketches import (
+    HyperLogLog, KLLSketch, SpaceSaving, DEFAULT_HEAVY_HITTERS, DEFAULT_HLL_PRECISION, DEFAULT_KLL_K
+)
+
+# Today and yesterday stay exact (late logging is common)
+OPEN_DAYS = 2
+
+# Seal closed days early once this many exact user-days are held
+MAX_PENDING_USER_DAYS = 200_000
+
+# A user-day meets the protein goal at this share of the target
+PROTEIN_ADHERENCE_PCT = 100.0
+
+UNKNOWN_COHORT = 'unknown'
+
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+
+ProfileSource = Callable[[str], Optional[UserProfile]]
+
+
+def cohort_of(profile: Optional[UserProfile]) -> str:
+    """Partition key for a user: their health goal, or 'unknown'"""
+    if profile is None:
+        return UNKNOWN_COHORT
+    return getattr(profile.health_goal, 'value', profile.health_goal)
+
+
+class UserDay:
+    """Exact totals for one user on one day"""
+
+    __slots__ = ('calories', 'protein', 'meals', 'foods')
+
+    def __init__(self, calories: float = 0.0, protein: float = 0.0, meals: int = 0,
+                 foods: Optional[Dict[str, List]] = None):
+        self.calories = calories
+        self.protein = protein
+        self.meals = meals
+        self.foods = foods if foods is not None else {}  # food_name -> [times, grams]
+
+    def apply(self, meal: MealEntry, sign: int = 1) -> None:
+        nutrition = meal.total_nutrition
+        self.calories += sign * nutrition.calories
+        self.protein += sign * nutrition.protein
+        self.meals += sign
+        for food in meal.detected_foods:
+            counter = self.foods.get(food.food_name)
+            if counter is None:
+                counter = self.foods[food.food_name] = [0, 0.0]
+            counter[0] += sign
+            counter[1] += sign * food.estimated_portion_g
+
+
+class CohortDay:
+    """Sketches for one partition (see module docstring)"""
+
+    __slots__ = ('user_days', 'meals', 'adherent', 'calories', 'protein_pct', 'users', 'foods')
+
+    def __init__(self):
+        self.user_days = 0
+        self.meals = 0
+        self.adherent = 0
+        self.calories = KLLSketch(DEFAULT_KLL_K)
+        self.protein_pct = KLLSketch(DEFAULT_KLL_K)
+        self.users = HyperLogLog(DEFAULT_HLL_PRECISION)
+        self.foods = SpaceSaving(DEFAULT_HEAVY_HITTERS)
+
+    def merge(self, other: "CohortDay") -> None:
+        self.user_days += other.user_days
+        self.meals += other.meals
+        self.adherent += other.adherent
+        self.calories.merge(other.calories)
+        self.protein_pct.merge(other.protein_pct)
+        self.users.merge(other.users)
+        self.foods.merge(other.foods)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'user_days': self.user_days, 'meals': self.meals, 'adherent': self.adherent,
+            'calories': self.calories.to_dict(), 'protein_pct': self.protein_pct.to_dict(),
+            'users': self.users.to_dict(), 'foods': self.foods.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CohortDay":
+        cohort = cls()
+        cohort.user_days = data['user_days']
+        cohort.meals = data['meals']
+        cohort.adherent = data['adherent']
+        cohort.calories = KLLSketch.from_dict(data['calories'])
+        cohort.protein_pct = KLLSketch.from_dict(data['protein_pct'])
+        cohort.users = HyperLogLog.from_dict(data['users'])
+        cohort.foods = SpaceSaving.from_dict(data['foods'])
+        return cohort
+
+
+Partition = Tuple[date, str]
+
+
+def seal_day(day: date, user_days: Dict[str, UserDay],
+             profile_of: Optional[ProfileSource]) -> Dict[Partition, CohortDay]:
+    """Build one day's partitions from its exact user-day totals"""
+    partitions: Dict[Partition, CohortDay] = {}
+    food_totals: Dict[str, Dict[str, List]] = {}
+    for user_id, totals in user_days.items():
+        profile = profile_of(user_id) if profile_of is not None else None
+        cohort = cohort_of(profile)
+        partition = partitions.get((day, cohort))
+        if partition is None:
+            partition = partitions[(day, cohort)] = CohortDay()
+            food_totals[cohort] = {}
+        partition.meals += totals.meals
+        foods = food_totals[cohort]
+        for name, (times, grams) in totals.foods.items():
+            counter = foods.get(name)
+            if counter is None:
+                counter = foods[name] = [0, 0.0]
+            counter[0] += times
+            counter[1] += grams
+        if totals.meals <= 0:
+            continue  # only late deletions for this user-day
+
+        partition.user_days += 1
+        partition.users.add(user_id)
+        partition.calories.update(totals.calories)
+        target = profile.daily_protein_target_g if profile is not None else 0
+        if target > 0:
+            pct = totals.protein / target * 100
+            partition.protein_pct.update(pct)
+            if pct >= PROTEIN_ADHERENCE_PCT:
+                partition.adherent += 1
+
+    for cohort, foods in food_totals.items():
+        sketch = partitions[(day, cohort)].foods
+        for name, (times, grams) in sorted(foods.items(), key=lambda item: item[1][0], reverse=True):
+            if times > 0:
+                sketch.update(name, times, grams)
+    return partitions
+
+
+class PopulationSummary:
+    """Partitions for a date range; merges with summaries of other shards"""
+
+    def __init__(self, partitions: Optional[Dict[Partition, CohortDay]] = None):
+        self.partitions: Dict[Partition, CohortDay] = partitions or {}
+
+    def add(self, key: Partition, cohort: CohortDay) -> None:
+        """Merge a partition in (never mutates `cohort`)"""
+        existing = self.partitions.get(key)
+        if existing is None:
+            existing = self.partitions[key] = CohortDay()
+        existing.merge(cohort)
+
+    def merge(self, other: "PopulationSummary") -> None:
+        for key, cohort in other.partitions.items():
+            self.add(key, cohort)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'partitions': [
+                {'day': day.isoformat(), 'cohort': cohort, **sketches.to_dict()}
+                for (day, cohort), sketches in sorted(self.partitions.items())
+            ]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PopulationSummary":
+        return cls({
+            (date.fromisoformat(item['day']), item['cohort']): CohortDay.from_dict(item)
+            for item in data['partitions']
+        })
+
+    def report(self, cohorts: Optional[Iterable[str]] = None, top_foods: int = 10) -> Dict[str, Any]:
+        """
+        Distributions overall and per cohort
+
+        Args:
+            cohorts: Only include these cohorts (None for all)
+            top_foods: Number of most common foods to list
+
+        Returns:
+            {'overall': stats, 'cohorts': {cohort: stats}}
+        """
+        wanted = set(cohorts) if cohorts is not None else None
+        overall = CohortDay()
+        by_cohort: Dict[str, CohortDay] = {}
+        for (_, cohort), sketches in self.partitions.items():
+            if wanted is not None and cohort not in wanted:
+                continue
+            total = by_cohort.get(cohort)
+            if total is None:
+                total = by_cohort[cohort] = CohortDay()
+            total.merge(sketches)
+            overall.merge(sketches)
+        return {
+            'overall': _stats(overall, top_foods),
+            'cohorts': {cohort: _stats(total, top_foods) for cohort, total in sorted(by_cohort.items())}
+        }
+
+
+def _percentiles(sketch: KLLSketch) -> Dict[str, Optional[float]]:
+    values = sketch.quantiles([p / 100 for p in PERCENTILES])
+    return {f"p{p}": round(value, 1) if value is not None else None for p, value in zip(PERCENTILES, values)}
+
+
+def _stats(cohort: CohortDay, top_foods: int) -> Dict[str, Any]:
+    measured = cohort.protein_pct.count
+    return {
+        'unique_users': cohort.users.estimate() if cohort.user_days else 0,
+        'user_days': cohort.user_days,
+        'meals': cohort.meals,
+        'daily_calories': _percentiles(cohort.calories),
+        'protein_adherence': {
+            'user_days_with_target': measured,
+            'adherent_user_days': cohort.adherent,
+            'adherence_rate': round(cohort.adherent / measured, 4) if measured else None,
+            'pct_of_target': _percentiles(cohort.protein_pct)
+        },
+        'top_foods': [
+            {'food_name': name, 'times_consumed': times, 'max_overcount': error, 'total_grams': round(grams, 1)}
+            for name, times, error, grams in cohort.foods.top(top_foods)
+        ]
+    }
+
+
+class PopulationIndex:
+    """Open days' exact user-day totals plus sealed per-partition sketches"""
+
+    def __init__(self, profile_of: Optional[ProfileSource] = None,
+                 open_days: int = OPEN_DAYS, max_pending: int = MAX_PENDING_USER_DAYS):
+        self.profile_of = profile_of
+        self.open_days = open_days
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        after_fork(self._reset_lock)
+        self._pending: Dict[date, Dict[str, UserDay]] = {}  # {day: {user_id: UserDay}}
+        self._pending_count = 0
+        self._sealed: Dict[Partition, CohortDay] = {}
+
+    def _reset_lock(self) -> None:
+        self._lock = threading.Lock()
+
+    def _user_day(self, user_id: str, day: date) -> UserDay:
+        users = self._pending.get(day)
+        if users is None:
+            users = self._pending[day] = {}
+        totals = users.get(user_id)
+        if totals is None:
+            totals = users[user_id] = UserDay()
+            self._pending_count += 1
+        return totals
+
+    def _apply(self, meals: Iterable[MealEntry], sign: int) -> None:
+        with self._lock:
+            for meal in meals:
+                self._user_day(meal.user_id, meal.timestamp.date()).apply(meal, sign)
+            if self._pending_count > self.max_pending:
+                self._seal_closed()
+
+    def add_meal(self, meal: MealEntry) -> None:
+        self._apply((meal,), 1)
+
+    def add_meals(self, meals: List[MealEntry]) -> None:
+        self._apply(meals, 1)
+
+    def remove_meal(self, meal: MealEntry) -> None:
+        self._apply((meal,), -1)
+
+    def add_user_days(self, user_id: str, days: Dict[date, UserDay]) -> None:
+        """Add a user's precomputed day totals (e.g. columns restored from a snapshot)"""
+        with self._lock:
+            for day, totals in days.items():
+                users = self._pending.setdefault(day, {})
+                existing = users.get(user_id)
+                if existing is None:
+                    users[user_id] = totals
+                    self._pending_count += 1
+                    continue
+                existing.calories += totals.calories
+                existing.protein += totals.protein
+                existing.meals += totals.meals
+                for name, (times, grams) in totals.foods.items():
+                    counter = existing.foods.setdefault(name, [0, 0.0])
+                    counter[0] += times
+                    counter[1] += grams
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pending.clear()
+            self._pending_count = 0
+            self._sealed.clear()
+
+    def _first_open_day(self) -> date:
+        return date.today() - timedelta(days=self.open_days - 1)
+
+    def _seal_closed(self) -> None:
+        first_open = self._first_open_day()
+        for day in [day for day in self._pending if day < first_open]:
+            users = self._pending.pop(day)
+            self._pending_count -= len(users)
+            for key, cohort in seal_day(day, users, self.profile_of).items():
+                existing = self._sealed.get(key)
+                if existing is None:
+                    self._sealed[key] = cohort
+                else:
+                    existing.merge(cohort)
+
+    def summary(self, start: date, end: date) -> PopulationSummary:
+        """Partitions for the days [start, end] (open days sealed on the fly)"""
+        summary = PopulationSummary()
+        with self._lock:
+            self._seal_closed()
+            for key, cohort in self._sealed.items():
+                if start <= key[0] <= end:
+                    summary.add(key, cohort)
+            for day, users in self._pending.items():
+                if start <= day <= end:
+                    for key, cohort in seal_day(day, users, self.profile_of).items():
+                        summary.add(key, cohort)
+        return summary
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'sealed_partitions': len(self._sealed), 'pending_user_days': self._pending_count}
+
+
+def create_population_index(profile_of: Optional[ProfileSource] = None) -> PopulationIndex:
+    """Index configured from POPULATION_OPEN_DAYS / POPULATION_MAX_PENDING"""
+    return PopulationIndex(
+        profile_of,
+        open_days=max(1, int(os.getenv('POPULATION_OPEN_DAYS', OPEN_DAYS))),
+        max_pending=int(os.getenv('POPULATION_MAX_PENDING', MAX_PENDING_USER_DAYS))
+    )
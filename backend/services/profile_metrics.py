@@ -0,0 +1,110 @@
+"""Profile Metrics - Vectorized BMI, BMR/TDEE and macro targets for many profiles
+
+A single profile's metrics come from models.user.compute_profile_metrics and
+are cached on the profile. A coach view over thousands of clients, or a
+preview of new formula parameters (activity factor, goal calorie offsets,
+protein per kg), instead loads the inputs into NumPy columns (ProfileArrays)
+and derives each metric with one array expression over every profile.
+
+With the default parameters the targets equal the per-profile ones: the
+arithmetic is done in the same order and truncated to int the same way. BMI
+uses np.round, which can differ from round() by 0.01 when the unrounded
+value sits on a rounding boundary.
+"""
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from models.user import (
+    ACTIVITY_FACTOR, CARBS_CALORIE_SHARE, FAT_CALORIE_SHARE, GENDER_BMR_OFFSETS, GOAL_CALORIE_OFFSETS,
+    GOAL_PROTEIN_G_PER_KG, Gender, HealthGoal, UserProfile
+)
+
+GENDERS = list(Gender)
+GOALS = list(HealthGoal)
+GENDER_CODES = {gender: code for code, gender in enumerate(GENDERS)}
+GOAL_CODES = {goal: code for code, goal in enumerate(GOALS)}
+
+METRIC_FIELDS = ('bmi', 'bmr', 'tdee', 'daily_calorie_target', 'daily_protein_target_g',
+                 'daily_carbs_target_g', 'daily_fat_target_g')
+
+
+@dataclass
+class MetricParameters:
+    """Formula parameters; the defaults are the ones UserProfile uses"""
+    activity_factor: float = ACTIVITY_FACTOR
+    goal_calorie_offsets: Dict[str, float] = field(
+        default_factory=lambda: {goal.value: offset for goal, offset in GOAL_CALORIE_OFFSETS.items()}
+    )
+    goal_protein_g_per_kg: Dict[str, float] = field(
+        default_factory=lambda: {goal.value: per_kg for goal, per_kg in GOAL_PROTEIN_G_PER_KG.items()}
+    )
+    carbs_calorie_share: float = CARBS_CALORIE_SHARE
+    fat_calorie_share: float = FAT_CALORIE_SHARE
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class ProfileArrays:
+    """Metric inputs of many profiles as parallel NumPy columns"""
+
+    def __init__(self, user_ids: List[str], age: np.ndarray, gender: np.ndarray,
+                 height_cm: np.ndarray, weight_kg: np.ndarray, health_goal: np.ndarray):
+        self.user_ids = user_ids
+        self.age = age
+        self.gender = gender            # codes into GENDERS
+        self.height_cm = height_cm
+        self.weight_kg = weight_kg
+        self.health_goal = health_goal  # codes into GOALS
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    @classmethod
+    def from_profiles(cls, profiles: Iterable[UserProfile]) -> 'ProfileArrays':
+        profiles = list(profiles)
+        count = len(profiles)
+        return cls(
+            [profile.user_id for profile in profiles],
+            np.fromiter((profile.age for profile in profiles), dtype=np.float64, count=count),
+            np.fromiter((GENDER_CODES[profile.gender] for profile in profiles), dtype=np.intp, count=count),
+            np.fromiter((profile.height_cm for profile in profiles), dtype=np.float64, count=count),
+            np.fromiter((profile.weight_kg for profile in profiles), dtype=np.float64, count=count),
+            np.fromiter((GOAL_CODES[profile.health_goal] for profile in profiles), dtype=np.intp, count=count)
+        )
+
+
+def compute_metrics(profiles: ProfileArrays, params: Optional[MetricParameters] = None) -> Dict[str, np.ndarray]:
+    """
+    Every metric in METRIC_FIELDS for every profile, one array per metric
+
+    Args:
+        profiles: Inputs as columns
+        params: Formula parameters (UserProfile's when None)
+
+    Returns:
+        Metric name -> array aligned with profiles.user_ids (targets as int64)
+    """
+    params = params or MetricParameters()
+    bmr_offsets = np.array([GENDER_BMR_OFFSETS[gender] for gender in GENDERS], dtype=np.float64)
+    calorie_offsets = np.array([params.goal_calorie_offsets.get(goal.value, GOAL_CALORIE_OFFSETS[goal])
+                                for goal in GOALS], dtype=np.float64)
+    protein_per_kg = np.array([params.goal_protein_g_per_kg.get(goal.value, GOAL_PROTEIN_G_PER_KG[goal])
+                               for goal in GOALS], dtype=np.float64)
+
+    height_m = profiles.height_cm / 100
+    bmr = ((10 * profiles.weight_kg) + (6.25 * profiles.height_cm) - (5 * profiles.age)
+           + bmr_offsets[profiles.gender])
+    tdee = bmr * params.activity_factor
+    calories = np.trunc(tdee + calorie_offsets[profiles.health_goal]).astype(np.int64)
+    return {
+        'bmi': np.round(profiles.weight_kg / (height_m ** 2), 2),
+        'bmr': bmr,
+        'tdee': tdee,
+        'daily_calorie_target': calories,
+        'daily_protein_target_g': np.trunc(profiles.weight_kg * protein_per_kg[profiles.health_goal]).astype(np.int64),
+        'daily_carbs_target_g': np.trunc(calories * params.carbs_calorie_share / 4).astype(np.int64),
+        'daily_fat_target_g': np.trunc(calories * params.fat_calorie_share / 9).astype(np.int64)
+    }
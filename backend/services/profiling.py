@@ -0,0 +1,390 @@
+"""Profiling - Opt-in CPU sampling of live requests and tracemalloc snapshots
+
+Disabled unless PROFILING_ENABLED=1; when disabled nothing is installed (no
+middleware, no admin routes, tracemalloc off), so there is no overhead.
+
+CPU: ProfilingMiddleware profiles a PROFILE_SAMPLE_RATE fraction of requests,
+and any request sent with an ``X-Profile`` header whose value equals
+PROFILE_TOKEN. Without a PROFILE_TOKEN the header is ignored and the admin
+routes are not mounted (profiles are then only written to PROFILE_DIR). While such a request runs, a StackSampler
+thread reads stacks every PROFILE_INTERVAL_MS with sys._current_frames() -
+the request itself runs uninstrumented, so the cost is one short sampler
+wake-up per interval. Async handlers and everything they await run on the
+event loop thread; sync handlers run in the threadpool, so the sampler also
+reads every worker thread that is busy, and roots each stack at its
+thread's name ("[AnyIO worker thread];handler ..."). Concurrent requests
+show up in the same samples. Stacks are kept as folded lines ("outer;inner count"),
+which flamegraph.pl, speedscope and inferno read directly. The newest
+PROFILE_KEEP profiles stay in memory, and are also written to PROFILE_DIR
+when set. The response carries X-Profile-Id.
+
+Memory: MemoryProfiler starts tracemalloc on demand and diffs each snapshot
+against the previous one, the way to find what keeps growing (unbounded
+caches, retained upload buffers).
+
+Environment:
+    PROFILING_ENABLED    - 1 to enable (default: off)
+    PROFILE_SAMPLE_RATE  - fraction of requests profiled (default: 0, header only)
+    PROFILE_INTERVAL_MS  - stack sampling interval (default: 5)
+    PROFILE_KEEP         - profiles kept in memory (default: 50)
+    PROFILE_MAX_ACTIVE   - requests profiled at once; more are skipped (default: 2)
+    PROFILE_DIR          - also write <id>.folded files here
+    PROFILE_TOKEN        - required X-Profile value and admin X-Admin-Token
+"""
+from collections import Counter, OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import hmac
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+DEFAULT_INTERVAL_MS = 5
+DEFAULT_KEEP = 50
+DEFAULT_MAX_ACTIVE = 2
+DEFAULT_TRACE_FRAMES = 25
+
+PROFILE_HEADER = b'x-profile'
+
+# Threads running sync handlers and dependencies (anyio's to_thread pool)
+THREADPOOL_THREAD_NAME = 'AnyIO worker thread'
+
+# Files of the pool machinery an idle worker waits in
+_POOL_FILES = {threading.__file__, queue.__file__}
+
+# Frames of the profiler itself, left out of memory statistics
+_IGNORED_ALLOCATIONS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>')
+)
+
+
+def profiling_enabled() -> bool:
+    """PROFILING_ENABLED (default off)"""
+    return os.getenv('PROFILING_ENABLED', '').strip().lower() in ('1', 'true', 'yes')
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_pool_code(code) -> bool:
+    filename = code.co_filename
+    return filename in _POOL_FILES or f"{os.sep}anyio{os.sep}" in filename
+
+
+class StackSampler:
+    """
+    Samples the event loop thread and busy threadpool workers at a fixed
+    interval on a helper thread; stacks are rooted at the thread's name
+    """
+
+    def __init__(self, thread_id: int, interval_s: float):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._names: Dict[Any, str] = {}
+        self._pool_code: Dict[Any, bool] = {}
+        self._thread_names: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self) -> 'StackSampler':
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _thread_name(self, thread_id: int) -> str:
+        name = self._thread_names.get(thread_id)
+        if name is None:
+            self._thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            name = self._thread_names.setdefault(thread_id, 'unknown thread')
+        return name
+
+    def _run(self) -> None:
+        names = self._names
+        pool_code = self._pool_code
+        while not self._stop.wait(self.interval_s):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != self.thread_id and self._thread_name(thread_id) != THREADPOOL_THREAD_NAME:
+                    continue
+                stack = []
+                busy = thread_id == self.thread_id
+                while frame is not None:
+                    code = frame.f_code
+                    name = names.get(code)
+                    if name is None:
+                        name = names[code] = _frame_name(code)
+                        pool_code[code] = _is_pool_code(code)
+                    busy = busy or not pool_code[code]
+                    stack.append(name)
+                    frame = frame.f_back
+                if not busy:  # an idle worker waiting for its next job
+                    continue
+                stack.append(f"[{self._thread_name(thread_id)}]")
+                stack.reverse()
+                self.stacks[';'.join(stack)] += 1
+                self.samples += 1
+
+
+class Profile:
+    """CPU samples of one request"""
+
+    def __init__(self, method: str, path: str, interval_ms: float, trigger: str):
+        self.profile_id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.interval_ms = interval_ms
+        self.trigger = trigger
+        self.started_at = datetime.utcnow()
+        self.duration_ms = 0.0
+        self.status: Optional[int] = None
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def folded(self) -> str:
+        """Folded stacks, one "frame;frame;frame count" line per distinct stack"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Functions by self samples (innermost frame) and total samples (anywhere on the stack)"""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        return [{
+            'function': function,
+            'self_samples': samples,
+            'self_pct': round(samples / self.samples * 100, 1) if self.samples else 0.0,
+            'total_pct': round(total[function] / self.samples * 100, 1) if self.samples else 0.0
+        } for function, samples in own.most_common(limit)]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'profile_id': self.profile_id,
+            'method': self.method,
+            'path': self.path,
+            'trigger': self.trigger,
+            'status': self.status,
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': round(self.duration_ms, 2),
+            'interval_ms': self.interval_ms,
+            'samples': self.samples
+        }
+
+
+class CPUProfiler:
+    """Decides which requests to profile and keeps the newest profiles"""
+
+    def __init__(self, sample_rate: float = 0.0, interval_ms: float = DEFAULT_INTERVAL_MS,
+                 keep: int = DEFAULT_KEEP, max_active: int = DEFAULT_MAX_ACTIVE,
+                 directory: Optional[str] = None, token: Optional[str] = None):
+        self.sample_rate = sample_rate
+        self.interval_ms = interval_ms
+        self.keep = keep
+        self.max_active = max_active
+        self.directory = Path(directory) if directory else None
+        self.token = token
+        self.skipped = 0
+        self._active = 0
+        self._profiles: "OrderedDict[str, Profile]" = OrderedDict()
+        self._lock = threading.Lock()
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def trigger_for(self, header: Optional[bytes]) -> Optional[str]:
+        """'header' or 'sampled' when this request should be profiled, else None"""
+        if header is not None and self.token is not None and hmac.compare_digest(
+                header, self.token.encode('latin-1')):
+            return 'header'
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sampled'
+        return None
+
+    def begin(self, method: str, path: str, trigger: str) -> Optional[tuple]:
+        """Start sampling the calling thread, or None when too many profiles are running"""
+        with self._lock:
+            if self._active >= self.max_active:
+                self.skipped += 1
+                return None
+            self._active += 1
+        profile = Profile(method, path, self.interval_ms, trigger)
+        sampler = StackSampler(threading.get_ident(), self.interval_ms / 1000).start()
+        return profile, sampler, time.perf_counter()
+
+    def end(self, session: tuple, status: Optional[int]) -> Profile:
+        profile, sampler, started = session
+        profile.stacks = sampler.stop()
+        profile.samples = sampler.samples
+        profile.duration_ms = (time.perf_counter() - started) * 1000
+        profile.status = status
+        with self._lock:
+            self._active -= 1
+            self._profiles[profile.profile_id] = profile
+            while len(self._profiles) > self.keep:
+                self._profiles.popitem(last=False)
+        if self.directory is not None:
+            (self.directory / f"{profile.profile_id}.folded").write_text(profile.folded(), encoding='utf-8')
+        return profile
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            profiles = list(self._profiles.values())
+        return [profile.summary() for profile in reversed(profiles)]
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._profiles)
+            self._profiles.clear()
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'sample_rate': self.sample_rate, 'interval_ms': self.interval_ms, 'kept': len(self._profiles),
+                    'active': self._active, 'skipped': self.skipped, 'directory': str(self.directory or '')}
+
+
+class MemoryProfiler:
+    """tracemalloc on demand; each snapshot is diffed against the previous one"""
+
+    def __init__(self):
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self._taken_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = DEFAULT_TRACE_FRAMES) -> Dict[str, Any]:
+        """Start tracing allocations (slows allocation-heavy code while on)"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                self._previous = None
+            return self.status()
+
+    def stop(self) -> Dict[str, Any]:
+        with self._lock:
+            tracemalloc.stop()
+            self._previous = None
+            self._taken_at = None
+            return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            'tracing': tracemalloc.is_tracing(),
+            'frames': tracemalloc.get_traceback_limit() if tracemalloc.is_tracing() else 0,
+            'traced_kb': round(current / 1024, 1),
+            'peak_kb': round(peak / 1024, 1),
+            'previous_snapshot_at': self._taken_at.isoformat() if self._taken_at else None
+        }
+
+    def snapshot(self, limit: int = 25, group_by: str = 'lineno') -> Dict[str, Any]:
+        """
+        Top allocation sites now, and their growth since the previous snapshot
+
+        Args:
+            limit: Sites to return
+            group_by: 'lineno', 'filename' or 'traceback'
+
+        Raises:
+            RuntimeError: tracing was not started
+        """
+        if group_by not in ('lineno', 'filename', 'traceback'):
+            raise ValueError(f"Invalid group_by: {group_by}")
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc is not running")
+            snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED_ALLOCATIONS)
+            previous, taken_at = self._previous, self._taken_at
+            self._previous, self._taken_at = snapshot, datetime.utcnow()
+
+        top = [_allocation(stat) for stat in snapshot.statistics(group_by)[:limit]]
+        result = {**self.status(), 'top': top, 'growth': None}
+        if previous is not None:
+            diff = [stat for stat in snapshot.compare_to(previous, group_by) if stat.size_diff > 0]
+            result['growth'] = {
+                'since': taken_at.isoformat(),
+                'total_kb': round(sum(stat.size_diff for stat in diff) / 1024, 1),
+                'top': [_allocation(stat) for stat in diff[:limit]]
+            }
+        return result
+
+
+def _allocation(stat) -> Dict[str, Any]:
+    entry = {
+        'location': [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        'size_kb': round(stat.size / 1024, 1),
+        'count': stat.count
+    }
+    if hasattr(stat, 'size_diff'):
+        entry['size_diff_kb'] = round(stat.size_diff / 1024, 1)
+        entry['count_diff'] = stat.count_diff
+    return entry
+
+
+class ProfilingMiddleware:
+    """ASGI middleware running chosen requests under the CPU profiler"""
+
+    def __init__(self, app, profiler: CPUProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        header = next((value for name, value in scope['headers'] if name == PROFILE_HEADER), None)
+        trigger = self.profiler.trigger_for(header)
+        session = self.profiler.begin(scope['method'], scope['path'], trigger) if trigger else None
+        if session is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = [None]
+        profile_id = session[0].profile_id.encode('latin-1')
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+                message['headers'] = list(message.get('headers', [])) + [(b'x-profile-id', profile_id)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.profiler.end(session, status[0])
+
+
+def create_cpu_profiler() -> CPUProfiler:
+    """CPU profiler configured from the PROFILE_* environment variables"""
+    return CPUProfiler(
+        sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', '0')),
+        interval_ms=float(os.getenv('PROFILE_INTERVAL_MS', DEFAULT_INTERVAL_MS)),
+        keep=int(os.getenv('PROFILE_KEEP', DEFAULT_KEEP)),
+        max_active=int(os.getenv('PROFILE_MAX_ACTIVE', DEFAULT_MAX_ACTIVE)),
+        directory=os.getenv('PROFILE_DIR') or None,
+        token=os.getenv('PROFILE_TOKEN') or None
+    )
@@ -0,0 +1,417 @@
+"""Daily Rollups - Incrementally maintained per-user, per-day nutrition totals
+
+Every meal write adds (or subtracts) the meal's totals to the rollup for its
+user and day, so the daily summary and goal progress read one small record
+instead of scanning the user's meals. rebuild() repairs rollups from raw
+meals if they ever drift.
+
+For long-horizon charts the in-memory index also keeps, per user:
+
+    * week (Monday) and month rollups, updated on the same writes, and
+    * a Fenwick tree over daily totals (DayTree) answering any date-range
+      sum in O(log n). Trees are built on a user's first range query, kept
+      current on writes and capped to the most recently queried users.
+
+rollup_series() serves calendar resolutions from the maintained week/month
+rollups (tree sums for partial edge periods) and fixed N-day buckets, used
+to downsample to a point budget, from tree sums.
+"""
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from datetime import date, timedelta
+import threading
+
+import numpy as np
+
+from models.meal import MealEntry, MealType, DailyNutritionSummary
+from utils.serialization import NUTRIENT_FIELDS
+
+MEAL_TYPE_FIELDS = tuple(f"{meal_type.value}_calories" for meal_type in MealType)
+ROLLUP_FIELDS = NUTRIENT_FIELDS + MEAL_TYPE_FIELDS
+
+
+class DailyRollup:
+    """Nutrition totals, per-meal-type calories and meal count for one user-day"""
+
+    __slots__ = ROLLUP_FIELDS + ('meals_count',)
+
+    def __init__(self):
+        self.calories = self.protein = self.carbs = self.fat = 0.0
+        self.fiber = self.sugar = self.sodium = 0.0
+        self.breakfast_calories = self.lunch_calories = 0.0
+        self.dinner_calories = self.snack_calories = 0.0
+        self.meals_count = 0
+
+    def apply(self, meal: MealEntry, sign: int = 1) -> None:
+        """Add a meal's totals (sign=-1 subtracts them)"""
+        nutrition = meal.total_nutrition
+        for field in NUTRIENT_FIELDS:
+            setattr(self, field, getattr(self, field) + sign * getattr(nutrition, field))
+        type_field = f"{MealType(meal.meal_type).value}_calories"
+        setattr(self, type_field, getattr(self, type_field) + sign * nutrition.calories)
+        self.meals_count += sign
+
+    def merge(self, other: "DailyRollup") -> None:
+        """Add another rollup's totals into this one"""
+        for field in ROLLUP_FIELDS:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        self.meals_count += other.meals_count
+
+    def values(self) -> Tuple:
+        """Field values in ROLLUP_FIELDS order followed by meals_count"""
+        return tuple(getattr(self, field) for field in ROLLUP_FIELDS) + (self.meals_count,)
+
+    @classmethod
+    def from_values(cls, values: Iterable) -> "DailyRollup":
+        """Inverse of values()"""
+        rollup = cls()
+        values = tuple(values)
+        for field, value in zip(ROLLUP_FIELDS, values):
+            setattr(rollup, field, value)
+        rollup.meals_count = values[len(ROLLUP_FIELDS)]
+        return rollup
+
+    def to_summary(self, user_id: str, day: date) -> DailyNutritionSummary:
+        """Daily summary response model (values rounded to 0.1)"""
+        return DailyNutritionSummary(
+            user_id=user_id,
+            date=day.isoformat(),
+            total_calories=_round(self.calories),
+            total_protein=_round(self.protein),
+            total_carbs=_round(self.carbs),
+            total_fat=_round(self.fat),
+            total_fiber=_round(self.fiber),
+            meals_count=self.meals_count,
+            breakfast_calories=_round(self.breakfast_calories),
+            lunch_calories=_round(self.lunch_calories),
+            dinner_calories=_round(self.dinner_calories),
+            snack_calories=_round(self.snack_calories)
+        )
+
+
+def _round(value: float) -> float:
+    """Round to 0.1, clamping float residue left by subtraction to zero"""
+    return max(0.0, round(value, 1))
+
+
+class PeriodRollup(DailyRollup):
+    """Totals over a span of days, plus the number of days that had meals"""
+
+    __slots__ = ('days_logged',)
+
+    def __init__(self):
+        super().__init__()
+        self.days_logged = 0
+
+    @classmethod
+    def from_vector(cls, vector) -> "PeriodRollup":
+        """Inverse of rollup_vector() (also takes a plain sequence)"""
+        rollup = cls()
+        values = vector.tolist() if isinstance(vector, np.ndarray) else list(vector)
+        for field, value in zip(ROLLUP_FIELDS, values):
+            setattr(rollup, field, value)
+        rollup.meals_count = int(round(values[-2]))
+        rollup.days_logged = int(round(values[-1]))
+        return rollup
+
+    def to_dict(self) -> Dict[str, float]:
+        """Totals rounded to 0.1 with meal and logged-day counts"""
+        return {
+            **{field: _round(getattr(self, field)) for field in ROLLUP_FIELDS},
+            'meals_count': self.meals_count,
+            'days_logged': self.days_logged
+        }
+
+
+# Period sizes for rollup series: calendar periods, or a bucket width in days
+Resolution = Union[str, int]
+RESOLUTIONS = ('day', 'week', 'month')
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def day_number(day: date) -> int:
+    """Days since 1970-01-01"""
+    return day.toordinal() - _EPOCH_ORDINAL
+
+
+def period_start(day: date, resolution: Resolution, origin: Optional[date] = None) -> date:
+    """First day of the period containing day (N-day buckets are aligned to origin)"""
+    if resolution == 'day':
+        return day
+    if resolution == 'week':
+        return day - timedelta(days=day.weekday())
+    if resolution == 'month':
+        return day.replace(day=1)
+    offset = (day - origin).days // resolution * resolution
+    return origin + timedelta(days=offset)
+
+
+def next_period(start: date, resolution: Resolution) -> date:
+    """First day of the period after the one starting at start"""
+    if resolution == 'day':
+        return start + timedelta(days=1)
+    if resolution == 'week':
+        return start + timedelta(days=7)
+    if resolution == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=resolution)
+
+
+def rollup_vector(rollup: DailyRollup, days_logged: int = 0) -> np.ndarray:
+    """ROLLUP_FIELDS values, meals_count and days_logged as one row"""
+    return np.array(rollup.values() + (days_logged,), dtype=np.float64)
+
+
+TREE_WIDTH = len(ROLLUP_FIELDS) + 2
+
+
+class DayTree:
+    """Fenwick tree of daily rollup vectors over [origin, origin + capacity) day numbers"""
+
+    __slots__ = ('origin', 'capacity', 'tree')
+
+    def __init__(self, origin: int, capacity: int, daily: Optional[np.ndarray] = None):
+        self.origin = origin
+        self.capacity = capacity
+        self.tree = np.zeros((capacity + 1, TREE_WIDTH))
+        if daily is not None:
+            # tree[i] = sum of daily[i - lowbit(i) + 1 .. i], from prefix sums in one pass
+            prefix = np.zeros((capacity + 1, TREE_WIDTH))
+            np.cumsum(daily, axis=0, out=prefix[1:])
+            index = np.arange(1, capacity + 1)
+            self.tree[1:] = prefix[index] - prefix[index - (index & -index)]
+
+    @classmethod
+    def build(cls, days: Dict[date, DailyRollup]) -> "DayTree":
+        """Tree over a user's daily rollups, with room to grow forward"""
+        numbers = [day_number(day) for day in days] or [day_number(date.today())]
+        origin = min(numbers)
+        span = max(numbers) - origin + 1
+        capacity = 1 << max(6, (span * 2 - 1).bit_length())
+        daily = np.zeros((capacity, TREE_WIDTH))
+        for day, rollup in days.items():
+            daily[day_number(day) - origin] = rollup_vector(rollup, 1)
+        return cls(origin, capacity, daily)
+
+    def add(self, number: int, vector: np.ndarray) -> bool:
+        """Add vector to one day; False if the day is outside the tree (rebuild it)"""
+        i = number - self.origin + 1
+        if i < 1 or i > self.capacity:
+            return False
+        tree, capacity = self.tree, self.capacity
+        while i <= capacity:
+            tree[i] += vector
+            i += i & -i
+        return True
+
+    def _prefix(self, number: int) -> np.ndarray:
+        """Sum over days origin..number"""
+        i = min(number - self.origin + 1, self.capacity)
+        index = []
+        while i > 0:
+            index.append(i)
+            i -= i & -i
+        return self.tree[index].sum(axis=0) if index else np.zeros(TREE_WIDTH)
+
+    def range_sum(self, first: int, last: int) -> np.ndarray:
+        """Sum over day numbers first..last (inclusive)"""
+        if last < first:
+            return np.zeros(TREE_WIDTH)
+        return self._prefix(last) - self._prefix(first - 1)
+
+
+def aggregate_by_day(meals: Iterable[MealEntry]) -> Dict[Tuple[str, date], DailyRollup]:
+    """Sum a batch of meals into one rollup per (user_id, day)"""
+    deltas: Dict[Tuple[str, date], DailyRollup] = {}
+    for meal in meals:
+        key = (meal.user_id, meal.timestamp.date())
+        delta = deltas.get(key)
+        if delta is None:
+            delta = deltas[key] = DailyRollup()
+        delta.apply(meal)
+    return deltas
+
+
+# Users whose day trees are kept (most recently queried)
+DEFAULT_MAX_TREES = 1024
+
+
+class RollupIndex:
+    """In-memory rollups: {user_id: {date: DailyRollup}} plus week/month rollups and day trees"""
+
+    def __init__(self, max_trees: int = DEFAULT_MAX_TREES):
+        self._rollups: Dict[str, Dict[date, DailyRollup]] = {}
+        self._periods: Dict[str, Dict[str, Dict[date, PeriodRollup]]] = {'week': {}, 'month': {}}
+        self._trees: "OrderedDict[str, DayTree]" = OrderedDict()
+        self.max_trees = max_trees
+        self._lock = threading.RLock()
+
+    def _add(self, user_id: str, day: date, delta: DailyRollup) -> None:
+        """Add a (possibly negative) delta to a user-day and every aggregate above it"""
+        days = self._rollups.setdefault(user_id, {})
+        rollup = days.get(day)
+        logged = 0
+        if rollup is None:
+            rollup = days[day] = DailyRollup()
+            logged = 1
+        rollup.merge(delta)
+        if rollup.meals_count <= 0:
+            del days[day]
+            logged -= 1
+
+        for resolution, users in self._periods.items():
+            periods = users.setdefault(user_id, {})
+            start = period_start(day, resolution)
+            period = periods.get(start)
+            if period is None:
+                period = periods[start] = PeriodRollup()
+            period.merge(delta)
+            period.days_logged += logged
+            if period.meals_count <= 0:
+                del periods[start]
+
+        tree = self._trees.get(user_id)
+        if tree is not None and not tree.add(day_number(day), rollup_vector(delta, logged)):
+            del self._trees[user_id]  # day outside the tree: rebuilt on the next range query
+
+    def add_meal(self, meal: MealEntry) -> None:
+        delta = DailyRollup()
+        delta.apply(meal)
+        with self._lock:
+            self._add(meal.user_id, meal.timestamp.date(), delta)
+
+    def add_meals(self, meals: Iterable[MealEntry]) -> None:
+        """Add a batch of meals, touching each affected user-day once"""
+        with self._lock:
+            for (user_id, day), delta in aggregate_by_day(meals).items():
+                self._add(user_id, day, delta)
+
+    def remove_meal(self, meal: MealEntry) -> None:
+        day = meal.timestamp.date()
+        with self._lock:
+            if self.get(meal.user_id, day) is None:
+                return
+            delta = DailyRollup()
+            delta.apply(meal, sign=-1)
+            self._add(meal.user_id, day, delta)
+
+    def get(self, user_id: str, day: date) -> Optional[DailyRollup]:
+        """Rollup for a user-day, or None if no meals were logged that day"""
+        days = self._rollups.get(user_id)
+        return days.get(day) if days else None
+
+    def set_user(self, user_id: str, days: Dict[date, DailyRollup]) -> None:
+        """Replace a user's rollups"""
+        with self._lock:
+            self._trees.pop(user_id, None)
+            for users in self._periods.values():
+                users.pop(user_id, None)
+            if not days:
+                self._rollups.pop(user_id, None)
+                return
+            self._rollups[user_id] = days
+            for resolution, users in self._periods.items():
+                periods = users[user_id] = {}
+                for day, rollup in days.items():
+                    start = period_start(day, resolution)
+                    period = periods.get(start)
+                    if period is None:
+                        period = periods[start] = PeriodRollup()
+                    period.merge(rollup)
+                    period.days_logged += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rollups = {}
+            self._periods = {resolution: {} for resolution in self._periods}
+            self._trees.clear()
+
+    def _tree(self, user_id: str) -> DayTree:
+        """The user's day tree, built on first use (least recently used trees are dropped)"""
+        tree = self._trees.get(user_id)
+        if tree is None:
+            tree = self._trees[user_id] = DayTree.build(self._rollups.get(user_id, {}))
+            while len(self._trees) > self.max_trees:
+                self._trees.popitem(last=False)
+        else:
+            self._trees.move_to_end(user_id)
+        return tree
+
+    def range_total(self, user_id: str, start: date, end: date) -> PeriodRollup:
+        """Summed rollup over [start, end] in O(log n)"""
+        with self._lock:
+            if user_id not in self._rollups:
+                return PeriodRollup()
+            return PeriodRollup.from_vector(self._tree(user_id).range_sum(day_number(start), day_number(end)))
+
+    def series(self, user_id: str, start: date, end: date,
+               resolution: Resolution = 'day') -> List[Tuple[date, PeriodRollup]]:
+        """
+        (period start, rollup) for every period in [start, end] that has meals
+
+        Args:
+            user_id: User identifier
+            start: First day (partial first/last periods only cover days in range)
+            end: Last day
+            resolution: 'day', 'week', 'month' or a bucket width in days counted from start
+
+        Returns:
+            Periods in date order
+        """
+        with self._lock:
+            if user_id not in self._rollups:
+                return []
+            if resolution == 'day':
+                days = self._rollups[user_id]
+                if (end - start).days + 1 < len(days):
+                    candidates = (start + timedelta(days=i) for i in range((end - start).days + 1))
+                    found = [(day, days[day]) for day in candidates if day in days]
+                else:
+                    found = sorted((day, rollup) for day, rollup in days.items() if start <= day <= end)
+                return [(day, _period_of_day(rollup)) for day, rollup in found]
+
+            periods = self._periods.get(resolution, {}).get(user_id, {}) if resolution in RESOLUTIONS else {}
+            series = []
+            period = period_start(start, resolution, origin=start)
+            while period <= end:
+                following = next_period(period, resolution)
+                if period >= start and following <= end + timedelta(days=1) and resolution in RESOLUTIONS:
+                    rollup = periods.get(period)  # whole period: maintained aggregate
+                else:
+                    rollup = PeriodRollup.from_vector(self._tree(user_id).range_sum(
+                        day_number(max(period, start)), day_number(min(following - timedelta(days=1), end))
+                    ))
+                if rollup is not None and rollup.meals_count > 0:
+                    series.append((period, rollup))
+                period = following
+            return series
+
+    def rebuild(self, meals: Iterable[MealEntry], user_id: Optional[str] = None) -> int:
+        """
+        Recompute rollups from raw meals
+
+        Args:
+            meals: Every meal in scope (all meals, or all of user_id's meals)
+            user_id: Only rebuild this user's rollups
+
+        Returns:
+            Number of meals aggregated
+        """
+        if user_id is None:
+            self.clear()
+        else:
+            self.set_user(user_id, {})
+
+        count = 0
+        for meal in meals:
+            self.add_meal(meal)
+            count += 1
+        return count
+
+
+def _period_of_day(rollup: DailyRollup) -> PeriodRollup:
+    period = PeriodRollup()
+    period.merge(rollup)
+    period.days_logged = 1
+    return period
@@ -0,0 +1,434 @@
+"""Job Scheduler - Cron-scheduled batch jobs in a process pool, with persistent state
+
+Heavy per-user work (precomputing reports) runs here instead of in request
+handlers. No broker is involved: job state lives in a local SQLite file
+(JobStateStore) and work runs in a process pool owned by the scheduler.
+
+    * Schedules are 5-field cron expressions (minute hour day month weekday,
+      local time; see CronSchedule). A fire missed while the process was
+      down runs once on the next start.
+    * A run records every item (user_id) it has to process. Items are
+      handed to the pool in chunks and marked done as their chunk's results
+      are collected, so a run interrupted by a crash or shutdown resumes
+      with only its pending items.
+    * Concurrency is limited to max_running runs at a time, max_workers
+      processes per run and 2 * max_workers chunks in flight per run.
+
+Workers are forked where the platform allows, so they read the parent's
+in-memory stores as of the run's start (services.storage.after_fork resets
+locks and connections in the child). Spawned workers start with empty
+in-memory stores, so without fork and with a process-local STORAGE_BACKEND
+chunks run on a single thread in this process instead. Job functions must
+be module-level so they can be sent to the pool.
+
+Environment:
+    JOBS_DIR - directory for job state (and precomputed reports); jobs are
+               disabled when unset
+    JOB_WORKERS - processes per run (default: 2)
+    JOB_MAX_RUNNING - concurrent runs (default: 1)
+    JOB_CHUNK_SIZE - items per pool task (default: 200)
+    JOB_POLL_S - seconds between schedule checks (default: 30)
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import multiprocessing
+import os
+import sqlite3
+import threading
+import traceback
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_RUNNING = 1
+DEFAULT_CHUNK_SIZE = 200
+DEFAULT_POLL_S = 30.0
+
+# Cron fields: (name, lowest, highest)
+_CRON_FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 6))
+
+# Give up looking for the next fire after this long (e.g. "0 0 31 2 *")
+_MAX_SEARCH = timedelta(days=5 * 366)
+
+
+class CronSchedule:
+    """
+    Standard 5-field cron expression
+
+    Each field is '*', a number, a range 'a-b', a step '*/n' or 'a-b/n', or
+    a comma-separated list of those. Weekdays are 0-6 from Sunday (7 is also
+    Sunday). As in cron, when both day and weekday are restricted a time
+    matches if either does.
+    """
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != len(_CRON_FIELDS):
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(part, name, low, high + (name == 'weekday'))
+            for part, (name, low, high) in zip(parts, _CRON_FIELDS)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        self._any_day = parts[2] == '*'
+        self._any_weekday = parts[4] == '*'
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.isoweekday() % 7) in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def matches(self, moment: datetime) -> bool:
+        return (moment.minute in self.minutes and moment.hour in self.hours
+                and moment.month in self.months and self._day_matches(moment))
+
+    def next_after(self, moment: datetime) -> Optional[datetime]:
+        """First matching minute strictly after `moment` (None if there is none)"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + _MAX_SEARCH
+        while candidate <= limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        return None
+
+
+def _parse_field(text: str, name: str, low: int, high: int) -> frozenset:
+    values = set()
+    for part in text.split(','):
+        span, _, step = part.partition('/')
+        try:
+            if span == '*':
+                first, last = low, high
+            elif '-' in span:
+                first, last = (int(value) for value in span.split('-', 1))
+            else:
+                first = last = int(span)
+            step = int(step) if step else 1
+        except ValueError:
+            raise ValueError(f"Invalid cron {name} field: {text!r}")
+        if first < low or last > high or first > last or step < 1:
+            raise ValueError(f"Invalid cron {name} field: {text!r}")
+        values.update(range(first, last + 1, step))
+    return frozenset(values)
+
+
+class Job:
+    """
+    A scheduled batch job
+
+    Args:
+        name: Unique job name
+        schedule: Cron expression
+        items: Called in the scheduler to list the run's items
+        work: Module-level function run in the pool on a list of items
+        collect: Called in the scheduler with each chunk's result, before
+            the chunk is marked done
+        initializer: Optional module-level function run once per worker
+        chunk_size: Items per pool task
+    """
+
+    def __init__(self, name: str, schedule: str,
+                 items: Callable[[], Iterable[str]],
+                 work: Callable[[List[str]], Any],
+                 collect: Callable[[Any], None],
+                 initializer: Optional[Callable[[], None]] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.name = name
+        self.schedule = CronSchedule(schedule)
+        self.items = items
+        self.work = work
+        self.collect = collect
+        self.initializer = initializer
+        self.chunk_size = max(1, chunk_size)
+
+
+_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_runs (
+    run_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    job         TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    trigger     TEXT NOT NULL,
+    started_at  TEXT NOT NULL,
+    finished_at TEXT,
+    total       INTEGER NOT NULL DEFAULT 0,
+    done        INTEGER NOT NULL DEFAULT 0,
+    failed      INTEGER NOT NULL DEFAULT 0,
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_job_runs_job ON job_runs (job, run_id);
+
+CREATE TABLE IF NOT EXISTS job_items (
+    run_id INTEGER NOT NULL,
+    item   TEXT NOT NULL,
+    status INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (run_id, item)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS job_fires (
+    job       TEXT PRIMARY KEY,
+    last_fire TEXT NOT NULL
+);
+"""
+
+# job_items.status
+PENDING, DONE, FAILED = 0, 1, 2
+
+# job_runs.status
+RUNNING, COMPLETED, INTERRUPTED = 'running', 'completed', 'interrupted'
+
+
+class JobStateStore:
+    """Runs, their items and last schedule fires in a local SQLite file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_STATE_SCHEMA)
+        self._lock = threading.Lock()
+
+    def create_run(self, job: str, trigger: str, items: List[str]) -> int:
+        with self._lock, self._conn:
+            run_id = self._conn.execute(
+                "INSERT INTO job_runs (job, status, trigger, started_at, total) VALUES (?, ?, ?, ?, ?)",
+                (job, RUNNING, trigger, datetime.now().isoformat(timespec='seconds'), len(items))
+            ).lastrowid
+            self._conn.executemany("INSERT OR IGNORE INTO job_items (run_id, item) VALUES (?, ?)",
+                                   [(run_id, item) for item in items])
+        return run_id
+
+    def pending_items(self, run_id: int) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT item FROM job_items WHERE run_id = ? AND status = ? ORDER BY item",
+                                      (run_id, PENDING)).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_items(self, run_id: int, items: List[str], status: int) -> None:
+        column = 'done' if status == DONE else 'failed'
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE job_items SET status = ? WHERE run_id = ? AND item = ?",
+                                   [(status, run_id, item) for item in items])
+            self._conn.execute(f"UPDATE job_runs SET {column} = {column} + ? WHERE run_id = ?", (len(items), run_id))
+
+    def finish_run(self, run_id: int, status: str, error: Optional[str] = None) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE job_runs SET status = ?, finished_at = ?, error = ? WHERE run_id = ?",
+                               (status, datetime.now().isoformat(timespec='seconds'), error, run_id))
+            if status == COMPLETED:
+                self._conn.execute("DELETE FROM job_items WHERE run_id = ?", (run_id,))
+
+    def unfinished_runs(self) -> List[Dict[str, Any]]:
+        """Runs left running (crash) or interrupted (shutdown), oldest first"""
+        with self._lock:
+            rows = self._conn.execute("SELECT run_id, job FROM job_runs WHERE status IN (?, ?) ORDER BY run_id",
+                                      (RUNNING, INTERRUPTED)).fetchall()
+        return [{'run_id': run_id, 'job': job} for run_id, job in rows]
+
+    def set_status(self, run_id: int, status: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE job_runs SET status = ? WHERE run_id = ?", (status, run_id))
+
+    def runs(self, job: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """Most recent runs first"""
+        query = "SELECT run_id, job, status, trigger, started_at, finished_at, total, done, failed, error FROM job_runs"
+        params: tuple = ()
+        if job is not None:
+            query += " WHERE job = ?"
+            params = (job,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY run_id DESC LIMIT ?", params + (limit,)).fetchall()
+        keys = ('run_id', 'job', 'status', 'trigger', 'started_at', 'finished_at', 'total', 'done', 'failed', 'error')
+        runs = [dict(zip(keys, row)) for row in rows]
+        for run in runs:
+            run['progress'] = round((run['done'] + run['failed']) / run['total'], 4) if run['total'] else 1.0
+        return runs
+
+    def last_fire(self, job: str) -> Optional[datetime]:
+        with self._lock:
+            row = self._conn.execute("SELECT last_fire FROM job_fires WHERE job = ?", (job,)).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def set_last_fire(self, job: str, fire: datetime) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO job_fires (job, last_fire) VALUES (?, ?)",
+                               (job, fire.isoformat(timespec='seconds')))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobScheduler:
+    """Fires registered jobs on their schedules and runs them in process pools"""
+
+    def __init__(self, state: JobStateStore,
+                 max_workers: int = DEFAULT_WORKERS,
+                 max_running: int = DEFAULT_MAX_RUNNING,
+                 poll_s: float = DEFAULT_POLL_S,
+                 in_process: bool = False):
+        self.state = state
+        self.max_workers = max(1, max_workers)
+        self.max_running = max(1, max_running)
+        self.poll_s = poll_s
+        self.jobs: Dict[str, Job] = {}
+        self._slots = threading.BoundedSemaphore(self.max_running)
+        self._running: Dict[str, int] = {}  # job -> run_id
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        # None: run chunks on one thread of this process
+        self._context = None if in_process else multiprocessing.get_context(
+            'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        )
+
+    def register(self, job: Job) -> None:
+        self.jobs[job.name] = job
+
+    def start(self) -> None:
+        """Resume unfinished runs and start checking schedules"""
+        now = datetime.now()
+        for job in self.jobs.values():
+            if self.state.last_fire(job.name) is None:
+                self.state.set_last_fire(job.name, now)  # first start: wait for the next fire
+        for run in self.state.unfinished_runs():
+            if run['job'] in self.jobs:
+                self._launch(self.jobs[run['job']], run['run_id'])
+        thread = threading.Thread(target=self._loop, name='job-scheduler', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop firing jobs; running runs stop after their in-flight chunks and resume on restart"""
+        self._stop.set()
+        for thread in list(self._threads):
+            thread.join(timeout)
+
+    def trigger(self, name: str, trigger: str = 'manual') -> int:
+        """Start a run now (or return the job's current run); raises KeyError for unknown jobs"""
+        job = self.jobs[name]
+        with self._lock:
+            if name in self._running:
+                return self._running[name]
+            run_id = self.state.create_run(name, trigger, list(job.items()))
+            self._running[name] = run_id
+        self._launch(job, run_id)
+        return run_id
+
+    def _launch(self, job: Job, run_id: int) -> None:
+        with self._lock:
+            self._running[job.name] = run_id
+        thread = threading.Thread(target=self._execute, args=(job, run_id), name=f'job-{job.name}', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.poll_s):
+            try:
+                self.check()
+            except Exception as e:  # keep checking; the next poll retries
+                print(f"⚠️ Job schedule check failed: {e!r}")
+                traceback.print_exc(limit=5)
+
+    def check(self, now: Optional[datetime] = None) -> List[int]:
+        """Fire jobs whose next scheduled time has passed; returns started run ids"""
+        now = now or datetime.now()
+        started = []
+        for job in self.jobs.values():
+            last = self.state.last_fire(job.name) or now
+            fire = job.schedule.next_after(last)
+            if fire is None or fire > now:
+                continue
+            self.state.set_last_fire(job.name, now)  # missed fires collapse into one run
+            started.append(self.trigger(job.name, trigger=f"schedule {fire.isoformat(timespec='minutes')}"))
+        return started
+
+    def _execute(self, job: Job, run_id: int) -> None:
+        self.state.set_status(run_id, RUNNING)
+        try:
+            with self._slots:
+                status = self._process(job, run_id)
+            self.state.finish_run(run_id, status)
+        except Exception:
+            self.state.finish_run(run_id, INTERRUPTED, traceback.format_exc(limit=5))
+        finally:
+            with self._lock:
+                self._running.pop(job.name, None)
+
+    def _process(self, job: Job, run_id: int) -> str:
+        pending = self.state.pending_items(run_id)
+        chunks = [pending[i:i + job.chunk_size] for i in range(0, len(pending), job.chunk_size)]
+        if not chunks:
+            return COMPLETED
+        if self._context is None:
+            executor = ThreadPoolExecutor(1, initializer=job.initializer)
+        else:
+            executor = ProcessPoolExecutor(self.max_workers, mp_context=self._context, initializer=job.initializer)
+        with executor as pool:
+            in_flight = {}
+            while chunks or in_flight:
+                while chunks and len(in_flight) < 2 * self.max_workers and not self._stop.is_set():
+                    chunk = chunks.pop(0)
+                    in_flight[pool.submit(job.work, chunk)] = chunk
+                if not in_flight:
+                    break  # stopping; the rest stays pending
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    chunk = in_flight.pop(future)
+                    try:
+                        job.collect(future.result())
+                    except Exception:
+                        self.state.mark_items(run_id, chunk, FAILED)
+                        continue
+                    self.state.mark_items(run_id, chunk, DONE)
+        return INTERRUPTED if chunks else COMPLETED
+
+    def status(self) -> Dict[str, Any]:
+        """Each job's schedule, last and next fire and recent runs with progress"""
+        jobs = {}
+        for name, job in self.jobs.items():
+            last = self.state.last_fire(name)
+            next_fire = job.schedule.next_after(last or datetime.now())
+            jobs[name] = {
+                'schedule': job.schedule.expression,
+                'last_fire': last.isoformat(timespec='seconds') if last else None,
+                'next_fire': next_fire.isoformat(timespec='seconds') if next_fire else None,
+                'running_run_id': self._running.get(name),
+                'runs': self.state.runs(name, limit=5)
+            }
+        return {'max_workers': self.max_workers, 'max_running': self.max_running,
+                'in_process': self._context is None, 'jobs': jobs}
+
+
+def jobs_dir() -> Optional[str]:
+    """Directory for job state (JOBS_DIR), or None when jobs are disabled"""
+    return os.getenv('JOBS_DIR') or None
+
+
+def create_job_scheduler() -> Optional[JobScheduler]:
+    """Scheduler with state under JOBS_DIR, or None when JOBS_DIR is unset"""
+    directory = jobs_dir()
+    if directory is None:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    from services.storage import is_process_local
+    in_process = 'fork' not in multiprocessing.get_all_start_methods() and is_process_local()
+    if in_process:
+        print("⚠️ fork is unavailable and STORAGE_BACKEND data is process-local: jobs run in-process")
+    return JobScheduler(
+        JobStateStore(os.path.join(directory, 'jobs.db')),
+        max_workers=int(os.getenv('JOB_WORKERS', DEFAULT_WORKERS)),
+        max_running=int(os.getenv('JOB_MAX_RUNNING', DEFAULT_MAX_RUNNING)),
+        poll_s=float(os.getenv('JOB_POLL_S', DEFAULT_POLL_S)),
+        in_process=in_process
+    )
@@ -0,0 +1,99 @@
+"""Shard Server - Serve one in-memory store shard on a local socket
+
+Usage (from the backend directory):
+    python -m services.shard_server serve --address /tmp/nutrition-shard-0.sock [--wal-dir data/wal/shard-0]
+    python -m services.shard_server rebalance --addresses A,B,C [--retire D]
+
+Both commands need SHARD_AUTHKEY (or --authkey), the secret clients
+authenticate with; the socket is created readable by its owner only.
+
+Each connection is served by its own thread; calls are (method, args)
+tuples answered with ('ok', result) or ('error', exception). The shard's
+stores serialize writes with their own locks. Population summaries are sent
+as PopulationSummary.to_dict(), which pickles smaller and faster than the
+sketch objects.
+"""
+import argparse
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.population import PopulationSummary
+from services.sharding import Shard, ShardClient, DEFAULT_VNODES, create_local_shard, rebalance
+
+
+def _serve_connection(connection, shard: Shard) -> None:
+    try:
+        while True:
+            try:
+                method, args = connection.recv()
+            except EOFError:
+                return
+            try:
+                result = shard.call(method, args)
+                if isinstance(result, PopulationSummary):
+                    result = result.to_dict()
+                connection.send(('ok', result))
+            except Exception as e:
+                connection.send(('error', e))
+    except OSError:
+        return
+    finally:
+        connection.close()
+
+
+def serve(address: str, shard: Shard, authkey: bytes) -> None:
+    """Accept connections forever on an owner-only (0600) socket"""
+    from multiprocessing import AuthenticationError
+    from multiprocessing.connection import Listener
+
+    if os.path.exists(address):
+        os.remove(address)
+    umask = os.umask(0o177)  # bind() creates the socket file with these permissions
+    try:
+        listener = Listener(address, family='AF_UNIX', authkey=authkey)
+    finally:
+        os.umask(umask)
+    with listener:
+        print(f"✅ Shard listening on {address}", flush=True)
+        while True:
+            try:
+                connection = listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                print(f"⚠️ Rejected shard connection: {e}", flush=True)
+                continue
+            threading.Thread(target=_serve_connection, args=(connection, shard), daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--authkey', default=os.getenv('SHARD_AUTHKEY', ''), help='Shared secret (default: SHARD_AUTHKEY)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help='Run a shard server')
+    serve_parser.add_argument('--address', required=True, help='Unix socket path')
+    serve_parser.add_argument('--wal-dir', default=None, help='Journal the shard in this directory')
+
+    rebalance_parser = commands.add_parser('rebalance', help='Move users to their ring owners')
+    rebalance_parser.add_argument('--addresses', required=True, help='Comma-separated socket paths of the new shard set')
+    rebalance_parser.add_argument('--retire', default='', help='Comma-separated socket paths of shards to drain')
+    rebalance_parser.add_argument('--vnodes', type=int, default=int(os.getenv('SHARD_VNODES', DEFAULT_VNODES)))
+
+    args = parser.parse_args()
+    if not args.authkey.strip():
+        parser.error("SHARD_AUTHKEY (or --authkey) must be set to a shared secret")
+    authkey = args.authkey.strip().encode()
+
+    if args.command == 'serve':
+        serve(args.address, create_local_shard(args.wal_dir), authkey)
+        return
+
+    shards = [ShardClient(address, authkey) for address in args.addresses.split(',') if address]
+    retired = [ShardClient(address, authkey) for address in args.retire.split(',') if address]
+    print(rebalance(shards, retired, args.vnodes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+"""Sharding - Partition users across store shards with a consistent-hash ring
+
+With STORAGE_BACKEND=sharded, every user (their profile and all their meals)
+lives on exactly one shard, chosen by hashing user_id onto a ring of virtual
+nodes. Per-user reads and writes go to that shard only; shards never talk to
+each other.
+
+Shards are either
+    in-process   SHARD_COUNT in-memory shards in this process (default 4)
+    local socket SHARD_ADDRESSES=/tmp/shard-0.sock,/tmp/shard-1.sock,...
+                 served by `python -m services.shard_server serve`, so every
+                 API worker shares them and each shard runs on its own core.
+                 Calls are pickled, so socket shards require a shared secret
+                 in SHARD_AUTHKEY (there is no default)
+
+Route handlers keep using the MealStore / UserStore interface: the sharded
+stores forward each call through a thin client (ShardClient for sockets,
+LocalShard in-process). Calls keyed only by meal_id or email are sent to
+every shard.
+
+Email uniqueness spans shards: a registration first claims the normalized
+email on the shard the ring assigns to that email, then checks every shard
+and saves the user on its own shard, then releases the claim. Claims are
+short-lived (EMAIL_CLAIM_TTL_S bounds one left by a crashed router), so
+concurrent registrations through any number of API workers serialize on the
+claim.
+
+When the shard set changes, rebalance() moves only the users whose ring
+position now maps to a different shard (about 1/N of them when adding one).
+Moves copy before they delete and never duplicate a meal_id, so a rebalance
+interrupted part-way is finished by running it again.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from bisect import bisect_right
+from datetime import date
+from queue import LifoQueue, Empty
+import hashlib
+import os
+import threading
+import time
+
+from models.meal import MealEntry
+from models.user import UserProfile
+from services.population import PopulationSummary
+from services.rollups import DailyRollup, PeriodRollup
+from services.storage import (
+    MealStore, UserStore, after_fork, decode_cursor, encode_user_cursor, normalize_email, user_key
+)
+
+DEFAULT_VNODES = 160
+DEFAULT_SHARD_COUNT = 4
+EMAIL_CLAIM_TTL_S = 30.0
+MOVE_PASSES = 3  # export/import rounds per user before rebalance() leaves it for the next run
+
+# Snapshots hold shard-local arrays, so they are never proxied (routers read live data)
+MEAL_METHODS = frozenset(
+    name for name in vars(MealStore) if not name.startswith('_') and name not in ('snapshot', 'set_profile_source')
+)
+USER_METHODS = frozenset(name for name in vars(UserStore) if not name.startswith('_'))
+
+
+def shard_authkey() -> bytes:
+    """The SHARD_AUTHKEY secret shared by shard servers and their clients"""
+    authkey = os.getenv('SHARD_AUTHKEY', '').strip()
+    if not authkey:
+        raise ValueError("SHARD_AUTHKEY must be set to a shared secret to use shard servers")
+    return authkey.encode()
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent-hash ring mapping keys to shard names"""
+
+    def __init__(self, names: Iterable[str], vnodes: int = DEFAULT_VNODES):
+        self.names = list(names)
+        if not self.names:
+            raise ValueError("A hash ring needs at least one shard")
+        points = sorted((_hash(f"{name}#{i}"), name) for name in self.names for i in range(vnodes))
+        self._points = [point for point, _ in points]
+        self._owners = [name for _, name in points]
+
+    def owner(self, key: str) -> str:
+        """Shard name responsible for a key"""
+        index = bisect_right(self._points, _hash(key))
+        return self._owners[index % len(self._owners)]
+
+
+class Shard:
+    """One partition: an in-memory meal store and user store"""
+
+    def __init__(self, meal_store: MealStore, user_store: UserStore):
+        self.meal_store = meal_store
+        self.user_store = user_store
+        meal_store.set_profile_source(user_store.get_user)  # users live with their meals
+        self._claims: Dict[str, Tuple[str, float]] = {}  # email -> (user_id, expires)
+        self._claims_lock = threading.Lock()
+        after_fork(self._reset_lock)
+
+    def _reset_lock(self) -> None:
+        self._claims_lock = threading.Lock()
+
+    def call(self, method: str, args: Tuple) -> Any:
+        """Dispatch a 'meals.<name>', 'users.<name>' or 'shard.<name>' call"""
+        target, _, name = method.partition('.')
+        if target == 'meals' and name in MEAL_METHODS:
+            return getattr(self.meal_store, name)(*args)
+        if target == 'users' and name in USER_METHODS:
+            return getattr(self.user_store, name)(*args)
+        if target == 'shard' and name in ('user_ids', 'export_user', 'import_user', 'drop_user', 'ping',
+                                          'claim_email', 'release_email'):
+            return getattr(self, name)(*args)
+        raise ValueError(f"Unknown shard method: {method}")
+
+    def ping(self) -> bool:
+        return True
+
+    def claim_email(self, email: str, user_id: str) -> bool:
+        """Reserve an email for one registration; False while another holds it"""
+        now = time.monotonic()
+        with self._claims_lock:
+            holder = self._claims.get(email)
+            if holder is not None and holder[0] != user_id and holder[1] > now:
+                return False
+            self._claims[email] = (user_id, now + EMAIL_CLAIM_TTL_S)
+            return True
+
+    def release_email(self, email: str, user_id: str) -> None:
+        with self._claims_lock:
+            holder = self._claims.get(email)
+            if holder is not None and holder[0] == user_id:
+                del self._claims[email]
+
+    def user_ids(self) -> List[str]:
+        """Every user with a profile or meals on this shard"""
+        user_ids = set(self.meal_store.meal_user_ids())
+        user_ids.update(user.user_id for user in self.user_store.list_users())
+        return sorted(user_ids)
+
+    def export_user(self, user_id: str) -> Tuple[Optional[UserProfile], List[MealEntry]]:
+        return self.user_store.get_user(user_id), self.meal_store.query_meals(user_id)
+
+    def import_user(self, user: Optional[UserProfile], meals: List[MealEntry]) -> int:
+        """Save an exported user here, skipping meals already present; returns meals added"""
+        if user is not None:
+            self.user_store.save_user(user)
+        existing = self.meal_store.existing_meal_ids([meal.meal_id for meal in meals]) if meals else set()
+        meals = [meal for meal in meals if meal.meal_id not in existing]
+        if meals:
+            self.meal_store.add_meals(meals)
+        return len(meals)
+
+    def drop_user(self, user_id: str, meal_ids: List[str], user: Optional[UserProfile]) -> bool:
+        """
+        Remove what export_user returned once it is imported elsewhere
+
+        Only the given meal_ids are removed, and the profile only while it
+        still equals the exported one, so writes that raced the export stay
+        here for the next pass. Returns whether anything of the user is left.
+        """
+        for meal_id in meal_ids:
+            self.meal_store.remove_meal(meal_id)
+        current = self.user_store.get_user(user_id)
+        if current is not None and current == user:
+            self.user_store.delete_user(user_id)
+            current = None
+        return current is not None or self.meal_store.has_meals(user_id)
+
+
+class LocalShard:
+    """Client for a shard living in this process"""
+
+    def __init__(self, name: str, shard: Shard):
+        self.name = name
+        self.shard = shard
+
+    def call(self, method: str, *args) -> Any:
+        return self.shard.call(method, args)
+
+    def close(self) -> None:
+        pass
+
+
+class ShardClient:
+    """Client for a shard server on a local socket, with a small connection pool"""
+
+    def __init__(self, address: str, authkey: bytes, pool_size: int = 8):
+        self.name = address
+        self.address = address
+        self.authkey = authkey
+        self._pool: LifoQueue = LifoQueue(maxsize=pool_size)
+        after_fork(self._reset_pool)
+
+    def _reset_pool(self) -> None:
+        # Pooled sockets stay with the parent; a forked child dials its own
+        self._pool = LifoQueue(maxsize=self._pool.maxsize)
+
+    def _connect(self):
+        from multiprocessing.connection import Client
+        return Client(self.address, family='AF_UNIX', authkey=self.authkey)
+
+    def call(self, method: str, *args) -> Any:
+        """Send one call; exceptions raised by the shard are re-raised here"""
+        try:
+            connection = self._pool.get_nowait()
+        except Empty:
+            connection = self._connect()
+        try:
+            connection.send((method, args))
+            status, value = connection.recv()
+        except (OSError, EOFError):
+            connection.close()
+            raise
+        try:
+            self._pool.put_nowait(connection)
+        except Exception:
+            connection.close()
+        if status == 'error':
+            raise value
+        return value
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except Empty:
+                return
+
+
+class ShardRouter:
+    """Routes user IDs to shard clients"""
+
+    def __init__(self, shards: List, vnodes: int = DEFAULT_VNODES):
+        self.shards = {shard.name: shard for shard in shards}
+        self.ring = HashRing(self.shards, vnodes)
+
+    def shard_for(self, user_id: str):
+        return self.shards[self.ring.owner(user_id)]
+
+    def broadcast(self, method: str, *args) -> List[Any]:
+        return [shard.call(method, *args) for shard in self.shards.values()]
+
+    def close(self) -> None:
+        for shard in self.shards.values():
+            shard.close()
+
+
+def rebalance(shards: List, retired: Iterable = (), vnodes: int = DEFAULT_VNODES) -> Dict[str, Any]:
+    """
+    Move every user to the shard the ring assigns them to
+
+    Args:
+        shards: The new shard set (the ring is built from these)
+        retired: Shards being removed; all of their users are moved off
+        vnodes: Virtual nodes per shard
+
+    Returns:
+        Users scanned/moved, meals moved, users still receiving writes on
+        their old shard after MOVE_PASSES passes (re-run to finish them)
+        and elapsed seconds
+    """
+    started = time.perf_counter()
+    router = ShardRouter(shards, vnodes)
+    scanned = moved = meals_moved = 0
+    pending = []
+    for shard in list(router.shards.values()) + list(retired):
+        name = shard.name
+        for user_id in shard.call('shard.user_ids'):
+            scanned += 1
+            target = router.shard_for(user_id)
+            if target.name == name:
+                continue
+            # Import skips meals the target already has and drop removes only
+            # what was exported, so an interrupted move is safe to re-run
+            for _ in range(MOVE_PASSES):
+                user, meals = shard.call('shard.export_user', user_id)
+                meals_moved += target.call('shard.import_user', user, meals)
+                if not shard.call('shard.drop_user', user_id, [meal.meal_id for meal in meals], user):
+                    moved += 1
+                    break
+            else:
+                pending.append(user_id)
+    return {
+        'users_scanned': scanned,
+        'users_moved': moved,
+        'meals_moved': meals_moved,
+        'users_pending': pending,
+        'elapsed_s': round(time.perf_counter() - started, 3)
+    }
+
+
+class ShardedMealStore(MealStore):
+    """MealStore that forwards each call to the user's shard"""
+
+    def __init__(self, router: ShardRouter):
+        self.router = router
+
+    def add_meal(self, meal: MealEntry) -> None:
+        self.router.shard_for(meal.user_id).call('meals.add_meal', meal)
+
+    def add_meals(self, meals: List[MealEntry]) -> None:
+        by_shard: Dict[str, List[MealEntry]] = {}
+        for meal in meals:
+            by_shard.setdefault(self.router.ring.owner(meal.user_id), []).append(meal)
+        for name, shard_meals in by_shard.items():
+            self.router.shards[name].call('meals.add_meals', shard_meals)
+
+    def existing_meal_ids(self, meal_ids: List[str]) -> Set[str]:
+        existing: Set[str] = set()
+        for found in self.router.broadcast('meals.existing_meal_ids', meal_ids):
+            existing |= found
+        return existing
+
+    def get_meal(self, meal_id: str) -> Optional[MealEntry]:
+        for shard in self.router.shards.values():
+            meal = shard.call('meals.get_meal', meal_id)
+            if meal is not None:
+                return meal
+        return None
+
+    def remove_meal(self, meal_id: str) -> Optional[MealEntry]:
+        for shard in self.router.shards.values():
+            meal = shard.call('meals.remove_meal', meal_id)
+            if meal is not None:
+                return meal
+        return None
+
+    def has_meals(self, user_id: str) -> bool:
+        return self.router.shard_for(user_id).call('meals.has_meals', user_id)
+
+    def query_meals(self, user_id, meal_type=None, start=None, end=None,
+                    limit=None, offset=0, newest_first=False) -> List[MealEntry]:
+        return self.router.shard_for(user_id).call(
+            'meals.query_meals', user_id, meal_type, start, end, limit, offset, newest_first
+        )
+
+    def page_meals(self, user_id, meal_type=None, start=None, end=None,
+                   limit=10, cursor=None, newest_first=True) -> Tuple[List[MealEntry], Optional[str]]:
+        return self.router.shard_for(user_id).call(
+            'meals.page_meals', user_id, meal_type, start, end, limit, cursor, newest_first
+        )
+
+    def count_meals(self, user_id, meal_type=None, start=None, end=None) -> int:
+        return self.router.shard_for(user_id).call('meals.count_meals', user_id, meal_type, start, end)
+
+    def daily_rollup(self, user_id, day) -> Optional[DailyRollup]:
+        return self.router.shard_for(user_id).call('meals.daily_rollup', user_id, day)
+
+    def rollup_range(self, user_id, start, end) -> PeriodRollup:
+        return self.router.shard_for(user_id).call('meals.rollup_range', user_id, start, end)
+
+    def rollup_series(self, user_id, start, end, resolution='day') -> List[Tuple[date, PeriodRollup]]:
+        return self.router.shard_for(user_id).call('meals.rollup_series', user_id, start, end, resolution)
+
+    def top_foods(self, user_id, start, end, k=20) -> Tuple[List[Tuple[str, str, int, float]], int]:
+        return self.router.shard_for(user_id).call('meals.top_foods', user_id, start, end, k)
+
+    def data_version(self, user_id: str) -> int:
+        return self.router.shard_for(user_id).call('meals.data_version', user_id)
+
+    def population_summary(self, start: date, end: date) -> PopulationSummary:
+        summary = PopulationSummary()
+        for part in self.router.broadcast('meals.population_summary', start, end):
+            # Socket shards send the compact dict form (see shard_server)
+            summary.merge(part if isinstance(part, PopulationSummary) else PopulationSummary.from_dict(part))
+        return summary
+
+    def rebuild_rollups(self, user_id: Optional[str] = None) -> int:
+        if user_id is not None:
+            return self.router.shard_for(user_id).call('meals.rebuild_rollups', user_id)
+        return sum(self.router.broadcast('meals.rebuild_rollups'))
+
+
+class ShardedUserStore(UserStore):
+    """UserStore that forwards each call to the user's shard"""
+
+    def __init__(self, router: ShardRouter):
+        self.router = router
+
+    def create_user(self, user: UserProfile) -> bool:
+        email = normalize_email(user.email)
+        claims = self.router.shard_for(f"email:{email}")
+        if not claims.call('shard.claim_email', email, user.user_id):
+            return False
+        try:
+            existing = self.get_user_by_email(email)
+            if existing is not None and existing.user_id != user.user_id:
+                return False
+            return self.router.shard_for(user.user_id).call('users.create_user', user)
+        finally:
+            claims.call('shard.release_email', email, user.user_id)
+
+    def save_user(self, user: UserProfile) -> None:
+        self.router.shard_for(user.user_id).call('users.save_user', user)
+
+    def get_user(self, user_id: str) -> Optional[UserProfile]:
+        return self.router.shard_for(user_id).call('users.get_user', user_id)
+
+    def get_users(self, user_ids: List[str]) -> List[UserProfile]:
+        by_shard: Dict[str, List[str]] = {}
+        for user_id in user_ids:
+            by_shard.setdefault(self.router.ring.owner(user_id), []).append(user_id)
+        found = {user.user_id: user
+                 for name, shard_ids in by_shard.items()
+                 for user in self.router.shards[name].call('users.get_users', shard_ids)}
+        return [found[user_id] for user_id in user_ids if user_id in found]
+
+    def get_user_by_email(self, email: str) -> Optional[UserProfile]:
+        for user in self.router.broadcast('users.get_user_by_email', email):
+            if user is not None:
+                return user
+        return None
+
+    def delete_user(self, user_id: str) -> bool:
+        return self.router.shard_for(user_id).call('users.delete_user', user_id)
+
+    def list_users(self) -> List[UserProfile]:
+        return [user for users in self.router.broadcast('users.list_users') for user in users]
+
+    def page_users(self, limit=50, cursor=None, health_goal=None, gender=None) -> Tuple[List[UserProfile], Optional[str]]:
+        if cursor:
+            decode_cursor(cursor)  # reject malformed cursors before fanning out
+        # Every shard pages from the same cursor; the first `limit` of the merge are the global page
+        pages = self.router.broadcast('users.page_users', limit, cursor, health_goal, gender)
+        merged = sorted((user for users, _ in pages for user in users), key=user_key)
+        users = merged[:limit]
+        more = len(merged) > limit or any(next_cursor is not None for _, next_cursor in pages)
+        return users, encode_user_cursor(users[-1]) if more and users else None
+
+    def count_users(self, health_goal=None, gender=None) -> int:
+        return sum(self.router.broadcast('users.count_users', health_goal, gender))
+
+
+def create_local_shard(wal_dir: Optional[str] = None) -> Shard:
+    """In-memory shard, journaled under wal_dir when given"""
+    if wal_dir:
+        from services.persistence import get_journal
+        journal = get_journal(wal_dir)
+        return Shard(journal.meal_store, journal.user_store)
+    from services.memory_store import InMemoryMealStore, InMemoryUserStore
+    return Shard(InMemoryMealStore(), InMemoryUserStore())
+
+
+_router: Optional[ShardRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ShardRouter:
+    """Shared router built from SHARD_ADDRESSES or SHARD_COUNT"""
+    global _router
+    with _router_lock:
+        if _router is not None:
+            return _router
+
+        vnodes = int(os.getenv('SHARD_VNODES', DEFAULT_VNODES))
+        addresses = [address.strip() for address in os.getenv('SHARD_ADDRESSES', '').split(',') if address.strip()]
+        if addresses:
+            authkey = shard_authkey()
+            shards = [ShardClient(address, authkey) for address in addresses]
+        else:
+            count = int(os.getenv('SHARD_COUNT', DEFAULT_SHARD_COUNT))
+            wal_dir = os.getenv('WAL_DIR')
+            shards = [
+                LocalShard(f"shard-{i}", create_local_shard(wal_dir and os.path.join(wal_dir, f"shard-{i}")))
+                for i in range(count)
+            ]
+            if wal_dir:
+                # Shards recovered from disk may hold users that a new SHARD_COUNT
+                # assigns elsewhere, and shards beyond SHARD_COUNT are drained
+                retired = []
+                i = count
+                while os.path.isdir(os.path.join(wal_dir, f"shard-{i}")):
+                    retired.append(LocalShard(f"shard-{i}", create_local_shard(os.path.join(wal_dir, f"shard-{i}"))))
+                    i += 1
+                moved = rebalance(shards, retired, vnodes)
+                if moved['users_moved']:
+                    print(f"✅ Rebalanced {moved['users_moved']} users across {count} shards")
+
+        _router = ShardRouter(shards, vnodes)
+        print(f"✅ Sharded storage: {len(shards)} {'socket' if addresses else 'in-process'} shards")
+        return _router
@@ -0,0 +1,322 @@
+"""Sketches - Fixed-size, mergeable approximate summaries
+
+    * CountMinSketch - per-key totals in depth x width counters; every key
+      updates one counter per row and the estimate is the smallest of its
+      counters, so it never undercounts while true totals are non-negative
+      (deletions are fine as long as they undo earlier additions)
+    * KLLSketch - quantiles of a stream of numbers
+    * HyperLogLog - number of distinct keys
+    * SpaceSaving - heavy hitters (most frequent keys)
+
+Sketches of the same shape merge, e.g. to combine per-day partitions or the
+summaries of several shards, and round-trip through to_dict() / from_dict()
+(JSON-safe) to move between processes.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import base64
+import hashlib
+import heapq
+import math
+import random
+
+import numpy as np
+
+DEFAULT_CMS_WIDTH = 2048
+DEFAULT_CMS_DEPTH = 4
+
+
+def _hash_rows(key: str, depth: int, width: int, seed: int) -> List[int]:
+    """One column per row from a single 64-bit-per-row digest of the key"""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8 * depth, salt=seed.to_bytes(8, 'little')).digest()
+    return [int.from_bytes(digest[8 * row:8 * row + 8], 'little') % width for row in range(depth)]
+
+
+class CountMinSketch:
+    """Count-min sketch over string keys with a float weight column alongside the counts"""
+
+    __slots__ = ('width', 'depth', 'seed', 'counts', 'weights', '_rows')
+
+    def __init__(self, width: int = DEFAULT_CMS_WIDTH, depth: int = DEFAULT_CMS_DEPTH, seed: int = 0):
+        self.width = width
+        self.depth = depth
+        self.seed = seed
+        self.counts = np.zeros((depth, width), dtype=np.int64)
+        self.weights = np.zeros((depth, width), dtype=np.float64)  # e.g. grams, read at the argmin count cell
+        self._rows = np.arange(depth)
+
+    def _columns(self, key: str) -> List[int]:
+        return _hash_rows(key, self.depth, self.width, self.seed)
+
+    def add(self, key: str, count: int = 1, weight: float = 0.0) -> int:
+        """Add to a key; returns its new estimated count"""
+        columns = self._columns(key)
+        self.counts[self._rows, columns] += count
+        self.weights[self._rows, columns] += weight
+        return int(self.counts[self._rows, columns].min())
+
+    def estimate(self, key: str) -> int:
+        return int(self.counts[self._rows, self._columns(key)].min())
+
+    def estimate_with_weight(self, key: str):
+        """(estimated count, weight from the same least-collided counter)"""
+        columns = self._columns(key)
+        counts = self.counts[self._rows, columns]
+        row = int(counts.argmin())
+        return int(counts[row]), float(self.weights[row, columns[row]])
+
+    def merge(self, other: "CountMinSketch", sign: int = 1) -> None:
+        """Add (sign=-1: subtract) another sketch of the same shape and seed"""
+        if (other.width, other.depth, other.seed) != (self.width, self.depth, self.seed):
+            raise ValueError("Count-min sketches must share width, depth and seed to merge")
+        self.counts += sign * other.counts
+        self.weights += sign * other.weights
+
+    def nbytes(self) -> int:
+        return self.counts.nbytes + self.weights.nbytes
+
+    @classmethod
+    def from_items(cls, items: Iterable, width: int = DEFAULT_CMS_WIDTH,
+                   depth: int = DEFAULT_CMS_DEPTH, seed: int = 0) -> "CountMinSketch":
+        """Sketch of (key, count, weight) items"""
+        sketch = cls(width, depth, seed)
+        for key, count, weight in items:
+            sketch.add(key, count, weight)
+        return sketch
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'width': self.width, 'depth': self.depth, 'seed': self.seed,
+            'counts': _encode(self.counts), 'weights': _encode(self.weights)
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CountMinSketch":
+        sketch = cls(data['width'], data['depth'], data['seed'])
+        sketch.counts = _decode(data['counts'], np.int64).reshape(sketch.depth, sketch.width)
+        sketch.weights = _decode(data['weights'], np.float64).reshape(sketch.depth, sketch.width)
+        return sketch
+
+
+def _encode(values: np.ndarray) -> str:
+    return base64.b64encode(np.ascontiguousarray(values).tobytes()).decode('ascii')
+
+
+def _decode(text: str, dtype) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(text), dtype=dtype).copy()
+
+
+DEFAULT_KLL_K = 200
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang, Liberty 2016)
+
+    Items are kept in a stack of compactors; level h items stand for 2^h
+    inputs. When the sketch is over capacity the lowest full compactor is
+    sorted and every other item (random offset) is promoted one level, so
+    memory stays O(k) while rank error is about 1.65 / k. Two sketches merge
+    by concatenating levels and compacting.
+    """
+
+    __slots__ = ('k', 'count', 'min', 'max', 'compactors', '_rng')
+
+    def __init__(self, k: int = DEFAULT_KLL_K, seed: Optional[int] = None):
+        self.k = k
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.compactors: List[List[float]] = [[]]
+        self._rng = random.Random(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _size(self) -> int:
+        return sum(len(compactor) for compactor in self.compactors)
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def update(self, value: float) -> None:
+        self.compactors[0].append(value)
+        self.count += 1
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if len(self.compactors[0]) >= self._capacity(0):
+            self._compress()
+
+    def _compress(self) -> None:
+        while self._size() >= self._max_size():
+            for level, compactor in enumerate(self.compactors):
+                if len(compactor) >= self._capacity(level):
+                    if level + 1 == len(self.compactors):
+                        self.compactors.append([])
+                    compactor.sort()
+                    # An odd item out stays at this level so no weight is lost
+                    kept = [compactor.pop()] if len(compactor) % 2 else []
+                    self.compactors[level + 1].extend(compactor[self._rng.random() < 0.5::2])
+                    self.compactors[level] = kept
+                    break
+            else:
+                return
+
+    def merge(self, other: "KLLSketch") -> None:
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for level, compactor in enumerate(other.compactors):
+            self.compactors[level].extend(compactor)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+
+    def quantiles(self, fractions: Sequence[float]) -> List[Optional[float]]:
+        """Approximate values at each fraction in [0, 1] (None when empty)"""
+        if not self.count:
+            return [None for _ in fractions]
+        items = sorted((value, 1 << level) for level, compactor in enumerate(self.compactors) for value in compactor)
+        cumulative = np.cumsum([weight for _, weight in items])
+        values = [value for value, _ in items]
+        total = cumulative[-1]
+        result = []
+        for fraction in fractions:
+            if fraction <= 0:
+                result.append(self.min)
+            elif fraction >= 1:
+                result.append(self.max)
+            else:
+                index = int(np.searchsorted(cumulative, fraction * total, side='left'))
+                result.append(values[min(index, len(values) - 1)])
+        return result
+
+    def quantile(self, fraction: float) -> Optional[float]:
+        return self.quantiles([fraction])[0]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'k': self.k, 'count': self.count,
+            'min': self.min if self.count else None, 'max': self.max if self.count else None,
+            'compactors': [list(compactor) for compactor in self.compactors]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "KLLSketch":
+        sketch = cls(data['k'])
+        sketch.count = data['count']
+        if sketch.count:
+            sketch.min, sketch.max = data['min'], data['max']
+        sketch.compactors = [list(compactor) for compactor in data['compactors']] or [[]]
+        return sketch
+
+
+DEFAULT_HLL_PRECISION = 11
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter (2^p one-byte registers, ~1.04 / sqrt(2^p) error)
+
+    Merging takes the register-wise maximum, so per-day sketches union into
+    distinct counts over any range.
+    """
+
+    __slots__ = ('p', 'registers')
+
+    def __init__(self, p: int = DEFAULT_HLL_PRECISION):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add(self, key: str) -> None:
+        value = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+        index = value >> (64 - self.p)
+        rest = value & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.p != self.p:
+            raise ValueError("HyperLogLogs must share precision to merge")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'p': self.p, 'registers': _encode(self.registers)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HyperLogLog":
+        sketch = cls(data['p'])
+        sketch.registers = _decode(data['registers'], np.uint8)
+        return sketch
+
+
+DEFAULT_HEAVY_HITTERS = 128
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters (Metwally et al.) with a weight per key
+
+    Keeps at most `capacity` keys. A new key replaces the one with the
+    smallest count and inherits that count as its error, so counts never
+    undercount and overcount by at most `error`. Merging sums counts over
+    both key sets and keeps the largest `capacity` (Agarwal et al.'s
+    mergeable summaries).
+    """
+
+    __slots__ = ('capacity', 'counters')
+
+    def __init__(self, capacity: int = DEFAULT_HEAVY_HITTERS):
+        self.capacity = capacity
+        self.counters: Dict[str, List] = {}  # key -> [count, error, weight]
+
+    def update(self, key: str, count: int = 1, weight: float = 0.0) -> None:
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += count
+            counter[2] += weight
+        elif len(self.counters) < self.capacity:
+            self.counters[key] = [count, 0, weight]
+        else:
+            victim = min(self.counters, key=lambda candidate: self.counters[candidate][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[key] = [floor + count, floor, weight]
+
+    def merge(self, other: "SpaceSaving") -> None:
+        for key, (count, error, weight) in other.counters.items():
+            counter = self.counters.get(key)
+            if counter is None:
+                self.counters[key] = [count, error, weight]
+            else:
+                counter[0] += count
+                counter[1] += error
+                counter[2] += weight
+        if len(self.counters) > self.capacity:
+            kept = heapq.nlargest(self.capacity, self.counters.items(), key=lambda item: item[1][0])
+            self.counters = dict(kept)
+
+    def top(self, n: int) -> List[Tuple[str, int, int, float]]:
+        """(key, count, max overcount, weight), largest counts first"""
+        items = heapq.nlargest(n, self.counters.items(), key=lambda item: (item[1][0], item[0]))
+        return [(key, count, error, weight) for key, (count, error, weight) in items]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'capacity': self.capacity, 'counters': {key: list(counter) for key, counter in self.counters.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SpaceSaving":
+        sketch = cls(data['capacity'])
+        sketch.counters = {key: list(counter) for key, counter in data['counters'].items()}
+        return sketch
@@ -0,0 +1,668 @@
+"""SQLite Storage Backend - Durable meal and user stores
+
+Meals and users are stored as JSON payloads next to the columns we filter
+and sort on. The database runs in WAL mode so several uvicorn workers can
+read while one writes, and each process keeps a small pool of connections.
+All SQL is parameterised with fixed statement text so sqlite3's per-connection
+statement cache reuses the prepared statements.
+
+Environment:
+    SQLITE_PATH            - database file (default: backend/data/nutrition.db)
+    SQLITE_POOL_SIZE       - connections per process (default: 4)
+    POPULATION_OPEN_DAYS   - recent days whose population sketches are rebuilt on every query (default: 2)
+    POPULATION_CACHE_DAYS  - sealed population days cached per process (default: 400)
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from contextlib import contextmanager
+from pathlib import Path
+import os
+import queue
+import sqlite3
+import threading
+
+from models.meal import MealEntry, MealType
+from models.user import Gender, HealthGoal, UserProfile
+from services.population import OPEN_DAYS, CohortDay, Partition, PopulationSummary, UserDay, seal_day
+from services.storage import (
+    MealStore, UserStore, after_fork, to_micros, encode_cursor, decode_cursor, encode_user_cursor, normalize_email
+)
+from services.rollups import DailyRollup, PeriodRollup, ROLLUP_FIELDS, aggregate_by_day
+from utils.serialization import dumps, loads, construct_meal_entry, construct_user_profile
+
+DEFAULT_DB_PATH = Path(__file__).parent.parent / "data" / "nutrition.db"
+
+DEFAULT_POPULATION_CACHE_DAYS = 400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meals (
+    meal_id   TEXT PRIMARY KEY,
+    user_id   TEXT NOT NULL,
+    meal_type TEXT NOT NULL,
+    ts        INTEGER NOT NULL,
+    payload   BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_meals_user_ts ON meals (user_id, ts);
+CREATE INDEX IF NOT EXISTS idx_meals_user_type_ts ON meals (user_id, meal_type, ts);
+
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    user_id            TEXT NOT NULL,
+    day                TEXT NOT NULL,
+    calories           REAL NOT NULL,
+    protein            REAL NOT NULL,
+    carbs              REAL NOT NULL,
+    fat                REAL NOT NULL,
+    fiber              REAL NOT NULL,
+    sugar              REAL NOT NULL,
+    sodium             REAL NOT NULL,
+    breakfast_calories REAL NOT NULL,
+    lunch_calories     REAL NOT NULL,
+    dinner_calories    REAL NOT NULL,
+    snack_calories     REAL NOT NULL,
+    meals_count        INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_daily_rollups_day ON daily_rollups (day);
+
+-- Detected foods per user-day, kept with daily_rollups so population
+-- summaries never parse meal payloads
+CREATE TABLE IF NOT EXISTS daily_foods (
+    user_id   TEXT NOT NULL,
+    day       TEXT NOT NULL,
+    food_name TEXT NOT NULL,
+    times     INTEGER NOT NULL,
+    grams     REAL NOT NULL,
+    PRIMARY KEY (user_id, day, food_name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_daily_foods_day ON daily_foods (day);
+
+-- Bumped in the same transaction as every change to a day's meals; sealed
+-- population days are cached per process at their version
+CREATE TABLE IF NOT EXISTS day_versions (
+    day     TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id    TEXT PRIMARY KEY,
+    email      TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    payload    BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_users_email ON users (email);
+
+-- Secondary indexes over users: directory rows carry the filter and sort
+-- columns for pagination, user_emails makes the normalized email unique
+CREATE TABLE IF NOT EXISTS user_directory (
+    user_id     TEXT PRIMARY KEY,
+    created_at  INTEGER NOT NULL,
+    health_goal TEXT NOT NULL,
+    gender      TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_user_directory_created ON user_directory (created_at, user_id);
+CREATE INDEX IF NOT EXISTS idx_user_directory_goal ON user_directory (health_goal, created_at, user_id);
+CREATE INDEX IF NOT EXISTS idx_user_directory_gender ON user_directory (gender, created_at, user_id);
+
+CREATE TABLE IF NOT EXISTS user_emails (
+    email   TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_user_emails_user ON user_emails (user_id);
+
+CREATE TABLE IF NOT EXISTS meal_versions (
+    user_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+class SQLiteDatabase:
+    """SQLite database file with a per-process connection pool"""
+
+    def __init__(self, path: str, pool_size: int = 4):
+        self.path = str(path)
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self.pool_size = max(1, pool_size)
+        for _ in range(self.pool_size):
+            self._pool.put(self._connect())
+        after_fork(self._reopen)
+
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _reopen(self) -> None:
+        # SQLite connections must not be used across fork; the parent keeps its own
+        self._pool = queue.LifoQueue()
+        for _ in range(self.pool_size):
+            self._pool.put(self._connect())
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection from the pool"""
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Borrow a connection and run the block in one write transaction"""
+        with self.connection() as conn:
+            with conn:
+                yield conn
+
+    def close(self):
+        """Close every pooled connection"""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(path: Optional[str] = None) -> SQLiteDatabase:
+    """Return the shared database for a path (SQLITE_PATH by default)"""
+    path = str(path or os.getenv('SQLITE_PATH', DEFAULT_DB_PATH))
+    with _databases_lock:
+        if path not in _databases:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            pool_size = int(os.getenv('SQLITE_POOL_SIZE', '4'))
+            _databases[path] = SQLiteDatabase(path, pool_size=pool_size)
+        return _databases[path]
+
+
+def _meal_filters(user_id: str,
+                  meal_type: Optional[MealType],
+                  start: Optional[datetime],
+                  end: Optional[datetime]) -> Tuple[str, list]:
+    """Build the WHERE clause; the clause text only depends on which filters are set"""
+    clauses = ["user_id = ?"]
+    params: list = [user_id]
+    if meal_type:
+        clauses.append("meal_type = ?")
+        params.append(MealType(meal_type).value)
+    if start:
+        clauses.append("ts >= ?")
+        params.append(to_micros(start))
+    if end:
+        clauses.append("ts <= ?")
+        params.append(to_micros(end))
+    return " AND ".join(clauses), params
+
+
+# Stay under SQLite's default limit on bound parameters per statement
+_MAX_PARAMS = 500
+
+_ROLLUP_COLUMNS = ROLLUP_FIELDS + ('meals_count',)
+
+_UPSERT_ROLLUP = (
+    f"INSERT INTO daily_rollups (user_id, day, {', '.join(_ROLLUP_COLUMNS)}) "
+    f"VALUES (?, ?, {', '.join('?' for _ in _ROLLUP_COLUMNS)}) "
+    f"ON CONFLICT (user_id, day) DO UPDATE SET "
+    + ", ".join(f"{column} = {column} + excluded.{column}" for column in _ROLLUP_COLUMNS)
+)
+
+
+_SUM_ROLLUP = ", ".join(f"SUM({column})" for column in _ROLLUP_COLUMNS) + ", COUNT(*)"
+
+# Bumped in the same transaction as every change to a user's meals
+_BUMP_VERSION = (
+    "INSERT INTO meal_versions (user_id, version) VALUES (?, 1) "
+    "ON CONFLICT (user_id) DO UPDATE SET version = version + 1"
+)
+
+# Period start of a daily_rollups.day for each calendar resolution (week starts Monday)
+_PERIOD_SQL = {
+    'day': "day",
+    'week': "date(day, '-6 days', 'weekday 1')",
+    'month': "strftime('%Y-%m-01', day)"
+}
+# N-day buckets counted from an origin day (parameters: origin, origin, n, n)
+_BUCKET_SQL = "date(?, '+' || (CAST(julianday(day) - julianday(?) AS INTEGER) / ? * ?) || ' days')"
+
+# Detected foods of a user's meals in [ts, ts) grouped by food_id, most frequent first;
+# the last column is the number of distinct foods (parameters: user_id, start, end, limit)
+_TOP_FOODS_SQL = (
+    "SELECT json_extract(food.value, '$.food_id') AS food_id, MIN(json_extract(food.value, '$.food_name')), "
+    "COUNT(*) AS times, TOTAL(json_extract(food.value, '$.estimated_portion_g')), COUNT(*) OVER () "
+    "FROM meals, json_each(CAST(meals.payload AS TEXT), '$.detected_foods') AS food "
+    "WHERE meals.user_id = ? AND meals.ts >= ? AND meals.ts < ? "
+    "GROUP BY food_id ORDER BY times DESC, food_id DESC LIMIT ?"
+)
+
+_UPSERT_FOOD = (
+    "INSERT INTO daily_foods (user_id, day, food_name, times, grams) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (user_id, day, food_name) DO UPDATE SET "
+    "times = times + excluded.times, grams = grams + excluded.grams"
+)
+
+_BUMP_DAY = (
+    "INSERT INTO day_versions (day, version) VALUES (?, 1) "
+    "ON CONFLICT (day) DO UPDATE SET version = version + 1"
+)
+
+
+def _rollup_delta(meal: MealEntry, sign: int) -> tuple:
+    """Parameters for _UPSERT_ROLLUP adding (or subtracting) one meal"""
+    delta = DailyRollup()
+    delta.apply(meal, sign)
+    return (meal.user_id, meal.timestamp.date().isoformat()) + delta.values()
+
+
+def _food_deltas(meals: Iterable[MealEntry], sign: int = 1) -> List[tuple]:
+    """Parameters for _UPSERT_FOOD adding (or subtracting) a batch of meals"""
+    user_days: Dict[Tuple[str, str], UserDay] = {}
+    for meal in meals:
+        key = (meal.user_id, meal.timestamp.date().isoformat())
+        totals = user_days.get(key)
+        if totals is None:
+            totals = user_days[key] = UserDay()
+        totals.apply(meal, sign)
+    return [(user_id, day, name, times, grams)
+            for (user_id, day), totals in user_days.items()
+            for name, (times, grams) in totals.foods.items()]
+
+
+class SQLiteMealStore(MealStore):
+    """Meal storage backed by SQLite"""
+
+    def __init__(self, database: SQLiteDatabase, open_days: int = OPEN_DAYS,
+                 cache_days: int = DEFAULT_POPULATION_CACHE_DAYS):
+        self.db = database
+        self.open_days = max(1, open_days)
+        self.cache_days = cache_days
+        # Sealed population days: {day: (day version, partitions)}, least recently used first
+        self._sealed_days: "OrderedDict[date, Tuple[int, Dict[Partition, CohortDay]]]" = OrderedDict()
+        self._sealed_lock = threading.Lock()
+        after_fork(self._reset_lock)
+
+        # Databases created before rollups (or daily foods) existed have meals but no rollups
+        with self.db.connection() as conn:
+            has_rollups = conn.execute("SELECT 1 FROM daily_rollups LIMIT 1").fetchone()
+            has_foods = conn.execute("SELECT 1 FROM daily_foods LIMIT 1").fetchone()
+            has_meals = conn.execute("SELECT 1 FROM meals LIMIT 1").fetchone()
+        if has_meals and not (has_rollups and has_foods):
+            self.rebuild_rollups()
+
+    def _reset_lock(self) -> None:
+        self._sealed_lock = threading.Lock()
+
+    def add_meal(self, meal: MealEntry) -> None:
+        with self.db.transaction() as conn:
+            conn.execute(
+                "INSERT INTO meals (meal_id, user_id, meal_type, ts, payload) VALUES (?, ?, ?, ?, ?)",
+                (meal.meal_id, meal.user_id, MealType(meal.meal_type).value, to_micros(meal.timestamp), dumps(meal))
+            )
+            conn.execute(_UPSERT_ROLLUP, _rollup_delta(meal, 1))
+            conn.executemany(_UPSERT_FOOD, _food_deltas((meal,)))
+            conn.execute(_BUMP_VERSION, (meal.user_id,))
+            conn.execute(_BUMP_DAY, (meal.timestamp.date().isoformat(),))
+
+    def add_meals(self, meals: List[MealEntry]) -> None:
+        if not meals:
+            return
+        with self.db.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO meals (meal_id, user_id, meal_type, ts, payload) VALUES (?, ?, ?, ?, ?)",
+                [(meal.meal_id, meal.user_id, MealType(meal.meal_type).value, to_micros(meal.timestamp), dumps(meal))
+                 for meal in meals]
+            )
+            conn.executemany(_UPSERT_ROLLUP, [
+                (user_id, day.isoformat()) + delta.values()
+                for (user_id, day), delta in aggregate_by_day(meals).items()
+            ])
+            conn.executemany(_UPSERT_FOOD, _food_deltas(meals))
+            conn.executemany(_BUMP_VERSION, [(user_id,) for user_id in {meal.user_id for meal in meals}])
+            conn.executemany(_BUMP_DAY, [(day,) for day in {meal.timestamp.date().isoformat() for meal in meals}])
+
+    def existing_meal_ids(self, meal_ids: List[str]) -> Set[str]:
+        existing = set()
+        with self.db.connection() as conn:
+            for i in range(0, len(meal_ids), _MAX_PARAMS):
+                chunk = meal_ids[i:i + _MAX_PARAMS]
+                placeholders = ", ".join("?" for _ in chunk)
+                rows = conn.execute(f"SELECT meal_id FROM meals WHERE meal_id IN ({placeholders})", chunk)
+                existing.update(row[0] for row in rows)
+        return existing
+
+    def get_meal(self, meal_id: str) -> Optional[MealEntry]:
+        with self.db.connection() as conn:
+            row = conn.execute("SELECT payload FROM meals WHERE meal_id = ?", (meal_id,)).fetchone()
+        return construct_meal_entry(loads(row[0])) if row else None
+
+    def remove_meal(self, meal_id: str) -> Optional[MealEntry]:
+        with self.db.transaction() as conn:
+            row = conn.execute("DELETE FROM meals WHERE meal_id = ? RETURNING payload", (meal_id,)).fetchone()
+            if row is None:
+                return None
+            meal = construct_meal_entry(loads(row[0]))
+            conn.execute(_UPSERT_ROLLUP, _rollup_delta(meal, -1))
+            conn.executemany(_UPSERT_FOOD, _food_deltas((meal,), -1))
+            day = meal.timestamp.date().isoformat()
+            conn.execute(
+                "DELETE FROM daily_rollups WHERE user_id = ? AND day = ? AND meals_count <= 0",
+                (meal.user_id, day)
+            )
+            conn.execute("DELETE FROM daily_foods WHERE user_id = ? AND day = ? AND times <= 0", (meal.user_id, day))
+            conn.execute(_BUMP_VERSION, (meal.user_id,))
+            conn.execute(_BUMP_DAY, (day,))
+        return meal
+
+    def has_meals(self, user_id: str) -> bool:
+        with self.db.connection() as conn:
+            row = conn.execute("SELECT 1 FROM meals WHERE user_id = ? LIMIT 1", (user_id,)).fetchone()
+        return row is not None
+
+    def query_meals(self, user_id, meal_type=None, start=None, end=None,
+                    limit=None, offset=0, newest_first=False) -> List[MealEntry]:
+        where, params = _meal_filters(user_id, meal_type, start, end)
+        order = "DESC" if newest_first else "ASC"
+        sql = f"SELECT payload FROM meals WHERE {where} ORDER BY ts {order}, meal_id {order} LIMIT ? OFFSET ?"
+        params.extend([-1 if limit is None else limit, offset])
+        with self.db.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [construct_meal_entry(loads(row[0])) for row in rows]
+
+    def page_meals(self, user_id, meal_type=None, start=None, end=None,
+                   limit=10, cursor=None, newest_first=True) -> Tuple[List[MealEntry], Optional[str]]:
+        where, params = _meal_filters(user_id, meal_type, start, end)
+        if cursor:
+            where += " AND (ts, meal_id) < (?, ?)" if newest_first else " AND (ts, meal_id) > (?, ?)"
+            params.extend(decode_cursor(cursor))
+        order = "DESC" if newest_first else "ASC"
+        sql = f"SELECT payload FROM meals WHERE {where} ORDER BY ts {order}, meal_id {order} LIMIT ?"
+        params.append(limit + 1)
+        with self.db.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        meals = [construct_meal_entry(loads(row[0])) for row in rows[:limit]]
+        next_cursor = encode_cursor(meals[-1]) if len(rows) > limit else None
+        return meals, next_cursor
+
+    def count_meals(self, user_id, meal_type=None, start=None, end=None) -> int:
+        where, params = _meal_filters(user_id, meal_type, start, end)
+        with self.db.connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM meals WHERE {where}", params).fetchone()[0]
+
+    def daily_rollup(self, user_id: str, day: date) -> Optional[DailyRollup]:
+        with self.db.connection() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(_ROLLUP_COLUMNS)} FROM daily_rollups WHERE user_id = ? AND day = ?",
+                (user_id, day.isoformat())
+            ).fetchone()
+        return DailyRollup.from_values(row) if row else None
+
+    def rollup_range(self, user_id: str, start: date, end: date) -> PeriodRollup:
+        with self.db.connection() as conn:
+            row = conn.execute(
+                f"SELECT {_SUM_ROLLUP} FROM daily_rollups WHERE user_id = ? AND day BETWEEN ? AND ?",
+                (user_id, start.isoformat(), end.isoformat())
+            ).fetchone()
+        return PeriodRollup.from_vector([value or 0 for value in row])
+
+    def rollup_series(self, user_id, start, end, resolution='day') -> List[Tuple[date, PeriodRollup]]:
+        if resolution in _PERIOD_SQL:
+            period, params = _PERIOD_SQL[resolution], []
+        else:
+            period, params = _BUCKET_SQL, [start.isoformat(), start.isoformat(), int(resolution), int(resolution)]
+        params.extend([user_id, start.isoformat(), end.isoformat()])
+        with self.db.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {period} AS period, {_SUM_ROLLUP} FROM daily_rollups "
+                f"WHERE user_id = ? AND day BETWEEN ? AND ? GROUP BY period ORDER BY period",
+                params
+            ).fetchall()
+        return [(date.fromisoformat(row[0]), PeriodRollup.from_vector(row[1:])) for row in rows]
+
+    def top_foods(self, user_id, start, end, k=20) -> Tuple[List[Tuple[str, str, int, float]], int]:
+        day_start = to_micros(datetime.combine(start, time.min))
+        day_end = to_micros(datetime.combine(end + timedelta(days=1), time.min))
+        with self.db.connection() as conn:
+            rows = conn.execute(_TOP_FOODS_SQL, (user_id, day_start, day_end, -1 if k is None else k)).fetchall()
+        if not rows:
+            return [], 0
+        return [tuple(row[:4]) for row in rows], rows[0][4]
+
+    def population_summary(self, start: date, end: date) -> PopulationSummary:
+        """
+        Population partitions for [start, end] from daily_rollups, daily_foods and the users' profiles
+
+        Days older than the last open_days are sealed once per day version
+        and cached (the cohort is resolved when a day is sealed, as in
+        services.population); only open days and days written since they
+        were cached are read back.
+        """
+        first_open = date.today() - timedelta(days=self.open_days - 1)
+        with self.db.connection() as conn:
+            versions = {
+                date.fromisoformat(day): version
+                for day, version in conn.execute(
+                    "SELECT day, version FROM day_versions WHERE day BETWEEN ? AND ?",
+                    (start.isoformat(), end.isoformat())
+                )
+            }
+
+        summary = PopulationSummary()
+        stale = []
+        with self._sealed_lock:
+            for day, version in versions.items():
+                cached = self._sealed_days.get(day)
+                if day < first_open and cached is not None and cached[0] == version:
+                    self._sealed_days.move_to_end(day)
+                    for key, cohort in cached[1].items():
+                        summary.add(key, cohort)
+                else:
+                    stale.append(day)
+
+        for day, partitions in self._seal_days(stale).items():
+            for key, cohort in partitions.items():
+                summary.add(key, cohort)
+            if day < first_open and self.cache_days > 0:
+                # Versions were read before the data: a racing write only makes the entry stale
+                with self._sealed_lock:
+                    self._sealed_days[day] = (versions[day], partitions)
+                    self._sealed_days.move_to_end(day)
+                    while len(self._sealed_days) > self.cache_days:
+                        self._sealed_days.popitem(last=False)
+        return summary
+
+    def _seal_days(self, days: List[date]) -> Dict[date, Dict[Partition, CohortDay]]:
+        """Seal each day's partitions from its exact user-day totals"""
+        user_days: Dict[date, Dict[str, UserDay]] = {day: {} for day in days}
+        if not days:
+            return {}
+        keys = [day.isoformat() for day in days]
+        with self.db.connection() as conn:
+            for i in range(0, len(keys), _MAX_PARAMS):
+                chunk = keys[i:i + _MAX_PARAMS]
+                placeholders = ", ".join("?" for _ in chunk)
+                for user_id, day, calories, protein, meals_count in conn.execute(
+                    f"SELECT user_id, day, calories, protein, meals_count FROM daily_rollups "
+                    f"WHERE day IN ({placeholders})", chunk
+                ):
+                    user_days[date.fromisoformat(day)][user_id] = UserDay(calories, protein, meals_count)
+                for user_id, day, food_name, times, grams in conn.execute(
+                    f"SELECT user_id, day, food_name, times, grams FROM daily_foods WHERE day IN ({placeholders})",
+                    chunk
+                ):
+                    totals = user_days[date.fromisoformat(day)].get(user_id)
+                    if totals is not None:
+                        totals.foods[food_name] = [times, grams]
+
+            user_ids = sorted({user_id for users in user_days.values() for user_id in users})
+            profiles = {}
+            for i in range(0, len(user_ids), _MAX_PARAMS):
+                chunk = user_ids[i:i + _MAX_PARAMS]
+                placeholders = ", ".join("?" for _ in chunk)
+                for user_id, payload in conn.execute(
+                    f"SELECT user_id, payload FROM users WHERE user_id IN ({placeholders})", chunk
+                ):
+                    profiles[user_id] = construct_user_profile(loads(payload))
+
+        return {day: seal_day(day, users, profiles.get) for day, users in user_days.items()}
+
+    def rebuild_rollups(self, user_id: Optional[str] = None) -> int:
+        with self.db.transaction() as conn:
+            if user_id is None:
+                days = {row[0] for row in conn.execute("SELECT day FROM daily_rollups")}
+                conn.execute("DELETE FROM daily_rollups")
+                conn.execute("DELETE FROM daily_foods")
+                rows = conn.execute("SELECT payload FROM meals")
+            else:
+                days = {row[0] for row in conn.execute("SELECT day FROM daily_rollups WHERE user_id = ?", (user_id,))}
+                conn.execute("DELETE FROM daily_rollups WHERE user_id = ?", (user_id,))
+                conn.execute("DELETE FROM daily_foods WHERE user_id = ?", (user_id,))
+                rows = conn.execute("SELECT payload FROM meals WHERE user_id = ?", (user_id,))
+
+            meals = [construct_meal_entry(loads(row[0])) for row in rows.fetchall()]
+            for meal in meals:
+                conn.execute(_UPSERT_ROLLUP, _rollup_delta(meal, 1))
+                days.add(meal.timestamp.date().isoformat())
+            conn.executemany(_UPSERT_FOOD, _food_deltas(meals))
+            conn.executemany(_BUMP_DAY, [(day,) for day in days])
+            if user_id is None:
+                conn.execute("UPDATE meal_versions SET version = version + 1")
+            else:
+                conn.execute(_BUMP_VERSION, (user_id,))
+        return len(meals)
+
+    def data_version(self, user_id: str) -> int:
+        with self.db.connection() as conn:
+            row = conn.execute("SELECT version FROM meal_versions WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+
+_UPSERT_USER = "INSERT OR REPLACE INTO users (user_id, email, created_at, payload) VALUES (?, ?, ?, ?)"
+_UPSERT_DIRECTORY = "INSERT OR REPLACE INTO user_directory (user_id, created_at, health_goal, gender) VALUES (?, ?, ?, ?)"
+_CLAIM_EMAIL = "INSERT INTO user_emails (email, user_id) VALUES (?, ?) ON CONFLICT (email) DO NOTHING"
+
+
+def _page_users_sql(health_goal: bool, gender: bool, after: bool) -> str:
+    """Fixed statement text per filter combination, so every variant stays a cached prepared statement"""
+    where = [clause for clause, used in (("d.health_goal = ?", health_goal), ("d.gender = ?", gender),
+                                         ("(d.created_at, d.user_id) > (?, ?)", after)) if used]
+    return ("SELECT u.payload FROM user_directory AS d JOIN users AS u ON u.user_id = d.user_id"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + " ORDER BY d.created_at, d.user_id LIMIT ?")
+
+
+_PAGE_USERS_SQL = {(goal, gender, after): _page_users_sql(goal, gender, after)
+                   for goal in (False, True) for gender in (False, True) for after in (False, True)}
+
+
+def _directory_row(user: UserProfile) -> tuple:
+    return user.user_id, to_micros(user.created_at), HealthGoal(user.health_goal).value, Gender(user.gender).value
+
+
+class SQLiteUserStore(UserStore):
+    """User profile storage backed by SQLite"""
+
+    def __init__(self, database: SQLiteDatabase):
+        self.db = database
+
+        # Databases created before the directory existed have users but no index rows
+        with self.db.connection() as conn:
+            users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+            indexed = conn.execute("SELECT COUNT(*) FROM user_directory").fetchone()[0]
+        if users != indexed:
+            self.rebuild_directory()
+
+    def rebuild_directory(self) -> int:
+        """Recompute the directory and email index from the stored profiles (oldest claims an email first)"""
+        with self.db.transaction() as conn:
+            users = [construct_user_profile(loads(row[0]))
+                     for row in conn.execute("SELECT payload FROM users ORDER BY created_at, user_id")]
+            conn.execute("DELETE FROM user_directory")
+            conn.execute("DELETE FROM user_emails")
+            conn.executemany(_UPSERT_DIRECTORY, [_directory_row(user) for user in users])
+            conn.executemany(_CLAIM_EMAIL, [(normalize_email(user.email), user.user_id) for user in users])
+        return len(users)
+
+    def _write(self, conn: sqlite3.Connection, user: UserProfile, email: str) -> None:
+        conn.execute(_UPSERT_USER, (user.user_id, user.email, to_micros(user.created_at), dumps(user)))
+        conn.execute(_UPSERT_DIRECTORY, _directory_row(user))
+        conn.execute("DELETE FROM user_emails WHERE user_id = ? AND email != ?", (user.user_id, email))
+        conn.execute(_CLAIM_EMAIL, (email, user.user_id))
+
+    def create_user(self, user: UserProfile) -> bool:
+        email = normalize_email(user.email)
+        with self.db.transaction() as conn:
+            # The claim takes the write lock, so the owner read back is final
+            conn.execute(_CLAIM_EMAIL, (email, user.user_id))
+            owner = conn.execute("SELECT user_id FROM user_emails WHERE email = ?", (email,)).fetchone()[0]
+            if owner != user.user_id:
+                return False
+            self._write(conn, user, email)
+        return True
+
+    def save_user(self, user: UserProfile) -> None:
+        with self.db.transaction() as conn:
+            self._write(conn, user, normalize_email(user.email))
+
+    def get_user(self, user_id: str) -> Optional[UserProfile]:
+        with self.db.connection() as conn:
+            row = conn.execute("SELECT payload FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return construct_user_profile(loads(row[0])) if row else None
+
+    def get_users(self, user_ids: List[str]) -> List[UserProfile]:
+        if not user_ids:
+            return []
+        with self.db.connection() as conn:
+            rows = conn.execute(
+                "SELECT users.user_id, users.payload FROM json_each(?) AS ids "
+                "JOIN users ON users.user_id = ids.value", (dumps(list(user_ids)).decode('utf-8'),)
+            ).fetchall()
+        found = {user_id: payload for user_id, payload in rows}
+        return [construct_user_profile(loads(found[user_id])) for user_id in user_ids if user_id in found]
+
+    def get_user_by_email(self, email: str) -> Optional[UserProfile]:
+        with self.db.connection() as conn:
+            row = conn.execute(
+                "SELECT users.payload FROM user_emails JOIN users ON users.user_id = user_emails.user_id "
+                "WHERE user_emails.email = ?", (normalize_email(email),)
+            ).fetchone()
+        return construct_user_profile(loads(row[0])) if row else None
+
+    def delete_user(self, user_id: str) -> bool:
+        with self.db.transaction() as conn:
+            cursor = conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM user_directory WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM user_emails WHERE user_id = ?", (user_id,))
+        return cursor.rowcount > 0
+
+    def list_users(self) -> List[UserProfile]:
+        with self.db.connection() as conn:
+            rows = conn.execute("SELECT payload FROM users ORDER BY created_at").fetchall()
+        return [construct_user_profile(loads(row[0])) for row in rows]
+
+    def page_users(self, limit=50, cursor=None, health_goal=None, gender=None) -> Tuple[List[UserProfile], Optional[str]]:
+        after = decode_cursor(cursor) if cursor else None
+        params = [value for value in (health_goal, gender) if value is not None]
+        if after is not None:
+            params.extend(after)
+        sql = _PAGE_USERS_SQL[(health_goal is not None, gender is not None, after is not None)]
+        with self.db.connection() as conn:
+            rows = conn.execute(sql, params + [limit + 1]).fetchall()
+        users = [construct_user_profile(loads(row[0])) for row in rows[:limit]]
+        next_cursor = encode_user_cursor(users[-1]) if len(rows) > limit else None
+        return users, next_cursor
+
+    def count_users(self, health_goal=None, gender=None) -> int:
+        with self.db.connection() as conn:
+            if health_goal is None and gender is None:
+                return conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+            return conn.execute(
+                "SELECT COUNT(*) FROM user_directory WHERE (?1 IS NULL OR health_goal = ?1) "
+                "AND (?2 IS NULL OR gender = ?2)", (health_goal, gender)
+            ).fetchone()[0]
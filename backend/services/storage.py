@@ -0,0 +1,441 @@
+"""Storage Layer - Pluggable meal and user stores
+
+Routes talk to a MealStore / UserStore instead of module-level dicts so the
+backing storage can be swapped without changing route semantics.
+
+Backends (selected with the STORAGE_BACKEND environment variable):
+    memory - process-local columnar store (default); data is lost on restart
+             unless WAL_DIR is set (write-ahead log + snapshots, see services.persistence)
+    sqlite - durable SQLite database at SQLITE_PATH, shareable by workers
+    sharded - users partitioned across in-process or socket shards (services.sharding)
+"""
+from typing import TYPE_CHECKING, Callable, List, Optional, Set, Tuple
+from datetime import date, datetime, timedelta, timezone
+import os
+import weakref
+
+from models.meal import MealEntry, MealType
+from models.user import UserProfile
+from services.rollups import DailyRollup, PeriodRollup, Resolution
+
+if TYPE_CHECKING:  # analytics_engine imports this module
+    from services.analytics_engine import MealArrays
+    from services.population import PopulationSummary
+
+CursorKey = Tuple[int, str]  # (timestamp in microseconds, meal_id)
+
+# Sorts after every meal_id, so (ts, MAX_ID) bounds all meals at ts
+MAX_ID = '\U0010ffff'
+
+
+class StoreBusyError(RuntimeError):
+    """The store cannot take more writes right now; the caller should retry shortly"""
+
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def to_micros(value: datetime) -> int:
+    """Convert a (naive UTC or aware) datetime to integer microseconds since epoch"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def encode_cursor(meal: MealEntry) -> str:
+    """Opaque keyset cursor pointing just past this meal"""
+    return f"{to_micros(meal.timestamp)}:{meal.meal_id}"
+
+
+def decode_cursor(cursor: str) -> CursorKey:
+    """Parse a cursor produced by encode_cursor (raises ValueError if malformed)"""
+    micros, sep, meal_id = cursor.partition(':')
+    if not sep or not meal_id:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return int(micros), meal_id
+
+
+def normalize_email(email: str) -> str:
+    """Key used for email uniqueness (case and surrounding whitespace ignored)"""
+    return email.strip().lower()
+
+
+def user_key(user: UserProfile) -> CursorKey:
+    """Directory order of a user: (created_at in microseconds, user_id)"""
+    return to_micros(user.created_at), user.user_id
+
+
+def encode_user_cursor(user: UserProfile) -> str:
+    """Opaque keyset cursor pointing just past this user in directory order"""
+    return f"{to_micros(user.created_at)}:{user.user_id}"
+
+
+class MealStore:
+    """Interface for meal storage backends"""
+
+    def add_meal(self, meal: MealEntry) -> None:
+        """Store a new meal"""
+        raise NotImplementedError
+
+    def add_meals(self, meals: List[MealEntry]) -> None:
+        """Store a batch of new meals in one write, updating indexes once"""
+        raise NotImplementedError
+
+    def existing_meal_ids(self, meal_ids: List[str]) -> Set[str]:
+        """Subset of meal_ids that are already stored"""
+        raise NotImplementedError
+
+    def get_meal(self, meal_id: str) -> Optional[MealEntry]:
+        """Return a meal by ID, or None if it does not exist"""
+        raise NotImplementedError
+
+    def remove_meal(self, meal_id: str) -> Optional[MealEntry]:
+        """Delete a meal and return it, or None if it does not exist"""
+        raise NotImplementedError
+
+    def has_meals(self, user_id: str) -> bool:
+        """Whether the user has logged any meals"""
+        raise NotImplementedError
+
+    def query_meals(self,
+                    user_id: str,
+                    meal_type: Optional[MealType] = None,
+                    start: Optional[datetime] = None,
+                    end: Optional[datetime] = None,
+                    limit: Optional[int] = None,
+                    offset: int = 0,
+                    newest_first: bool = False) -> List[MealEntry]:
+        """
+        Return a user's meals ordered by timestamp
+
+        Args:
+            user_id: User identifier
+            meal_type: Only include meals of this type
+            start: Only include meals at or after this time
+            end: Only include meals at or before this time
+            limit: Maximum number of meals to return (None for all)
+            offset: Number of matching meals to skip
+            newest_first: Order newest to oldest instead of oldest to newest
+        """
+        raise NotImplementedError
+
+    def page_meals(self,
+                   user_id: str,
+                   meal_type: Optional[MealType] = None,
+                   start: Optional[datetime] = None,
+                   end: Optional[datetime] = None,
+                   limit: int = 10,
+                   cursor: Optional[str] = None,
+                   newest_first: bool = True) -> Tuple[List[MealEntry], Optional[str]]:
+        """
+        Return one keyset-paginated page of a user's meals
+
+        The cursor is the one returned with the previous page; the returned
+        cursor is None when there are no further meals.
+        """
+        raise NotImplementedError
+
+    def count_meals(self,
+                    user_id: str,
+                    meal_type: Optional[MealType] = None,
+                    start: Optional[datetime] = None,
+                    end: Optional[datetime] = None) -> int:
+        """Count a user's meals matching the filters"""
+        raise NotImplementedError
+
+    def daily_rollup(self, user_id: str, day: date) -> Optional[DailyRollup]:
+        """Nutrition totals for a user-day, or None if nothing was logged"""
+        raise NotImplementedError
+
+    def rollup_range(self, user_id: str, start: date, end: date) -> PeriodRollup:
+        """Nutrition totals and days with meals over [start, end]"""
+        raise NotImplementedError
+
+    def rollup_series(self,
+                      user_id: str,
+                      start: date,
+                      end: date,
+                      resolution: Resolution = 'day') -> List[Tuple[date, PeriodRollup]]:
+        """
+        Per-period totals over [start, end], only for periods with meals
+
+        Args:
+            user_id: User identifier
+            start: First day
+            end: Last day
+            resolution: 'day', 'week' (Monday start), 'month', or a bucket
+                width in days counted from start; edge periods only cover
+                days inside the range
+
+        Returns:
+            (period start, totals) in date order
+        """
+        raise NotImplementedError
+
+    def top_foods(self,
+                  user_id: str,
+                  start: date,
+                  end: date,
+                  k: Optional[int] = 20) -> Tuple[List[Tuple[str, str, int, float]], int]:
+        """
+        Most consumed foods over the days [start, end]
+
+        Args:
+            user_id: User identifier
+            start: First day
+            end: Last day
+            k: Number of foods to return (None for all)
+
+        Returns:
+            ((food_id, food_name, times consumed, total grams) most frequent
+            first, ties by food_id; number of distinct foods in the range)
+        """
+        raise NotImplementedError
+
+    def rebuild_rollups(self, user_id: Optional[str] = None) -> int:
+        """Recompute daily rollups from raw meals; returns meals aggregated"""
+        raise NotImplementedError
+
+    def data_version(self, user_id: str) -> int:
+        """
+        Counter that grows on every change to a user's meals
+
+        Bumped only once a mutation is fully visible to reads (meals and
+        rollups), so results computed after reading a version are at least
+        that fresh. Used to key cached analytics (services.analytics_cache).
+        """
+        raise NotImplementedError
+
+    def set_profile_source(self, profile_of: Callable[[str], Optional[UserProfile]]) -> None:
+        """
+        Resolve user_id -> profile for population analytics (health goal,
+        protein target); stores that read profiles themselves ignore it
+        """
+
+    def population_summary(self, start: date, end: date) -> "PopulationSummary":
+        """
+        Population sketches over the days [start, end] (services.population)
+
+        Returns:
+            PopulationSummary: per (day, health goal) partitions that merge
+            with the summaries of other shards; the caller owns it (to_dict()
+            only when it leaves the process)
+        """
+        raise NotImplementedError
+
+    def snapshot(self, user_id: str) -> "MealSnapshot":
+        """
+        Read-only view of one user's meals for multi-query scans
+
+        The in-memory store returns an O(1) copy-on-write snapshot that later
+        writes never change; other backends read live data.
+        """
+        return MealSnapshot(self, user_id)
+
+
+class MealSnapshot:
+    """
+    One user's meals for a sequence of reads (use as a context manager)
+
+    Same query methods as MealStore, without the user_id argument. This base
+    class reads through to the store; versioned backends subclass it.
+    """
+
+    def __init__(self, store: MealStore, user_id: str):
+        self.store = store
+        self.user_id = user_id
+
+    def __enter__(self) -> "MealSnapshot":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Release the snapshot so its version can be reclaimed"""
+
+    def query_meals(self, meal_type=None, start=None, end=None,
+                    limit=None, offset=0, newest_first=False) -> List[MealEntry]:
+        return self.store.query_meals(self.user_id, meal_type, start, end, limit, offset, newest_first)
+
+    def page_meals(self, meal_type=None, start=None, end=None,
+                   limit=10, cursor=None, newest_first=True) -> Tuple[List[MealEntry], Optional[str]]:
+        return self.store.page_meals(self.user_id, meal_type, start, end, limit, cursor, newest_first)
+
+    def count_meals(self, meal_type=None, start=None, end=None) -> int:
+        return self.store.count_meals(self.user_id, meal_type, start, end)
+
+    def meal_arrays(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                    foods: bool = False) -> "MealArrays":
+        """Meals in [start, end] as NumPy columns for the analytics engine (foods adds detected foods)"""
+        from services.analytics_engine import MealArrays
+        return MealArrays.from_meals(self.query_meals(start=start, end=end), foods=foods)
+
+
+class UserStore:
+    """Interface for user profile storage backends"""
+
+    def save_user(self, user: UserProfile) -> None:
+        """Insert or replace a user profile"""
+        raise NotImplementedError
+
+    def get_user(self, user_id: str) -> Optional[UserProfile]:
+        """Return a user by ID, or None if it does not exist"""
+        raise NotImplementedError
+
+    def create_user(self, user: UserProfile) -> bool:
+        """
+        Store a new user unless its email is already registered
+
+        The check and the insert are atomic, so of two concurrent
+        registrations with the same (normalized) email exactly one succeeds.
+        Returns False when the email is taken.
+        """
+        raise NotImplementedError
+
+    def get_users(self, user_ids: List[str]) -> List[UserProfile]:
+        """Return the existing users among user_ids, in request order"""
+        raise NotImplementedError
+
+    def get_user_by_email(self, email: str) -> Optional[UserProfile]:
+        """Return the user registered with this email (normalized), if any"""
+        raise NotImplementedError
+
+    def delete_user(self, user_id: str) -> bool:
+        """Delete a user; returns False if the user did not exist"""
+        raise NotImplementedError
+
+    def list_users(self) -> List[UserProfile]:
+        """Return all user profiles"""
+        raise NotImplementedError
+
+    def page_users(self,
+                   limit: int = 50,
+                   cursor: Optional[str] = None,
+                   health_goal: Optional[str] = None,
+                   gender: Optional[str] = None) -> Tuple[List[UserProfile], Optional[str]]:
+        """
+        Return one keyset-paginated page of users, oldest first
+
+        Users are ordered by (created_at, user_id) and optionally filtered by
+        health goal and gender values. The cursor is the one returned with
+        the previous page (encode_user_cursor); the returned cursor is None
+        when there are no further users.
+        """
+        raise NotImplementedError
+
+    def count_users(self, health_goal: Optional[str] = None, gender: Optional[str] = None) -> int:
+        """Number of stored users, optionally only those matching the filters"""
+        raise NotImplementedError
+
+
+_shutdown_hooks: List[Callable[[], None]] = []
+_fork_hooks: List[weakref.WeakMethod] = []
+
+
+def on_shutdown(hook: Callable[[], None]) -> None:
+    """Register a storage cleanup callback (flush queues, close logs)"""
+    _shutdown_hooks.append(hook)
+
+
+def close_stores() -> None:
+    """Run shutdown hooks, most recently registered first"""
+    while _shutdown_hooks:
+        _shutdown_hooks.pop()()
+
+
+def after_fork(hook: Callable[[], None]) -> None:
+    """
+    Register a bound method run in a forked child process (e.g. a job worker)
+
+    A fork copies locks held by other threads of the parent, which would
+    then never be released, and pooled connections shared with the parent;
+    hooks replace them. Held weakly, so registering does not keep the owner
+    alive.
+    """
+    _fork_hooks.append(weakref.WeakMethod(hook))
+
+
+def _run_fork_hooks() -> None:
+    for ref in _fork_hooks:
+        hook = ref()
+        if hook is not None:
+            hook()
+    _fork_hooks[:] = [ref for ref in _fork_hooks if ref() is not None]
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_run_fork_hooks)
+
+
+def get_backend_name() -> str:
+    """Storage backend selected by the STORAGE_BACKEND environment variable"""
+    return os.getenv('STORAGE_BACKEND', 'memory').strip().lower()
+
+
+def is_process_local(backend: Optional[str] = None) -> bool:
+    """Whether the backend's data lives in this process only (memory, or in-process shards)"""
+    backend = backend or get_backend_name()
+    return backend == 'memory' or (backend == 'sharded' and not os.getenv('SHARD_ADDRESSES', '').strip())
+
+
+def create_meal_store(backend: Optional[str] = None) -> MealStore:
+    """Create the meal store for the configured backend (write-behind if WRITE_BEHIND=1)"""
+    store = _create_backend_meal_store(backend or get_backend_name())
+    if os.getenv('WRITE_BEHIND', '').strip().lower() in ('1', 'true', 'yes'):
+        from services.write_behind import (
+            WriteBehindMealStore, DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL_S, DEFAULT_MAX_PENDING,
+            DEFAULT_MAX_WAIT_S
+        )
+        store = WriteBehindMealStore(
+            store,
+            batch_size=int(os.getenv('WRITE_BEHIND_BATCH', DEFAULT_BATCH_SIZE)),
+            flush_interval_s=float(os.getenv('WRITE_BEHIND_INTERVAL_MS', DEFAULT_FLUSH_INTERVAL_S * 1000)) / 1000,
+            max_pending=int(os.getenv('WRITE_BEHIND_MAX_PENDING', DEFAULT_MAX_PENDING)),
+            max_wait_s=float(os.getenv('WRITE_BEHIND_MAX_WAIT_MS', DEFAULT_MAX_WAIT_S * 1000)) / 1000
+        )
+        on_shutdown(store.close)
+    return store
+
+
+def _create_backend_meal_store(backend: str) -> MealStore:
+    if backend == 'memory':
+        if os.getenv('WAL_DIR'):
+            from services.persistence import get_journal
+            return get_journal().meal_store
+        if os.getenv('TIER_MEMORY_BUDGET_MB'):
+            from services.tiered_store import create_tiered_meal_store
+            return create_tiered_meal_store()
+        from services.memory_store import InMemoryMealStore
+        return InMemoryMealStore()
+    if backend == 'sqlite':
+        from services.population import OPEN_DAYS
+        from services.sqlite_store import DEFAULT_POPULATION_CACHE_DAYS, SQLiteMealStore, get_database
+        return SQLiteMealStore(
+            get_database(),
+            open_days=int(os.getenv('POPULATION_OPEN_DAYS', OPEN_DAYS)),
+            cache_days=int(os.getenv('POPULATION_CACHE_DAYS', DEFAULT_POPULATION_CACHE_DAYS))
+        )
+    if backend == 'sharded':
+        from services.sharding import ShardedMealStore, get_router
+        return ShardedMealStore(get_router())
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+def create_user_store(backend: Optional[str] = None) -> UserStore:
+    """Create the user store for the configured backend"""
+    backend = backend or get_backend_name()
+    if backend == 'memory':
+        if os.getenv('WAL_DIR'):
+            from services.persistence import get_journal
+            return get_journal().user_store
+        from services.memory_store import InMemoryUserStore
+        return InMemoryUserStore()
+    if backend == 'sqlite':
+        from services.sqlite_store import SQLiteUserStore, get_database
+        return SQLiteUserStore(get_database())
+    if backend == 'sharded':
+        from services.sharding import ShardedUserStore, get_router
+        return ShardedUserStore(get_router())
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
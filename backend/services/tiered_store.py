@@ -0,0 +1,315 @@
+"""Tiered Meal Store - Evict cold users' meal columns to disk, page them back on demand
+
+Enabled for the memory backend with TIER_MEMORY_BUDGET_MB. Users stay in
+memory while active; a user's columns are written to a compact per-user
+file (the snapshot column format) and dropped from memory when
+
+    * they have not been touched for TIER_IDLE_S seconds (background sweep), or
+    * resident columns exceed the memory budget (least recently used first).
+
+The next call that needs the user reads the file back (a page-in) before
+answering, so callers never notice. The meal_id -> user index stays in
+memory so meal lookups by ID still find evicted users.
+
+Tier files are a cache of in-memory state: the store's files in the
+directory (TIER_DIR, or <WAL_DIR>/tier when journaled) are deleted on
+startup; anything else in it is left alone. stats() reports resident/evicted
+bytes, hit rate and page-in latency.
+"""
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+import hashlib
+import os
+import re
+import threading
+import time
+
+from services.memory_store import InMemoryMealStore, UserMealColumns
+from services.persistence import capture_columns, encode_columns, decode_columns, read_frames
+from services.storage import after_fork
+
+DEFAULT_TIER_DIR = 'data/tier'
+DEFAULT_MEMORY_BUDGET_MB = 512
+DEFAULT_IDLE_S = 7 * 24 * 3600
+
+TIER_MAGIC = b'NUTRITIER1\n'
+
+# Names of the files the store writes (user hash, optionally mid-write)
+TIER_FILE_PATTERN = re.compile(r'[0-9a-f]{32}\.cols(\.tmp)?')
+
+# Page-in latencies kept for percentiles
+LATENCY_SAMPLES = 1024
+
+
+class _ColdUser:
+    """Where an evicted user's columns live"""
+
+    __slots__ = ('path', 'nbytes', 'file_bytes', 'meals')
+
+    def __init__(self, path: str, nbytes: int, file_bytes: int, meals: int):
+        self.path = path
+        self.nbytes = nbytes
+        self.file_bytes = file_bytes
+        self.meals = meals
+
+
+class TieredMealStore(InMemoryMealStore):
+    """Columnar meal store with LRU eviction of whole users to disk"""
+
+    def __init__(self, journal=None, directory: str = DEFAULT_TIER_DIR,
+                 memory_budget_bytes: int = DEFAULT_MEMORY_BUDGET_MB * 2 ** 20,
+                 idle_s: float = DEFAULT_IDLE_S):
+        super().__init__(journal=journal)
+        self.directory = directory
+        self.memory_budget_bytes = memory_budget_bytes
+        self.idle_s = idle_s
+        os.makedirs(directory, exist_ok=True)
+        _remove_tier_files(directory)
+
+        self._lock = threading.RLock()
+        after_fork(self._reset_lock)
+        self._recency: "OrderedDict[str, float]" = OrderedDict()  # resident users, least recent first
+        self._sizes: Dict[str, int] = {}  # estimated bytes of resident users
+        self._resident_bytes = 0
+        self._cold: Dict[str, _ColdUser] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._page_in_ms: List[float] = []
+
+        self._stop = threading.Event()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name='tier-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def _reset_lock(self) -> None:
+        self._lock = threading.RLock()
+
+    # Residency
+
+    def _columns(self, user_id: str) -> Optional[UserMealColumns]:
+        with self._lock:
+            columns = self.user_columns.get(user_id)
+            if columns is not None:
+                self.hits += 1
+                self._recency[user_id] = time.monotonic()
+                self._recency.move_to_end(user_id)
+                return columns
+            if user_id not in self._cold:
+                return None
+            self.misses += 1
+            return self._page_in(user_id)
+
+    def _page_in(self, user_id: str) -> UserMealColumns:
+        started = time.perf_counter()
+        cold = self._cold.pop(user_id)
+        columns = _read_user_file(cold.path)
+        os.remove(cold.path)
+
+        self.user_columns[user_id] = columns
+        self.rollups.set_user(user_id, columns.daily_rollups())
+        self._track(user_id, columns)
+
+        self._page_in_ms.append((time.perf_counter() - started) * 1000)
+        if len(self._page_in_ms) > LATENCY_SAMPLES:
+            del self._page_in_ms[:len(self._page_in_ms) - LATENCY_SAMPLES]
+        self._enforce_budget(keep=user_id)
+        return columns
+
+    def _track(self, user_id: str, columns: UserMealColumns) -> None:
+        """Record a resident user's size and recency"""
+        size = columns.nbytes()
+        self._resident_bytes += size - self._sizes.get(user_id, 0)
+        self._sizes[user_id] = size
+        self._recency[user_id] = time.monotonic()
+        self._recency.move_to_end(user_id)
+
+    def _untrack(self, user_id: str) -> None:
+        self._resident_bytes -= self._sizes.pop(user_id, 0)
+        self._recency.pop(user_id, None)
+
+    def _evict(self, user_id: str) -> None:
+        columns = self.user_columns.pop(user_id)
+        path = os.path.join(self.directory, hashlib.blake2b(user_id.encode('utf-8'), digest_size=16).hexdigest() + '.cols')
+        file_bytes = _write_user_file(path, columns)
+        self._cold[user_id] = _ColdUser(path, self._sizes.get(user_id, columns.nbytes()), file_bytes, len(columns))
+        self.rollups.set_user(user_id, {})
+        self._untrack(user_id)
+        self.evictions += 1
+
+    def _enforce_budget(self, keep: Optional[str] = None) -> None:
+        """Evict least recently used users until resident columns fit the budget"""
+        while self._resident_bytes > self.memory_budget_bytes and len(self._recency) > 1:
+            user_id = next(iter(self._recency))
+            if user_id == keep:
+                self._recency.move_to_end(user_id)
+                user_id = next(iter(self._recency))
+            self._evict(user_id)
+
+    def evict_idle(self, idle_s: Optional[float] = None) -> int:
+        """Evict users untouched for idle_s seconds; returns users evicted"""
+        cutoff = time.monotonic() - (self.idle_s if idle_s is None else idle_s)
+        evicted = 0
+        with self._lock:
+            while self._recency:
+                user_id, last_used = next(iter(self._recency.items()))
+                if last_used > cutoff:
+                    break
+                self._evict(user_id)
+                evicted += 1
+        return evicted
+
+    def _sweep_loop(self) -> None:
+        interval = max(1.0, min(self.idle_s / 4, 60.0))
+        while not self._stop.wait(interval):
+            try:
+                self.evict_idle()
+            except OSError as e:
+                print(f"⚠️ Tier eviction failed: {e}")
+
+    def close(self) -> None:
+        self._stop.set()
+
+    # Writes keep size and recency bookkeeping current. They take the food
+    # window lock before the tier lock, the order a window build (which may
+    # page the user in) takes them in.
+
+    def apply_add_meal(self, meal) -> None:
+        with self.food_windows.lock, self._lock:
+            super().apply_add_meal(meal)
+            self._track(meal.user_id, self.user_columns[meal.user_id])
+            self._enforce_budget(keep=meal.user_id)
+
+    def apply_add_meals(self, meals) -> None:
+        with self.food_windows.lock, self._lock:
+            super().apply_add_meals(meals)
+            for user_id in {meal.user_id for meal in meals}:
+                columns = self.user_columns.get(user_id)
+                if columns is not None:  # may have been evicted by a page-in later in the batch
+                    self._track(user_id, columns)
+            self._enforce_budget()
+
+    def apply_remove_meal(self, meal_id: str):
+        with self.food_windows.lock, self._lock:
+            user_id = self.meal_owners.get(meal_id)
+            meal = super().apply_remove_meal(meal_id)
+            if user_id is not None:
+                columns = self.user_columns.get(user_id)
+                if columns is None:
+                    self._untrack(user_id)
+                else:
+                    self._track(user_id, columns)
+            return meal
+
+    def restore_columns(self, user_id: str, columns: UserMealColumns) -> None:
+        with self.food_windows.lock, self._lock:
+            super().restore_columns(user_id, columns)
+            self._track(user_id, columns)
+            self._enforce_budget(keep=user_id)
+
+    # Reads that bypass _columns
+
+    def has_meals(self, user_id: str) -> bool:
+        return user_id in self.user_columns or user_id in self._cold
+
+    def daily_rollup(self, user_id, day):
+        self._columns(user_id)  # rollups of evicted users are rebuilt on page-in
+        return super().daily_rollup(user_id, day)
+
+    def rollup_range(self, user_id, start, end):
+        self._columns(user_id)
+        return super().rollup_range(user_id, start, end)
+
+    def rollup_series(self, user_id, start, end, resolution='day'):
+        self._columns(user_id)
+        return super().rollup_series(user_id, start, end, resolution)
+
+    def meal_user_ids(self) -> List[str]:
+        with self._lock:
+            return list(self.user_columns) + list(self._cold)
+
+    def iter_user_columns(self) -> Iterator[Tuple[str, UserMealColumns]]:
+        """Every user's columns; evicted users are read from disk without paging them in"""
+        with self._lock:
+            resident = list(self.user_columns.items())
+            cold = [(user_id, cold.path) for user_id, cold in self._cold.items()]
+        yield from resident
+        for user_id, path in cold:
+            with self._lock:
+                if user_id in self.user_columns:
+                    columns = self.user_columns[user_id]
+                else:
+                    columns = _read_user_file(path)
+            yield user_id, columns
+
+    def rebuild_rollups(self, user_id: Optional[str] = None) -> int:
+        with self._lock:
+            if user_id is not None:
+                self._columns(user_id)
+                return super().rebuild_rollups(user_id)
+            # Evicted users get fresh rollups when paged in
+            return super().rebuild_rollups() + sum(cold.meals for cold in self._cold.values())
+
+    def stats(self) -> Dict[str, float]:
+        """Residency, memory saved, hit rate and page-in latency"""
+        with self._lock:
+            samples = sorted(self._page_in_ms)
+            lookups = self.hits + self.misses
+            return {
+                'resident_users': len(self.user_columns),
+                'evicted_users': len(self._cold),
+                'resident_mb': round(self._resident_bytes / 2 ** 20, 2),
+                'memory_budget_mb': round(self.memory_budget_bytes / 2 ** 20, 2),
+                'memory_saved_mb': round(sum(cold.nbytes for cold in self._cold.values()) / 2 ** 20, 2),
+                'disk_mb': round(sum(cold.file_bytes for cold in self._cold.values()) / 2 ** 20, 2),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 1.0,
+                'evictions': self.evictions,
+                'page_in_p50_ms': round(samples[len(samples) // 2], 3) if samples else 0.0,
+                'page_in_p99_ms': round(samples[int(len(samples) * 0.99)], 3) if samples else 0.0
+            }
+
+
+def _remove_tier_files(directory: str) -> None:
+    """Delete tier files left by a previous process, and nothing else"""
+    for entry in os.scandir(directory):
+        if TIER_FILE_PATTERN.fullmatch(entry.name) and entry.is_file(follow_symlinks=False):
+            os.remove(entry.path)
+
+
+def _write_user_file(path: str, columns: UserMealColumns) -> int:
+    """Write one user's columns (temp file + rename); returns bytes written"""
+    tmp_path = path + '.tmp'
+    written = len(TIER_MAGIC)
+    with open(tmp_path, 'wb') as f:
+        f.write(TIER_MAGIC)
+        for frame in encode_columns(capture_columns(columns)):
+            f.write(frame)
+            written += len(frame)
+    os.replace(tmp_path, path)
+    return written
+
+
+def _read_user_file(path: str) -> UserMealColumns:
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(TIER_MAGIC):
+        raise ValueError(f"Not a tier file: {path}")
+    frames, _ = read_frames(data[len(TIER_MAGIC):])
+    return decode_columns(frames)
+
+
+def create_tiered_meal_store(journal=None) -> TieredMealStore:
+    """Tiered store configured from TIER_DIR, TIER_MEMORY_BUDGET_MB and TIER_IDLE_S"""
+    if journal is not None:
+        directory = os.path.join(journal.directory, 'tier')
+    else:
+        directory = os.getenv('TIER_DIR', DEFAULT_TIER_DIR)
+    store = TieredMealStore(
+        journal=journal,
+        directory=directory,
+        memory_budget_bytes=int(float(os.getenv('TIER_MEMORY_BUDGET_MB', DEFAULT_MEMORY_BUDGET_MB)) * 2 ** 20),
+        idle_s=float(os.getenv('TIER_IDLE_S', DEFAULT_IDLE_S))
+    )
+    return store
@@ -0,0 +1,574 @@
+"""Write-Behind Meal Store - Acknowledge meal writes before they are durable
+
+Wraps any MealStore (SQLite, or the journaled memory store). Writes are
+queued in memory and acknowledged immediately; a background thread drains
+the queue in group commits of up to WRITE_BEHIND_BATCH meals (one
+transaction / one WAL fsync each), at least every WRITE_BEHIND_INTERVAL_MS.
+
+Queued writes are visible to reads at once: every read merges the user's
+pending additions and removals over the wrapped store's results, and
+snapshot() merges a copy of them over the wrapped store's snapshot. A commit
+runs outside the store's lock, so queueing a write or reading never waits
+on it; only reads of a user whose changes are in the batch being committed
+wait for that one commit. The queue is bounded by WRITE_BEHIND_MAX_PENDING;
+when it is full a writer waits up to WRITE_BEHIND_MAX_WAIT_MS for the
+flusher and then gets StoreBusyError (the API answers 503). A failed commit
+is retried, skipping meals the failed attempt already wrote. close()
+(called on shutdown) drains the queue.
+
+Trade-off: meals acknowledged in the last flush interval are lost if the
+process crashes, so this mode is opt-in (WRITE_BEHIND=1).
+"""
+from typing import Callable, Dict, List, Optional, Set, Tuple, TypeVar
+from datetime import date, datetime, time
+import functools
+import threading
+import time as clock
+
+from models.meal import MealEntry
+from services.food_counts import FoodTally
+from services.population import PopulationSummary
+from services.rollups import DailyRollup, PeriodRollup, period_start
+from services.storage import (
+    MealSnapshot, MealStore, StoreBusyError, after_fork, to_micros, encode_cursor, decode_cursor
+)
+
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_FLUSH_INTERVAL_S = 0.05
+DEFAULT_MAX_PENDING = 10000
+DEFAULT_MAX_WAIT_S = 1.0
+
+_ADD = 'add'
+_REMOVE = 'remove'
+
+T = TypeVar('T')
+
+
+def _key(meal: MealEntry) -> Tuple[int, str]:
+    return to_micros(meal.timestamp), meal.meal_id
+
+
+def _matches(meal: MealEntry, meal_type, start, end) -> bool:
+    if meal_type is not None and meal.meal_type != meal_type:
+        return False
+    if start is not None and meal.timestamp < start:
+        return False
+    if end is not None and meal.timestamp > end:
+        return False
+    return True
+
+
+class _PendingUser:
+    """A user's queued, not yet flushed changes"""
+
+    __slots__ = ('added', 'removed')
+
+    def __init__(self):
+        self.added: Dict[str, MealEntry] = {}
+        self.removed: Dict[str, MealEntry] = {}  # stored meals queued for removal
+
+    def copy(self) -> '_PendingUser':
+        pending = _PendingUser()
+        pending.added = dict(self.added)
+        pending.removed = dict(self.removed)
+        return pending
+
+
+def _merged_query(query, pending: Optional[_PendingUser], meal_type, start, end,
+                  limit, offset, newest_first) -> List[MealEntry]:
+    """query_meals over the stored meals (query, without user_id) with queued changes merged"""
+    if pending is None:
+        return query(meal_type, start, end, limit, offset, newest_first)
+
+    removed = pending.removed
+    fetch = None if limit is None else offset + limit + len(removed)
+    stored = query(meal_type, start, end, fetch, 0, newest_first)
+    merged = [meal for meal in stored if meal.meal_id not in removed]
+    merged += [meal for meal in pending.added.values() if _matches(meal, meal_type, start, end)]
+    merged.sort(key=_key, reverse=newest_first)
+    return merged[offset:None if limit is None else offset + limit]
+
+
+def _merged_page(page_meals, pending: Optional[_PendingUser], meal_type, start, end,
+                 limit, cursor, newest_first) -> Tuple[List[MealEntry], Optional[str]]:
+    """page_meals over the stored meals (page_meals, without user_id) with queued changes merged"""
+    if pending is None:
+        return page_meals(meal_type, start, end, limit, cursor, newest_first)
+
+    after = decode_cursor(cursor) if cursor else None
+    removed = pending.removed
+    stored, stored_next = page_meals(meal_type, start, end, limit + len(removed), cursor, newest_first)
+    merged = [meal for meal in stored if meal.meal_id not in removed]
+    for meal in pending.added.values():
+        if not _matches(meal, meal_type, start, end):
+            continue
+        if after is not None and (_key(meal) >= after if newest_first else _key(meal) <= after):
+            continue
+        merged.append(meal)
+    merged.sort(key=_key, reverse=newest_first)
+
+    page = merged[:limit]
+    has_more = len(merged) > limit or stored_next is not None
+    return page, encode_cursor(page[-1]) if has_more and page else None
+
+
+def _merged_count(count_meals, pending: Optional[_PendingUser], meal_type, start, end) -> int:
+    """count_meals over the stored meals (count_meals, without user_id) with queued changes merged"""
+    count = count_meals(meal_type, start, end)
+    if pending is not None:
+        count += sum(1 for meal in pending.added.values() if _matches(meal, meal_type, start, end))
+        count -= sum(1 for meal in pending.removed.values() if _matches(meal, meal_type, start, end))
+    return count
+
+
+class WriteBehindSnapshot(MealSnapshot):
+    """
+    The wrapped store's snapshot of a user with a copy of their queued changes
+
+    Both are taken together (see WriteBehindMealStore._read), so counts,
+    pages and arrays read from it agree with each other.
+    """
+
+    def __init__(self, snapshot: MealSnapshot, pending: Optional[_PendingUser]):
+        self.store = None
+        self.user_id = snapshot.user_id
+        self.snapshot = snapshot
+        self.pending = pending
+
+    def close(self) -> None:
+        self.snapshot.close()
+
+    def query_meals(self, meal_type=None, start=None, end=None,
+                    limit=None, offset=0, newest_first=False) -> List[MealEntry]:
+        return _merged_query(self.snapshot.query_meals, self.pending, meal_type, start, end,
+                             limit, offset, newest_first)
+
+    def page_meals(self, meal_type=None, start=None, end=None,
+                   limit=10, cursor=None, newest_first=True) -> Tuple[List[MealEntry], Optional[str]]:
+        return _merged_page(self.snapshot.page_meals, self.pending, meal_type, start, end,
+                            limit, cursor, newest_first)
+
+    def count_meals(self, meal_type=None, start=None, end=None) -> int:
+        return _merged_count(self.snapshot.count_meals, self.pending, meal_type, start, end)
+
+    def meal_arrays(self, start=None, end=None, foods=False):
+        if self.pending is None:
+            return self.snapshot.meal_arrays(start, end, foods)
+        return super().meal_arrays(start, end, foods)
+
+
+class WriteBehindMealStore(MealStore):
+    """Meal store wrapper with queued writes and background group commits"""
+
+    def __init__(self, store: MealStore,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval_s: float = DEFAULT_FLUSH_INTERVAL_S,
+                 max_pending: int = DEFAULT_MAX_PENDING,
+                 max_wait_s: float = DEFAULT_MAX_WAIT_S):
+        self.store = store
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_s = flush_interval_s
+        self.max_pending = max(self.batch_size, max_pending)
+        self.max_wait_s = max_wait_s
+
+        # self._lock guards the queue and overlay and is never held during
+        # wrapped-store I/O; self._flush_lock lets one commit run at a time
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        after_fork(self._reset_locks)
+        self._queue: List[Tuple[str, MealEntry]] = []
+        self._pending: Dict[str, _PendingUser] = {}
+        self._owners: Dict[str, str] = {}  # {meal_id: user_id} for queued meals
+        # Queued changes per user; added to the wrapped store's data version, which
+        # grows again when they are flushed (a harmless extra cache miss)
+        self._versions: Dict[str, int] = {}
+        # The batch being committed (kept until it succeeds), its users and meal ids,
+        # and per-user commit counts that tell reads a commit overlapped them
+        self._inflight: Optional[List[Tuple[str, MealEntry]]] = None
+        self._committing: Set[str] = set()
+        self._inflight_ids: Set[str] = set()
+        self._epochs: Dict[str, int] = {}
+        self._retrying = False
+        self._closed = False
+
+        self.flushes = 0
+        self.flushed_ops = 0
+        self.backpressure_waits = 0
+        self.rejected_writes = 0
+
+        self._thread = threading.Thread(target=self._run, name='meal-write-behind', daemon=True)
+        self._thread.start()
+
+    def _reset_locks(self) -> None:
+        # A forked child only reads; the flusher thread stays in the parent
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+
+    # Queueing
+
+    def _enqueue(self, ops: List[Tuple[str, MealEntry]]) -> None:
+        with self._changed:
+            if self._closed:
+                raise RuntimeError("Write-behind store is closed")
+            deadline = None
+            while len(self._queue) + len(ops) > self.max_pending and self._queue:
+                if deadline is None:
+                    self.backpressure_waits += 1
+                    deadline = clock.monotonic() + self.max_wait_s
+                remaining = deadline - clock.monotonic()
+                if remaining <= 0:
+                    self.rejected_writes += len(ops)
+                    raise StoreBusyError("Meal write queue is full, retry shortly")
+                self._changed.notify_all()
+                self._changed.wait(remaining)
+            for op, meal in ops:
+                pending = self._pending.get(meal.user_id)
+                if pending is None:
+                    pending = self._pending[meal.user_id] = _PendingUser()
+                if op == _ADD:
+                    pending.added[meal.meal_id] = meal
+                else:
+                    pending.removed[meal.meal_id] = meal
+                self._owners[meal.meal_id] = meal.user_id
+                self._queue.append((op, meal))
+                self._versions[meal.user_id] = self._versions.get(meal.user_id, 0) + 1
+            if len(self._queue) >= self.batch_size:
+                self._changed.notify_all()
+
+    def add_meal(self, meal: MealEntry) -> None:
+        self._enqueue([(_ADD, meal)])
+
+    def add_meals(self, meals: List[MealEntry]) -> None:
+        for start in range(0, len(meals), self.batch_size):
+            self._enqueue([(_ADD, meal) for meal in meals[start:start + self.batch_size]])
+
+    def remove_meal(self, meal_id: str) -> Optional[MealEntry]:
+        with self._changed:
+            # Wait out a commit writing this meal, so it is either queued or stored
+            while meal_id in self._inflight_ids:
+                self._changed.wait()
+            user_id = self._owners.get(meal_id)
+            if user_id is not None:
+                pending = self._pending[user_id]
+                if meal_id in pending.removed:
+                    return None
+                # Never written: drop the queued add instead of queueing a removal
+                meal = pending.added.pop(meal_id)
+                del self._owners[meal_id]
+                self._queue = [item for item in self._queue if item[1].meal_id != meal_id]
+                self._versions[user_id] += 1
+                return meal
+
+        meal = self.store.get_meal(meal_id)
+        if meal is None:
+            return None
+        self._enqueue([(_REMOVE, meal)])
+        return meal
+
+    # Flushing
+
+    def flush(self) -> int:
+        """Write every queued change to the wrapped store; returns operations flushed"""
+        flushed = 0
+        while True:
+            count = self._flush_batch()
+            if not count:
+                return flushed
+            flushed += count
+
+    def _flush_batch(self) -> int:
+        """Group-commit up to batch_size queued operations, or retry the failed batch"""
+        with self._flush_lock:
+            with self._changed:
+                batch = self._inflight
+                if batch is None:
+                    batch = self._queue[:self.batch_size]
+                    if not batch:
+                        return 0
+                    del self._queue[:len(batch)]
+                    self._inflight = batch
+                    self._inflight_ids = {meal.meal_id for _, meal in batch}
+                    self._committing = {meal.user_id for _, meal in batch}
+                    for user_id in self._committing:
+                        self._epochs[user_id] = self._epochs.get(user_id, 0) + 1
+
+            # Without the lock: writers and readers of other users carry on. On
+            # failure the batch stays in flight and the next flush retries it
+            try:
+                self._apply(batch, skip_existing=self._retrying)
+            except Exception:
+                self._retrying = True
+                raise
+            self._retrying = False
+
+            with self._changed:
+                for op, meal in batch:
+                    pending = self._pending.get(meal.user_id)
+                    if pending is not None:
+                        changes = pending.added if op == _ADD else pending.removed
+                        if changes.get(meal.meal_id) is meal:
+                            del changes[meal.meal_id]
+                        if meal.meal_id not in pending.added and meal.meal_id not in pending.removed:
+                            self._owners.pop(meal.meal_id, None)
+                        if not pending.added and not pending.removed:
+                            del self._pending[meal.user_id]
+                self._inflight = None
+                self._inflight_ids = set()
+                self._committing = set()
+                self.flushes += 1
+                self.flushed_ops += len(batch)
+                self._changed.notify_all()
+            return len(batch)
+
+    def _apply(self, batch: List[Tuple[str, MealEntry]], skip_existing: bool) -> None:
+        """Write a batch in order; a retry skips adds its failed attempt already wrote"""
+        adds: List[MealEntry] = []
+        for op, meal in batch:
+            if op == _ADD:
+                adds.append(meal)
+                continue
+            self._add_meals(adds, skip_existing)
+            adds = []
+            self.store.remove_meal(meal.meal_id)  # a no-op if already removed
+        self._add_meals(adds, skip_existing)
+
+    def _add_meals(self, meals: List[MealEntry], skip_existing: bool) -> None:
+        if skip_existing and meals:
+            existing = self.store.existing_meal_ids([meal.meal_id for meal in meals])
+            meals = [meal for meal in meals if meal.meal_id not in existing]
+        if meals:
+            self.store.add_meals(meals)
+
+    def _run(self) -> None:
+        while True:
+            with self._changed:
+                if len(self._queue) < self.batch_size and self._inflight is None and not self._closed:
+                    self._changed.wait(self.flush_interval_s)
+                if self._closed:
+                    return  # close() drains the rest
+            try:
+                self._flush_batch()
+            except Exception as e:
+                # Keep the batch and retry after the next interval
+                print(f"⚠️ Write-behind flush failed, retrying: {e}")
+                with self._changed:
+                    self._changed.wait(self.flush_interval_s)
+
+    def close(self) -> None:
+        """Stop the flusher and drain the queue"""
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        self._thread.join()
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'pending': len(self._queue) + len(self._inflight or ()),
+                'flushes': self.flushes,
+                'flushed_ops': self.flushed_ops,
+                'backpressure_waits': self.backpressure_waits,
+                'rejected_writes': self.rejected_writes
+            }
+
+    def _read(self, user_id: str, read: Callable[[Optional[_PendingUser]], T],
+              discard: Optional[Callable[[T], None]] = None) -> T:
+        """
+        Run read(pending) over the wrapped store without holding the lock
+
+        pending is a copy of the user's queued changes (None when there are
+        none). If a commit of those changes overlaps the read, the store
+        result and the copy could both contain them, so the read waits for
+        such a commit and is retried when one started while it ran (after
+        passing the stale result to discard).
+        """
+        while True:
+            with self._changed:
+                while user_id in self._committing:
+                    self._changed.wait()
+                pending = self._pending.get(user_id)
+                if pending is None:
+                    snapshot = None
+                else:
+                    snapshot = pending.copy()
+                epoch = self._epochs.get(user_id, 0)
+            result = read(snapshot)
+            if snapshot is None:
+                # Writes queued since can only make the store newer than the (empty) overlay
+                return result
+            with self._lock:
+                if self._epochs.get(user_id, 0) == epoch:
+                    return result
+            if discard is not None:
+                discard(result)
+
+    # Reads (wrapped store merged with queued changes)
+
+    def existing_meal_ids(self, meal_ids: List[str]) -> Set[str]:
+        with self._changed:
+            while self._inflight_ids.intersection(meal_ids):
+                self._changed.wait()
+            queued = {}
+            for meal_id in meal_ids:
+                user_id = self._owners.get(meal_id)
+                if user_id is not None:
+                    queued[meal_id] = meal_id in self._pending[user_id].added
+        existing = self.store.existing_meal_ids(meal_ids)
+        for meal_id, added in queued.items():
+            if added:
+                existing.add(meal_id)
+            else:
+                existing.discard(meal_id)
+        return existing
+
+    def get_meal(self, meal_id: str) -> Optional[MealEntry]:
+        with self._changed:
+            while meal_id in self._inflight_ids:
+                self._changed.wait()
+            user_id = self._owners.get(meal_id)
+            if user_id is not None:
+                return self._pending[user_id].added.get(meal_id)
+        return self.store.get_meal(meal_id)
+
+    def has_meals(self, user_id: str) -> bool:
+        return self._read(user_id, lambda pending: bool(pending and pending.added) or self.store.has_meals(user_id))
+
+    def query_meals(self, user_id, meal_type=None, start=None, end=None,
+                    limit=None, offset=0, newest_first=False) -> List[MealEntry]:
+        query = functools.partial(self.store.query_meals, user_id)
+        return self._read(user_id, lambda pending: _merged_query(
+            query, pending, meal_type, start, end, limit, offset, newest_first
+        ))
+
+    def page_meals(self, user_id, meal_type=None, start=None, end=None,
+                   limit=10, cursor=None, newest_first=True) -> Tuple[List[MealEntry], Optional[str]]:
+        if cursor:
+            decode_cursor(cursor)  # a bad cursor is a ValueError whether or not changes are queued
+        page_meals = functools.partial(self.store.page_meals, user_id)
+        return self._read(user_id, lambda pending: _merged_page(
+            page_meals, pending, meal_type, start, end, limit, cursor, newest_first
+        ))
+
+    def count_meals(self, user_id, meal_type=None, start=None, end=None) -> int:
+        count_meals = functools.partial(self.store.count_meals, user_id)
+        return self._read(user_id, lambda pending: _merged_count(count_meals, pending, meal_type, start, end))
+
+    def daily_rollup(self, user_id: str, day: date) -> Optional[DailyRollup]:
+        def read(pending):
+            rollup = self.store.daily_rollup(user_id, day)
+            if pending is None:
+                return rollup
+            added = [meal for meal in pending.added.values() if meal.timestamp.date() == day]
+            removed = [meal for meal in pending.removed.values() if meal.timestamp.date() == day]
+            if not added and not removed:
+                return rollup
+
+            merged = DailyRollup()
+            if rollup is not None:
+                merged.merge(rollup)
+            for meal in added:
+                merged.apply(meal)
+            for meal in removed:
+                merged.apply(meal, sign=-1)
+            return merged if merged.meals_count > 0 else None
+
+        return self._read(user_id, read)
+
+    @staticmethod
+    def _pending_days(pending: Optional[_PendingUser], start: date, end: date) -> Dict[date, DailyRollup]:
+        """Net per-day change from a user's queued writes within [start, end]"""
+        deltas: Dict[date, DailyRollup] = {}
+        if pending is None:
+            return deltas
+        for sign, meals in ((1, pending.added), (-1, pending.removed)):
+            for meal in meals.values():
+                day = meal.timestamp.date()
+                if start <= day <= end:
+                    deltas.setdefault(day, DailyRollup()).apply(meal, sign)
+        return deltas
+
+    def _merge_day(self, user_id: str, day: date, delta: DailyRollup, target: PeriodRollup) -> None:
+        """Add a pending day delta to a period, adjusting its logged-day count"""
+        stored = self.store.daily_rollup(user_id, day)
+        before = stored.meals_count if stored is not None else 0
+        target.merge(delta)
+        target.days_logged += (before + delta.meals_count > 0) - (before > 0)
+
+    def rollup_range(self, user_id, start, end) -> PeriodRollup:
+        def read(pending):
+            total = self.store.rollup_range(user_id, start, end)
+            for day, delta in self._pending_days(pending, start, end).items():
+                self._merge_day(user_id, day, delta, total)
+            return total
+
+        return self._read(user_id, read)
+
+    def rollup_series(self, user_id, start, end, resolution='day') -> List[Tuple[date, PeriodRollup]]:
+        def read(pending):
+            series = self.store.rollup_series(user_id, start, end, resolution)
+            deltas = self._pending_days(pending, start, end)
+            if not deltas:
+                return series
+
+            periods = {}
+            for period, rollup in series:
+                periods[period] = copy = PeriodRollup()  # never mutate the wrapped store's rollups
+                copy.merge(rollup)
+                copy.days_logged = rollup.days_logged
+            for day, delta in deltas.items():
+                period = period_start(day, resolution, origin=start)
+                if period not in periods:
+                    periods[period] = PeriodRollup()
+                self._merge_day(user_id, day, delta, periods[period])
+            return sorted(((period, rollup) for period, rollup in periods.items() if rollup.meals_count > 0),
+                          key=lambda item: item[0])
+
+        return self._read(user_id, read)
+
+    def top_foods(self, user_id, start, end, k=20) -> Tuple[List[Tuple[str, str, int, float]], int]:
+        first, last = datetime.combine(start, time.min), datetime.combine(end, time.max)
+
+        def read(pending):
+            changes = [] if pending is None else [
+                (sign, meal)
+                for sign, meals in ((1, pending.added), (-1, pending.removed))
+                for meal in meals.values()
+                if meal.detected_foods and _matches(meal, None, first, last)
+            ]
+            if not changes:
+                return self.store.top_foods(user_id, start, end, k)
+
+            # Queued meals can reorder any food, so merge them over the full stored tally
+            tally = FoodTally()
+            for food_id, food_name, count, grams in self.store.top_foods(user_id, start, end, None)[0]:
+                tally.add(food_id, food_name, count, grams)
+            for sign, meal in changes:
+                for food in meal.detected_foods:
+                    tally.add(food.food_id, food.food_name, sign, sign * food.estimated_portion_g)
+            return tally.top(k), tally.unique()
+
+        return self._read(user_id, read)
+
+    def snapshot(self, user_id: str) -> WriteBehindSnapshot:
+        """The wrapped store's snapshot (copy-on-write for the memory store) with the queued changes merged"""
+        return self._read(user_id, lambda pending: WriteBehindSnapshot(self.store.snapshot(user_id), pending),
+                          discard=WriteBehindSnapshot.close)
+
+    def rebuild_rollups(self, user_id: Optional[str] = None) -> int:
+        self.flush()
+        return self.store.rebuild_rollups(user_id)
+
+    def data_version(self, user_id: str) -> int:
+        with self._lock:
+            queued = self._versions.get(user_id, 0)
+        return self.store.data_version(user_id) + queued
+
+    def set_profile_source(self, profile_of) -> None:
+        self.store.set_profile_source(profile_of)
+
+    def population_summary(self, start: date, end: date) -> PopulationSummary:
+        self.flush()
+        return self.store.population_summary(start, end)
@@ -0,0 +1,73 @@
+"""
+In-memory store tests - Concurrent writers from the threadpool lose no meals
+
+Run from backend/:
+    python -m pytest tests
+"""
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.memory_store import InMemoryMealStore
+from utils.serialization import construct_meal_entry
+from benchmarks.common import make_meal_dicts
+
+THREADS = 8
+MEALS_PER_THREAD = 1000
+
+
+def write_concurrently(store, user_for_thread):
+    """Each thread logs MEALS_PER_THREAD meals one add_meal at a time; returns them by thread"""
+    batches = [
+        [construct_meal_entry(d) for d in make_meal_dicts(MEALS_PER_THREAD, user_id=user_for_thread(i), seed=i)]
+        for i in range(THREADS)
+    ]
+    start = threading.Barrier(THREADS)
+
+    def write(meals):
+        start.wait()
+        for meal in meals:
+            store.add_meal(meal)
+
+    # Switch threads often so unsynchronized writes would interleave
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(THREADS) as pool:
+            list(pool.map(write, batches))
+    finally:
+        sys.setswitchinterval(interval)
+    return batches
+
+
+def assert_round_trips(store, meals):
+    for meal in meals:
+        stored = store.get_meal(meal.meal_id)
+        assert stored is not None and stored.meal_id == meal.meal_id
+        assert stored.total_nutrition.calories == meal.total_nutrition.calories
+        assert [food.food_id for food in stored.detected_foods] == [food.food_id for food in meal.detected_foods]
+
+
+def test_concurrent_writes_to_one_user():
+    store = InMemoryMealStore()
+    batches = write_concurrently(store, lambda i: 'hot-user')
+    meals = [meal for batch in batches for meal in batch]
+
+    assert store.count_meals('hot-user') == len(meals)
+    assert sorted(meal.meal_id for meal in store.query_meals('hot-user')) == sorted(meal.meal_id for meal in meals)
+    assert sum(rollup.meals_count for _, rollup in store.rollup_series(
+        'hot-user', min(m.timestamp for m in meals).date(), max(m.timestamp for m in meals).date())) == len(meals)
+    assert_round_trips(store, meals)
+
+
+def test_concurrent_writes_to_many_users():
+    store = InMemoryMealStore()
+    batches = write_concurrently(store, lambda i: f'user-{i % 4}')
+
+    for i in range(4):
+        expected = [meal for j, batch in enumerate(batches) if j % 4 == i for meal in batch]
+        assert store.count_meals(f'user-{i}') == len(expected)
+        assert_round_trips(store, expected)
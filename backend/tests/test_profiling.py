@@ -0,0 +1,44 @@
+"""
+Profiling tests - X-Profile on a sync handler samples the threadpool worker running it
+
+Run from backend/:
+    python -m pytest tests
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from services.profiling import CPUProfiler, ProfilingMiddleware
+
+
+def spin_in_sync_handler():
+    deadline = time.perf_counter() + 0.2
+    total = 0
+    while time.perf_counter() < deadline:
+        total += 1
+    return total
+
+
+def test_sync_handler_frames_are_sampled():
+    app = FastAPI()
+
+    @app.get('/spin')
+    def spin():
+        return {'iterations': spin_in_sync_handler()}
+
+    profiler = CPUProfiler(interval_ms=1, token='secret')
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+    with TestClient(app) as client:
+        response = client.get('/spin', headers={'X-Profile': 'secret'})
+    assert response.status_code == 200
+
+    profile = profiler.get(response.headers['X-Profile-Id'])
+    functions = [entry['function'] for entry in profile.top_functions()]
+    assert any(function.startswith('spin_in_sync_handler ') for function in functions), functions
+    assert any(stack.startswith('[AnyIO worker thread];') for stack in profile.stacks)
@@ -0,0 +1,140 @@
+"""
+Crash recovery tests - A SIGKILLed journaled writer loses no acknowledged write
+
+Run from backend/:
+    python -m pytest tests
+"""
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from services import persistence
+from services.persistence import Journal, WriteAheadLog, read_log
+from utils.serialization import construct_meal_entry
+from benchmarks.bench_recovery import verify
+from benchmarks.common import make_meal_dicts
+
+# Acknowledged operations to wait for before killing the writer
+MIN_ACKNOWLEDGED = 300
+WRITER_TIMEOUT_S = 60
+
+
+def run_and_kill(directory: str, seed: int):
+    """Start a bench_recovery writer, SIGKILL it mid-stream and return its acknowledged lines"""
+    writer = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.bench_recovery', '--writer', directory, '--seed', str(seed)],
+        cwd=BACKEND_DIR, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    lines = []
+    deadline = time.monotonic() + WRITER_TIMEOUT_S
+    try:
+        for line in writer.stdout:
+            lines.append(line)
+            if len(lines) >= MIN_ACKNOWLEDGED or time.monotonic() > deadline:
+                break
+    finally:
+        writer.send_signal(signal.SIGKILL)
+        writer.wait()
+        writer.stdout.close()
+    assert writer.returncode == -signal.SIGKILL
+    assert len(lines) >= MIN_ACKNOWLEDGED, "writer stopped acknowledging writes"
+    return lines
+
+
+def parse_acknowledged(lines):
+    acknowledged, deleted, users = {}, set(), {}
+    for line in lines:
+        if not line.endswith('\n'):
+            continue  # the kill interrupted this acknowledgement
+        kind, key, *rest = line.rstrip('\n').split(' ', 2)
+        if kind == 'A':
+            acknowledged[key] = True
+        elif kind == 'D':
+            deleted.add(key)
+        elif kind == 'U':
+            users[key] = rest[0]
+    return acknowledged, deleted, users
+
+
+def live_segment(directory: str) -> str:
+    return os.path.join(directory, max(name for name in os.listdir(directory) if name.startswith('wal-')))
+
+
+def test_sigkill_then_torn_tail_recovers_every_acknowledged_write(tmp_path):
+    directory = str(tmp_path)
+    acknowledged, deleted, users = {}, set(), {}
+    for seed in (1, 2):
+        round_acknowledged, round_deleted, round_users = parse_acknowledged(run_and_kill(directory, seed))
+        acknowledged.update(round_acknowledged)
+        deleted |= round_deleted
+        users.update(round_users)
+
+    # Tear the tail of the live segment as a crash mid-append would
+    segment = live_segment(directory)
+    with open(segment, 'ab') as f:
+        f.write(b'\xff\x00\x00\x00\x12\x34\x56\x78{"partial')
+    torn_size = os.path.getsize(segment)
+
+    stats = verify(directory, acknowledged, deleted, users)
+    assert stats['meals'] >= len(acknowledged) - len(deleted)
+
+    # Recovery cut the torn record off, so the next writer appends to a clean log
+    assert os.path.getsize(segment) < torn_size
+    _, end, size = read_log(segment)
+    assert end == size
+    verify(directory, acknowledged, deleted, users)
+
+
+def test_failed_write_keeps_records_for_the_next_commit(tmp_path, monkeypatch):
+    journal = Journal(str(tmp_path), snapshot_interval_s=0)
+    meals = [construct_meal_entry(d) for d in make_meal_dicts(3, user_id='wal-user', seed=7)]
+
+    real_write = os.write
+    calls = {'n': 0}
+
+    def flaky_write(fd, data):
+        calls['n'] += 1
+        if calls['n'] == 1:
+            return real_write(fd, bytes(data[:5]))  # short write, then the disk fills up
+        if calls['n'] == 2:
+            raise OSError(28, 'No space left on device')
+        return real_write(fd, data)
+
+    monkeypatch.setattr(persistence.os, 'write', flaky_write)
+    with pytest.raises(OSError):
+        journal.meal_store.add_meal(meals[0])
+    assert journal.wal._durable_lsn < journal.wal.lsn
+
+    journal.meal_store.add_meals(meals[1:])
+    monkeypatch.setattr(persistence.os, 'write', real_write)
+    journal.close()
+
+    recovered = Journal(str(tmp_path), snapshot_interval_s=0)
+    assert all(recovered.meal_store.get_meal(meal.meal_id) is not None for meal in meals)
+    recovered.close()
+
+
+def test_failed_fsync_fails_closed(tmp_path, monkeypatch):
+    wal = WriteAheadLog(str(tmp_path), 1)
+
+    def failing_fsync(fd):
+        raise OSError(5, 'Input/output error')
+
+    first = wal.append(b'first')
+    monkeypatch.setattr(persistence.os, 'fsync', failing_fsync)
+    with pytest.raises(OSError):
+        wal.commit(first)
+    monkeypatch.undo()
+
+    # Later records are never reported durable, even though fsync works again
+    second = wal.append(b'second')
+    with pytest.raises(OSError, match='failed fsync'):
+        wal.commit(second)
+    assert wal._durable_lsn < first
@@ -0,0 +1,53 @@
+"""
+Write-behind tests - A snapshot merges queued writes, so its counts, pages and arrays agree
+
+Run from backend/:
+    python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.memory_store import InMemoryMealStore
+from services.write_behind import WriteBehindMealStore
+from utils.serialization import construct_meal_entry
+from benchmarks.common import make_meal_dicts
+
+USER_ID = 'queued-user'
+
+
+def make_meals(count, seed):
+    return [construct_meal_entry(d) for d in make_meal_dicts(count, user_id=USER_ID, seed=seed)]
+
+
+def test_snapshot_merges_queued_writes():
+    store = WriteBehindMealStore(InMemoryMealStore(), flush_interval_s=3600)
+    stored = make_meals(30, seed=1)
+    store.add_meals(stored)
+    store.flush()
+
+    queued = make_meals(10, seed=2)
+    store.add_meals(queued)
+    store.remove_meal(stored[0].meal_id)
+    expected = sorted((meal for meal in stored[1:] + queued), key=lambda meal: (meal.timestamp, meal.meal_id),
+                      reverse=True)
+
+    with store.snapshot(USER_ID) as snapshot:
+        store.flush()  # committing the queue must not change what the snapshot reads
+        store.add_meals(make_meals(5, seed=3))
+
+        assert snapshot.count_meals() == len(expected)
+        assert [meal.meal_id for meal in snapshot.query_meals(newest_first=True)] == [m.meal_id for m in expected]
+        assert len(snapshot.meal_arrays()) == len(expected)
+
+        paged, cursor = [], None
+        while True:
+            page, cursor = snapshot.page_meals(limit=7, cursor=cursor)
+            paged += page
+            if cursor is None:
+                break
+        assert [meal.meal_id for meal in paged] == [meal.meal_id for meal in expected]
+
+    assert store.count_meals(USER_ID) == len(expected) + 5
+    store.close()
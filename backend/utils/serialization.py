@@ -0,0 +1,182 @@
+"""Serialization helpers - Fast JSON responses and trusted model construction
+
+FastAPI's default path runs every response through ``jsonable_encoder``,
+which walks nested Pydantic models in Python. Hot endpoints return an
+``ORJSONResponse`` directly instead, so models are dumped by pydantic-core
+and encoded by orjson in one pass.
+
+Data that we produced ourselves (storage loads, log replay, benchmarks) has
+already been validated once; ``construct_*`` builds models from it without
+running validators a second time.
+"""
+from typing import Any, Dict, List
+from datetime import datetime
+import json
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+from models.food import NutritionInfo, DetectedFood
+from models.meal import MealEntry, MealType
+from models.user import UserProfile, Gender, HealthGoal
+
+try:
+    import orjson  # type: ignore
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    print("Warning: orjson not available. Falling back to standard json. Install with: pip install orjson")
+
+
+NUTRIENT_FIELDS = ('calories', 'protein', 'carbs', 'fat', 'fiber', 'sugar', 'sodium')
+
+# Validates a whole list of foods in a single pydantic-core call
+_detected_foods_adapter = TypeAdapter(List[DetectedFood])
+
+
+def _default(obj: Any) -> Any:
+    """Fallback encoder for objects orjson does not know natively"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _json_default(obj: Any) -> Any:
+    """Fallback encoder for the standard json module"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode='json')
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize response content (dicts, lists, models, datetimes) to JSON bytes"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_json_default, ensure_ascii=False).encode('utf-8')
+
+
+def loads(data: Any) -> Any:
+    """Parse JSON bytes or str"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson (standard json if orjson is missing)
+
+    Not fastapi.responses.ORJSONResponse: that one cannot encode Pydantic
+    models (handlers return MealEntry/UserProfile objects inside plain
+    dicts), asserts orjson is installed instead of falling back, and is
+    deprecated in current FastAPI in favour of response models, which
+    validate the returned data again before encoding it.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def validate_detected_foods(detected_foods: List[dict]) -> List[DetectedFood]:
+    """
+    Validate client-supplied food dicts into DetectedFood models
+
+    Accepts the recognize output shape, where the portion is stored under
+    ``estimated_grams``.
+    """
+    normalized = []
+    for food in detected_foods:
+        normalized.append({
+            'food_id': food['food_id'],
+            'food_name': food['food_name'],
+            'confidence': food['confidence'],
+            'estimated_portion_g': food.get('estimated_portion_g', food.get('estimated_grams', 100)),
+            'bounding_box': food.get('bounding_box'),
+            'nutrition': food.get('nutrition', {})
+        })
+    return _detected_foods_adapter.validate_python(normalized)
+
+
+# model_construct() resolves defaults and field aliases in Python on every call,
+# which in pydantic v2 is slower than validating. Trusted records always carry
+# every field, so the instance state is assigned directly instead.
+_new_object = object.__new__
+_set_attribute = object.__setattr__
+_NUTRITION_FIELDS_SET = set(NutritionInfo.model_fields)
+_DETECTED_FOOD_FIELDS_SET = set(DetectedFood.model_fields)
+_MEAL_ENTRY_FIELDS_SET = set(MealEntry.model_fields)
+
+
+def _construct(cls, values: Dict[str, Any], fields_set: set):
+    """Create a model instance from a complete, already-valid field dict"""
+    instance = _new_object(cls)
+    _set_attribute(instance, '__dict__', values)
+    _set_attribute(instance, '__pydantic_fields_set__', fields_set)
+    _set_attribute(instance, '__pydantic_extra__', None)
+    _set_attribute(instance, '__pydantic_private__', None)
+    return instance
+
+
+def construct_nutrition(data: Dict[str, float]) -> NutritionInfo:
+    """Build NutritionInfo from trusted data without validation"""
+    return _construct(NutritionInfo, {
+        field: data.get(field, 0) for field in NUTRIENT_FIELDS
+    }, _NUTRITION_FIELDS_SET)
+
+
+def construct_detected_food(data: Dict[str, Any]) -> DetectedFood:
+    """Build DetectedFood from trusted data without validation"""
+    return _construct(DetectedFood, {
+        'food_id': data['food_id'],
+        'food_name': data['food_name'],
+        'confidence': data['confidence'],
+        'estimated_portion_g': data.get('estimated_portion_g', data.get('estimated_grams', 100)),
+        'bounding_box': data.get('bounding_box'),
+        'nutrition': construct_nutrition(data.get('nutrition', {}))
+    }, _DETECTED_FOOD_FIELDS_SET)
+
+
+def construct_meal_entry(data: Dict[str, Any]) -> MealEntry:
+    """
+    Build MealEntry from trusted data without validation
+
+    Accepts either a ``model_dump()`` of a MealEntry or a decoded JSON
+    document (string timestamps and meal types are converted).
+    """
+    timestamp = data['timestamp']
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+
+    return _construct(MealEntry, {
+        'meal_id': data['meal_id'],
+        'user_id': data['user_id'],
+        'meal_type': MealType(data['meal_type']),
+        'detected_foods': [construct_detected_food(food) for food in data.get('detected_foods', [])],
+        'total_nutrition': construct_nutrition(data.get('total_nutrition', {})),
+        'image_path': data.get('image_path'),
+        'notes': data.get('notes'),
+        'timestamp': timestamp,
+        'alerts': list(data.get('alerts') or [])
+    }, _MEAL_ENTRY_FIELDS_SET)
+
+
+def construct_user_profile(data: Dict[str, Any]) -> UserProfile:
+    """Build UserProfile from trusted data without validation"""
+    created_at = data['created_at']
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+
+    return UserProfile.model_construct(
+        user_id=data['user_id'],
+        name=data['name'],
+        email=data['email'],
+        age=data['age'],
+        gender=Gender(data['gender']),
+        height_cm=data['height_cm'],
+        weight_kg=data['weight_kg'],
+        health_goal=HealthGoal(data['health_goal']),
+        created_at=created_at
+    )
@@ -21,6 +21,7 @@ except ImportError:
     GEMINI_AVAILABLE = False
     print("Warning: Google Generative AI not available. Install with: pip install google-generativeai pillow")
 
+from contextlib import nullcontext
 from typing import List, Tuple, Optional, Dict
 import json
 import os
@@ -38,6 +39,12 @@ class FoodClassifier:
         """Initialize the food classifier"""
         self.model_path = model_path
         self.food_database = self._load_food_database()
+        
+        # Instrumentation hooks, no-ops unless the API installs its metrics:
+        # stage_timer(stage) returns a context manager timing one stage
+        # ('decode', 'gemini'); on_event(event) counts fallbacks and errors
+        self.stage_timer = lambda stage: nullcontext()
+        self.on_event = lambda event: None
         self.indian_foods = list(self.food_database.keys())
         
         # Initialize Gemini API
@@ -144,7 +151,8 @@ class FoodClassifier:
         Returns:
             List of tuples (food_id, confidence, food_data)
         """
-        image = self.preprocess_image(image_path)
+        with self.stage_timer('decode'):
+            image = self.preprocess_image(image_path)
         features = self.extract_features(image)
         predictions = self._simple_food_matching(features, top_k)
         
@@ -207,6 +215,8 @@ class FoodClassifier:
             try:
                 return self._detect_with_gemini(image_path)
             except Exception as e:
+                self.on_event('gemini_error')
+                self.on_event('color_matching_fallback')
                 print(f"⚠️ Gemini detection failed: {e}. Falling back to color matching.")
         
         # Fallback to color-based detection
@@ -243,8 +253,10 @@ class FoodClassifier:
         """
         Use Gemini Vision API to detect Indian foods in image
         """
-        # Load image
-        img = Image.open(image_path)
+        # Load image (decoded here so the upload is read once, before the API call)
+        with self.stage_timer('decode'):
+            img = Image.open(image_path)
+            img.load()
         
         # Create comprehensive prompt for Indian food detection
         prompt = f"""Analyze this food image and identify Indian food items present.
@@ -269,7 +281,8 @@ If the food is not in the database list, find the closest match or use generic t
 Only return the JSON array, nothing else."""
 
         # Generate content with Gemini
-        response = self.model.generate_content([prompt, img])
+        with self.stage_timer('gemini'):
+            response = self.model.generate_content([prompt, img])
         response_text = response.text.strip()
         
         # Extract JSON from response
@@ -278,6 +291,7 @@ Only return the JSON array, nothing else."""
             detected_items = json.loads(json_match.group())
         else:
             # Fallback parsing
+            self.on_event('gemini_unparseable_response')
             detected_items = [{"food_id": "rice", "confidence": 0.7, "description": "Unable to parse AI response"}]
         
         # Map to our database and format results
@@ -297,6 +311,7 @@ Only return the JSON array, nothing else."""
             
             # If still not found, use a default
             if not food_data:
+                self.on_event('unknown_food_default')
                 food_id = 'rice'  # Default fallback
                 food_data = self.food_database.get(food_id, {})
             
@@ -316,7 +331,10 @@ Only return the JSON array, nothing else."""
                 'ai_description': item.get('description', '')
             })
         
-        return results if results else self._get_default_detection()
+        if not results:
+            self.on_event('default_detection')
+            return self._get_default_detection()
+        return results
     
     def assess_image_quality(self, image_path: str) -> float:
         """
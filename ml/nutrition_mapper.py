@@ -16,6 +16,13 @@ import sys
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+# Daily limits for nutrients without a per-user target (mg / g per day)
+DAILY_SODIUM_LIMIT_MG = 2300
+DAILY_SUGAR_LIMIT_G = 50
+
+# Day-aware alerts fire once the day's total (including this meal) reaches this share of the limit
+DAILY_ALERT_THRESHOLD = 1.0
+
 
 class NutritionInfo:
     """Nutrition information structure"""
@@ -119,13 +126,16 @@ class NutritionMapper:
     
     def generate_health_alerts(self, 
                               nutrition: Dict,
-                              user_profile: Optional[Dict] = None) -> List[str]:
+                              user_profile: Optional[Dict] = None,
+                              today_totals: Optional[Dict] = None) -> List[str]:
         """
         Generate health alerts based on nutrition values and user profile
         
         Args:
             nutrition: Nutrition information for the meal
             user_profile: User's health profile (optional)
+            today_totals: Nutrition already logged today, before this meal
+                          (optional; enables day-aware alerts)
             
         Returns:
             List of alert messages
@@ -182,12 +192,40 @@ class NutritionMapper:
                         f"💪 Muscle Gain Goal: This meal has {nutrition['protein']}g protein. "
                         f"Consider adding {int(protein_target - nutrition['protein'])}g more protein."
                     )
+            
+            if today_totals is not None:
+                alerts.extend(self._daily_alerts(nutrition, user_profile, today_totals))
         
         if not alerts:
             alerts.append("✅ This meal looks balanced and healthy!")
         
         return alerts
     
+    def _daily_alerts(self, nutrition: Dict, user_profile: Dict, today_totals: Dict) -> List[str]:
+        """Alerts for daily limits this meal would reach or exceed, given what was already eaten today"""
+        limits = (
+            ('calories', "calorie target", user_profile.get('daily_calorie_target', 2000), " cal"),
+            ('fat', "fat target", user_profile.get('daily_fat_target_g', 65), "g"),
+            ('sodium', "sodium limit", DAILY_SODIUM_LIMIT_MG, "mg"),
+            ('sugar', "sugar limit", DAILY_SUGAR_LIMIT_G, "g")
+        )
+        alerts = []
+        for nutrient, label, limit, unit in limits:
+            total = today_totals.get(nutrient, 0) + nutrition[nutrient]
+            if limit > 0 and total >= limit * DAILY_ALERT_THRESHOLD:
+                alerts.append(
+                    f"📅 This meal puts you at {total / limit * 100:.0f}% of today's {label} "
+                    f"({total:.0f}{unit} of {limit}{unit})."
+                )
+        
+        protein_target = user_profile.get('daily_protein_target_g', 0)
+        protein_total = today_totals.get('protein', 0) + nutrition['protein']
+        if user_profile.get('health_goal') == 'muscle_gain' and 0 < protein_total < protein_target:
+            alerts.append(
+                f"💪 With this meal you are at {protein_total:.0f}g of today's {protein_target}g protein target."
+            )
+        return alerts
+    
     def generate_explanation(self, 
                            detected_foods: List[Dict],
                            portions: Dict[str, Dict]) -> str: